@@ -1,42 +1,45 @@
 # app/__init__.py - Multi-Tenant Flask Application Factory - VERSIÓN REFACTORIZADA
 
-from flask import Flask, request, send_from_directory, send_file, jsonify, make_response
+from flask import Flask, request, send_from_directory, send_file, jsonify, make_response, g
 from app.config import Config
-from app.utils.error_handlers import register_error_handlers
-from app.services.redis_service import init_redis
-from app.services.vectorstore_service import init_vectorstore
-from app.services.openai_service import init_openai
 from app.config.company_config import get_company_manager
-from app.services.multi_agent_factory import get_multi_agent_factory
-from app.services.prompt_service import get_prompt_service
+from app.utils.logging_config import (
+    bind_log_context,
+    configure_logging,
+    get_log_context,
+    reset_log_context
+)
 
-# 🆕 IMPORTAR SERVICIO ENTERPRISE
-from app.services.company_config_service import get_enterprise_company_service
-
-# Importar blueprints existentes
-from app.routes import webhook, documents, conversations, health, multimedia
-
-# Importar blueprint de diagnóstico (TEMPORAL)
-from app.routes.diagnostic import diagnostic_bp
-
-# Importar nuevos blueprints integrados
-from app.routes.admin import bp as admin_bp
-from app.routes.companies import bp as companies_bp
-from app.routes.conversations_extended import conversations_extended_bp
-
-# ✅ AGREGAR - Importar blueprint de tools
-from app.routes import tools as tools_bp
-
-from app.routes.workflows import workflows_bp
+# Servicios, agentes e integraciones (LangGraph, LangChain Redis, Google
+# Calendar, email) se importan dentro de create_app o en su primer uso:
+# importar cualquier submódulo de app (scripts de migración,
+# diagnose_prompts_system.py) ejecuta este __init__ y no debe cargarlos.
+# El presupuesto de import lo vigila tests/unit/test_import_time.py
 
+import gc
+import importlib
 import logging
-import sys
 import threading
 import time
+import uuid
 import os
 
+# Módulos pesados que el master importa antes del fork en modo preload
+PRELOAD_MODULES = (
+    'app.services.multi_agent_orchestrator',
+    'app.services.vectorstore_service',
+    'langchain_redis',
+    'app.workflows.tool_executor',
+)
+
 def create_app(config_class=Config):
     """Factory pattern para crear la aplicación Flask multi-tenant"""
+    from app.utils.error_handlers import register_error_handlers
+    from app.services.redis_service import init_redis
+    from app.services.openai_service import init_openai
+    from app.services.multi_agent_factory import get_multi_agent_factory
+    from app.services.company_config_service import get_enterprise_company_service
+    
     app = Flask(__name__, static_folder=None)
     app.config.from_object(config_class)
     
@@ -92,12 +95,8 @@ def create_app(config_class=Config):
     # =============================
     STATIC_DIR = os.path.join('/app', 'static')
     
-    # Configurar logging con contexto multi-tenant
-    logging.basicConfig(
-        level=app.config.get('LOG_LEVEL', 'INFO'),
-        format="%(asctime)s [%(levelname)s] [%(name)s] %(message)s",
-        handlers=[logging.StreamHandler(sys.stdout)]
-    )
+    # Configurar logging con contexto multi-tenant (cola async, JSON opcional)
+    configure_logging(app)
     
     logger = logging.getLogger(__name__)
     logger.info("🚀 Initializing Multi-Tenant Chatbot System")
@@ -128,6 +127,25 @@ def create_app(config_class=Config):
         except Exception as e:
             logger.warning(f"⚠️ Enterprise service initialization failed: {e}")
     
+    # Contexto de logging por request (request_id / company_id en cada record)
+    @app.before_request
+    def bind_request_log_context():
+        g.log_context_token = bind_log_context(
+            request_id=request.headers.get('X-Request-ID') or uuid.uuid4().hex[:12],
+            company_id=_extract_company_from_request()
+        )
+    
+    @app.after_request
+    def add_request_id_header(response):
+        response.headers['X-Request-ID'] = get_log_context().get('request_id', '')
+        return response
+    
+    @app.teardown_request
+    def reset_request_log_context(exc=None):
+        token = g.pop('log_context_token', None)
+        if token is not None:
+            reset_log_context(token)
+    
     # ENHANCED: Middleware multi-tenant
     @app.before_request
     def ensure_multitenant_health():
@@ -139,23 +157,18 @@ def create_app(config_class=Config):
                 # Verificar que el gestor de empresas esté inicializado
                 company_manager = get_company_manager()
                 
-                # Log de actividad multi-tenant
-                company_id = _extract_company_from_request()
+                # Log de actividad multi-tenant (extraído en bind_request_log_context)
+                company_id = get_log_context().get('company_id')
                 if company_id:
-                    logger.debug(f"Processing request for company: {company_id}")
+                    logger.debug("Processing request for company: %s", company_id)
                 
                 # Verificación no-bloqueante del factory
                 factory = get_multi_agent_factory()
                 
-                # Si es un webhook, asegurar que el orquestador esté listo en background
+                # Si es un webhook, disparar el warmup del orquestador (una sola vez por
+                # empresa; no-op si ya está listo o calentándose)
                 if '/webhook/chatwoot' in request.path and company_id:
-                    def background_orchestrator_prep():
-                        try:
-                            factory.get_orchestrator(company_id)
-                        except Exception as e:
-                            logger.debug(f"Background orchestrator prep failed for {company_id}: {e}")
-                    
-                    threading.Thread(target=background_orchestrator_prep, daemon=True).start()
+                    factory.warmup_async(company_id, app=app)
                             
             except Exception as e:
                 logger.error(f"Error in multi-tenant middleware: {e}")
@@ -200,6 +213,15 @@ def create_app(config_class=Config):
             logger.debug(f"Could not extract company_id from request: {e}")
             return None
     
+    # Importar blueprints (cada uno importa sus servicios de forma perezosa)
+    from app.routes import webhook, documents, conversations, health, multimedia
+    from app.routes.diagnostic import diagnostic_bp
+    from app.routes.admin import bp as admin_bp
+    from app.routes.companies import bp as companies_bp
+    from app.routes.conversations_extended import conversations_extended_bp
+    from app.routes import tools as tools_bp
+    from app.routes.workflows import workflows_bp
+    
     # Registrar blueprints existentes
     app.register_blueprint(webhook.bp, url_prefix='/api/webhook')
     app.register_blueprint(documents.bp, url_prefix='/api/documents')
@@ -616,13 +638,23 @@ def create_app(config_class=Config):
     # ================================================================
     with app.app_context():
         initialize_multitenant_system(app)
-    start_background_initialization(app)
+    
+    if app.config.get('PRELOAD_APP'):
+        # Master de gunicorn --preload: solo estado inmutable; los threads y
+        # clientes de cada worker se crean en el hook post_fork
+        with app.app_context():
+            preload_shared_state(app)
+    else:
+        start_worker_services(app)
     
     logger.info("🎉 Multi-Tenant Flask application created successfully")
     return app
 
 def initialize_multitenant_system(app):
     """Inicializar sistema multi-tenant después de crear la app"""
+    from app.services.multi_agent_factory import get_multi_agent_factory
+    from app.services.company_config_service import get_enterprise_company_service
+    
     try:
         logger = app.logger
         
@@ -698,6 +730,7 @@ def startup_checks(app):
         with app.app_context():
             from app.services.redis_service import get_redis_client
             from app.services.openai_service import OpenAIService
+            from app.services.multi_agent_factory import get_multi_agent_factory
             
             # Validar servicios básicos
             redis_client = get_redis_client()
@@ -730,6 +763,8 @@ def startup_checks(app):
 
 def delayed_multitenant_initialization(app):
     """Inicialización inteligente multi-tenant en background"""
+    from app.services.multi_agent_factory import get_multi_agent_factory
+    
     max_attempts = 5
     attempt = 0
     
@@ -776,6 +811,67 @@ def delayed_multitenant_initialization(app):
         if attempt >= max_attempts:
             logger.warning("⚠️ Multi-tenant initialization completed with limited companies")
 
+def start_worker_services(app):
+    """Threads propios de cada proceso worker (no sobreviven a un fork)"""
+    start_background_initialization(app)
+    start_workflow_scheduler(app)
+    start_conversation_summarizer(app)
+    start_admission_dispatcher(app)
+    start_message_burst_coalescer(app)
+    start_vector_health_monitor(app)
+
+def preload_shared_state(app):
+    """
+    Construir en el master, antes del fork, el estado inmutable por empresa
+    (configuraciones, workflows con sus planes de ejecución e índices de
+    triggers) para que los workers lo compartan copy-on-write.
+    
+    Los orquestadores no se construyen aquí: guardan clientes HTTP/Redis que
+    no deben cruzar un fork; cada worker los calienta tras el fork. Sí se
+    importan sus módulos (agentes, LangGraph, vectorstore), que de otro modo
+    cada worker cargaría por su cuenta en el primer warmup.
+    """
+    start = time.perf_counter()
+    companies = list(get_company_manager().get_all_companies().keys())
+    
+    for module in PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            app.logger.warning(f"Preload import of {module} failed: {e}")
+    
+    workflow_stats = {}
+    try:
+        from app.workflows.workflow_registry import get_workflow_registry
+        workflow_stats = get_workflow_registry().preload(companies)
+    except Exception as e:
+        app.logger.warning(f"Workflow preload skipped: {e}")
+    
+    # Sacar del GC lo construido hasta aquí: recorrerlo en los workers
+    # ensuciaría las páginas compartidas (copy-on-write)
+    gc.collect()
+    gc.freeze()
+    
+    app.logger.info(
+        f"Preloaded shared state for {len(companies)} companies in "
+        f"{(time.perf_counter() - start) * 1000:.0f}ms: {workflow_stats} "
+        f"(frozen objects: {gc.get_freeze_count()})"
+    )
+
+def reinitialize_after_fork(app):
+    """
+    Hook post_fork (gunicorn --preload): descartar clientes heredados del
+    master y arrancar los threads del worker.
+    
+    Los pools de redis-py detectan el cambio de pid y reconectan solos;
+    PostgreSQL abre conexiones por operación.
+    """
+    from app.services.openai_service import reset_client_pool
+    configure_logging(app)
+    reset_client_pool()
+    start_worker_services(app)
+    app.logger.info(f"Worker {os.getpid()} initialized after fork")
+
 def start_background_initialization(app):
     """Iniciar proceso de inicialización multi-tenant en background"""
     try:
@@ -789,6 +885,71 @@ def start_background_initialization(app):
     except Exception as e:
         app.logger.error(f"Error starting background multi-tenant initialization: {e}")
 
+def start_workflow_scheduler(app):
+    """Iniciar el scheduler de timers de workflows (WAIT durables, triggers cron)"""
+    if not app.config.get('WORKFLOW_SCHEDULER_ENABLED', True):
+        app.logger.info("Workflow scheduler disabled (WORKFLOW_SCHEDULER_ENABLED=false)")
+        return
+    
+    try:
+        from app.workflows.workflow_scheduler import get_workflow_scheduler
+        with app.app_context():
+            get_workflow_scheduler().start(app)
+    except Exception as e:
+        app.logger.error(f"Error starting workflow scheduler: {e}")
+
+def start_conversation_summarizer(app):
+    """Iniciar el thread que resume los turnos desalojados de la ventana de conversación"""
+    if not app.config.get('CONVERSATION_SUMMARY_ENABLED', True):
+        app.logger.info("Conversation summarizer disabled (CONVERSATION_SUMMARY_ENABLED=false)")
+        return
+    
+    try:
+        from app.services.conversation_summarizer import get_conversation_summarizer
+        with app.app_context():
+            get_conversation_summarizer().start(app)
+    except Exception as e:
+        app.logger.error(f"Error starting conversation summarizer: {e}")
+
+def start_admission_dispatcher(app):
+    """Iniciar el thread que despacha los webhooks diferidos por control de admisión"""
+    if not app.config.get('ADMISSION_CONTROL_ENABLED', True):
+        app.logger.info("Admission control disabled (ADMISSION_CONTROL_ENABLED=false)")
+        return
+    
+    try:
+        from app.services.admission_control import get_admission_dispatcher
+        with app.app_context():
+            get_admission_dispatcher().start(app)
+    except Exception as e:
+        app.logger.error(f"Error starting admission dispatcher: {e}")
+
+def start_message_burst_coalescer(app):
+    """Iniciar el thread que responde las ráfagas de mensajes por conversación"""
+    if not app.config.get('MESSAGE_BURST_ENABLED', False):
+        app.logger.info("Message burst coalescing disabled (set MESSAGE_BURST_ENABLED=true to enable)")
+        return
+    
+    try:
+        from app.services.message_burst import get_burst_coalescer
+        with app.app_context():
+            get_burst_coalescer().start(app)
+    except Exception as e:
+        app.logger.error(f"Error starting message burst coalescer: {e}")
+
+def start_vector_health_monitor(app):
+    """Iniciar el monitor que verifica los índices vectoriales fuera del request path"""
+    if not app.config.get('VECTOR_HEALTH_MONITOR_ENABLED', True):
+        app.logger.info("Vector health monitor disabled (VECTOR_HEALTH_MONITOR_ENABLED=false)")
+        return
+    
+    try:
+        from app.services.vector_health import get_vector_health_monitor
+        with app.app_context():
+            get_vector_health_monitor().start(app)
+    except Exception as e:
+        app.logger.error(f"Error starting vector health monitor: {e}")
+
 # ============================================================================
 # FUNCIONES HELPER
 # ============================================================================
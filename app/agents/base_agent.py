@@ -13,6 +13,7 @@ from app.services.openai_service import OpenAIService
 
 # 🆕 NUEVOS IMPORTS PARA POSTGRESQL
 from app.services.prompt_service import get_prompt_service
+from app.services.prompt_budgeter import get_prompt_budgeter
 import logging
 import json
 import os
@@ -34,12 +35,18 @@ class BaseAgent(ABC):
     def __init__(self, company_config: CompanyConfig, openai_service: OpenAIService):
         self.company_config = company_config
         self.openai_service = openai_service
-        self.chat_model = openai_service.get_chat_model()
         self.agent_name = self.__class__.__name__
         
+        # Modelo según el perfil del agente/empresa (registro de OpenAIService)
+        self.model_profile = openai_service.get_model_profile(self._get_agent_key(), company_config.company_id)
+        self.chat_model = openai_service.get_coalesced_chat_model(self._get_agent_key(), company_config.company_id)
+        
         # 🆕 NUEVO: Servicio de prompts para PostgreSQL
         self.prompt_service = get_prompt_service()
 
+        # Presupuesto de tokens (historial, contexto RAG, pregunta)
+        self.prompt_budgeter = get_prompt_budgeter(getattr(self.model_profile, 'model', None))
+
         # ✅ AGREGAR - Tools library (opcional)
         self.tools_library = None  # Se inyecta externamente si se necesita
         
@@ -525,12 +532,19 @@ Ayuda al usuario de manera profesional."""
                 else:
                     raise Exception("Chain creation method not found")
             
+            # Ajustar historial y pregunta al presupuesto de tokens del agente;
+            # el contexto RAG se ajusta dentro de la chain con el sobrante
+            allocation = self.prompt_budgeter.allocate(self._get_agent_key(), self._get_system_prompt_text())
+            chat_history = self.prompt_budgeter.fit_history(chat_history or [], allocation)
+            question = self.prompt_budgeter.fit_question(question, allocation)
+
             inputs = {
                 "question": question,
-                "chat_history": chat_history or [],
+                "chat_history": chat_history,
                 "context": context,
                 "company_name": self.company_config.company_name,
-                "services": self.company_config.services
+                "services": self.company_config.services,
+                "prompt_allocation": allocation
             }
             
             # 🆕 LOGGING DETALLADO ANTES DE ENVIAR A OPENAI
@@ -550,6 +564,7 @@ Ayuda al usuario de manera profesional."""
             # 🚨 AQUÍ SE EJECUTA LA CHAIN QUE VA A OPENAI
             logger.info(f"🚀 [{self.company_config.company_id}] Executing chain.invoke()...")
             response = self.chain.invoke(inputs)
+            self.prompt_budgeter.record(self.company_config.company_id, allocation)
             
             logger.info(f"✅ [{self.company_config.company_id}] Chain executed successfully, response length: {len(response)}")
             return response
@@ -559,6 +574,22 @@ Ayuda al usuario de manera profesional."""
             # Respuesta de fallback
             return f"Lo siento, estoy experimentando dificultades técnicas. Por favor, contacta con {self.company_config.company_name} directamente."
 
+    def _get_system_prompt_text(self) -> str:
+        """Texto de los mensajes fijos del template (para el presupuesto de tokens)"""
+        parts = []
+        for message in getattr(getattr(self, 'prompt_template', None), 'messages', []) or []:
+            template = getattr(getattr(message, 'prompt', None), 'template', None)
+            if isinstance(template, str):
+                parts.append(template)
+        return "\n".join(parts)
+
+    def _fit_context(self, chunks: List[str], inputs: Dict[str, Any], separator: str = "\n\n") -> str:
+        """Unir chunks RAG (en orden de relevancia) dentro del presupuesto de la llamada"""
+        allocation = inputs.get("prompt_allocation") if isinstance(inputs, dict) else None
+        if allocation is None:
+            allocation = self.prompt_budgeter.allocate(self._get_agent_key(), self._get_system_prompt_text())
+        return self.prompt_budgeter.fit_context(chunks, allocation, separator=separator)
+
     def get_agent_capabilities(self) -> Dict[str, Any]:
         """
         🆕 NUEVA FUNCIÓN: Obtener capacidades del agente
@@ -571,5 +602,5 @@ Ayuda al usuario de manera profesional."""
             "supports_custom_prompts": True,
             "supports_context": True,
             "supports_history": True,
-            "model_name": getattr(self.chat_model, 'model_name', 'unknown')
+            "model_name": getattr(self.model_profile, 'model', None) or 'unknown'
         }
@@ -111,7 +111,7 @@ Mensaje del usuario: {{question}}"""),
                         context_parts.append(doc['content'])
             
             if context_parts:
-                return f"Protocolos específicos de {self.company_config.company_name}:\n" + "\n\n".join(context_parts)
+                return f"Protocolos específicos de {self.company_config.company_name}:\n" + self._fit_context(context_parts, inputs)
             else:
                 return f"""Protocolos generales de emergencia para {self.company_config.company_name}:
 - Evaluación inmediata para síntomas severos
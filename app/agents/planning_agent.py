@@ -1,7 +1,7 @@
 # NUEVO: app/agents/planning_agent.py
 
 from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
+from app.services.openai_service import OpenAIService
 from typing import TypedDict, List, Dict, Any
 
 class PlanningState(TypedDict):
@@ -42,17 +42,14 @@ class PlanningAgent:
         self.company_config = company_config
         self.orchestrator = orchestrator
         
-        # LLM para planificación (más potente)
-        self.planner_llm = ChatOpenAI(
-            model="gpt-4o",  # Modelo potente para razonamiento
-            temperature=0.2
-        )
+        # Modelos desde el registro de OpenAIService (perfiles "planner" / "planner_decision")
+        openai_service = getattr(orchestrator, "openai_service", None) or OpenAIService()
         
-        # LLM para decisiones
-        self.decision_llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=0.0
-        )
+        # LLM para planificación (modelo de razonamiento)
+        self.planner_llm = openai_service.get_coalesced_chat_model("planner", company_config.company_id)
+        
+        # LLM para decisiones (modelo pequeño)
+        self.decision_llm = openai_service.get_coalesced_chat_model("planner_decision", company_config.company_id)
         
         # Construir grafo de LangGraph
         self.graph = self._build_planning_graph()
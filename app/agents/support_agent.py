@@ -100,7 +100,8 @@ Para consultas específicas, te conectaré con un especialista."""
                     context_parts.append(doc['content'])
             
             if context_parts:
-                return "\n\n".join(context_parts)
+                # Chunks en orden de relevancia: se recortan los de menor valor
+                return self._fit_context(context_parts, inputs)
             else:
                 return f"Información general de {self.company_config.company_name} disponible."
             
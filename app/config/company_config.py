@@ -35,6 +35,18 @@ class CompanyConfig:
     
     # ✅ NUEVO CAMPO - Herramientas habilitadas por empresa
     enabled_tools: List[str] = None
+    
+    # Perfiles de modelo por agente: {"router_agent": {"model": ..., "max_tokens": ..., "temperature": ...}}
+    agent_models: Dict[str, Dict[str, Any]] = None
+    
+    # Límites por recurso sobre los defaults de la app y peso en el reparto de colas diferidas:
+    # {"weight": 2, "webhook": {"per_minute": 30, "burst": 10}, "llm_tokens": {"per_minute": 50000}}
+    rate_limits: Dict[str, Any] = None
+    
+    # Forma del índice vectorial sobre los defaults VECTOR_* (se aplica con un re-index):
+    # {"dimensions": 768, "dtype": "float16", "algorithm": "hnsw", "m": 16, "ef_construction": 200, "ef_runtime": 10}
+    # o {"mode": "shared"} para usar el índice compartido filtrado por company_id
+    vector_settings: Dict[str, Any] = None
 
     def __post_init__(self):
         if self.treatment_durations is None:
@@ -46,6 +58,15 @@ class CompanyConfig:
         if self.sales_keywords is None:
             self.sales_keywords = []
         
+        if self.agent_models is None:
+            self.agent_models = {}
+        
+        if self.rate_limits is None:
+            self.rate_limits = {}
+        
+        if self.vector_settings is None:
+            self.vector_settings = {}
+        
         # ✅ AGREGAR - Inicializar enabled_tools con defaults
         if self.enabled_tools is None:
             self.enabled_tools = [
@@ -214,6 +235,9 @@ class CompanyConfigManager:
                     "max_tokens": config.max_tokens,
                     "temperature": config.temperature,
                     "treatment_durations": config.treatment_durations or {},
+                    "agent_models": config.agent_models or {},
+                    "rate_limits": config.rate_limits or {},
+                    "vector_settings": config.vector_settings or {},
                     "_source": "postgresql_sync",
                     "_synced_at": "auto"
                 }
@@ -7,9 +7,33 @@ BOT_INACTIVE_STATUSES = ["pending", "resolved", "snoozed"]
 # Redis key patterns (ahora con prefijos dinámicos por empresa)
 REDIS_KEY_PATTERNS = {
     "conversation": "{company_prefix}conversation:",
+    "conversation_activity": "{company_prefix}conversation_activity",  # ZSET user_id -> last activity
+    "conversation_counts": "{company_prefix}conversation_counts",      # HASH user_id -> messages
+    "conversation_stats": "{company_prefix}conversation_stats",        # HASH contadores globales
+    "conversation_summary": "{company_prefix}conversation_summary:",   # JSON resumen acumulado por usuario
+    "conversation_summary_pending": "{company_prefix}conversation_summary_pending:",  # LIST turnos desalojados sin resumir
+    "workflow_execution": "{company_prefix}workflow_execution:",      # estado de ejecuciones en background
+    "workflow_checkpoint": "{company_prefix}workflow_checkpoint:",    # estado durable (reanudable) de ejecuciones
+    "workflow_execution_lock": "{company_prefix}workflow_execution_lock:",
     "document": "{company_prefix}document:",
     "bot_status": "{company_prefix}bot_status:",
-    "processed_message": "{company_prefix}processed_message:",
+    "processed_message": "{company_prefix}processed_message:",         # reclamo idempotente del webhook (processing/done)
+    "outbound_message": "{company_prefix}outbound_message:",          # reclamo idempotente de envíos a Chatwoot
+    "idempotency_stats": "{company_prefix}idempotency_stats",          # HASH duplicados suprimidos
+    "rate_limit": "{company_prefix}rate_limit:",                      # HASH token bucket por recurso
+    "admission_stats": "{company_prefix}admission_stats",              # HASH eventos de throttling
+    "admission_deferred": "{company_prefix}admission_deferred",        # LIST webhooks diferidos
+    "admission_inflight": "{company_prefix}admission_inflight",        # ZSET diferidos en proceso (score = fin del lease)
+    "admission_holding_reply": "{company_prefix}admission_holding_reply:",  # mensaje de espera ya enviado
+    "message_burst": "{company_prefix}message_burst:",                # LIST mensajes de una ráfaga por conversación
+    "message_burst_meta": "{company_prefix}message_burst_meta:",      # HASH seq/first_at/user_id de la ráfaga
+    "message_burst_lock": "{company_prefix}message_burst_lock:",      # vaciado en curso de la conversación
+    "vector_index": "{company_prefix}vector_index",                  # HASH alias -> índice físico activo/destino
+    "vector_shared_index": "vector_index:shared",                     # HASH VectorSettings del índice compartido
+    "vector_doc_count": "{company_prefix}vector_doc_count",          # HASH prefijo de claves -> documentos almacenados
+    "vector_health": "{company_prefix}vector_health",                # JSON estado publicado por el monitor
+    "vector_health_leader": "vector_health:leader",                   # lease del worker que verifica los índices
+    "vector_health_pending": "vector_health:pending",                 # SET empresas con verificación pedida
     "chat_history": "chat_history:",  # LangChain maneja esto automáticamente
     "cache": "cache:",
     "doc_change": "{company_prefix}doc_change:",
@@ -23,7 +47,9 @@ REDIS_TTL = {
     "processed_message": 3600, # 1 hour
     "conversation": 604800,    # 7 days
     "cache": 300,             # 5 minutes
-    "doc_change": 3600        # 1 hour
+    "doc_change": 3600,       # 1 hour
+    "workflow_execution": 86400,  # 24 hours
+    "workflow_checkpoint": 604800  # 7 days (más el tiempo de espera pendiente)
 }
 
 # Multimedia constants (compartidas)
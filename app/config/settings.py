@@ -15,6 +15,9 @@ class Config:
     EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
     MAX_TOKENS = int(os.getenv('MAX_TOKENS', '1500'))
     TEMPERATURE = float(os.getenv('TEMPERATURE', '0.7'))
+    # Modelos del registro por agente (router/validación → pequeño, planner → razonamiento)
+    SMALL_MODEL_NAME = os.getenv('SMALL_MODEL_NAME', 'gpt-4o-mini')
+    REASONING_MODEL_NAME = os.getenv('REASONING_MODEL_NAME', 'gpt-4o')
     
     # Redis Configuration
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
@@ -26,6 +29,11 @@ class Config:
     
     # Application Configuration
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    # Logging estructurado (ver app/utils/logging_config.py)
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # text | json
+    LOG_LEVELS = os.getenv('LOG_LEVELS', '')  # "modulo=NIVEL,..."
+    LOG_ASYNC = os.getenv('LOG_ASYNC', 'true').lower() == 'true'
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
     MAX_CONTEXT_MESSAGES = int(os.getenv('MAX_CONTEXT_MESSAGES', '10'))
     SIMILARITY_THRESHOLD = float(os.getenv('SIMILARITY_THRESHOLD', '0.7'))
     MAX_RETRIEVED_DOCS = int(os.getenv('MAX_RETRIEVED_DOCS', '3'))
@@ -35,6 +43,67 @@ class Config:
     IMAGE_ENABLED = os.getenv('IMAGE_ENABLED', 'false').lower() == 'true'
     WEBHOOK_DEBUG = os.getenv('WEBHOOK_DEBUG', 'false').lower() == 'true'
     
+    # Multimedia attachments (Chatwoot)
+    ATTACHMENT_MAX_WORKERS = int(os.getenv('ATTACHMENT_MAX_WORKERS', '4'))
+    ATTACHMENT_TIMEOUT = float(os.getenv('ATTACHMENT_TIMEOUT', '60'))
+    
+    # Workflow runtime (event loop persistente por worker)
+    WORKFLOW_NODE_MAX_WORKERS = int(os.getenv('WORKFLOW_NODE_MAX_WORKERS', '8'))
+    WORKFLOW_MAX_CONCURRENT_EXECUTIONS = int(os.getenv('WORKFLOW_MAX_CONCURRENT_EXECUTIONS', '4'))
+    WORKFLOW_EXECUTION_TIMEOUT = float(os.getenv('WORKFLOW_EXECUTION_TIMEOUT', '300'))
+    WORKFLOW_EXECUTION_TTL = int(os.getenv('WORKFLOW_EXECUTION_TTL', '86400'))
+    
+    # Ejecución durable (checkpoints + scheduler de timers en Redis)
+    WORKFLOW_SCHEDULER_ENABLED = os.getenv('WORKFLOW_SCHEDULER_ENABLED', 'true').lower() == 'true'
+    WORKFLOW_SCHEDULER_POLL_INTERVAL = float(os.getenv('WORKFLOW_SCHEDULER_POLL_INTERVAL', '1.0'))
+    WORKFLOW_EXECUTION_LEASE = int(os.getenv('WORKFLOW_EXECUTION_LEASE', '600'))
+    WORKFLOW_INLINE_WAIT_MAX_MS = int(os.getenv('WORKFLOW_INLINE_WAIT_MAX_MS', '1000'))
+    
+    # Presupuesto de tiempo por respuesta del orquestador (acota el p99 del webhook)
+    ORCHESTRATOR_DEADLINE_MS = int(os.getenv('ORCHESTRATOR_DEADLINE_MS', '25000'))
+    ORCHESTRATOR_MIN_STEP_MS = int(os.getenv('ORCHESTRATOR_MIN_STEP_MS', '3000'))
+    
+    # Warmup de orquestadores (single-flight por empresa)
+    ORCHESTRATOR_WARMUP_WAIT_TIMEOUT = float(os.getenv('ORCHESTRATOR_WARMUP_WAIT_TIMEOUT', '120'))
+    ORCHESTRATOR_WARMUP_RETRY_AFTER = float(os.getenv('ORCHESTRATOR_WARMUP_RETRY_AFTER', '10'))
+    
+    # Resúmenes de conversación (turnos desalojados de la ventana, en background)
+    CONVERSATION_SUMMARY_ENABLED = os.getenv('CONVERSATION_SUMMARY_ENABLED', 'true').lower() == 'true'
+    CONVERSATION_SUMMARY_MODEL = os.getenv('CONVERSATION_SUMMARY_MODEL', 'gpt-4o-mini')
+    CONVERSATION_SUMMARY_MIN_PENDING = int(os.getenv('CONVERSATION_SUMMARY_MIN_PENDING', '6'))
+    CONVERSATION_SUMMARY_BATCH_SIZE = int(os.getenv('CONVERSATION_SUMMARY_BATCH_SIZE', '8'))
+    CONVERSATION_SUMMARY_POLL_INTERVAL = float(os.getenv('CONVERSATION_SUMMARY_POLL_INTERVAL', '5.0'))
+    
+    # Control de admisión por empresa (token buckets en Redis por recurso, colas diferidas)
+    ADMISSION_CONTROL_ENABLED = os.getenv('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_WEBHOOK_PER_MINUTE = float(os.getenv('RATE_LIMIT_WEBHOOK_PER_MINUTE', '120'))
+    RATE_LIMIT_LLM_TOKENS_PER_MINUTE = float(os.getenv('RATE_LIMIT_LLM_TOKENS_PER_MINUTE', '200000'))
+    RATE_LIMIT_EMBEDDINGS_PER_MINUTE = float(os.getenv('RATE_LIMIT_EMBEDDINGS_PER_MINUTE', '600'))
+    RATE_LIMIT_CHATWOOT_API_PER_MINUTE = float(os.getenv('RATE_LIMIT_CHATWOOT_API_PER_MINUTE', '300'))
+    RATE_LIMIT_BURST_SECONDS = float(os.getenv('RATE_LIMIT_BURST_SECONDS', '15'))  # capacidad = ráfaga de N segundos
+    RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '5'))
+    ADMISSION_MAX_DEFERRED = int(os.getenv('ADMISSION_MAX_DEFERRED', '200'))
+    ADMISSION_DISPATCH_CONCURRENCY = int(os.getenv('ADMISSION_DISPATCH_CONCURRENCY', '2'))
+    ADMISSION_POLL_INTERVAL = float(os.getenv('ADMISSION_POLL_INTERVAL', '0.5'))
+    ADMISSION_HOLDING_REPLY_TTL = int(os.getenv('ADMISSION_HOLDING_REPLY_TTL', '300'))
+    ADMISSION_LEASE_SECONDS = float(os.getenv('ADMISSION_LEASE_SECONDS', '600'))  # un worker caído libera sus diferidos al vencer
+    
+    # Ráfagas de mensajes por conversación: una sola respuesta por ráfaga (opt-in: suma la ventana
+    # a la latencia de cada respuesta; 0 = responder cada mensaje)
+    MESSAGE_BURST_ENABLED = os.getenv('MESSAGE_BURST_ENABLED', 'false').lower() == 'true'
+    MESSAGE_BURST_WINDOW_MS = int(os.getenv('MESSAGE_BURST_WINDOW_MS', '2500'))
+    MESSAGE_BURST_MAX_WAIT_MS = int(os.getenv('MESSAGE_BURST_MAX_WAIT_MS', '8000'))  # tope desde el primer mensaje
+    MESSAGE_BURST_CONCURRENCY = int(os.getenv('MESSAGE_BURST_CONCURRENCY', '4'))
+    MESSAGE_BURST_POLL_INTERVAL = float(os.getenv('MESSAGE_BURST_POLL_INTERVAL', '0.2'))
+    
+    # Idempotencia de webhooks y envíos (lease del estado processing, TTL del resultado guardado)
+    IDEMPOTENCY_LEASE_SECONDS = int(os.getenv('IDEMPOTENCY_LEASE_SECONDS', '180'))
+    IDEMPOTENCY_RESULT_TTL = int(os.getenv('IDEMPOTENCY_RESULT_TTL', '3600'))
+    
+    # Gunicorn --preload: el master construye el estado inmutable y los workers
+    # arrancan sus threads en post_fork (ver gunicorn.conf.py)
+    PRELOAD_APP = os.getenv('GUNICORN_PRELOAD', 'false').lower() == 'true'
+    
     # Schedule Service
     SCHEDULE_SERVICE_URL = os.getenv('SCHEDULE_SERVICE_URL', 'http://127.0.0.1:4040')
     
@@ -45,6 +114,23 @@ class Config:
     VECTORSTORE_AUTO_RECOVERY = os.getenv('VECTORSTORE_AUTO_RECOVERY', 'true').lower() == 'true'
     VECTORSTORE_HEALTH_CHECK_INTERVAL = int(os.getenv('VECTORSTORE_HEALTH_CHECK_INTERVAL', '30'))
     VECTORSTORE_RECOVERY_TIMEOUT = int(os.getenv('VECTORSTORE_RECOVERY_TIMEOUT', '60'))
+    # Un worker (leader) verifica los índices en background; el request path solo lee el estado
+    VECTOR_HEALTH_MONITOR_ENABLED = os.getenv('VECTOR_HEALTH_MONITOR_ENABLED', 'true').lower() == 'true'
+    VECTOR_HEALTH_RECONCILE_SECONDS = int(os.getenv('VECTOR_HEALTH_RECONCILE_SECONDS', '3600'))
+    VECTOR_HEALTH_POLL_INTERVAL = float(os.getenv('VECTOR_HEALTH_POLL_INTERVAL', '2.0'))
+    
+    # Forma por defecto de los índices vectoriales (cada empresa la ajusta con vector_settings)
+    VECTOR_DIMENSIONS = int(os.getenv('VECTOR_DIMENSIONS', '1536'))
+    VECTOR_DTYPE = os.getenv('VECTOR_DTYPE', 'float32')
+    VECTOR_ALGORITHM = os.getenv('VECTOR_ALGORITHM', 'flat')
+    VECTOR_HNSW_M = int(os.getenv('VECTOR_HNSW_M', '16'))
+    VECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv('VECTOR_HNSW_EF_CONSTRUCTION', '200'))
+    VECTOR_HNSW_EF_RUNTIME = int(os.getenv('VECTOR_HNSW_EF_RUNTIME', '10'))
+    # dedicated: índice por empresa; shared: un índice con TAG company_id para empresas pequeñas
+    VECTOR_INDEX_MODE = os.getenv('VECTOR_INDEX_MODE', 'dedicated')
+    VECTOR_SHARED_INDEX = os.getenv('VECTOR_SHARED_INDEX', 'shared_documents')
+    VECTOR_INDEX_REFRESH_SECONDS = float(os.getenv('VECTOR_INDEX_REFRESH_SECONDS', '30'))
+    VECTOR_REINDEX_BATCH_SIZE = int(os.getenv('VECTOR_REINDEX_BATCH_SIZE', '200'))
     
     # Multi-tenant Configuration
     COMPANIES_CONFIG_FILE = os.getenv('COMPANIES_CONFIG_FILE', 'companies_config.json')
@@ -81,3 +167,13 @@ def get_config() -> Config:
     """Get configuration based on environment"""
     env = os.getenv('FLASK_ENV', 'development')
     return config.get(env, config['default'])
+
+def app_config_overlay(defaults: Dict[str, Any]) -> Dict[str, Any]:
+    """Defaults (entorno) sobrescritos por current_app.config cuando hay app context"""
+    try:
+        from flask import current_app, has_app_context
+        if has_app_context():
+            return {key: current_app.config.get(key, value) for key, value in defaults.items()}
+    except ImportError:
+        pass
+    return defaults
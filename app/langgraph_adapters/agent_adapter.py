@@ -9,6 +9,7 @@ Características:
 - Logging automático de ejecución
 - Validación de inputs y outputs
 - Manejo de errores con reintentos
+- Timeout efectivo: min(timeout_ms, presupuesto restante del deadline)
 - Métricas de rendimiento (latencia, tokens)
 - Compatible con checkpointing de LangGraph
 
@@ -25,6 +26,7 @@ import traceback
 
 from app.agents.base_agent import BaseAgent
 from app.langgraph_adapters.state_schemas import AgentExecutionState, ValidationResult
+from app.utils.deadline import Deadline, DeadlineExceeded, call_with_timeout, deadline_scope
 
 logger = logging.getLogger(__name__)
 
@@ -44,8 +46,11 @@ class AgentAdapter:
             timeout_ms=30000
         )
 
-        # Usar en un nodo de LangGraph
-        result = adapted.invoke({"question": "¿Precios?", "chat_history": []})
+        # Usar en un nodo de LangGraph (con el deadline de la request)
+        result = adapted.invoke(
+            {"question": "¿Precios?", "chat_history": []},
+            deadline=Deadline.from_state(state)
+        )
     """
 
     def __init__(
@@ -54,6 +59,7 @@ class AgentAdapter:
         agent_name: str,
         timeout_ms: int = 30000,
         max_retries: int = 2,
+        min_attempt_ms: int = 1500,
         validate_input: Optional[Callable[[Dict[str, Any]], ValidationResult]] = None,
         validate_output: Optional[Callable[[str], ValidationResult]] = None
     ):
@@ -63,8 +69,9 @@ class AgentAdapter:
         Args:
             agent: Instancia del agente LangChain (BaseAgent)
             agent_name: Nombre del agente (ej: "sales", "support")
-            timeout_ms: Timeout en milisegundos
+            timeout_ms: Timeout por intento en milisegundos
             max_retries: Número máximo de reintentos en caso de error
+            min_attempt_ms: Presupuesto mínimo para que valga la pena un intento
             validate_input: Función opcional para validar inputs
             validate_output: Función opcional para validar outputs
         """
@@ -72,12 +79,14 @@ class AgentAdapter:
         self.agent_name = agent_name
         self.timeout_ms = timeout_ms
         self.max_retries = max_retries
+        self.min_attempt_ms = min_attempt_ms
         self.validate_input = validate_input
         self.validate_output = validate_output
 
         # Estadísticas
         self.total_executions = 0
         self.total_errors = 0
+        self.total_timeouts = 0
         self.total_duration_ms = 0.0
 
         logger.info(
@@ -85,15 +94,19 @@ class AgentAdapter:
             f"(timeout={timeout_ms}ms, max_retries={max_retries})"
         )
 
-    def invoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    def invoke(self, inputs: Dict[str, Any], deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         Invocar agente con logging, validación y manejo de errores.
 
+        Cada intento espera como máximo min(timeout_ms, restante del deadline);
+        no se reintenta si el presupuesto restante es menor a min_attempt_ms.
+
         Args:
             inputs: Diccionario con al menos:
                 - question: str - Pregunta del usuario
                 - chat_history: List - Historial de conversación (opcional)
                 - context: str - Contexto adicional (opcional)
+            deadline: Deadline de la request (opcional)
 
         Returns:
             Diccionario con:
@@ -128,7 +141,16 @@ class AgentAdapter:
 
         # Intentar ejecución con reintentos
         last_error = None
+        attempt = 0
         for attempt in range(self.max_retries + 1):
+            if deadline is not None and not deadline.has_budget(self.min_attempt_ms):
+                last_error = last_error or DeadlineExceeded("Request deadline exceeded")
+                logger.warning(
+                    f"[{self.agent_name}] Skipping attempt {attempt + 1}: "
+                    f"only {deadline.remaining_ms():.0f}ms left"
+                )
+                break
+
             try:
                 if attempt > 0:
                     logger.info(
@@ -136,8 +158,9 @@ class AgentAdapter:
                     )
 
                 # ✅ LLAMADA AL AGENTE LANGCHAIN EXISTENTE
-                # Usa el método invoke() que ya tienen todos los BaseAgent
-                output = self.agent.invoke(inputs)
+                # Usa el método invoke() que ya tienen todos los BaseAgent,
+                # acotada por el timeout efectivo del intento
+                output = self._invoke_agent(inputs, deadline)
 
                 # Validar output
                 if self.validate_output:
@@ -177,6 +200,14 @@ class AgentAdapter:
                     "retries": attempt
                 }
 
+            except DeadlineExceeded as e:
+                # Sin presupuesto no tiene sentido reintentar
+                last_error = e
+                self.total_errors += 1
+                self.total_timeouts += 1
+                logger.error(f"[{self.agent_name}] Attempt {attempt + 1} timed out: {e}")
+                break
+
             except Exception as e:
                 last_error = e
                 self.total_errors += 1
@@ -190,8 +221,15 @@ class AgentAdapter:
                 if attempt >= self.max_retries:
                     break
 
-                # Esperar antes de reintentar (backoff exponencial)
+                # Esperar antes de reintentar (backoff exponencial), solo si
+                # después de esperar queda presupuesto para otro intento
                 wait_time = 2 ** attempt  # 1s, 2s, 4s, etc.
+                if deadline is not None and not deadline.has_budget(wait_time * 1000 + self.min_attempt_ms):
+                    logger.warning(
+                        f"[{self.agent_name}] Not enough budget for a retry "
+                        f"({deadline.remaining_ms():.0f}ms left)"
+                    )
+                    break
                 logger.info(f"[{self.agent_name}] Waiting {wait_time}s before retry...")
                 time.sleep(wait_time)
 
@@ -199,12 +237,13 @@ class AgentAdapter:
         duration_ms = (time.time() - start_time) * 1000
         self.total_duration_ms += duration_ms
 
+        status = "timeout" if isinstance(last_error, DeadlineExceeded) else "failed"
         execution_state = self._create_execution_state(
             started_at,
             datetime.utcnow(),
             duration_ms,
-            self.max_retries,
-            "failed",
+            attempt,
+            status,
             error=str(last_error)
         )
 
@@ -214,29 +253,40 @@ class AgentAdapter:
             "success": False,
             "output": None,
             "error": str(last_error),
+            "timed_out": status == "timeout",
             "execution_state": execution_state,
             "validation": validation,
-            "retries": self.max_retries
+            "retries": attempt
         }
 
+    def _invoke_agent(self, inputs: Dict[str, Any], deadline: Optional[Deadline]) -> str:
+        """Un intento: agent.invoke() acotado por min(timeout_ms, restante)"""
+        timeout_seconds = self.timeout_ms / 1000.0
+        if deadline is not None:
+            timeout_seconds = deadline.timeout(timeout_seconds)
+
+        with deadline_scope(deadline):
+            return call_with_timeout(self.agent.invoke, timeout_seconds, inputs)
+
     def _log_execution_start(self, inputs: Dict[str, Any]):
         """Log de inicio de ejecución"""
         question = inputs.get("question", "")
         company_id = self.agent.company_config.company_id
 
-        logger.info(f"🤖 [{company_id}] {self.agent_name}.invoke() started")
-        logger.info(f"   → Question: {question[:100]}...")
-        logger.info(f"   → Has history: {bool(inputs.get('chat_history'))}")
-        logger.info(f"   → Has context: {bool(inputs.get('context'))}")
+        logger.debug(
+            "🤖 [%s] %s.invoke() started (history=%s, context=%s): %.100s",
+            company_id, self.agent_name, bool(inputs.get('chat_history')),
+            bool(inputs.get('context')), question
+        )
 
     def _log_execution_success(self, output: str, duration_ms: float):
         """Log de ejecución exitosa"""
         company_id = self.agent.company_config.company_id
 
-        logger.info(f"✅ [{company_id}] {self.agent_name} completed successfully")
-        logger.info(f"   → Duration: {duration_ms:.2f}ms")
-        logger.info(f"   → Output length: {len(output)} chars")
-        logger.info(f"   → Average duration: {self.get_average_duration_ms():.2f}ms")
+        logger.info(
+            "✅ [%s] %s completed in %.2fms (%d chars, avg %.2fms)",
+            company_id, self.agent_name, duration_ms, len(output), self.get_average_duration_ms()
+        )
 
     def _create_execution_state(
         self,
@@ -310,6 +360,7 @@ class AgentAdapter:
                 - agent_name: Nombre del agente
                 - total_executions: Total de ejecuciones
                 - total_errors: Total de errores
+                - total_timeouts: Intentos cortados por timeout/deadline
                 - error_rate: Tasa de error (0.0-1.0)
                 - average_duration_ms: Duración promedio
                 - total_duration_ms: Duración total
@@ -324,6 +375,7 @@ class AgentAdapter:
             "agent_name": self.agent_name,
             "total_executions": self.total_executions,
             "total_errors": self.total_errors,
+            "total_timeouts": self.total_timeouts,
             "error_rate": error_rate,
             "average_duration_ms": self.get_average_duration_ms(),
             "total_duration_ms": self.total_duration_ms
@@ -339,6 +391,7 @@ class AgentAdapter:
         """Resetear estadísticas"""
         self.total_executions = 0
         self.total_errors = 0
+        self.total_timeouts = 0
         self.total_duration_ms = 0.0
 
     def __repr__(self) -> str:
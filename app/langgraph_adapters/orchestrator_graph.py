@@ -28,6 +28,8 @@ Ventajas vs implementación actual:
 - Logging detallado de cada transición
 - Checkpointing para debugging
 - Escalado a agente de soporte en caso de fallo
+- Deadline por request: cada llamada recibe el presupuesto restante como
+  timeout; retry/handoff/escalado se omiten si ya no alcanza el tiempo
 """
 
 from typing import Dict, Any, List, Literal
@@ -36,6 +38,7 @@ from langgraph.checkpoint.memory import MemorySaver
 from datetime import datetime
 import logging
 import json
+import threading
 
 from app.langgraph_adapters.state_schemas import (
     OrchestratorState,
@@ -46,10 +49,40 @@ from app.langgraph_adapters.agent_adapter import AgentAdapter, validate_has_ques
 from app.agents.base_agent import BaseAgent
 from app.services.shared_state_store import SharedStateStore
 from app.models.audit_trail import AuditManager
+from app.utils.deadline import Deadline, deadline_scope
 # CompensationOrchestrator: lazy import to avoid circular dependency
 
 logger = logging.getLogger(__name__)
 
+DEADLINE_FALLBACK_RESPONSE = (
+    "Lo siento, estoy tardando más de lo normal en responder. "
+    "Por favor, intenta de nuevo en unos minutos."
+)
+
+# Aviso cuando una cita reintentada en segundo plano termina
+BOOKING_CONFIRMED_FOLLOW_UP = (
+    "✅ ¡Listo! Tu cita de {treatment} quedó agendada para el {date} a las {time}."
+)
+BOOKING_FAILED_FOLLOW_UP = (
+    "Lo sentimos, no pudimos agendar tu cita de {treatment} para el {date} a las {time}. "
+    "Por favor, escríbenos para buscar otro horario. 🙏"
+)
+
+
+def _deadline_config() -> Dict[str, int]:
+    """Presupuesto por request desde la config de Flask (o defaults)"""
+    defaults = {
+        "ORCHESTRATOR_DEADLINE_MS": 25000,
+        "ORCHESTRATOR_MIN_STEP_MS": 3000
+    }
+    try:
+        from flask import current_app, has_app_context
+        if has_app_context():
+            return {key: int(current_app.config.get(key, value)) for key, value in defaults.items()}
+    except Exception:
+        pass
+    return defaults
+
 
 class MultiAgentOrchestratorGraph:
     """
@@ -91,7 +124,9 @@ class MultiAgentOrchestratorGraph:
         company_id: str,
         enable_checkpointing: bool = False,
         shared_state_store: SharedStateStore = None,
-        tool_executor = None  # ToolExecutor opcional
+        tool_executor = None,  # ToolExecutor opcional
+        deadline_ms: int = None,
+        min_step_ms: int = None
     ):
         """
         Inicializar grafo de orquestación.
@@ -104,10 +139,18 @@ class MultiAgentOrchestratorGraph:
             enable_checkpointing: Habilitar checkpointing para debugging
             shared_state_store: Store compartido entre agentes (opcional)
             tool_executor: ToolExecutor para acciones (opcional)
+            deadline_ms: Presupuesto total por request (default: ORCHESTRATOR_DEADLINE_MS)
+            min_step_ms: Presupuesto mínimo para iniciar otro paso con agente
+                (retry, handoff, escalado); default: ORCHESTRATOR_MIN_STEP_MS
         """
         self.company_id = company_id
         self.enable_checkpointing = enable_checkpointing
 
+        # Presupuesto de tiempo por request
+        deadline_config = _deadline_config()
+        self.deadline_ms = deadline_ms or deadline_config["ORCHESTRATOR_DEADLINE_MS"]
+        self.min_step_ms = min_step_ms or deadline_config["ORCHESTRATOR_MIN_STEP_MS"]
+
         # Shared State Store para coordinación entre agentes
         self.shared_state_store = shared_state_store or SharedStateStore(
             backend="memory",
@@ -316,7 +359,7 @@ class MultiAgentOrchestratorGraph:
         - user_id válido
         - company_id coincide
         """
-        logger.info(f"[{self.company_id}] 📍 Node: validate_input")
+        logger.debug("[%s] 📍 Node: validate_input", self.company_id)
 
         validation: ValidationResult = {
             "is_valid": True,
@@ -366,7 +409,7 @@ class MultiAgentOrchestratorGraph:
         - confidence: Nivel de confianza (0.0-1.0)
         - intent_keywords: Keywords detectados
         """
-        logger.info(f"[{self.company_id}] 📍 Node: classify_intent")
+        logger.debug("[%s] 📍 Node: classify_intent", self.company_id)
 
         question = state["question"]
         chat_history = state.get("chat_history", [])
@@ -375,7 +418,7 @@ class MultiAgentOrchestratorGraph:
         result = self.router_adapter.invoke({
             "question": question,
             "chat_history": chat_history
-        })
+        }, deadline=Deadline.from_state(state))
 
         # Guardar ejecución
         state["executions"].append(result["execution_state"])
@@ -424,7 +467,7 @@ class MultiAgentOrchestratorGraph:
 
         Si se detecta secondary intent con alta confianza, se puede hacer handoff.
         """
-        logger.info(f"[{self.company_id}] 📍 Node: detect_secondary_intent")
+        logger.debug("[%s] 📍 Node: detect_secondary_intent", self.company_id)
 
         question = state["question"].lower()
         primary_intent = state.get("intent", "").lower()
@@ -465,10 +508,10 @@ class MultiAgentOrchestratorGraph:
         has_support_query = any(keyword in question for keyword in support_keywords)
         has_emergency_query = any(keyword in question for keyword in emergency_keywords)
 
-        logger.info(
-            f"[{self.company_id}] Detection: primary_intent={primary_intent}, "
-            f"pricing={has_pricing_query}, schedule={has_schedule_query}, "
-            f"support={has_support_query}, emergency={has_emergency_query}"
+        logger.debug(
+            "[%s] Detection: primary_intent=%s, pricing=%s, schedule=%s, support=%s, emergency=%s",
+            self.company_id, primary_intent, has_pricing_query, has_schedule_query,
+            has_support_query, has_emergency_query
         )
 
         # ===== PRIORIDAD 1: EMERGENCIAS (siempre tiene máxima prioridad) ===== #
@@ -511,9 +554,7 @@ class MultiAgentOrchestratorGraph:
         else:
             state["secondary_intent"] = None
             state["secondary_confidence"] = 0.0
-            logger.info(
-                f"[{self.company_id}] ❌ No secondary intent detected"
-            )
+            logger.debug("[%s] ❌ No secondary intent detected", self.company_id)
 
         return state
 
@@ -548,7 +589,7 @@ class MultiAgentOrchestratorGraph:
         Returns:
             Estado actualizado con respuesta del agente
         """
-        logger.info(f"[{self.company_id}] 📍 Node: execute_{agent_name}")
+        logger.debug("[%s] 📍 Node: execute_%s", self.company_id, agent_name)
 
         state["current_agent"] = agent_name
 
@@ -570,8 +611,8 @@ class MultiAgentOrchestratorGraph:
             "company_id": state["company_id"]
         }
 
-        # Ejecutar agente mediante adaptador
-        result = adapter.invoke(inputs)
+        # Ejecutar agente mediante adaptador (acotado por el deadline)
+        result = adapter.invoke(inputs, deadline=Deadline.from_state(state))
 
         # Guardar ejecución en historial
         state["executions"].append(result["execution_state"])
@@ -580,8 +621,8 @@ class MultiAgentOrchestratorGraph:
         if result["success"]:
             state["agent_response"] = result["output"]
             logger.info(
-                f"[{self.company_id}] {agent_name} executed successfully "
-                f"({len(result['output'])} chars)"
+                "[%s] %s executed successfully (%d chars)",
+                self.company_id, agent_name, len(result['output'])
             )
 
             # ✅ Guardar información en shared state store para TODOS los agentes
@@ -595,7 +636,7 @@ class MultiAgentOrchestratorGraph:
                     for keyword in ["$", "cop", "pesos", "precio", "costo", "valor"]
                 )
                 if has_pricing:
-                    logger.info(f"[{self.company_id}] Storing pricing info from {agent_name}")
+                    logger.debug("[%s] Storing pricing info from %s", self.company_id, agent_name)
 
                 state["shared_context"]["sales_info"] = {
                     "response": response,
@@ -610,7 +651,7 @@ class MultiAgentOrchestratorGraph:
                     keyword in response.lower()
                     for keyword in ["cita", "agenda", "fecha", "hora", "confirmada"]
                 )
-                logger.info(f"[{self.company_id}] Storing schedule info from {agent_name}")
+                logger.debug("[%s] Storing schedule info from %s", self.company_id, agent_name)
 
                 state["shared_context"]["schedule_info"] = {
                     "response": response,
@@ -621,7 +662,7 @@ class MultiAgentOrchestratorGraph:
 
             # ===== SUPPORT AGENT: Guardar support info ===== #
             elif agent_name == "support":
-                logger.info(f"[{self.company_id}] Storing support info from {agent_name}")
+                logger.debug("[%s] Storing support info from %s", self.company_id, agent_name)
 
                 state["shared_context"]["support_info"] = {
                     "response": response,
@@ -636,7 +677,7 @@ class MultiAgentOrchestratorGraph:
                     keyword in response.lower()
                     for keyword in ["urgente", "emergencia", "inmediato", "llamar", "contactar"]
                 )
-                logger.info(f"[{self.company_id}] Storing emergency info from {agent_name}")
+                logger.debug("[%s] Storing emergency info from %s", self.company_id, agent_name)
 
                 state["shared_context"]["emergency_info"] = {
                     "response": response,
@@ -664,7 +705,7 @@ class MultiAgentOrchestratorGraph:
         - Longitud razonable
         - Sin errores críticos
         """
-        logger.info(f"[{self.company_id}] 📍 Node: validate_output")
+        logger.debug("[%s] 📍 Node: validate_output", self.company_id)
 
         validation: ValidationResult = {
             "is_valid": True,
@@ -708,7 +749,7 @@ class MultiAgentOrchestratorGraph:
         - Escalar a support
         - Terminar con error
         """
-        logger.info(f"[{self.company_id}] 📍 Node: handle_retry")
+        logger.debug("[%s] 📍 Node: handle_retry", self.company_id)
 
         state["retries"] += 1
 
@@ -736,7 +777,7 @@ class MultiAgentOrchestratorGraph:
         El handoff permite que un agente derive a otro temporalmente
         y luego puede volver al agente original.
         """
-        logger.info(f"[{self.company_id}] 📍 Node: handle_agent_handoff")
+        logger.debug("[%s] 📍 Node: handle_agent_handoff", self.company_id)
 
         current_agent = state.get("current_agent")
         secondary_intent = state.get("secondary_intent")
@@ -744,7 +785,7 @@ class MultiAgentOrchestratorGraph:
 
         # ✅ PREVENIR LOOP: Si ya se completó handoff, no hacer otro
         if state.get("handoff_completed", False):
-            logger.info(f"[{self.company_id}] Handoff already completed, skipping")
+            logger.debug("[%s] Handoff already completed, skipping", self.company_id)
             state["handoff_requested"] = False
             return state
 
@@ -767,17 +808,18 @@ class MultiAgentOrchestratorGraph:
             }
 
             logger.info(
-                f"[{self.company_id}] Handoff requested: {current_agent} → {secondary_intent}"
+                "[%s] Handoff requested: %s → %s", self.company_id, current_agent, secondary_intent
             )
 
         else:
             state["handoff_requested"] = False
             if secondary_intent == current_agent:
-                logger.info(
-                    f"[{self.company_id}] No handoff needed: secondary_intent same as current_agent ({current_agent})"
+                logger.debug(
+                    "[%s] No handoff needed: secondary_intent same as current_agent (%s)",
+                    self.company_id, current_agent
                 )
             else:
-                logger.info(f"[{self.company_id}] No handoff needed")
+                logger.debug("[%s] No handoff needed", self.company_id)
 
         # ✅ Marcar handoff como completado para prevenir loops
         state["handoff_completed"] = True
@@ -796,7 +838,7 @@ class MultiAgentOrchestratorGraph:
 
         Esta validación usa el shared_context para comparar información.
         """
-        logger.info(f"[{self.company_id}] 📍 Node: validate_cross_agent_info")
+        logger.debug("[%s] 📍 Node: validate_cross_agent_info", self.company_id)
 
         current_agent = state.get("current_agent")
         agent_response = state.get("agent_response", "")
@@ -867,15 +909,15 @@ class MultiAgentOrchestratorGraph:
         available_contexts = [k for k in shared_context.keys()]
         if available_contexts:
             validation["metadata"]["available_contexts"] = available_contexts
-            logger.info(
-                f"[{self.company_id}] Available contexts: {', '.join(available_contexts)}"
+            logger.debug(
+                "[%s] Available contexts: %s", self.company_id, ', '.join(available_contexts)
             )
 
         state["validations"].append(validation)
 
-        logger.info(
-            f"[{self.company_id}] Cross-agent validation completed: "
-            f"{len(validation['errors'])} errors, {len(validation['warnings'])} warnings"
+        logger.debug(
+            "[%s] Cross-agent validation completed: %d errors, %d warnings",
+            self.company_id, len(validation['errors']), len(validation['warnings'])
         )
 
         return state
@@ -906,9 +948,7 @@ class MultiAgentOrchestratorGraph:
         intent = state.get("intent", "SUPPORT").lower()
         confidence = state.get("confidence", 0.0)
 
-        logger.info(
-            f"[{self.company_id}] Routing: intent={intent}, confidence={confidence}"
-        )
+        logger.info("[%s] Routing: intent=%s, confidence=%s", self.company_id, intent, confidence)
 
         # Si confianza es baja, ir a support
         if confidence <= 0.7:
@@ -924,6 +964,18 @@ class MultiAgentOrchestratorGraph:
             )
             return "support"
 
+    def _has_budget_for_step(self, state: OrchestratorState, step: str) -> bool:
+        """¿Queda presupuesto para otro paso con agente? (sin deadline: siempre)"""
+        deadline = Deadline.from_state(state)
+        if deadline is None or deadline.has_budget(self.min_step_ms):
+            return True
+
+        logger.warning(
+            f"[{self.company_id}] ⏱️ Skipping {step}: "
+            f"{deadline.remaining_ms():.0f}ms left (< {self.min_step_ms}ms)"
+        )
+        return False
+
     def _should_validate_cross_agent_or_retry(
         self,
         state: OrchestratorState
@@ -939,13 +991,14 @@ class MultiAgentOrchestratorGraph:
         """
         # ✅ PREVENIR LOOP: Verificar si ya se completó handoff
         if state.get("handoff_completed", False):
-            logger.info(f"[{self.company_id}] Handoff already completed, skipping check")
+            logger.debug("[%s] Handoff already completed, skipping check", self.company_id)
             return "end"
 
         # Prioridad 1: Verificar handoff si hay secondary intent Y NO se ha completado
         if (state.get("secondary_intent") and
             state.get("secondary_confidence", 0.0) >= 0.7 and
-            not state.get("handoff_completed", False)):
+            not state.get("handoff_completed", False) and
+            self._has_budget_for_step(state, "handoff")):
             return "check_handoff"
 
         # Prioridad 2: Validar cross-agent si hay pricing/schedule info
@@ -958,8 +1011,9 @@ class MultiAgentOrchestratorGraph:
         ):
             return "validate_cross_agent"
 
-        # Prioridad 3: Reintentar si es necesario
-        if state.get("should_retry", False) and state["retries"] < 2:
+        # Prioridad 3: Reintentar si es necesario (y si alcanza el tiempo)
+        if (state.get("should_retry", False) and state["retries"] < 2 and
+                self._has_budget_for_step(state, "retry")):
             return "retry"
 
         # Default: terminar
@@ -970,7 +1024,8 @@ class MultiAgentOrchestratorGraph:
         state: OrchestratorState
     ) -> Literal["retry", "end"]:
         """Determinar si reintentar después de validar output"""
-        if state.get("should_retry", False) and state["retries"] < 2:
+        if (state.get("should_retry", False) and state["retries"] < 2 and
+                self._has_budget_for_step(state, "retry")):
             return "retry"
         return "end"
 
@@ -991,6 +1046,9 @@ class MultiAgentOrchestratorGraph:
         if not state.get("handoff_requested", False):
             return "end"
 
+        if not self._has_budget_for_step(state, "handoff"):
+            return "end"
+
         handoff_to = state.get("handoff_to")
 
         if handoff_to == "sales":
@@ -1010,8 +1068,9 @@ class MultiAgentOrchestratorGraph:
     ) -> Literal["escalate", "end"]:
         """Determinar si escalar a support"""
         if state.get("should_escalate", False):
-            # Solo escalar si no estamos ya en support
-            if state.get("current_agent") != "support":
+            # Solo escalar si no estamos ya en support (y si alcanza el tiempo)
+            if (state.get("current_agent") != "support" and
+                    self._has_budget_for_step(state, "escalation")):
                 return "escalate"
         return "end"
 
@@ -1040,7 +1099,9 @@ class MultiAgentOrchestratorGraph:
             schedule_info = shared_context.get("schedule_info", {})
 
             # Prioridad 1: Verificar disponibilidad si se solicitó y NO se ha verificado
-            if schedule_info.get("needs_availability_check") and not schedule_info.get("availability_checked"):
+            if (schedule_info.get("needs_availability_check") and
+                    not schedule_info.get("availability_checked") and
+                    self._has_budget_for_step(state, "check_availability")):
                 logger.info(
                     f"[{self.company_id}] 🔧 Tool detected: Need availability check → check_availability"
                 )
@@ -1095,7 +1156,7 @@ class MultiAgentOrchestratorGraph:
         3. Actualiza shared_context con slots disponibles
         4. Regresa a schedule agent para que confirme con usuario
         """
-        logger.info(f"[{self.company_id}] 📍 Node: check_availability")
+        logger.debug("[%s] 📍 Node: check_availability", self.company_id)
 
         user_id = state.get("user_id", "unknown")
         shared_context = state.get("shared_context", {})
@@ -1184,7 +1245,7 @@ class MultiAgentOrchestratorGraph:
         Este nodo se ejecuta cuando el schedule agent confirmó una cita.
         Usa CompensationOrchestrator para rollback automático si falla.
         """
-        logger.info(f"[{self.company_id}] 📍 Node: execute_booking")
+        logger.debug("[%s] 📍 Node: execute_booking", self.company_id)
 
         user_id = state.get("user_id", "unknown")
         shared_context = state.get("shared_context", {})
@@ -1238,11 +1299,32 @@ class MultiAgentOrchestratorGraph:
                 "treatment": schedule_info.get("treatment"),
                 "date": schedule_info.get("date"),
                 "time": schedule_info.get("time")
-            }
+            },
+            # Misma cita = misma clave: un reintento no crea un segundo evento
+            idempotency_key=(
+                f"booking:{user_id}:{schedule_info.get('date')}:{schedule_info.get('time')}"
+            )
         )
 
-        # Ejecutar saga
-        result = self.compensation_orchestrator.execute_saga(saga.saga_id)
+        # Si la saga termina en segundo plano (reintento), avisar en la conversación.
+        # Un resultado en el primer intento llega en este mismo thread y ya lo
+        # cubre la respuesta del turno
+        caller_thread = threading.get_ident()
+        conversation_id = state.get("conversation_id")
+        booking = {
+            "treatment": schedule_info.get("treatment", "Consulta"),
+            "date": schedule_info.get("date", ""),
+            "time": schedule_info.get("time", "")
+        }
+
+        def notify_retried_booking(saga_result: Dict[str, Any]):
+            if threading.get_ident() != caller_thread:
+                self._send_booking_follow_up(user_id, conversation_id, booking, saga_result)
+
+        # Ejecutar saga (si falla, los reintentos siguen en segundo plano)
+        result = self.compensation_orchestrator.execute_saga(
+            saga.saga_id, on_complete=notify_retried_booking
+        )
 
         if result["success"]:
             logger.info(
@@ -1258,6 +1340,19 @@ class MultiAgentOrchestratorGraph:
                 state["tool_results"] = {}
             state["tool_results"]["booking"] = result
 
+        elif result.get("status") == "retrying":
+            logger.warning(
+                f"⏳ [{self.company_id}] Booking pending retry: {result.get('error')}"
+            )
+
+            state["tool_errors"] = state.get("tool_errors", [])
+            state["tool_errors"].append({
+                "tool": "booking",
+                "error": result.get("error"),
+                "retrying": True,
+                "saga_id": result.get("saga_id")
+            })
+
         else:
             logger.error(
                 f"❌ [{self.company_id}] Booking failed and rolled back: {result.get('error')}"
@@ -1272,13 +1367,40 @@ class MultiAgentOrchestratorGraph:
 
         return state
 
+    def _send_booking_follow_up(self, user_id: str, conversation_id: Any,
+                                booking: Dict[str, Any], saga_result: Dict[str, Any]):
+        """Mensaje a la conversación con el resultado final de una cita reintentada"""
+        template = BOOKING_CONFIRMED_FOLLOW_UP if saga_result.get("success") else BOOKING_FAILED_FOLLOW_UP
+        status = saga_result.get("status")
+
+        if not conversation_id or not self.tool_executor:
+            logger.warning(
+                "[%s] Retried booking for %s finished as %s, no conversation to notify",
+                self.company_id, user_id, status
+            )
+            return
+
+        result = self.tool_executor.execute_tool(
+            "send_whatsapp",
+            {"conversation_id": conversation_id, "message": template.format(**booking)},
+            user_id=user_id,
+            agent_name="schedule_agent",
+            conversation_id=conversation_id
+        )
+        if result.get("success"):
+            logger.info("[%s] Retried booking finished as %s, conversation %s notified",
+                        self.company_id, status, conversation_id)
+        else:
+            logger.error("[%s] Could not notify conversation %s of retried booking (%s): %s",
+                         self.company_id, conversation_id, status, result.get("error"))
+
     def _send_notification_tool(self, state: OrchestratorState) -> OrchestratorState:
         """
         Nodo: Enviar notificación (email/WhatsApp) de confirmación.
 
         Se ejecuta después de crear booking exitosamente.
         """
-        logger.info(f"[{self.company_id}] 📍 Node: send_notification")
+        logger.debug("[%s] 📍 Node: send_notification", self.company_id)
 
         user_id = state.get("user_id", "unknown")
         shared_context = state.get("shared_context", {})
@@ -1355,7 +1477,7 @@ class MultiAgentOrchestratorGraph:
 
         Se ejecuta cuando support agent detecta un problema que requiere seguimiento.
         """
-        logger.info(f"[{self.company_id}] 📍 Node: create_ticket")
+        logger.debug("[%s] 📍 Node: create_ticket", self.company_id)
 
         user_id = state.get("user_id", "unknown")
         agent_response = state.get("agent_response", "")
@@ -1420,23 +1542,34 @@ class MultiAgentOrchestratorGraph:
         question: str,
         user_id: str,
         chat_history: List[Any] = None,
-        context: str = ""
+        context: str = "",
+        deadline: Deadline = None,
+        conversation_id: Any = None
     ) -> tuple[str, str]:
         """
         Obtener respuesta del sistema multi-agente.
 
         ✅ COMPATIBLE CON API EXISTENTE
 
+        La respuesta está acotada por un Deadline (deadline_ms por defecto):
+        los nodos reciben el presupuesto restante vía OrchestratorState y, al
+        vencer, se retorna la mejor respuesta disponible o un fallback.
+
         Args:
             question: Pregunta del usuario
             user_id: ID del usuario
             chat_history: Historial de conversación
             context: Contexto adicional (RAG, etc.)
+            deadline: Deadline ya iniciado por el caller (opcional)
+            conversation_id: Conversación de Chatwoot; permite avisar cuando
+                una acción reintentada en segundo plano termina (opcional)
 
         Returns:
             Tupla (response, agent_used)
         """
-        logger.info(f"[{self.company_id}] 🚀 MultiAgentOrchestratorGraph.get_response()")
+        logger.debug("[%s] 🚀 MultiAgentOrchestratorGraph.get_response()", self.company_id)
+
+        deadline = deadline or Deadline(budget_ms=self.deadline_ms)
 
         # Crear estado inicial
         initial_state = create_initial_orchestrator_state(
@@ -1444,30 +1577,38 @@ class MultiAgentOrchestratorGraph:
             user_id=user_id,
             company_id=self.company_id,
             chat_history=chat_history or [],
-            context=context
+            context=context,
+            deadline_at=deadline.expires_at,
+            conversation_id=conversation_id
         )
 
         # Ejecutar grafo con recursion_limit configurado
         try:
-            final_state = self.app.invoke(
-                initial_state,
-                config={"recursion_limit": self.recursion_limit}
-            )
+            with deadline_scope(deadline):
+                final_state = self.app.invoke(
+                    initial_state,
+                    config={"recursion_limit": self.recursion_limit}
+                )
 
             # Extraer respuesta y agente usado
             response = final_state.get("agent_response", "")
             agent_used = final_state.get("current_agent", "support")
 
             # Si no hay respuesta, usar fallback
-            if not response:
+            if not response and deadline.expired():
+                logger.warning(
+                    f"[{self.company_id}] ⏱️ Deadline of {deadline.budget_ms:.0f}ms exceeded without response"
+                )
+                response = DEADLINE_FALLBACK_RESPONSE
+            elif not response:
                 response = (
                     "Lo siento, estoy experimentando dificultades técnicas. "
                     "Por favor, intenta de nuevo más tarde."
                 )
 
             logger.info(
-                f"[{self.company_id}] ✅ Response generated by {agent_used} "
-                f"({len(response)} chars, {final_state['retries']} retries)"
+                "[%s] ✅ Response generated by %s (%d chars, %s retries)",
+                self.company_id, agent_used, len(response), final_state['retries']
             )
 
             return response, agent_used
@@ -31,7 +31,7 @@ class AgentExecutionState(TypedDict):
     completed_at: Optional[str]
     duration_ms: Optional[float]
     retries: int
-    status: str  # 'pending', 'running', 'success', 'failed'
+    status: str  # 'pending', 'running', 'success', 'failed', 'timeout'
     error: Optional[str]
     output: Optional[str]
 
@@ -58,6 +58,8 @@ class OrchestratorState(TypedDict):
     - retries: Contador de reintentos
     - errors: Lista de errores ocurridos
     - metadata: Metadatos adicionales
+    - deadline_at: Deadline de la request (epoch); ver app.utils.deadline
+    - conversation_id: Conversación de Chatwoot (mensajes fuera del turno)
     """
 
     # === Entradas inmutables === #
@@ -112,6 +114,12 @@ class OrchestratorState(TypedDict):
     started_at: str
     completed_at: Optional[str]
 
+    # === Presupuesto de tiempo === #
+    deadline_at: Optional[float]
+
+    # === Canal === #
+    conversation_id: Optional[Any]
+
 
 class ScheduleAgentState(TypedDict):
     """
@@ -167,7 +175,9 @@ def create_initial_orchestrator_state(
     user_id: str,
     company_id: str,
     chat_history: List[Any] = None,
-    context: str = ""
+    context: str = "",
+    deadline_at: Optional[float] = None,
+    conversation_id: Optional[Any] = None
 ) -> OrchestratorState:
     """
     Crear estado inicial del orquestador.
@@ -225,7 +235,13 @@ def create_initial_orchestrator_state(
         # Metadata
         "metadata": {},
         "started_at": datetime.utcnow().isoformat(),
-        "completed_at": None
+        "completed_at": None,
+
+        # Presupuesto de tiempo
+        "deadline_at": deadline_at,
+
+        # Canal
+        "conversation_id": conversation_id
     }
 
 
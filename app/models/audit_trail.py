@@ -15,13 +15,21 @@ Características:
 - Soporte para compensating transactions (rollback)
 - Registro de metadata completa
 - TTL configurable para archivado
+- Escritura write-behind: las entradas se encolan en memoria y un hilo
+  de fondo las persiste en lotes con un único pipeline de Redis
+- Índices ordenados por timestamp (ZSET) para consultas "últimas N acciones"
 """
 
-from typing import Dict, Any, List, Optional
-from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Callable
+from datetime import datetime, timedelta, timezone
 from dataclasses import dataclass, field, asdict
+from collections import OrderedDict
+import atexit
 import json
 import logging
+import queue
+import threading
+import time
 import uuid
 
 logger = logging.getLogger(__name__)
@@ -81,6 +89,167 @@ class AuditEntry:
         return cls(**data)
 
 
+class AuditWriteBuffer:
+    """
+    Buffer write-behind compartido por proceso para el audit trail.
+
+    ``log_action``/``mark_*`` solo serializan y encolan la entrada (sin I/O); un
+    hilo de fondo agrupa lo pendiente durante ``flush_interval`` segundos (o
+    hasta ``max_batch``) y lo escribe con un pipeline por cliente Redis. Varias
+    actualizaciones de la misma entrada dentro de un lote se colapsan en un
+    solo SET.
+    """
+
+    def __init__(self, flush_interval: float = 0.05, max_batch: int = 500):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._pending = 0  # encoladas y aún no escritas
+        self._pending_cond = threading.Condition()
+        self._flush_now = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self.stats = {"enqueued": 0, "flushed": 0, "batches": 0, "errors": 0}
+
+    def enqueue(self, manager: 'AuditManager', entry: 'AuditEntry', is_new: bool):
+        """Encolar escritura de una entrada (no bloquea)"""
+        # Serializar ahora: el hilo de fondo nunca toca objetos que la request sigue mutando
+        payload = json.dumps(entry.to_dict())
+        indexes = manager._entry_index_keys(entry) if is_new else []
+
+        with self._pending_cond:
+            self._pending += 1
+        self._queue.put((manager, entry.audit_id, payload, indexes))
+        self.stats["enqueued"] += 1
+        self._ensure_thread()
+
+    def flush(self, timeout: float = 5.0):
+        """
+        Esperar a que todo lo encolado esté en Redis.
+
+        Solo el hilo de fondo escribe (así se respeta el orden de las
+        actualizaciones); si no está vivo se escribe en el hilo actual.
+        """
+        if not (self._thread and self._thread.is_alive()):
+            self._drain()
+            return
+
+        self._flush_now.set()
+        with self._pending_cond:
+            self._pending_cond.wait_for(lambda: self._pending <= 0, timeout=timeout)
+
+    def _drain(self):
+        while True:
+            items = self._take_nowait()
+            if not items:
+                return
+            try:
+                self._write_batch(items)
+            finally:
+                self._release(len(items))
+
+    def _take_nowait(self) -> list:
+        items = []
+        try:
+            while len(items) < self.max_batch:
+                items.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return items
+
+    def _release(self, count: int):
+        with self._pending_cond:
+            self._pending -= count
+            self._pending_cond.notify_all()
+
+    def _ensure_thread(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="audit-write-behind", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            items = []
+            try:
+                items.append(self._queue.get())
+
+                # Dejar que el lote se acumule (o escribir ya si alguien pidió flush)
+                if self._flush_now.wait(self.flush_interval):
+                    self._flush_now.clear()
+
+                items.extend(self._take_nowait())
+                self._write_batch(items)
+
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Audit write-behind loop error: {e}")
+            finally:
+                if items:
+                    self._release(len(items))
+
+    def _write_batch(self, items):
+        # Agrupar por cliente Redis y colapsar por audit_id (se escribe el último estado)
+        grouped: Dict[int, Dict[str, Any]] = {}
+        for manager, audit_id, payload, indexes in items:
+            group = grouped.setdefault(
+                id(manager.redis_client),
+                {"client": manager.redis_client, "entries": OrderedDict()}
+            )
+            key = (manager.redis_prefix, audit_id)
+            previous = group["entries"].get(key)
+            group["entries"][key] = (manager, audit_id, payload, indexes or (previous[3] if previous else []))
+
+        for group in grouped.values():
+            try:
+                pipe = group["client"].pipeline(transaction=False)
+                touched_indexes = {}
+                for manager, audit_id, payload, indexes in group["entries"].values():
+                    manager._queue_entry_writes(pipe, audit_id, payload, indexes, touched_indexes)
+                now = time.time()
+                for index_key, ttl_seconds in touched_indexes.items():
+                    pipe.zremrangebyscore(index_key, "-inf", now - ttl_seconds)
+                    pipe.expire(index_key, ttl_seconds)
+                pipe.execute()
+
+                self.stats["flushed"] += len(group["entries"])
+                self.stats["batches"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Error flushing {len(group['entries'])} audit entries: {e}")
+
+
+_audit_write_buffer: Optional[AuditWriteBuffer] = None
+_audit_write_buffer_lock = threading.Lock()
+
+
+def get_audit_write_buffer() -> AuditWriteBuffer:
+    """Obtener buffer write-behind global del proceso"""
+    global _audit_write_buffer
+    if _audit_write_buffer is None:
+        with _audit_write_buffer_lock:
+            if _audit_write_buffer is None:
+                _audit_write_buffer = AuditWriteBuffer()
+                atexit.register(_audit_write_buffer.flush)
+    return _audit_write_buffer
+
+
+def _entry_timestamp(entry: 'AuditEntry') -> float:
+    """created_at (ISO, UTC naive) -> epoch seconds para los índices ZSET"""
+    try:
+        created = datetime.fromisoformat(entry.created_at)
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        return created.timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
 class AuditManager:
     """
     Gestor de auditoría multi-tenant.
@@ -90,9 +259,12 @@ class AuditManager:
 
     Redis Key Pattern:
         {company_prefix}audit:{audit_id} - Entrada individual
-        {company_prefix}audit:user:{user_id} - Set de audit_ids por usuario
-        {company_prefix}audit:action:{action_type} - Set de audit_ids por tipo
-        {company_prefix}audit:date:{YYYY-MM-DD} - Set de audit_ids por fecha
+        {company_prefix}audit:idx:user:{user_id} - ZSET audit_id -> timestamp por usuario
+        {company_prefix}audit:idx:action:{action_type} - ZSET audit_id -> timestamp por tipo
+        {company_prefix}audit:idx:all - ZSET audit_id -> timestamp (línea de tiempo; rangos por fecha)
+
+    Las escrituras van por ``AuditWriteBuffer`` (write-behind) salvo que se
+    cree con ``write_behind=False``; llamar a ``flush()`` fuerza la persistencia.
 
     Ejemplo:
         audit = AuditManager(company_id="benova")
@@ -119,7 +291,9 @@ class AuditManager:
         self,
         company_id: str,
         redis_client=None,
-        ttl_days: int = 90  # Retener auditoría 90 días por defecto
+        ttl_days: int = 90,  # Retener auditoría 90 días por defecto
+        write_behind: bool = True,
+        recent_cache_size: int = 1000
     ):
         """
         Inicializar gestor de auditoría.
@@ -128,9 +302,18 @@ class AuditManager:
             company_id: ID de la empresa
             redis_client: Cliente Redis (opcional)
             ttl_days: Días de retención de datos de auditoría
+            write_behind: Encolar escrituras y persistirlas en lotes en segundo plano
+            recent_cache_size: Entradas recientes mantenidas en memoria para mark_*
         """
         self.company_id = company_id
         self.ttl_seconds = ttl_days * 24 * 60 * 60
+        self.write_behind = write_behind
+        self._write_buffer = get_audit_write_buffer() if write_behind else None
+
+        # Entradas recientes: mark_success/mark_failed no releen Redis
+        self._recent: "OrderedDict[str, AuditEntry]" = OrderedDict()
+        self._recent_lock = threading.Lock()
+        self._recent_cache_size = recent_cache_size
 
         # Obtener Redis client
         if redis_client:
@@ -208,7 +391,7 @@ class AuditManager:
 
         # Guardar en Redis
         if self.redis_client:
-            self._save_entry(entry)
+            self._save_entry(entry, is_new=True)
 
         logger.info(
             f"📝 [{self.company_id}] Audit logged: {action_type}/{action_name} "
@@ -348,6 +531,11 @@ class AuditManager:
         Returns:
             AuditEntry o None si no existe
         """
+        with self._recent_lock:
+            recent = self._recent.get(audit_id)
+        if recent:
+            return recent
+
         if not self.redis_client:
             return None
 
@@ -357,6 +545,10 @@ class AuditManager:
         if not data:
             return None
 
+        return self._parse_entry(data)
+
+    def _parse_entry(self, data) -> Optional[AuditEntry]:
+        """Deserializar una entrada guardada en Redis"""
         try:
             entry_dict = json.loads(data)
             return AuditEntry.from_dict(entry_dict)
@@ -364,6 +556,78 @@ class AuditManager:
             logger.error(f"[{self.company_id}] Error parsing audit entry: {e}")
             return None
 
+    def _index_key(self, kind: str, value: str = None) -> str:
+        """Clave de índice ZSET (user/action/all)"""
+        if value is None:
+            return f"{self.redis_prefix}idx:{kind}"
+        return f"{self.redis_prefix}idx:{kind}:{value}"
+
+    def _load_from_index(
+        self,
+        index_key: str,
+        legacy_key: str,
+        limit: int,
+        predicate: Optional[Callable[[AuditEntry], bool]] = None
+    ) -> List[AuditEntry]:
+        """
+        Leer las entradas más recientes de un índice ZSET: un ZREVRANGE + un MGET
+        por página (se pagina solo si el filtro descarta entradas).
+        """
+        self.flush()
+
+        entries: List[AuditEntry] = []
+        page_size = max(limit, 1)
+        start = 0
+
+        while len(entries) < limit:
+            audit_ids = self.redis_client.zrevrange(index_key, start, start + page_size - 1)
+            if not audit_ids:
+                break
+            start += len(audit_ids)
+
+            keys = [f"{self.redis_prefix}{self._decode_id(a)}" for a in audit_ids]
+            for data in self.redis_client.mget(keys):
+                if not data:
+                    continue
+                entry = self._parse_entry(data)
+                if entry and (predicate is None or predicate(entry)):
+                    entries.append(entry)
+                    if len(entries) >= limit:
+                        break
+
+            if len(audit_ids) < page_size:
+                break
+
+        if not entries and start == 0 and legacy_key:
+            entries = self._load_from_legacy_set(legacy_key, limit, predicate)
+
+        return entries
+
+    def _load_from_legacy_set(
+        self,
+        legacy_key: str,
+        limit: int,
+        predicate: Optional[Callable[[AuditEntry], bool]] = None
+    ) -> List[AuditEntry]:
+        """Compatibilidad: índices SET anteriores a los ZSET (sin orden, un MGET)"""
+        audit_ids = self.redis_client.smembers(legacy_key)
+        if not audit_ids:
+            return []
+
+        keys = [f"{self.redis_prefix}{self._decode_id(a)}" for a in audit_ids]
+        entries = []
+        for data in self.redis_client.mget(keys):
+            entry = self._parse_entry(data) if data else None
+            if entry and (predicate is None or predicate(entry)):
+                entries.append(entry)
+
+        entries.sort(key=lambda e: e.created_at, reverse=True)
+        return entries[:limit]
+
+    @staticmethod
+    def _decode_id(audit_id) -> str:
+        return audit_id.decode('utf-8') if isinstance(audit_id, bytes) else audit_id
+
     def get_by_user(
         self,
         user_id: str,
@@ -384,21 +648,17 @@ class AuditManager:
         if not self.redis_client:
             return []
 
-        # Obtener IDs de auditoría del usuario
-        user_key = f"{self.redis_prefix}user:{user_id}"
-        audit_ids = self.redis_client.smembers(user_key)
-
-        entries = []
-        for audit_id in audit_ids:
-            entry = self.get_entry(audit_id)
-            if entry:
-                if action_type is None or entry.action_type == action_type:
-                    entries.append(entry)
-
-        # Ordenar por fecha (más reciente primero)
-        entries.sort(key=lambda e: e.created_at, reverse=True)
+        predicate = None
+        if action_type is not None:
+            predicate = lambda e: e.action_type == action_type
 
-        return entries[:limit]
+        # Más recientes primero: ZREVRANGE sobre el índice del usuario + MGET
+        return self._load_from_index(
+            self._index_key("user", user_id),
+            f"{self.redis_prefix}user:{user_id}",
+            limit,
+            predicate
+        )
 
     def get_by_action_type(
         self,
@@ -420,19 +680,56 @@ class AuditManager:
         if not self.redis_client:
             return []
 
-        action_key = f"{self.redis_prefix}action:{action_type}"
-        audit_ids = self.redis_client.smembers(action_key)
+        predicate = None
+        if status is not None:
+            predicate = lambda e: e.status == status
 
-        entries = []
-        for audit_id in audit_ids:
-            entry = self.get_entry(audit_id)
-            if entry:
-                if status is None or entry.status == status:
-                    entries.append(entry)
+        return self._load_from_index(
+            self._index_key("action", action_type),
+            f"{self.redis_prefix}action:{action_type}",
+            limit,
+            predicate
+        )
 
-        entries.sort(key=lambda e: e.created_at, reverse=True)
+    def get_by_date_range(
+        self,
+        start: datetime,
+        end: Optional[datetime] = None,
+        limit: int = 100
+    ) -> List[AuditEntry]:
+        """
+        Obtener entradas creadas en un rango de fechas (más recientes primero).
 
-        return entries[:limit]
+        Args:
+            start: Inicio del rango (naive = UTC)
+            end: Fin del rango (por defecto ahora)
+            limit: Máximo de entradas a retornar
+
+        Returns:
+            Lista de AuditEntry
+        """
+        if not self.redis_client:
+            return []
+
+        def _ts(value: datetime) -> float:
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            return value.timestamp()
+
+        self.flush()
+
+        max_score = _ts(end) if end else "+inf"
+        audit_ids = self.redis_client.zrevrangebyscore(
+            self._index_key("all"), max_score, _ts(start), start=0, num=limit
+        )
+        if not audit_ids:
+            return []
+
+        keys = [f"{self.redis_prefix}{self._decode_id(a)}" for a in audit_ids]
+        return [
+            entry for entry in (self._parse_entry(d) for d in self.redis_client.mget(keys) if d)
+            if entry
+        ]
 
     def get_compensable_actions(
         self,
@@ -490,42 +787,76 @@ class AuditManager:
             "total_entries": 0
         }
 
-        # Contar por tipo de acción
-        for action_type in ["api_call", "notification", "booking", "ticket", "agent_execution"]:
-            key = f"{self.redis_prefix}action:{action_type}"
-            count = self.redis_client.scard(key)
+        self.flush()
+
+        # Contar por tipo de acción (ZCARD en un solo pipeline)
+        action_types = ["api_call", "notification", "booking", "ticket", "agent_execution"]
+        pipe = self.redis_client.pipeline(transaction=False)
+        for action_type in action_types:
+            pipe.zcard(self._index_key("action", action_type))
+        for action_type, count in zip(action_types, pipe.execute()):
             stats["by_action_type"][action_type] = count
             stats["total_entries"] += count
 
+        if self._write_buffer:
+            stats["write_buffer"] = dict(self._write_buffer.stats)
+
         return stats
 
-    def _save_entry(self, entry: AuditEntry):
-        """Guardar entrada en Redis con indexación"""
+    def _save_entry(self, entry: AuditEntry, is_new: bool = False):
+        """
+        Guardar entrada en Redis con indexación.
+
+        Con write-behind solo se encola (sin I/O en el camino de la request);
+        en modo síncrono se escribe con un único pipeline.
+        """
         if not self.redis_client:
             return
 
-        # Guardar entrada principal
-        entry_key = f"{self.redis_prefix}{entry.audit_id}"
-        self.redis_client.set(
-            entry_key,
-            json.dumps(entry.to_dict()),
-            ex=self.ttl_seconds
-        )
+        self._remember(entry)
 
-        # Indexar por usuario
-        user_key = f"{self.redis_prefix}user:{entry.user_id}"
-        self.redis_client.sadd(user_key, entry.audit_id)
-        self.redis_client.expire(user_key, self.ttl_seconds)
+        if self._write_buffer:
+            self._write_buffer.enqueue(self, entry, is_new)
+            return
 
-        # Indexar por tipo de acción
-        action_key = f"{self.redis_prefix}action:{entry.action_type}"
-        self.redis_client.sadd(action_key, entry.audit_id)
-        self.redis_client.expire(action_key, self.ttl_seconds)
+        pipe = self.redis_client.pipeline(transaction=False)
+        touched_indexes = {}
+        indexes = self._entry_index_keys(entry) if is_new else []
+        self._queue_entry_writes(pipe, entry.audit_id, json.dumps(entry.to_dict()), indexes, touched_indexes)
+        for index_key, ttl_seconds in touched_indexes.items():
+            pipe.expire(index_key, ttl_seconds)
+        pipe.execute()
+
+    def _entry_index_keys(self, entry: AuditEntry) -> List[tuple]:
+        """Índices ZSET (clave, score) de una entrada nueva"""
+        score = _entry_timestamp(entry)
+        return [
+            (self._index_key("user", entry.user_id), score),
+            (self._index_key("action", entry.action_type), score),
+            (self._index_key("all"), score)
+        ]
 
-        # Indexar por fecha
-        date_key = f"{self.redis_prefix}date:{entry.created_at[:10]}"  # YYYY-MM-DD
-        self.redis_client.sadd(date_key, entry.audit_id)
-        self.redis_client.expire(date_key, self.ttl_seconds)
+    def _queue_entry_writes(self, pipe, audit_id: str, payload: str, indexes: List[tuple], touched_indexes: Dict[str, int]):
+        """Agregar al pipeline el SET de la entrada y, si es nueva, sus índices ZSET"""
+        pipe.set(f"{self.redis_prefix}{audit_id}", payload, ex=self.ttl_seconds)
+
+        # Las actualizaciones de estado no cambian created_at: solo las entradas nuevas indexan
+        for index_key, score in indexes:
+            pipe.zadd(index_key, {audit_id: score})
+            touched_indexes[index_key] = self.ttl_seconds
+
+    def _remember(self, entry: AuditEntry):
+        """Mantener la entrada en la caché local de recientes (LRU acotada)"""
+        with self._recent_lock:
+            self._recent[entry.audit_id] = entry
+            self._recent.move_to_end(entry.audit_id)
+            while len(self._recent) > self._recent_cache_size:
+                self._recent.popitem(last=False)
+
+    def flush(self):
+        """Forzar la persistencia de las escrituras pendientes (write-behind)"""
+        if self._write_buffer:
+            self._write_buffer.flush()
 
     def clear_user_data(self, user_id: str):
         """
@@ -537,16 +868,32 @@ class AuditManager:
         if not self.redis_client:
             return
 
-        user_key = f"{self.redis_prefix}user:{user_id}"
-        audit_ids = self.redis_client.smembers(user_key)
+        self.flush()
 
-        # Eliminar todas las entradas
-        for audit_id in audit_ids:
-            entry_key = f"{self.redis_prefix}{audit_id}"
-            self.redis_client.delete(entry_key)
+        user_index = self._index_key("user", user_id)
+        legacy_key = f"{self.redis_prefix}user:{user_id}"
+        audit_ids = [self._decode_id(a) for a in self.redis_client.zrange(user_index, 0, -1)]
+        audit_ids += [self._decode_id(a) for a in self.redis_client.smembers(legacy_key)]
 
-        # Eliminar índice de usuario
-        self.redis_client.delete(user_key)
+        # Obtener tipos de acción para limpiar los demás índices
+        keys = [f"{self.redis_prefix}{audit_id}" for audit_id in audit_ids]
+        entries = [self._parse_entry(d) for d in self.redis_client.mget(keys) if d] if keys else []
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for entry in entries:
+            if entry:
+                pipe.zrem(self._index_key("action", entry.action_type), entry.audit_id)
+        if audit_ids:
+            pipe.zrem(self._index_key("all"), *audit_ids)
+            pipe.delete(*keys)
+
+        # Eliminar índices de usuario
+        pipe.delete(user_index, legacy_key)
+        pipe.execute()
+
+        with self._recent_lock:
+            for audit_id in audit_ids:
+                self._recent.pop(audit_id, None)
 
         logger.info(
             f"🗑️ [{self.company_id}] Cleared audit data for user: {user_id} "
@@ -1,6 +1,15 @@
 from app.services.redis_service import get_redis_client
 from app.config.company_config import get_company_config
+from app.config.constants import REDIS_KEY_PATTERNS, REDIS_TTL
 from langchain_community.chat_message_histories import RedisChatMessageHistory
+from app.services.conversation_summarizer import (
+    ConversationSummarizer,
+    SUMMARY_SETTLE_DELAY,
+    format_summary_context,
+    summary_config,
+    summary_keys
+)
+from app.services.prompt_budgeter import PINNED_MESSAGE_KWARG
 from langchain_core.messages import HumanMessage, AIMessage
 import logging
 import json
@@ -9,6 +18,40 @@ from typing import Dict, Any, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# KEYS = historial, índice de actividad, contadores, stats; ARGV = user_id, last activity, actualizar last_activity.
+# ZADD GT: un backfill concurrente nunca retrocede la actividad que registró un mensaje nuevo.
+# El contador del usuario se deriva de LLEN (ya aplicada la ventana) y el total se ajusta por la diferencia,
+# así la ventana que recorta el historial nunca deja contadores inflados
+SYNC_CONVERSATION_LUA = """
+local length = redis.call('LLEN', KEYS[1])
+if length == 0 then
+    return 0
+end
+local previous = tonumber(redis.call('HGET', KEYS[3], ARGV[1]) or '0')
+redis.call('ZADD', KEYS[2], 'GT', ARGV[2], ARGV[1])
+redis.call('HSET', KEYS[3], ARGV[1], length)
+if length ~= previous then
+    redis.call('HINCRBY', KEYS[4], 'total_messages', length - previous)
+end
+if ARGV[3] == '1' then
+    redis.call('HSET', KEYS[4], 'last_activity', ARGV[2])
+end
+return length
+"""
+
+# KEYS = contadores, stats; ARGV = timestamp. Total exacto + marca de índice completo (fin del backfill)
+FINISH_INDEX_LUA = """
+local total = 0
+for _, count in ipairs(redis.call('HVALS', KEYS[1])) do
+    total = total + tonumber(count)
+end
+redis.call('HSET', KEYS[2], 'total_messages', total, 'index_built_at', ARGV[1])
+return total
+"""
+
+# Tope de un backfill; luego otro request puede reintentarlo
+INDEX_REBUILD_LOCK_TTL = 300
+
 class ConversationManager:
     """Gestión modularizada de conversaciones multi-tenant"""
     
@@ -17,14 +60,25 @@ class ConversationManager:
         self.company_config = get_company_config(self.company_id)
         
         # Configurar prefijo específico de empresa
-        if self.company_config:
-            self.redis_prefix = self.company_config.redis_prefix + "conversation:"
-        else:
-            self.redis_prefix = f"{self.company_id}:conversation:"
+        company_prefix = self.company_config.redis_prefix if self.company_config else f"{self.company_id}:"
+        self.redis_prefix = company_prefix + "conversation:"
+        
+        # Índice de actividad por empresa (evita KEYS + lectura de historiales completos)
+        self.activity_key = REDIS_KEY_PATTERNS["conversation_activity"].format(company_prefix=company_prefix)
+        self.counts_key = REDIS_KEY_PATTERNS["conversation_counts"].format(company_prefix=company_prefix)
+        self.stats_key = REDIS_KEY_PATTERNS["conversation_stats"].format(company_prefix=company_prefix)
+        self.history_ttl = REDIS_TTL["conversation"]
+        self.company_prefix = company_prefix
+        
+        # Turnos desalojados de la ventana → resumen en background (ConversationSummarizer)
+        config = summary_config()
+        self.summary_enabled = config["CONVERSATION_SUMMARY_ENABLED"]
+        self.summary_min_pending = config["CONVERSATION_SUMMARY_MIN_PENDING"]
         
         self.redis_client = get_redis_client()
         self.max_messages = max_messages
         self.message_histories = {}
+        self._sync_script = None
         
         logger.info(f"ConversationManager initialized for company: {self.company_id}")
     
@@ -96,6 +150,7 @@ class ConversationManager:
                 history.add_ai_message(content)
             
             self._apply_message_window(company_user_id)
+            self._touch_activity_index(company_user_id)
             
             # Log con contexto de empresa
             logger.debug(f"[{self.company_id}] Message added for user {company_user_id}")
@@ -124,7 +179,7 @@ class ConversationManager:
                 session_id=session_key,
                 url=redis_url,
                 key_prefix="",  # Ya incluido en session_id
-                ttl=604800  # 7 días
+                ttl=self.history_ttl  # 7 días
             )
         
         return self.message_histories[user_id]
@@ -139,6 +194,7 @@ class ConversationManager:
             messages = history.messages
             if len(messages) > self.max_messages:
                 messages_to_keep = messages[-self.max_messages:]
+                self._queue_for_summary(user_id, messages[:-self.max_messages])
                 history.clear()
                 for message in messages_to_keep:
                     history.add_message(message)
@@ -146,42 +202,346 @@ class ConversationManager:
         except Exception as e:
             logger.error(f"[{self.company_id}] Error applying message window: {e}")
     
-    def list_conversations(self, page: int = 1, page_size: int = 50) -> Dict[str, Any]:
-        """List conversations specific to company"""
+    # ------------------------------------------------------------------
+    # Resumen de turnos desalojados (se calcula fuera del hot path)
+    # ------------------------------------------------------------------
+    
+    def _queue_for_summary(self, company_user_id: str, evicted: List[Any]):
+        """
+        Guardar los turnos desalojados y encolar al usuario para resumir.
+        
+        Solo escrituras en Redis: la llamada al modelo la hace el
+        ConversationSummarizer cuando hay al menos `summary_min_pending` turnos.
+        """
+        if not self.summary_enabled or not evicted:
+            return
+        
+        try:
+            _, pending_key = summary_keys(self.company_prefix, company_user_id)
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.rpush(pending_key, *[
+                json.dumps({
+                    "role": "user" if isinstance(message, HumanMessage) else "assistant",
+                    "content": message.content
+                }, ensure_ascii=False)
+                for message in evicted
+            ])
+            pipe.expire(pending_key, self.history_ttl)
+            pending_count, _ = pipe.execute()
+            
+            if pending_count >= self.summary_min_pending:
+                self.redis_client.zadd(
+                    ConversationSummarizer.QUEUE_KEY,
+                    {ConversationSummarizer.queue_member(self.company_id, company_user_id): time.time() + SUMMARY_SETTLE_DELAY},
+                    nx=True
+                )
+        except Exception as e:
+            logger.warning(f"[{self.company_id}] Could not queue evicted messages for summary: {e}")
+    
+    def get_conversation_summary(self, user_id: str) -> Optional[str]:
+        """Resumen acumulado de los turnos que ya salieron de la ventana"""
+        if not user_id or not self.summary_enabled:
+            return None
+        
         try:
-            # Buscar solo conversaciones de esta empresa
-            pattern = f"{self.redis_prefix}*"
-            all_keys = self.redis_client.keys(pattern)
-            
-            # Extract user IDs (removing company prefix)
-            user_ids = []
-            for key in all_keys:
-                if key.startswith(self.redis_prefix):
-                    user_id = key[len(self.redis_prefix):]
-                    user_ids.append(user_id)
-            
-            # Pagination
-            total_conversations = len(user_ids)
-            start_idx = (page - 1) * page_size
-            end_idx = start_idx + page_size
-            paginated_user_ids = user_ids[start_idx:end_idx]
+            company_user_id = self._ensure_company_prefix(user_id)
+            summary_key, _ = summary_keys(self.company_prefix, company_user_id)
+            raw = self.redis_client.get(summary_key)
+            return json.loads(raw).get("summary") if raw else None
+        except Exception as e:
+            logger.warning(f"[{self.company_id}] Error reading conversation summary: {e}")
+            return None
+    
+    def get_context_history(self, user_id: str) -> List[Any]:
+        """
+        Historial para los agentes: resumen de la conversación previa (si
+        existe) + los últimos `max_messages` turnos.
+        
+        El resumen sale de texto del cliente, así que nunca va como
+        SystemMessage: viaja como mensaje de usuario delimitado y marcado
+        como historial no confiable (ver format_summary_context), fijado
+        para que fit_history nunca lo descarte.
+        """
+        messages = self.get_chat_history(user_id, format_type="messages") or []
+        summary = self.get_conversation_summary(user_id)
+        if not summary:
+            return messages
+        # Fijado: el presupuesto de historial descarta turnos viejos, nunca el resumen
+        pinned_summary = HumanMessage(
+            content=format_summary_context(summary),
+            additional_kwargs={PINNED_MESSAGE_KWARG: True}
+        )
+        return [pinned_summary] + list(messages)
+    
+    # ------------------------------------------------------------------
+    # Índice de actividad (ZSET last-activity + HASH de contadores)
+    # ------------------------------------------------------------------
+    
+    def _sync_conversation(self, company_user_id: str, last_activity: float, touch_stats: bool = True) -> int:
+        """Índice + contador del usuario según LLEN del historial (script atómico)"""
+        if self._sync_script is None:
+            self._sync_script = self.redis_client.register_script(SYNC_CONVERSATION_LUA)
+        return int(self._sync_script(
+            keys=[f"{self.redis_prefix}{company_user_id}", self.activity_key, self.counts_key, self.stats_key],
+            args=[company_user_id, last_activity, "1" if touch_stats else "0"]
+        ) or 0)
+    
+    def _touch_activity_index(self, company_user_id: str, timestamp: float = None):
+        """Update activity sorted set and message counters in one round trip"""
+        try:
+            self._sync_conversation(company_user_id, timestamp or time.time())
+        except Exception as e:
+            logger.warning(f"[{self.company_id}] Error updating conversation activity index: {e}")
+    
+    def _ensure_activity_index(self):
+        """
+        Backfill the activity index once for conversations created before it existed.
+        
+        Uses SCAN (never KEYS). A short lock keeps it to one request per company,
+        and ``index_built_at`` is only written when the backfill completes, so a
+        failed rebuild is retried by a later request.
+        """
+        try:
+            if self.redis_client.hexists(self.stats_key, "index_built_at"):
+                return
+            lock_key = f"{self.stats_key}:rebuilding"
+            if not self.redis_client.set(lock_key, time.time(), nx=True, ex=INDEX_REBUILD_LOCK_TTL):
+                return
+            try:
+                self.rebuild_activity_index()
+            finally:
+                self.redis_client.delete(lock_key)
+        except Exception as e:
+            logger.warning(f"[{self.company_id}] Could not ensure conversation activity index: {e}")
+    
+    def rebuild_activity_index(self, batch_size: int = 500) -> int:
+        """Rebuild activity index and counters from the stored histories (SCAN based)"""
+        now = time.time()
+        indexed = 0
+        batch = []
+        
+        def _flush(keys):
+            nonlocal indexed
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.ttl(key)
+            ttls = pipe.execute()
+            
+            for key, ttl in zip(keys, ttls):
+                # La TTL del historial se renueva en cada mensaje: de ahí sale la última actividad
+                last_activity = now - (self.history_ttl - ttl) if ttl and ttl > 0 else now
+                if self._sync_conversation(key[len(self.redis_prefix):], last_activity, touch_stats=False):
+                    indexed += 1
+        
+        for key in self.redis_client.scan_iter(match=f"{self.redis_prefix}*", count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                _flush(batch)
+                batch = []
+        if batch:
+            _flush(batch)
+        
+        self.redis_client.register_script(FINISH_INDEX_LUA)(keys=[self.counts_key, self.stats_key], args=[now])
+        
+        logger.info(f"[{self.company_id}] Conversation activity index rebuilt: {indexed} conversations")
+        return indexed
+    
+    def _prune_expired_index_entries(self, limit: int = 500) -> int:
+        """Drop index entries whose history already expired (TTL is refreshed on activity)"""
+        try:
+            cutoff = time.time() - self.history_ttl
+            expired = self.redis_client.zrangebyscore(self.activity_key, "-inf", cutoff, start=0, num=limit)
+            if expired:
+                self._remove_from_index(expired)
+            return len(expired)
+        except Exception as e:
+            logger.warning(f"[{self.company_id}] Error pruning conversation index: {e}")
+            return 0
+    
+    def _remove_from_index(self, company_user_ids: List[str]):
+        """Remove users from the activity index and adjust counters"""
+        if not company_user_ids:
+            return
+        counts = self.redis_client.hmget(self.counts_key, company_user_ids)
+        removed_messages = sum(int(c) for c in counts if c)
+        
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.zrem(self.activity_key, *company_user_ids)
+        pipe.hdel(self.counts_key, *company_user_ids)
+        if removed_messages:
+            pipe.hincrby(self.stats_key, "total_messages", -removed_messages)
+        pipe.execute()
+    
+    @staticmethod
+    def _encode_cursor(score: float, skip: int) -> str:
+        return f"{score!r}:{skip}"
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[float, int]:
+        score, _, skip = cursor.rpartition(":")
+        return float(score), int(skip or 0)
+    
+    @staticmethod
+    def _parse_raw_messages(raw_items: List[str]) -> List[Dict[str, str]]:
+        """Convert raw RedisChatMessageHistory items (newest first) to chronological dicts"""
+        messages = []
+        for raw in reversed(raw_items or []):
+            try:
+                item = json.loads(raw)
+                messages.append({
+                    "role": "user" if item.get("type") == "human" else "assistant",
+                    "content": item.get("data", {}).get("content", "")
+                })
+            except (TypeError, ValueError):
+                continue
+        return messages
+    
+    def _fetch_previews(self, company_user_ids: List[str], preview_size: int) -> List[List[Dict[str, str]]]:
+        """Fetch the last messages of many conversations with a single pipeline"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for company_user_id in company_user_ids:
+            # RedisChatMessageHistory hace LPUSH: el mensaje más reciente está en el índice 0
+            pipe.lrange(f"{self.redis_prefix}{company_user_id}", 0, preview_size - 1)
+        return [self._parse_raw_messages(raw_items) for raw_items in pipe.execute()]
+    
+    def iter_conversations(self, since: float = None, until: float = None, cursor: str = None,
+                           batch_size: int = 100, limit: int = None):
+        """
+        Iterate over the company's conversations in ascending last-activity order.
+        
+        Walks the activity index in batches of ``batch_size`` (ZRANGEBYSCORE + one
+        pipelined LRANGE per batch), so memory stays bounded by the batch no matter
+        how many conversations the tenant has. Every yielded item carries a
+        ``cursor`` that resumes the iteration right after it.
+        """
+        self._ensure_activity_index()
+        
+        if cursor:
+            min_score, skip = self._decode_cursor(cursor)
+        else:
+            min_score, skip = (since if since is not None else "-inf"), 0
+        max_score = until if until is not None else "+inf"
+        yielded = 0
+        
+        while True:
+            entries = self.redis_client.zrangebyscore(
+                self.activity_key, min_score, max_score,
+                start=skip, num=batch_size, withscores=True
+            )
+            if not entries:
+                return
+            
+            pipe = self.redis_client.pipeline(transaction=False)
+            for company_user_id, _ in entries:
+                pipe.lrange(f"{self.redis_prefix}{company_user_id}", 0, -1)
+            raw_histories = pipe.execute()
+            
+            for (company_user_id, score), raw_items in zip(entries, raw_histories):
+                if score == min_score:
+                    skip += 1
+                else:
+                    min_score, skip = score, 1
+                
+                if not raw_items:
+                    continue
+                
+                yield {
+                    "company_id": self.company_id,
+                    "user_id": company_user_id,
+                    "last_activity": score,
+                    "messages": self._parse_raw_messages(raw_items),
+                    "cursor": self._encode_cursor(min_score, skip)
+                }
+                
+                yielded += 1
+                if limit and yielded >= limit:
+                    return
+    
+    def get_conversation_export(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Full history + last activity of one conversation in a single round trip (export)"""
+        if not user_id:
+            return None
+        company_user_id = self._ensure_company_prefix(user_id)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.lrange(f"{self.redis_prefix}{company_user_id}", 0, -1)
+        pipe.zscore(self.activity_key, company_user_id)
+        raw_items, last_activity = pipe.execute()
+        if not raw_items:
+            return None
+        return {
+            "company_id": self.company_id,
+            "user_id": company_user_id,
+            "last_activity": last_activity,
+            "messages": self._parse_raw_messages(raw_items)
+        }
+    
+    def list_conversations(self, page: int = 1, page_size: int = 50,
+                           cursor: str = None, preview_size: int = None) -> Dict[str, Any]:
+        """
+        List conversations specific to company, most recent activity first.
+        
+        Reads the per-company activity index (ZREVRANGE) and fetches previews with
+        one pipelined LRANGE per page. ``cursor`` (returned as ``next_cursor``)
+        gives stable pagination while new messages arrive; ``page`` is kept for
+        compatibility.
+        """
+        preview_size = preview_size or self.max_messages
+        try:
+            self._ensure_activity_index()
+            
+            if cursor:
+                max_score, skip = self._decode_cursor(cursor)
+                entries = self.redis_client.zrevrangebyscore(
+                    self.activity_key, max_score, "-inf",
+                    start=skip, num=page_size, withscores=True
+                )
+            else:
+                start_idx = (page - 1) * page_size
+                entries = self.redis_client.zrevrange(
+                    self.activity_key, start_idx, start_idx + page_size - 1, withscores=True
+                )
+                max_score, skip = None, 0
+            
+            company_user_ids = [member for member, _ in entries]
+            previews = self._fetch_previews(company_user_ids, preview_size) if company_user_ids else []
+            counts = self.redis_client.hmget(self.counts_key, company_user_ids) if company_user_ids else []
             
             conversations = []
-            for user_id in paginated_user_ids:
-                try:
-                    details = self.get_conversation_details(user_id)
-                    if details:
-                        conversations.append(details)
-                except Exception as e:
-                    logger.warning(f"[{self.company_id}] Error getting details for {user_id}: {e}")
+            expired = []
+            for (company_user_id, score), messages, count in zip(entries, previews, counts):
+                if not messages:
+                    expired.append(company_user_id)
                     continue
+                conversations.append({
+                    "company_id": self.company_id,
+                    "user_id": company_user_id,
+                    "full_user_id": company_user_id,
+                    "message_count": int(count) if count else len(messages),
+                    "user_message_count": sum(1 for m in messages if m["role"] == "user"),
+                    "assistant_message_count": sum(1 for m in messages if m["role"] == "assistant"),
+                    "messages": messages,
+                    "last_updated": score,
+                    "created_at": None
+                })
+            
+            if expired:
+                self._remove_from_index(expired)
+            
+            next_cursor = None
+            if len(entries) == page_size:
+                last_score = entries[-1][1]
+                same_score = sum(1 for _, score in entries if score == last_score)
+                if max_score is not None and last_score == max_score:
+                    same_score += skip
+                next_cursor = self._encode_cursor(last_score, same_score)
             
             return {
                 "company_id": self.company_id,
-                "total_conversations": total_conversations,
+                "total_conversations": self.redis_client.zcard(self.activity_key),
                 "page": page,
                 "page_size": page_size,
-                "conversations": conversations
+                "conversations": conversations,
+                "next_cursor": next_cursor
             }
             
         except Exception as e:
@@ -191,7 +551,8 @@ class ConversationManager:
                 "total_conversations": 0,
                 "page": page,
                 "page_size": page_size,
-                "conversations": []
+                "conversations": [],
+                "next_cursor": None
             }
     
     def get_conversation_details(self, user_id: str) -> Optional[Dict[str, Any]]:
@@ -210,13 +571,11 @@ class ConversationManager:
             user_messages = [msg for msg in messages if msg["role"] == "user"]
             assistant_messages = [msg for msg in messages if msg["role"] == "assistant"]
             
-            # Get last activity timestamp
+            # Get last activity timestamp from the activity index
             last_updated = None
             try:
-                history_key = f"{self.redis_prefix}{company_user_id}"
-                if self.redis_client.exists(history_key):
-                    last_updated = time.time()
-            except:
+                last_updated = self.redis_client.zscore(self.activity_key, company_user_id)
+            except Exception:
                 pass
             
             return {
@@ -256,10 +615,15 @@ class ConversationManager:
             if self.redis_client.exists(history_key):
                 keys_to_delete.append(history_key)
             
+            # Resumen y turnos pendientes de resumir
+            keys_to_delete.extend(summary_keys(self.company_prefix, company_user_id))
+            
             # Delete all related keys
             if keys_to_delete:
                 self.redis_client.delete(*keys_to_delete)
             
+            self._remove_from_index([company_user_id])
+            
             logger.info(f"[{self.company_id}] Cleared conversation for user {user_id}")
             return True
             
@@ -267,34 +631,33 @@ class ConversationManager:
             logger.error(f"[{self.company_id}] Error clearing conversation for {user_id}: {e}")
             return False
     
-    def get_conversation_stats(self) -> Dict[str, Any]:
-        """Get conversation statistics for this company"""
+    def get_conversation_stats(self, active_window_seconds: int = 86400) -> Dict[str, Any]:
+        """
+        Get conversation statistics for this company from maintained counters.
+        
+        ``active_conversations`` counts conversations with activity inside
+        ``active_window_seconds`` (ZCOUNT on the activity index).
+        """
         try:
-            # Get conversations specific to this company
-            pattern = f"{self.redis_prefix}*"
-            all_keys = self.redis_client.keys(pattern)
-            
-            total_conversations = len(all_keys)
-            total_messages = 0
-            active_conversations = 0
-            
-            for key in all_keys[:100]:  # Limit for performance
-                try:
-                    if key.startswith(self.redis_prefix):
-                        user_id = key[len(self.redis_prefix):]
-                        messages = self.get_chat_history(user_id, format_type="dict")
-                        if messages:
-                            total_messages += len(messages)
-                            active_conversations += 1
-                except:
-                    continue
+            self._ensure_activity_index()
+            self._prune_expired_index_entries()
+            
+            now = time.time()
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.zcard(self.activity_key)
+            pipe.zcount(self.activity_key, now - active_window_seconds, "+inf")
+            pipe.hmget(self.stats_key, ["total_messages", "last_activity"])
+            total_conversations, active_conversations, (total_messages, last_activity) = pipe.execute()
+            
+            total_messages = max(int(total_messages or 0), 0)
             
             return {
                 "company_id": self.company_id,
                 "total_conversations": total_conversations,
                 "active_conversations": active_conversations,
                 "total_messages": total_messages,
-                "average_messages_per_conversation": round(total_messages / max(active_conversations, 1), 2)
+                "average_messages_per_conversation": round(total_messages / max(total_conversations, 1), 2),
+                "last_activity": float(last_activity) if last_activity else None
             }
             
         except Exception as e:
@@ -216,7 +216,7 @@ class DocumentManager:
             existing_doc_ids.add(doc_id)
         
         # Get all vectors for this company's index
-        vector_pattern = f"{vectorstore_service.index_name}:*"
+        vector_pattern = vectorstore_service.documents_pattern
         vector_keys = self.redis_client.keys(vector_pattern)
         
         orphaned_vectors = []
@@ -279,7 +279,7 @@ class DocumentManager:
     def get_diagnostics(self, vectorstore_service) -> Dict[str, Any]:
         """Get system diagnostics for this company"""
         doc_keys = self.redis_client.keys(f"{self.redis_prefix}*")
-        vector_keys = self.redis_client.keys(f"{vectorstore_service.index_name}:*")
+        vector_keys = self.redis_client.keys(vectorstore_service.documents_pattern)
         
         # Filter vectors by company
         company_vectors = []
@@ -484,15 +484,8 @@ class DocumentManager:
                 orchestrator = factory.get_orchestrator(self.company_id)
                 
                 if orchestrator and orchestrator.vectorstore_service:
-                    # Intentar obtener conteo de vectores
-                    index = orchestrator.vectorstore_service.redis_client.ft(
-                        orchestrator.vectorstore_service.index_name
-                    )
-                    info = index.info()
-                    
-                    # El conteo total de documentos en el índice
-                    total_vectors = info.get('num_docs', total_chunks)
-                    stats['total_vectors'] = total_vectors
+                    # Conteo de documentos de la empresa en el índice (propio o compartido)
+                    stats['total_vectors'] = orchestrator.vectorstore_service.indexed_document_count()
                 else:
                     # Fallback: asumir 1 vector por chunk
                     stats['total_vectors'] = total_chunks
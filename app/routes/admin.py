@@ -740,7 +740,7 @@ def force_vectorstore_recovery():
             return create_success_response({
                 "company_id": company_id,
                 "message": f"Index recovery completed successfully for {company_id}",
-                "new_health": auto_recovery.verify_index_health()
+                "new_health": auto_recovery.check_now()
             })
         else:
             return create_error_response(f"Index recovery failed for {company_id}", 500)
@@ -827,6 +827,71 @@ def vectorstore_health_check():
             "message": str(e)
         }), 500
 
+@bp.route('/vectorstore/reindex', methods=['GET'])
+@handle_errors
+def vectorstore_reindex_status():
+    """Estado del alias del índice vectorial, memoria y progreso del re-index"""
+    try:
+        company_id = _get_company_id_from_request()
+        
+        company_manager = get_company_manager()
+        if not company_manager.validate_company_id(company_id):
+            return create_error_response(f"Invalid company_id: {company_id}", 400)
+        
+        from app.services.vector_index import get_vector_index_status
+        
+        return create_success_response(get_vector_index_status(company_id))
+        
+    except Exception as e:
+        return create_error_response(str(e), 500)
+
+@bp.route('/vectorstore/reindex', methods=['POST'])
+@handle_errors
+def vectorstore_reindex():
+    """Re-index en línea a vector_settings de la empresa (o a settings/mode del body)"""
+    try:
+        from flask import current_app
+        
+        company_id = _get_company_id_from_request()
+        
+        company_manager = get_company_manager()
+        if not company_manager.validate_company_id(company_id):
+            return create_error_response(f"Invalid company_id: {company_id}", 400)
+        
+        from app.services.vector_index import (
+            INDEX_MODES, VectorSettings, index_mode_for_company, settings_for_company, start_reindex
+        )
+        
+        data = request.get_json(silent=True) or {}
+        company_config = company_manager.get_company_config(company_id)
+        settings = settings_for_company(company_config)
+        try:
+            if data.get('settings'):
+                settings = VectorSettings.from_dict(data['settings'], base=settings)
+            mode = str(data.get('mode') or index_mode_for_company(company_config)).lower()
+            if mode not in INDEX_MODES:
+                raise ValueError(f"mode must be one of {list(INDEX_MODES)}")
+        except (TypeError, ValueError) as e:
+            return create_error_response(f"Invalid vector settings: {e}", 400)
+        
+        started = start_reindex(
+            current_app._get_current_object(), company_id, settings, mode=mode,
+            drop_old=bool(data.get('drop_old', True))
+        )
+        if not started:
+            return create_error_response(f"Re-index already running for {company_id}", 409)
+        
+        logger.info(f"[{company_id}] Vector re-index started ({mode}): {settings.to_dict()}")
+        return create_success_response({
+            "company_id": company_id,
+            "message": "Re-index started; poll GET /api/admin/vectorstore/reindex for progress",
+            "mode": mode,
+            "settings": settings.to_dict()
+        }, 202)
+        
+    except Exception as e:
+        return create_error_response(str(e), 500)
+
 @bp.route('/system/reset', methods=['POST'])
 @handle_errors
 def reset_system():
@@ -37,9 +37,10 @@ def list_conversations():
         
         page = int(request.args.get('page', 1))
         page_size = min(int(request.args.get('page_size', 50)), 100)
+        cursor = request.args.get('cursor')
         
         manager = ConversationManager(company_id=company_id)
-        conversations = manager.list_conversations(page, page_size)
+        conversations = manager.list_conversations(page, page_size, cursor=cursor)
         
         return create_success_response(conversations)
         
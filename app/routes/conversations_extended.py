@@ -1,6 +1,10 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from app.config.company_config import get_company_manager
 from app.utils.helpers import create_success_response, create_error_response
+from datetime import datetime, timezone
+import csv
+import io
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,21 +25,17 @@ def get_conversations_stats():
         if not company_manager.validate_company_id(company_id):
             return create_error_response(f"Invalid company_id: {company_id}", 400)
         
-        # Estadísticas simuladas
+        # Estadísticas desde el índice de actividad (contadores O(1))
+        from app.models.conversation import ConversationManager
+        manager_stats = ConversationManager(company_id=company_id).get_conversation_stats()
+        
         stats = {
             "company_id": company_id,
-            "total_conversations": 127,
-            "active_conversations": 12,
-            "total_messages": 1543,
-            "avg_messages_per_conversation": 12.1,
-            "most_used_agents": {
-                "sales_agent": 45,
-                "support_agent": 38,
-                "router_agent": 44
-            },
-            "conversations_today": 8,
-            "conversations_this_week": 32,
-            "last_activity": "2025-01-15T14:22:00Z"
+            "total_conversations": manager_stats.get("total_conversations", 0),
+            "active_conversations": manager_stats.get("active_conversations", 0),
+            "total_messages": manager_stats.get("total_messages", 0),
+            "avg_messages_per_conversation": manager_stats.get("average_messages_per_conversation", 0),
+            "last_activity": manager_stats.get("last_activity")
         }
         
         return create_success_response({
@@ -125,52 +125,160 @@ def clear_user_conversations(user_id):
         logger.error(f"Error clearing conversations for user {user_id}: {e}")
         return create_error_response(str(e), 500)
 
+# ============================================================================
+# EXPORTACIÓN (streaming NDJSON / CSV)
+# ============================================================================
+
+EXPORT_CSV_COLUMNS = ["company_id", "user_id", "last_activity", "message_index", "role", "content", "cursor"]
+
+
+def _parse_export_timestamp(value):
+    """Parse epoch seconds or ISO-8601 date/datetime (naive = UTC) into epoch seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def _csv_lines(records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def _flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return line
+
+    writer.writerow(EXPORT_CSV_COLUMNS)
+    yield _flush()
+
+    for record in records:
+        for index, message in enumerate(record.get("messages", [])):
+            writer.writerow([
+                record.get("company_id"),
+                record.get("user_id"),
+                record.get("last_activity"),
+                index,
+                message.get("role"),
+                message.get("content"),
+                record.get("cursor")
+            ])
+        yield _flush()
+
+
+def _streaming_export_response(records, format_type: str, filename: str):
+    """Build a streaming Flask response; records is a lazy iterator"""
+    if format_type == 'csv':
+        body, mimetype, extension = _csv_lines(records), 'text/csv', 'csv'
+    else:
+        body, mimetype, extension = _ndjson_lines(records), 'application/x-ndjson', 'ndjson'
+
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    response.headers['X-Accel-Buffering'] = 'no'  # no bufferizar en proxies
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@conversations_extended_bp.route('/export', methods=['GET'])
+def export_company_conversations():
+    """
+    Exportar todas las conversaciones de una empresa en streaming (NDJSON o CSV).
+
+    Query params: format (ndjson|csv), since/until (epoch o ISO-8601, sobre la
+    última actividad), cursor (reanudar), limit, batch_size.
+    """
+    try:
+        company_id = request.args.get('company_id') or request.headers.get('X-Company-ID')
+        format_type = request.args.get('format', 'ndjson').lower()
+
+        if not company_id:
+            return create_error_response("company_id is required", 400)
+
+        if format_type not in ('ndjson', 'csv'):
+            return create_error_response(f"Unsupported export format: {format_type}", 400)
+
+        # Validar empresa
+        company_manager = get_company_manager()
+        if not company_manager.validate_company_id(company_id):
+            return create_error_response(f"Invalid company_id: {company_id}", 400)
+
+        try:
+            since = _parse_export_timestamp(request.args.get('since'))
+            until = _parse_export_timestamp(request.args.get('until'))
+        except ValueError as e:
+            return create_error_response(f"Invalid date filter: {e}", 400)
+
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', type=int)
+        batch_size = min(max(request.args.get('batch_size', 100, type=int), 1), 500)
+
+        from app.models.conversation import ConversationManager
+        manager = ConversationManager(company_id=company_id)
+
+        records = manager.iter_conversations(
+            since=since, until=until, cursor=cursor,
+            batch_size=batch_size, limit=limit
+        )
+
+        logger.info(f"[{company_id}] Streaming conversation export (format={format_type}, cursor={cursor})")
+        return _streaming_export_response(records, format_type, f"{company_id}_conversations")
+
+    except Exception as e:
+        logger.error(f"Error exporting conversations for company {company_id if 'company_id' in locals() else 'unknown'}: {e}")
+        return create_error_response(str(e), 500)
+
+
 @conversations_extended_bp.route('/<conversation_id>/export', methods=['GET'])
 def export_conversation(conversation_id):
-    """Exportar una conversación"""
+    """Exportar una conversación (json, ndjson o csv)"""
     try:
         company_id = request.args.get('company_id') or request.headers.get('X-Company-ID')
-        format_type = request.args.get('format', 'json')
+        format_type = request.args.get('format', 'json').lower()
         
         if not company_id:
             return create_error_response("company_id is required", 400)
+
+        if format_type not in ('json', 'ndjson', 'csv'):
+            return create_error_response(f"Unsupported export format: {format_type}", 400)
         
         # Validar empresa
         company_manager = get_company_manager()
         if not company_manager.validate_company_id(company_id):
             return create_error_response(f"Invalid company_id: {company_id}", 400)
         
-        # Datos de conversación simulados
+        from app.models.conversation import ConversationManager
+        manager = ConversationManager(company_id=company_id)
+        # Una sola lectura del historial (LRANGE + ZSCORE en un pipeline)
+        record = manager.get_conversation_export(conversation_id)
+
+        if not record:
+            return create_error_response(f"Conversation not found: {conversation_id}", 404)
+
         conversation_data = {
             "id": conversation_id,
             "company_id": company_id,
+            "user_id": record["user_id"],
+            "last_activity": record["last_activity"],
             "export_format": format_type,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": "Hola, necesito información sobre sus servicios",
-                    "timestamp": "2025-01-15T14:00:00Z"
-                },
-                {
-                    "role": "assistant",
-                    "content": f"¡Hola! Estaré encantado de ayudarte con información sobre nuestros servicios de {company_id}...",
-                    "agent_used": "sales_agent",
-                    "timestamp": "2025-01-15T14:00:30Z"
-                },
-                {
-                    "role": "user",
-                    "content": "¿Cuáles son sus horarios?",
-                    "timestamp": "2025-01-15T14:01:00Z"
-                },
-                {
-                    "role": "assistant",
-                    "content": "Nuestros horarios de atención son de lunes a viernes de 9:00 AM a 6:00 PM.",
-                    "agent_used": "support_agent",
-                    "timestamp": "2025-01-15T14:01:30Z"
-                }
-            ],
-            "exported_at": "2025-01-15T15:00:00Z"
+            "messages": record["messages"],
+            "exported_at": datetime.now(timezone.utc).isoformat()
         }
+
+        if format_type != 'json':
+            return _streaming_export_response(iter([conversation_data]), format_type, f"{company_id}_{conversation_id}")
         
         return create_success_response({
             "conversation": conversation_data,
@@ -10,6 +10,15 @@ import os
 import time
 from datetime import datetime
 
+from app.services.prompt_budgeter import get_prompt_budgeter
+from app.services.conversation_summarizer import get_conversation_summarizer
+from app.services.openai_service import get_openai_pool_stats
+from app.services.admission_control import get_admission_stats
+from app.services.message_burst import get_burst_coalescer
+from app.services.idempotency import get_idempotency_store
+from app.services.vector_health import get_vector_health_monitor
+from app.utils.logging_config import get_logging_stats
+
 logger = logging.getLogger(__name__)
 
 # Create blueprint
@@ -95,6 +104,9 @@ def company_status(company_id):
             "last_activity": datetime.utcnow().isoformat() + "Z"
         }
         
+        from app.services.multi_agent_factory import get_multi_agent_factory
+        status_data["warmup"] = get_multi_agent_factory().get_warmup_status(company_id)
+        
         return jsonify({
             "status": "success",
             "data": status_data
@@ -265,7 +277,15 @@ def system_metrics():
             "companies": {
                 "total_configured": 4,  # Based on logs showing 4 companies
                 "active": 4
-            }
+            },
+            "prompt_tokens": get_prompt_budgeter().get_metrics(request.args.get('company_id')),
+            "conversation_summaries": get_conversation_summarizer().get_stats(),
+            "openai": get_openai_pool_stats(),
+            "logging": get_logging_stats(),
+            "admission": get_admission_stats(request.args.get('company_id')),
+            "message_bursts": get_burst_coalescer().get_stats(),
+            "idempotency": get_idempotency_store().get_stats(request.args.get('company_id')),
+            "vector_health": get_vector_health_monitor().get_stats()
         }
         
         return jsonify({
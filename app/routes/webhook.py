@@ -2,6 +2,8 @@ from flask import Blueprint, request, jsonify
 from app.services.chatwoot_service import ChatwootService
 from app.services.multi_agent_factory import get_orchestrator_for_company
 from app.models.conversation import ConversationManager
+from app.services.admission_control import get_admission_dispatcher
+from app.config.constants import BOT_ACTIVE_STATUSES
 from app.config.company_config import extract_company_id_from_webhook, validate_company_context
 from app.utils.validators import validate_webhook_data
 from app.utils.decorators import handle_errors
@@ -18,6 +20,14 @@ class WebhookError(Exception):
         self.status_code = status_code
         super().__init__(self.message)
 
+def _requires_admission(event_type, data):
+    """Solo los mensajes entrantes que el bot va a responder consumen cuota"""
+    return (
+        event_type == "message_created"
+        and data.get("message_type") == "incoming"
+        and (data.get("conversation") or {}).get("status") in BOT_ACTIVE_STATUSES
+    )
+
 @bp.route('/chatwoot', methods=['POST'])
 @handle_errors
 def chatwoot_webhook():
@@ -34,6 +44,13 @@ def chatwoot_webhook():
         
         logger.info(f"🔔 [{company_id}] WEBHOOK RECEIVED - Event: {event_type}")
         
+        # PASO 1.5: Control de admisión por empresa (diferir o rechazar sobre el límite)
+        if _requires_admission(event_type, data):
+            backpressure = get_admission_dispatcher().admit(company_id, data)
+            if backpressure:
+                backpressure["company_id"] = company_id
+                return jsonify(backpressure), 202 if backpressure.get("deferred") else 429
+        
         # PASO 2: Inicializar servicios específicos de empresa
         chatwoot_service = ChatwootService(company_id=company_id)
         conversation_manager = ConversationManager(company_id=company_id)
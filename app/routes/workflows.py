@@ -4,7 +4,8 @@ from flask import Blueprint, request, jsonify, current_app, g
 from functools import wraps
 from typing import Dict, Any, Optional
 import logging
-import asyncio
+import concurrent.futures
+import functools
 from datetime import datetime
 import time
 import psycopg2
@@ -12,9 +13,10 @@ import os
 
 from app.workflows.workflow_models import WorkflowGraph, WorkflowNode, WorkflowEdge
 from app.workflows.workflow_executor import WorkflowExecutor
+from app.workflows.workflow_runtime import get_workflow_runtime, generate_execution_id
+from app.workflows.workflow_scheduler import get_workflow_scheduler
 from app.workflows.workflow_registry import get_workflow_registry
 from app.workflows.condition_evaluator import ConditionEvaluator, validate_condition
-from app.services.multi_agent_orchestrator import MultiAgentOrchestrator
 from app.services.multi_agent_factory import get_orchestrator_for_company
 from app.models.conversation import ConversationManager
 from app.config.company_config import get_company_config
@@ -462,10 +464,14 @@ def execute_workflow(workflow_id: str):
         "context": {
             "user_id": "user_123",
             "user_message": "Quiero información sobre botox"
-        }
+        },
+        "async": false
     }
     
-    Ejecutar un workflow.
+    Ejecutar un workflow en el event loop persistente del worker.
+    Con "async": true retorna 202 + execution_id inmediatamente; el estado
+    se consulta en /executions/{execution_id}. Los nodos WAIT largos dejan la
+    ejecución en "waiting" y el scheduler la reanuda en cualquier worker.
     """
     company_id = request.company_id
     context = request.json['context']
@@ -508,48 +514,80 @@ def execute_workflow(workflow_id: str):
     conversation_manager = ConversationManager()
     
     # Crear executor
+    scheduler = get_workflow_scheduler()
     executor = WorkflowExecutor(
         workflow=workflow,
         orchestrator=orchestrator,
-        conversation_manager=conversation_manager
+        conversation_manager=conversation_manager,
+        scheduler=scheduler
     )
     
-    # Ejecutar (async)
-    try:
-        # Crear event loop si no existe
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+    runtime = get_workflow_runtime()
+    execution_id = generate_execution_id(workflow_id)
+    run_async = bool(request.json.get('async', False))
+    
+    # Ejecución en background: retornar execution_id inmediatamente
+    if run_async:
+        runtime.submit_background(
+            executor.execute(context, execution_id=execution_id),
+            company_id=company_id,
+            workflow_id=workflow_id,
+            on_complete=functools.partial(_record_execution, workflow_id),
+            execution_id=execution_id
+        )
         
-        result = loop.run_until_complete(executor.execute(context))
+        logger.info(f"Workflow queued: {workflow_id} - Execution: {execution_id}")
         
-        # Log ejecución
-        registry.log_execution(workflow_id, result)
+        return jsonify({
+            "success": True,
+            "execution_id": execution_id,
+            "status": "pending",
+            "status_url": f"/api/workflows/{workflow_id}/executions/{execution_id}?company_id={company_id}"
+        }), 202
+    
+    # Ejecución síncrona en el event loop persistente del worker
+    timeout = current_app.config.get('WORKFLOW_EXECUTION_TIMEOUT', 300)
+    future = runtime.submit(
+        executor.execute(context, execution_id=execution_id),
+        workflow_key=f"{company_id}:{workflow_id}"
+    )
+    
+    try:
+        result = future.result(timeout=timeout)
         
-        # Actualizar estadísticas usando psycopg2
-        try:
-            conn = psycopg2.connect(os.getenv('DATABASE_URL'))
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT update_workflow_execution_stats(%s, %s)",
-                (workflow_id, result['status'])
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
-        except Exception as e:
-            logger.warning(f"Could not update execution stats: {e}")
+        _record_execution(workflow_id, result)
         
         logger.info(
             f"Workflow executed: {workflow_id} - Status: {result['status']}"
         )
         
+        # "waiting": suspendida en un WAIT, se reanuda desde el scheduler
         return jsonify({
-            "success": result['status'] == 'success',
+            "success": result['status'] in ('success', 'waiting'),
             "execution": result
         }), 200
+    
+    except concurrent.futures.TimeoutError:
+        # El cliente recibe 504: la ejecución no debe seguir ni ser recuperada después
+        future.cancel()
+        try:
+            scheduler.abandon_execution(company_id, workflow_id, execution_id)
+        except Exception as e:
+            logger.warning(f"Could not abandon timed out execution {execution_id}: {e}")
+        runtime.record_execution_status({
+            "execution_id": execution_id,
+            "workflow_id": workflow_id,
+            "company_id": company_id,
+            "status": "timeout",
+            "completed_at": datetime.utcnow().isoformat(),
+            "errors": [f"Synchronous execution exceeded {timeout}s"]
+        })
+        logger.error(f"Workflow execution timeout: {workflow_id} ({timeout}s)")
+        return jsonify({
+            "success": False,
+            "error": "execution_timeout",
+            "message": f"Workflow did not complete within {timeout}s; use async execution for long workflows"
+        }), 504
         
     except Exception as e:
         logger.exception(f"Error executing workflow {workflow_id}: {e}")
@@ -559,6 +597,34 @@ def execute_workflow(workflow_id: str):
             "message": str(e)
         }), 500
 
+def _record_execution(workflow_id: str, result: Dict[str, Any]):
+    """Registrar ejecución en el registry y actualizar estadísticas"""
+    get_workflow_registry().record_execution(workflow_id, result)
+
+@workflows_bp.route('/<workflow_id>/executions/<execution_id>', methods=['GET'])
+@require_company_context
+@handle_errors
+def get_execution_status(workflow_id: str, execution_id: str):
+    """
+    GET /api/workflows/{workflow_id}/executions/{execution_id}?company_id=benova
+    
+    Consultar el estado de una ejecución en background.
+    """
+    company_id = request.company_id
+    
+    execution = get_workflow_runtime().get_execution_status(company_id, execution_id)
+    if not execution or execution.get("workflow_id") != workflow_id:
+        return jsonify({
+            "success": False,
+            "error": "execution_not_found",
+            "message": f"Execution '{execution_id}' not found"
+        }), 404
+    
+    return jsonify({
+        "success": True,
+        "execution": execution
+    }), 200
+
 @workflows_bp.route('/<workflow_id>/executions', methods=['GET'])
 @require_company_context
 @handle_errors
@@ -759,6 +825,8 @@ def health_check():
             "status": "healthy",
             "registry_available": True,
             "total_workflows": test_stats.get("total_workflows", 0),
+            "runtime": get_workflow_runtime().get_stats(),
+            "scheduler": get_workflow_scheduler().get_stats(),
             "timestamp": datetime.utcnow().isoformat()
         }), 200
         
@@ -1,24 +1,65 @@
-"""Services package initialization - Enhanced for Multi-tenant"""
-from .chatwoot_service import ChatwootService
-from .openai_service import OpenAIService, init_openai
-from .redis_service import get_redis_client, init_redis, close_redis
-from .vectorstore_service import VectorstoreService, init_vectorstore
-from .multimedia_service import MultimediaService
-from .multi_agent_orchestrator import MultiAgentOrchestrator
-from .multi_agent_factory import MultiAgentFactory, get_multi_agent_factory, get_orchestrator_for_company
-from .vector_auto_recovery import (
-    RedisVectorAutoRecovery,
-    VectorstoreProtectionMiddleware,
-    initialize_auto_recovery_system,
-    get_auto_recovery_instance,
-    get_system_wide_health
-)
-from .prompt_service import PromptService, get_prompt_service, init_prompt_service
-from .company_config_service import (
-    EnterpriseCompanyConfigService,
-    get_enterprise_company_service,
-    EnterpriseCompanyConfig
-)
+"""Services package initialization - Enhanced for Multi-tenant
+
+Los exports se resuelven en el primer acceso (PEP 562): importar cualquier
+submódulo (p. ej. app.services.prompt_service desde un script) no debe cargar
+agentes, LangGraph, LangChain Redis ni el cliente de Google Calendar.
+"""
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+# Solo para anotaciones: en runtime los servicios se importan al usarse
+if TYPE_CHECKING:
+    from .chatwoot_service import ChatwootService
+    from .prompt_service import PromptService
+    from .vectorstore_service import VectorstoreService
+
+_LAZY_EXPORTS = {
+    # Basic services
+    'ChatwootService': '.chatwoot_service',
+    'OpenAIService': '.openai_service',
+    'init_openai': '.openai_service',
+    'get_redis_client': '.redis_service',
+    'init_redis': '.redis_service',
+    'close_redis': '.redis_service',
+    'VectorstoreService': '.vectorstore_service',
+    'init_vectorstore': '.vectorstore_service',
+    'MultimediaService': '.multimedia_service',
+
+    # Multi-agent system
+    'MultiAgentOrchestrator': '.multi_agent_orchestrator',
+    'MultiAgentFactory': '.multi_agent_factory',
+    'get_multi_agent_factory': '.multi_agent_factory',
+    'get_orchestrator_for_company': '.multi_agent_factory',
+
+    # Auto-recovery system
+    'RedisVectorAutoRecovery': '.vector_auto_recovery',
+    'VectorstoreProtectionMiddleware': '.vector_auto_recovery',
+    'initialize_auto_recovery_system': '.vector_auto_recovery',
+    'get_auto_recovery_instance': '.vector_auto_recovery',
+    'get_system_wide_health': '.vector_auto_recovery',
+
+    # Prompt service
+    'PromptService': '.prompt_service',
+    'get_prompt_service': '.prompt_service',
+    'init_prompt_service': '.prompt_service',
+
+    'EnterpriseCompanyConfigService': '.company_config_service',
+    'get_enterprise_company_service': '.company_config_service',
+    'EnterpriseCompanyConfig': '.company_config_service',
+}
+
+
+def __getattr__(name):
+    module = _LAZY_EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_EXPORTS))
 
 __all__ = [
     # Basic services
@@ -48,7 +89,7 @@ __all__ = [
     # Prompt service
     'PromptService',
     'get_prompt_service',
-    'init_prompt_service'
+    'init_prompt_service',
 
     'EnterpriseCompanyConfigService',
     'get_enterprise_company_service', 
@@ -56,14 +97,17 @@ __all__ = [
 ]
 
 # Convenience functions for multi-tenant usage
-def get_chatwoot_service(company_id: str) -> ChatwootService:
+def get_chatwoot_service(company_id: str) -> 'ChatwootService':
     """Get Chatwoot service for specific company"""
+    from .chatwoot_service import ChatwootService
     return ChatwootService(company_id=company_id)
 
-def get_vectorstore_service(company_id: str) -> VectorstoreService:
+def get_vectorstore_service(company_id: str) -> 'VectorstoreService':
     """Get Vectorstore service for specific company"""
+    from .vectorstore_service import VectorstoreService
     return VectorstoreService(company_id=company_id)
     
-def get_prompt_service_for_company(company_id: str = None) -> PromptService:
+def get_prompt_service_for_company(company_id: str = None) -> 'PromptService':
     """Get Prompt service (company-agnostic, handles multi-tenancy internally)"""
+    from .prompt_service import get_prompt_service
     return get_prompt_service()
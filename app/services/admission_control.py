@@ -0,0 +1,743 @@
+"""
+Control de admisión por empresa y reparto justo entre empresas
+
+Una campaña masiva de una empresa no debe agotar los workers de gunicorn ni
+el límite de OpenAI del resto. Cada empresa tiene un token bucket en Redis
+(compartido por todos los workers, actualizado con un script Lua atómico)
+por recurso:
+
+- webhook:       mensajes entrantes admitidos por minuto
+- llm_tokens:    tokens de prompt + completion por minuto (estimados antes de llamar)
+- embeddings:    textos embebidos por minuto (búsquedas RAG, ingesta)
+- chatwoot_api:  llamadas salientes a la API de Chatwoot por minuto
+
+Backpressure explícito:
+- Un webhook sobre el límite (o con mensajes ya diferidos, para no
+  adelantarlos) se encola en `admission_deferred` de la empresa y se
+  responde 202. La conversación recibe un único mensaje de espera.
+- Con la cola llena el mensaje se rechaza con un aviso de alta demanda.
+- LLM, embeddings y Chatwoot esperan como máximo RATE_LIMIT_MAX_WAIT
+  (acotado por el deadline de la request) y luego lanzan TenantRateLimited.
+
+AdmissionDispatcher (un thread por worker) vacía las colas diferidas por
+round robin ponderado (`rate_limits.weight` de cada empresa), respetando el
+bucket de webhook de cada una. Cada mensaje tomado queda en
+`admission_inflight` con un lease hasta que el handler termina o se
+reencola; si el worker muere, otro lo devuelve a la cola al vencer el lease.
+
+Límites por empresa en CompanyConfig.rate_limits (sobre los defaults de la app):
+    {"weight": 2, "webhook": {"per_minute": 30, "burst": 10}, "llm_tokens": {"per_minute": 50000}}
+"""
+
+from typing import Dict, Any, List, Optional, Tuple, Callable
+from contextlib import nullcontext
+from dataclasses import dataclass
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+
+from app.config.constants import REDIS_KEY_PATTERNS
+from app.config.settings import app_config_overlay
+from app.services.redis_service import ProcessRedisClient, get_company_redis_prefix, resolve_redis_url
+from app.utils.deadline import deadline_timeout
+from app.utils.logging_config import LogSampler, get_log_context, log_context
+
+logger = logging.getLogger(__name__)
+
+# Como máximo 1 aviso por empresa/recurso cada 30s (en pleno throttling serían miles)
+_throttle_sampler = LogSampler(limit=1, interval=30.0)
+
+RESOURCES = ("webhook", "llm_tokens", "embeddings", "chatwoot_api")
+
+HOLDING_REPLY = (
+    "¡Recibimos tu mensaje! 🙌 En este momento estamos atendiendo un alto volumen "
+    "de consultas; te responderemos en unos minutos."
+)
+BUSY_REPLY = (
+    "En este momento tenemos una demanda inusualmente alta y no pudimos procesar tu "
+    "mensaje. Por favor, escríbenos de nuevo en unos minutos. 🙏"
+)
+
+# KEYS[1] = bucket (HASH tokens/ts); ARGV = rate (tokens/s), capacidad, ahora, costo
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return {allowed, tostring(tokens), tostring(retry_after)}
+"""
+
+# KEYS[1] = cola diferida (LIST), KEYS[2] = en proceso (ZSET); ARGV[1] = vencimiento del lease
+CLAIM_DEFERRED_LUA = """
+local raw = redis.call('LPOP', KEYS[1])
+if raw then
+    redis.call('ZADD', KEYS[2], ARGV[1], raw)
+end
+return raw
+"""
+
+# KEYS[1] = en proceso (ZSET), KEYS[2] = cola diferida (LIST); ARGV = ahora, máximo a mover.
+# Vuelven al inicio de la cola: son los mensajes más antiguos de la empresa
+REQUEUE_EXPIRED_LUA = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, raw in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], raw)
+    redis.call('LPUSH', KEYS[2], raw)
+end
+return #expired
+"""
+
+
+def admission_config() -> Dict[str, Any]:
+    defaults = {
+        "ADMISSION_CONTROL_ENABLED": os.getenv('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true',
+        "RATE_LIMIT_WEBHOOK_PER_MINUTE": float(os.getenv('RATE_LIMIT_WEBHOOK_PER_MINUTE', '120')),
+        "RATE_LIMIT_LLM_TOKENS_PER_MINUTE": float(os.getenv('RATE_LIMIT_LLM_TOKENS_PER_MINUTE', '200000')),
+        "RATE_LIMIT_EMBEDDINGS_PER_MINUTE": float(os.getenv('RATE_LIMIT_EMBEDDINGS_PER_MINUTE', '600')),
+        "RATE_LIMIT_CHATWOOT_API_PER_MINUTE": float(os.getenv('RATE_LIMIT_CHATWOOT_API_PER_MINUTE', '300')),
+        "RATE_LIMIT_BURST_SECONDS": float(os.getenv('RATE_LIMIT_BURST_SECONDS', '15')),
+        "RATE_LIMIT_MAX_WAIT": float(os.getenv('RATE_LIMIT_MAX_WAIT', '5')),
+        "ADMISSION_MAX_DEFERRED": int(os.getenv('ADMISSION_MAX_DEFERRED', '200')),
+        "ADMISSION_DISPATCH_CONCURRENCY": int(os.getenv('ADMISSION_DISPATCH_CONCURRENCY', '2')),
+        "ADMISSION_POLL_INTERVAL": float(os.getenv('ADMISSION_POLL_INTERVAL', '0.5')),
+        "ADMISSION_HOLDING_REPLY_TTL": int(os.getenv('ADMISSION_HOLDING_REPLY_TTL', '300')),
+        "ADMISSION_LEASE_SECONDS": float(os.getenv('ADMISSION_LEASE_SECONDS', '600'))
+    }
+    return app_config_overlay(defaults)
+
+
+def _company_rate_limits(company_id: str) -> Dict[str, Any]:
+    from app.config.company_config import get_company_config
+    config = get_company_config(company_id)
+    return getattr(config, 'rate_limits', None) or {}
+
+
+class TenantRateLimited(RuntimeError):
+    """La empresa agotó su cuota de un recurso"""
+
+    def __init__(self, company_id: str, resource: str, retry_after: float):
+        self.company_id = company_id
+        self.resource = resource
+        self.retry_after = retry_after
+        super().__init__(f"[{company_id}] {resource} rate limit exceeded (retry after {retry_after:.1f}s)")
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Reposición por minuto y capacidad del bucket (per_minute <= 0 = sin límite)"""
+    per_minute: float
+    burst: float
+
+    @property
+    def rate_per_second(self) -> float:
+        return self.per_minute / 60.0
+
+    @property
+    def unlimited(self) -> bool:
+        return self.per_minute <= 0
+
+
+@dataclass(frozen=True)
+class AdmissionDecision:
+    allowed: bool
+    remaining: float = 0.0
+    retry_after: float = 0.0
+
+
+# ============================================================================
+# TOKEN BUCKETS POR EMPRESA Y RECURSO
+# ============================================================================
+
+class TenantLimiter(ProcessRedisClient):
+    """
+    Token buckets en Redis por (empresa, recurso).
+
+    Ejemplo:
+        limiter.acquire(company_id, "webhook")               # no bloquea
+        limiter.throttle(company_id, "llm_tokens", cost=1800)  # espera o TenantRateLimited
+
+    Si Redis falla se admite (fail-open): el limitador protege la
+    capacidad compartida, no debe tumbar la atención.
+    """
+
+    def __init__(self, defaults: Dict[str, RateLimit], max_wait: float = 5.0,
+                 enabled: bool = True, redis_client=None):
+        self.defaults = defaults
+        self.max_wait = max_wait
+        self.enabled = enabled
+        self._redis_url = resolve_redis_url()
+        self._use_client(redis_client)
+        self._script = None
+        self._script_client = None
+
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def bucket_key(company_id: str, resource: str) -> str:
+        return REDIS_KEY_PATTERNS["rate_limit"].format(company_prefix=get_company_redis_prefix(company_id)) + resource
+
+    @staticmethod
+    def stats_key(company_id: str) -> str:
+        return REDIS_KEY_PATTERNS["admission_stats"].format(company_prefix=get_company_redis_prefix(company_id))
+
+    def get_limit(self, company_id: str, resource: str) -> RateLimit:
+        """Default de la app < `rate_limits[resource]` de la empresa"""
+        limit = self.defaults.get(resource) or RateLimit(0, 0)
+        override = _company_rate_limits(company_id).get(resource)
+        if not isinstance(override, dict):
+            return limit
+        per_minute = float(override.get("per_minute", limit.per_minute))
+        if "burst" in override:
+            burst = float(override["burst"])
+        elif limit.per_minute > 0:
+            # Misma ventana de ráfaga que el default
+            burst = per_minute * limit.burst / limit.per_minute
+        else:
+            burst = per_minute / 4
+        return RateLimit(per_minute, max(1.0, burst))
+
+    @staticmethod
+    def get_weight(company_id: str) -> int:
+        try:
+            return max(1, int(_company_rate_limits(company_id).get("weight", 1)))
+        except (TypeError, ValueError):
+            return 1
+
+    def _take(self, key: str, limit: RateLimit, cost: float, now: float) -> Tuple[bool, float, float]:
+        client = self.redis
+        if self._script is None or self._script_client is not client:
+            self._script = client.register_script(TOKEN_BUCKET_LUA)
+            self._script_client = client
+        allowed, remaining, retry_after = self._script(
+            keys=[key], args=[limit.rate_per_second, limit.burst, now, cost]
+        )
+        return bool(int(allowed)), float(remaining), float(retry_after)
+
+    def acquire(self, company_id: str, resource: str, cost: float = 1.0, now: float = None) -> AdmissionDecision:
+        """Consumir `cost` tokens si hay; no bloquea"""
+        if not self.enabled:
+            return AdmissionDecision(True)
+        limit = self.get_limit(company_id, resource)
+        if limit.unlimited:
+            return AdmissionDecision(True)
+
+        # Un costo mayor que el bucket nunca pasaría: se cobra el bucket lleno
+        cost = min(max(cost, 0.0), limit.burst)
+        try:
+            allowed, remaining, retry_after = self._take(
+                self.bucket_key(company_id, resource), limit, cost, now or time.time()
+            )
+        except Exception as e:
+            self._count(company_id, f"{resource}:errors")
+            _throttle_sampler.log(
+                logger, logging.WARNING, f"{company_id}:{resource}:error",
+                "[%s] Rate limiter unavailable for %s, admitting: %s", company_id, resource, e
+            )
+            return AdmissionDecision(True)
+
+        if allowed:
+            self._count(company_id, f"{resource}:allowed")
+            return AdmissionDecision(True, remaining)
+
+        self._count(company_id, f"{resource}:throttled")
+        self._record_event(company_id, f"{resource}:throttled")
+        _throttle_sampler.log(
+            logger, logging.WARNING, f"{company_id}:{resource}",
+            "[%s] %s over limit (%.0f/min), retry after %.1fs",
+            company_id, resource, limit.per_minute, retry_after
+        )
+        return AdmissionDecision(False, remaining, retry_after)
+
+    def throttle(self, company_id: str, resource: str, cost: float = 1.0) -> AdmissionDecision:
+        """
+        Esperar tokens para una llamada a una dependencia externa.
+
+        Raises:
+            TenantRateLimited: si no hay tokens dentro de max_wait (o del deadline)
+            DeadlineExceeded: si el deadline de la request ya expiró
+        """
+        give_up_at = time.monotonic() + deadline_timeout(self.max_wait)
+        while True:
+            decision = self.acquire(company_id, resource, cost)
+            if decision.allowed:
+                return decision
+            if time.monotonic() + decision.retry_after > give_up_at:
+                raise TenantRateLimited(company_id, resource, decision.retry_after)
+            time.sleep(max(decision.retry_after, 0.01))
+
+    # === STATS === #
+
+    def _count(self, company_id: str, field: str, amount: int = 1):
+        with self._lock:
+            counters = self._stats.setdefault(company_id, {})
+            counters[field] = counters.get(field, 0) + amount
+
+    def _record_event(self, company_id: str, field: str, amount: int = 1):
+        """Contador compartido entre workers (solo eventos de throttling, no el camino feliz)"""
+        try:
+            self.redis.hincrby(self.stats_key(company_id), field, amount)
+        except Exception:
+            pass
+
+    def get_stats(self, company_id: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            local = {cid: dict(counters) for cid, counters in self._stats.items()}
+        if company_id is None:
+            return {"enabled": self.enabled, "worker": local}
+
+        stats = {
+            "enabled": self.enabled,
+            "weight": self.get_weight(company_id),
+            "worker": local.get(company_id, {}),
+            "limits": {},
+            "buckets": {}
+        }
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for resource in RESOURCES:
+                limit = self.get_limit(company_id, resource)
+                stats["limits"][resource] = {"per_minute": limit.per_minute, "burst": limit.burst}
+                pipe.hget(self.bucket_key(company_id, resource), "tokens")
+            pipe.hgetall(self.stats_key(company_id))
+            results = pipe.execute()
+            for resource, tokens in zip(RESOURCES, results):
+                stats["buckets"][resource] = round(float(tokens), 1) if tokens is not None else None
+            stats["events"] = {field: int(value) for field, value in (results[-1] or {}).items()}
+        except Exception as e:
+            stats["redis_error"] = str(e)
+        return stats
+
+
+# ============================================================================
+# COLAS DIFERIDAS + DESPACHO PONDERADO
+# ============================================================================
+
+class AdmissionDispatcher(ProcessRedisClient):
+    """
+    Backpressure de webhooks y despacho justo de lo diferido.
+
+    - admit(): decide en el webhook si el mensaje se procesa ya, se difiere
+      (cola por empresa + mensaje de espera) o se rechaza (cola llena).
+    - ACTIVE_KEY: SET de empresas con mensajes diferidos o en proceso.
+    - dispatch_once(): una ronda de round robin ponderado: cada empresa
+      despacha hasta `weight` mensajes si su bucket de webhook lo permite
+      y hay un slot libre (ADMISSION_DISPATCH_CONCURRENCY por worker).
+    - Un mensaje despachado sigue en `inflight_key` (lease de
+      ADMISSION_LEASE_SECONDS) hasta que el handler termina o se reencola;
+      requeue_expired() devuelve a la cola los de workers caídos.
+    """
+
+    ACTIVE_KEY = "admission:deferred_companies"
+    MAX_ATTEMPTS = 3
+    SWEEP_INTERVAL = 30.0
+    SWEEP_BATCH = 100
+
+    def __init__(self, limiter: TenantLimiter, max_deferred: int = 200, concurrency: int = 2,
+                 poll_interval: float = 0.5, holding_reply_ttl: int = 300,
+                 lease_seconds: float = 600.0, redis_client=None,
+                 handler: Optional[Callable[[str, Dict[str, Any]], Any]] = None,
+                 reply: Optional[Callable[[str, Any, str], bool]] = None):
+        self.limiter = limiter
+        self.max_deferred = max_deferred
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.holding_reply_ttl = holding_reply_ttl
+        self.lease_seconds = lease_seconds
+
+        # Procesamiento del mensaje y respuesta de espera; inyectables en tests
+        self._handler = handler or _process_deferred_message
+        self._reply = reply or _send_chatwoot_reply
+
+        self._redis_url = resolve_redis_url()
+        self._use_client(redis_client)
+        self._scripts: Dict[str, Any] = {}
+        self._scripts_client = None
+
+        self._app = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._cursor = 0
+        # 0: la primera ronda del proceso (arranque) ya recupera leases vencidos
+        self._next_sweep = 0.0
+
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def deferred_key(company_id: str) -> str:
+        return REDIS_KEY_PATTERNS["admission_deferred"].format(company_prefix=get_company_redis_prefix(company_id))
+
+    @staticmethod
+    def inflight_key(company_id: str) -> str:
+        return REDIS_KEY_PATTERNS["admission_inflight"].format(company_prefix=get_company_redis_prefix(company_id))
+
+    @staticmethod
+    def holding_key(company_id: str, conversation_id: Any) -> str:
+        return REDIS_KEY_PATTERNS["admission_holding_reply"].format(company_prefix=get_company_redis_prefix(company_id)) + str(conversation_id)
+
+    def _script(self, source: str):
+        client = self.redis
+        if self._scripts_client is not client:
+            self._scripts = {}
+            self._scripts_client = client
+        if source not in self._scripts:
+            self._scripts[source] = client.register_script(source)
+        return self._scripts[source]
+
+    # === WEBHOOK === #
+
+    def admit(self, company_id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        None si el mensaje se procesa ahora; si no, el cuerpo de la respuesta
+        del webhook ("deferred" o "throttled").
+        """
+        if not self.limiter.enabled:
+            return None
+
+        key = self.deferred_key(company_id)
+        try:
+            depth = self.redis.llen(key)
+        except Exception as e:
+            logger.warning("[%s] Admission queue unavailable, admitting: %s", company_id, e)
+            return None
+
+        retry_after = 0.0
+        if depth == 0:
+            decision = self.limiter.acquire(company_id, "webhook")
+            if decision.allowed:
+                return None
+            retry_after = decision.retry_after
+
+        conversation_id = (data.get("conversation") or {}).get("id")
+
+        if depth >= self.max_deferred:
+            self._count(company_id, "rejected")
+            self.limiter._record_event(company_id, "webhook:rejected")
+            logger.warning("[%s] Deferred queue full (%d), rejecting message", company_id, depth)
+            self._holding_reply(company_id, conversation_id, BUSY_REPLY)
+            return {"status": "throttled", "deferred": False, "queue_depth": depth}
+
+        entry = json.dumps({
+            "data": data,
+            "deferred_at": time.time(),
+            "request_id": get_log_context().get("request_id"),
+            "attempts": 0
+        }, ensure_ascii=False)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.rpush(key, entry)
+        pipe.sadd(self.ACTIVE_KEY, company_id)
+        depth = pipe.execute()[0]
+
+        self._count(company_id, "deferred")
+        self.limiter._record_event(company_id, "webhook:deferred")
+        logger.info("[%s] Message deferred (queue depth %d, retry after %.1fs)", company_id, depth, retry_after)
+        self._holding_reply(company_id, conversation_id, HOLDING_REPLY)
+        return {"status": "deferred", "deferred": True, "queue_depth": depth, "retry_after": round(retry_after, 1)}
+
+    def _holding_reply(self, company_id: str, conversation_id: Any, text: str):
+        """Un solo mensaje de espera por conversación cada holding_reply_ttl segundos"""
+        if not conversation_id:
+            return
+        try:
+            if not self.redis.set(self.holding_key(company_id, conversation_id), "1", nx=True, ex=self.holding_reply_ttl):
+                return
+            if self._reply(company_id, conversation_id, text):
+                self._count(company_id, "holding_replies")
+        except Exception as e:
+            logger.warning("[%s] Could not send holding reply to %s: %s", company_id, conversation_id, e)
+
+    # === DESPACHO === #
+
+    def dispatch_once(self) -> int:
+        """Una ronda de round robin ponderado. Retorna mensajes despachados."""
+        if time.time() >= self._next_sweep:
+            self._next_sweep = time.time() + self.SWEEP_INTERVAL
+            self.requeue_expired()
+
+        companies = sorted(self.redis.smembers(self.ACTIVE_KEY))
+        if not companies:
+            return 0
+
+        # Rotar el inicio para que la primera empresa no tenga siempre prioridad
+        start = self._cursor % len(companies)
+        self._cursor += 1
+        dispatched = 0
+
+        for company_id in companies[start:] + companies[:start]:
+            for _ in range(self.limiter.get_weight(company_id)):
+                if not self._slots.acquire(blocking=False):
+                    return dispatched
+                try:
+                    raw = self._next_message(company_id)
+                except Exception:
+                    self._slots.release()
+                    raise
+                if raw is None:
+                    self._slots.release()
+                    break
+                self._submit(company_id, raw)
+                dispatched += 1
+        return dispatched
+
+    def _next_message(self, company_id: str) -> Optional[str]:
+        key = self.deferred_key(company_id)
+        if not self.redis.llen(key):
+            # Con mensajes en proceso la empresa sigue activa: el barrido debe verlos
+            if not self.redis.zcard(self.inflight_key(company_id)):
+                self.redis.srem(self.ACTIVE_KEY, company_id)
+                # Un rpush entre el llen y el srem no debe quedar huérfano
+                if self.redis.llen(key):
+                    self.redis.sadd(self.ACTIVE_KEY, company_id)
+            return None
+        if not self.limiter.acquire(company_id, "webhook").allowed:
+            return None
+        return self._script(CLAIM_DEFERRED_LUA)(
+            keys=[key, self.inflight_key(company_id)],
+            args=[time.time() + self.lease_seconds]
+        )
+
+    def _submit(self, company_id: str, raw: str):
+        if self._executor is None:
+            self._process(company_id, raw)
+            return
+        try:
+            self._executor.submit(self._process, company_id, raw)
+        except RuntimeError:
+            self._slots.release()
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.zrem(self.inflight_key(company_id), raw)
+            pipe.lpush(self.deferred_key(company_id), raw)
+            pipe.execute()
+
+    def _process(self, company_id: str, raw: str):
+        try:
+            entry = json.loads(raw)
+            waited = time.time() - entry.get("deferred_at", time.time())
+            with self._app_context(), log_context(company_id=company_id, request_id=entry.get("request_id")):
+                try:
+                    self._handler(company_id, entry["data"])
+                except Exception as e:
+                    self._retry(company_id, raw, entry, e)
+                    return
+            self._ack(company_id, raw)
+            self._count(company_id, "processed")
+            self._count(company_id, "max_wait_seconds", waited, aggregate=max)
+            logger.debug("[%s] Deferred message processed after %.1fs", company_id, waited)
+        except Exception as e:
+            self._count(company_id, "errors")
+            logger.warning("[%s] Invalid deferred message dropped: %s", company_id, e)
+            self._ack(company_id, raw)
+        finally:
+            self._slots.release()
+
+    def _ack(self, company_id: str, raw: str):
+        """Soltar el lease; si Redis falla el mensaje vuelve a la cola al vencer"""
+        try:
+            self.redis.zrem(self.inflight_key(company_id), raw)
+        except Exception as e:
+            logger.warning("[%s] Could not release deferred message lease: %s", company_id, e)
+
+    def _retry(self, company_id: str, raw: str, entry: Dict[str, Any], error: Exception):
+        entry["attempts"] = entry.get("attempts", 0) + 1
+        self._count(company_id, "errors")
+        if entry["attempts"] >= self.MAX_ATTEMPTS:
+            logger.error("[%s] Deferred message failed %d times, dropping: %s", company_id, entry["attempts"], error)
+            self._ack(company_id, raw)
+            return
+        logger.warning("[%s] Deferred message failed (attempt %d), requeueing: %s", company_id, entry["attempts"], error)
+        try:
+            # Reencolar y soltar el lease juntos: nunca ambos ni ninguno
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.rpush(self.deferred_key(company_id), json.dumps(entry, ensure_ascii=False))
+            pipe.zrem(self.inflight_key(company_id), raw)
+            pipe.sadd(self.ACTIVE_KEY, company_id)
+            pipe.execute()
+        except Exception as e:
+            logger.warning("[%s] Could not requeue deferred message, it stays leased: %s", company_id, e)
+
+    def requeue_expired(self, now: Optional[float] = None) -> int:
+        """Devolver a su cola los mensajes cuyo lease venció (worker caído a mitad de proceso)"""
+        now = time.time() if now is None else now
+        requeued = 0
+        for company_id in sorted(self.redis.smembers(self.ACTIVE_KEY)):
+            moved = int(self._script(REQUEUE_EXPIRED_LUA)(
+                keys=[self.inflight_key(company_id), self.deferred_key(company_id)],
+                args=[now, self.SWEEP_BATCH]
+            ) or 0)
+            if moved:
+                self._count(company_id, "requeued", moved)
+                logger.warning("[%s] Requeued %d deferred messages with expired lease", company_id, moved)
+                requeued += moved
+        return requeued
+
+    # === THREAD === #
+
+    def start(self, app=None):
+        """Arrancar el thread de despacho (uno por proceso, re-arranca tras fork)"""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+
+            self._app = app
+            self._stop_event = threading.Event()
+            self._slots = threading.BoundedSemaphore(self.concurrency)
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix="admission-worker"
+            )
+            self._thread = threading.Thread(target=self._run, name="admission-dispatcher", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+        logger.info("AdmissionDispatcher started (pid=%s, concurrency=%d)", self._pid, self.concurrency)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False)
+
+    def _app_context(self):
+        return self._app.app_context() if self._app is not None else nullcontext()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            dispatched = 0
+            try:
+                with self._app_context():
+                    dispatched = self.dispatch_once()
+            except Exception as e:
+                logger.warning("AdmissionDispatcher cycle error: %s", e)
+
+            # Con trabajo despachado volver pronto: puede haber más y slots liberándose
+            self._stop_event.wait(0.05 if dispatched else self.poll_interval)
+
+    # === STATS === #
+
+    def _count(self, company_id: str, field: str, amount: float = 1, aggregate: Callable = None):
+        with self._lock:
+            counters = self._stats.setdefault(company_id, {})
+            current = counters.get(field, 0)
+            counters[field] = aggregate(current, round(amount, 1)) if aggregate else current + amount
+
+    def get_stats(self, company_id: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            local = {cid: dict(counters) for cid, counters in self._stats.items()}
+        stats = {
+            "running": self._pid == os.getpid() and bool(self._thread and self._thread.is_alive()),
+            "concurrency": self.concurrency,
+            "max_deferred": self.max_deferred
+        }
+        try:
+            companies: List[str] = [company_id] if company_id else sorted(self.redis.smembers(self.ACTIVE_KEY))
+            pipe = self.redis.pipeline(transaction=False)
+            for cid in companies:
+                pipe.llen(self.deferred_key(cid))
+                pipe.zcard(self.inflight_key(cid))
+            results = pipe.execute()
+            stats["queue_depth"] = dict(zip(companies, results[0::2]))
+            stats["inflight"] = dict(zip(companies, results[1::2]))
+        except Exception as e:
+            stats["redis_error"] = str(e)
+        stats["worker"] = local.get(company_id, {}) if company_id else local
+        return stats
+
+
+def _process_deferred_message(company_id: str, data: Dict[str, Any]):
+    """Mismo camino que el webhook síncrono (requiere app context)"""
+    from app.services.chatwoot_service import ChatwootService
+    from app.services.multi_agent_factory import get_orchestrator_for_company
+    from app.models.conversation import ConversationManager
+
+    orchestrator = get_orchestrator_for_company(company_id)
+    if not orchestrator:
+        raise RuntimeError(f"Orchestrator not available for company {company_id}")
+    return ChatwootService(company_id=company_id).process_incoming_message(
+        data, ConversationManager(company_id=company_id), orchestrator
+    )
+
+
+def _send_chatwoot_reply(company_id: str, conversation_id: Any, text: str) -> bool:
+    from app.services.chatwoot_service import ChatwootService
+    return ChatwootService(company_id=company_id).send_message(conversation_id, text)
+
+
+# ============================================================================
+# SINGLETONS POR WORKER
+# ============================================================================
+
+_limiter: Optional[TenantLimiter] = None
+_dispatcher: Optional[AdmissionDispatcher] = None
+_singleton_lock = threading.Lock()
+
+
+def get_tenant_limiter() -> TenantLimiter:
+    """Obtener el limitador del worker (lee la configuración de la app si existe)"""
+    global _limiter
+
+    if _limiter is None:
+        with _singleton_lock:
+            if _limiter is None:
+                config = admission_config()
+                burst_seconds = config["RATE_LIMIT_BURST_SECONDS"]
+                defaults = {}
+                for resource in RESOURCES:
+                    per_minute = float(config[f"RATE_LIMIT_{resource.upper()}_PER_MINUTE"])
+                    defaults[resource] = RateLimit(per_minute, max(1.0, per_minute * burst_seconds / 60.0))
+                _limiter = TenantLimiter(
+                    defaults,
+                    max_wait=config["RATE_LIMIT_MAX_WAIT"],
+                    enabled=config["ADMISSION_CONTROL_ENABLED"]
+                )
+    return _limiter
+
+
+def get_admission_dispatcher() -> AdmissionDispatcher:
+    global _dispatcher
+
+    if _dispatcher is None:
+        limiter = get_tenant_limiter()
+        with _singleton_lock:
+            if _dispatcher is None:
+                config = admission_config()
+                _dispatcher = AdmissionDispatcher(
+                    limiter,
+                    max_deferred=config["ADMISSION_MAX_DEFERRED"],
+                    concurrency=config["ADMISSION_DISPATCH_CONCURRENCY"],
+                    poll_interval=config["ADMISSION_POLL_INTERVAL"],
+                    holding_reply_ttl=config["ADMISSION_HOLDING_REPLY_TTL"],
+                    lease_seconds=config["ADMISSION_LEASE_SECONDS"]
+                )
+    return _dispatcher
+
+
+def get_admission_stats(company_id: Optional[str] = None) -> Dict[str, Any]:
+    """Throttling y profundidad de cola (por empresa si se indica company_id)"""
+    return {
+        "limiter": get_tenant_limiter().get_stats(company_id),
+        "deferred": get_admission_dispatcher().get_stats(company_id)
+    }
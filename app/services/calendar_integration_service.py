@@ -25,6 +25,7 @@ except ImportError:
 import requests
 
 from app.config.extended_company_config import ExtendedCompanyConfig, TreatmentConfig, AgendaConfig
+from app.utils.deadline import deadline_timeout
 
 logger = logging.getLogger(__name__)
 
@@ -420,7 +421,7 @@ class CalendarIntegrationService:
             response = requests.post(
                 self.webhook_url,
                 json=webhook_data,
-                timeout=30
+                timeout=deadline_timeout(30)
             )
             
             if response.status_code == 200:
@@ -445,7 +446,7 @@ class CalendarIntegrationService:
             response = requests.post(
                 self.webhook_url,
                 json=webhook_data,
-                timeout=60
+                timeout=deadline_timeout(60)
             )
             
             if response.status_code == 200:
@@ -473,7 +474,7 @@ class CalendarIntegrationService:
                     "treatment": asdict(treatment_config)
                 },
                 headers=self.api_headers,
-                timeout=30
+                timeout=deadline_timeout(30)
             )
             
             if response.status_code == 200:
@@ -495,7 +496,7 @@ class CalendarIntegrationService:
                     **booking_data
                 },
                 headers=self.api_headers,
-                timeout=60
+                timeout=deadline_timeout(60)
             )
             
             if response.status_code == 200:
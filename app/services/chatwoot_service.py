@@ -1,8 +1,10 @@
 from app.services.redis_service import get_redis_client
 from app.models.conversation import ConversationManager
-from app.services.multi_agent_orchestrator import MultiAgentOrchestrator
 from app.services.openai_service import OpenAIService
 from app.config.company_config import get_company_config
+from app.services.admission_control import get_tenant_limiter
+from app.services.message_burst import get_burst_coalescer
+from app.services.idempotency import get_idempotency_store, DONE
 from flask import current_app
 import requests
 import logging
@@ -11,11 +13,37 @@ import time
 import tempfile
 import os
 import base64
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from io import BytesIO
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple, Callable, TYPE_CHECKING
+
+# Solo para anotaciones: el orquestador (agentes + LangGraph) lo construye la factory
+if TYPE_CHECKING:
+    from app.services.multi_agent_orchestrator import MultiAgentOrchestrator
 
 logger = logging.getLogger(__name__)
 
+# Pool compartido por worker para procesar adjuntos (descarga + Whisper/Vision).
+# Acotado para que una ráfaga de mensajes con muchos adjuntos no dispare hilos sin límite.
+_attachment_executor: Optional[ThreadPoolExecutor] = None
+_attachment_executor_lock = threading.Lock()
+
+
+def _get_attachment_executor(max_workers: int) -> ThreadPoolExecutor:
+    """Get (or lazily create) the shared attachment thread pool"""
+    global _attachment_executor
+    if _attachment_executor is None:
+        with _attachment_executor_lock:
+            if _attachment_executor is None:
+                _attachment_executor = ThreadPoolExecutor(
+                    max_workers=max(1, max_workers),
+                    thread_name_prefix="chatwoot-attachment"
+                )
+    return _attachment_executor
+
+
 class ChatwootService:
     """Service for handling Chatwoot interactions - Multi-tenant"""
 
@@ -48,6 +76,8 @@ class ChatwootService:
         
         # Initialize OpenAI service for multimedia processing
         self.openai_service = OpenAIService()
+        self.attachment_max_workers = current_app.config.get('ATTACHMENT_MAX_WORKERS', 4)
+        self.attachment_timeout = current_app.config.get('ATTACHMENT_TIMEOUT', 60)
         
         logger.info(f"ChatwootService initialized for company: {self.company_id}")
 
@@ -86,25 +116,21 @@ class ChatwootService:
             logger.error(f"[{self.company_id}] Error updating bot status in Redis: {e}")
 
     def is_message_already_processed(self, message_id: int, conversation_id: int) -> bool:
-        """Check if message has already been processed with company context"""
+        """
+        Check if message has already been processed with company context.
+        
+        Reclamo atómico (SET NX) marcado como terminado de inmediato; el
+        webhook usa el reclamo completo con lease (process_incoming_message).
+        """
         if not message_id:
             return False
 
-        # Key específico con contexto de empresa
-        key = f"{self.redis_prefix}processed_message:{conversation_id}:{message_id}"
-
-        try:
-            if self.redis_client.exists(key):
-                logger.info(f"🔄 [{self.company_id}] Message {message_id} already processed, skipping")
-                return True
-
-            self.redis_client.set(key, "1", ex=3600)  # 1 hour TTL
-            logger.info(f"✅ [{self.company_id}] Message {message_id} marked as processed")
-            return False
-
-        except Exception as e:
-            logger.error(f"[{self.company_id}] Error checking processed message: {e}")
-            return False
+        store = get_idempotency_store()
+        claim = store.claim(self.company_id, "processed_message", f"{conversation_id}:{message_id}")
+        if claim.duplicate:
+            return True
+        store.complete(claim)
+        return False
 
     def extract_contact_id(self, data: Dict[str, Any]) -> Tuple[str, str, bool]:
         """Extract contact ID from webhook data"""
@@ -136,8 +162,30 @@ class ChatwootService:
             logger.error(f"[{self.company_id}] Error extracting contact_id: {e}")
             return "unknown_contact", "error", False
 
-    def send_message(self, conversation_id: int, message: str) -> bool:
-        """Send message to Chatwoot conversation"""
+    def send_message(self, conversation_id: int, message: str, idempotency_key: str = None) -> bool:
+        """
+        Send message to Chatwoot conversation.
+        
+        idempotency_key: envíos con la misma clave (por conversación) salen
+        una sola vez; un duplicado retorna True sin volver a enviar.
+        """
+        store = get_idempotency_store()
+        claim = None
+        if idempotency_key:
+            claim = store.claim(self.company_id, "outbound_message", f"{conversation_id}:{idempotency_key}")
+            if claim.duplicate:
+                logger.info("[%s] Duplicate send %s to conversation %s suppressed", self.company_id, idempotency_key, conversation_id)
+                return True
+
+        sent = self._post_message(conversation_id, message)
+        if claim is not None:
+            if sent:
+                store.complete(claim, {"sent": True})
+            else:
+                store.release(claim)
+        return sent
+
+    def _post_message(self, conversation_id: int, message: str) -> bool:
         try:
             url = f"{self.base_url}/api/v1/accounts/{self.account_id}/conversations/{conversation_id}/messages"
             headers = {
@@ -149,10 +197,13 @@ class ChatwootService:
                 "message_type": "outgoing"
             }
             
+            # Cuota de llamadas a la API de Chatwoot de la empresa (espera acotada)
+            get_tenant_limiter().throttle(self.company_id, "chatwoot_api")
+            
             response = requests.post(url, json=payload, headers=headers, timeout=10)
             
             if response.status_code == 200:
-                logger.info(f"✅ [{self.company_id}] Message sent to conversation {conversation_id}")
+                logger.info("✅ [%s] Message sent to conversation %s", self.company_id, conversation_id)
                 return True
             else:
                 logger.error(f"❌ [{self.company_id}] Failed to send message: {response.status_code} - {response.text}")
@@ -162,6 +213,48 @@ class ChatwootService:
             logger.error(f"[{self.company_id}] Error sending message: {e}")
             return False
 
+    def reply_with_orchestrator(self, conversation_id: Any, user_id: str, content: str,
+                                conversation_manager: ConversationManager,
+                                orchestrator: 'MultiAgentOrchestrator',
+                                media_type: str = "text", media_context: str = None,
+                                should_commit: Optional[Callable[[], bool]] = None,
+                                idempotency_key: str = None) -> Tuple[Optional[str], str]:
+        """
+        Generar la respuesta con el orquestador de la empresa y enviarla.
+        
+        idempotency_key: clave del envío (una respuesta por evento aunque se
+        reintente el procesamiento)
+        
+        Returns:
+            (assistant_reply, agent_used); (None, agent_used) si should_commit
+            descartó la respuesta (llegaron mensajes nuevos) y no se envió nada
+        """
+        logger.debug("🤖 [%s] Generating response with media_type: %s", self.company_id, media_type)
+        assistant_reply, agent_used = orchestrator.get_response(
+            question=content,
+            user_id=user_id,
+            conversation_manager=conversation_manager,
+            media_type=media_type,
+            media_context=media_context,
+            should_commit=should_commit,
+            conversation_id=conversation_id
+        )
+
+        if assistant_reply is None and should_commit is not None:
+            return None, agent_used
+
+        if not assistant_reply or not assistant_reply.strip():
+            company_name = self.company_config.company_name if self.company_config else self.company_id
+            assistant_reply = f"Disculpa, no pude procesar tu mensaje. ¿Podrías intentar de nuevo en {company_name}? 😊"
+
+        logger.debug("🤖 [%s] Assistant response: %.100s", self.company_id, assistant_reply)
+
+        # Send response to Chatwoot
+        if not self.send_message(conversation_id, assistant_reply, idempotency_key=idempotency_key):
+            raise ValueError("Failed to send response to Chatwoot")
+
+        return assistant_reply, agent_used
+
     def handle_conversation_updated(self, data: Dict[str, Any]) -> bool:
         """Handle conversation status updates"""
         try:
@@ -309,9 +402,154 @@ class ChatwootService:
             logger.error(f"[{self.company_id}] Error in image analysis from URL: {e}")
             raise
 
+    def _analyze_attachment(self, attachment_type: str, url: str) -> str:
+        """Run the media analysis for a single attachment (executed in the pool)"""
+        if attachment_type == "audio":
+            return self.transcribe_audio_from_url(url)
+        return self.analyze_image_from_url(url)
+
+    def process_attachments(self, attachments: List[Dict[str, Any]]) -> Tuple[Optional[str], str, List[Dict[str, Any]]]:
+        """
+        Process every supported attachment concurrently.
+
+        Each attachment runs in the shared bounded pool and gets
+        ``ATTACHMENT_TIMEOUT`` seconds measured from when its worker starts it,
+        so time spent queued behind other attachments does not count. A task
+        still queued after ``ATTACHMENT_TIMEOUT`` is cancelled before it starts.
+        A running task cannot be interrupted: once its deadline passes we stop
+        waiting for it and a late result is only logged. Failures and timeouts
+        keep a placeholder in the merged context instead of discarding the
+        other results.
+
+        Returns:
+            Tuple (media_context, media_type, processed_attachments) where
+            media_context keeps the original attachment order.
+        """
+        pending = []
+        for attachment in attachments or []:
+            try:
+                processed = self.process_attachment(attachment)
+            except Exception as e:
+                logger.error(f"❌ [{self.company_id}] Error processing attachment {attachment}: {e}")
+                continue
+
+            if not processed or processed.get("type") not in ["image", "audio"] or not processed.get("url"):
+                continue
+
+            pending.append(processed)
+
+        if not pending:
+            return None, "text", []
+
+        executor = _get_attachment_executor(self.attachment_max_workers)
+        submitted_at = time.time()
+        started = {}
+        finished = {}
+
+        def _run(index: int, attachment_type: str, url: str) -> str:
+            started[index] = time.time()
+            try:
+                return self._analyze_attachment(attachment_type, url)
+            finally:
+                finished[index] = time.time()
+
+        # copy_context: los logs del worker conservan request_id/company_id
+        futures = {
+            executor.submit(contextvars.copy_context().run, _run, index, item["type"], item["url"]): index
+            for index, item in enumerate(pending)
+        }
+
+        labels = {"image": "Image", "audio": "Audio"}
+        texts = {}
+        waiting = set(futures)
+
+        while waiting:
+            now = time.time()
+            for future in [f for f in waiting if f.done()]:
+                waiting.discard(future)
+                index = futures[future]
+                item = pending[index]
+                label = labels[item["type"]]
+                try:
+                    texts[index] = future.result()
+                    item["status"] = "success"
+                    logger.info(f"🎯 [{self.company_id}] {label} processed: {texts[index][:100]}...")
+                except Exception as e:
+                    item["status"] = "failed"
+                    item["error"] = str(e)
+                    action = "transcription" if item["type"] == "audio" else "analysis"
+                    texts[index] = f"[{label} file - {action} failed: {str(e)}]"
+                    logger.error(f"❌ [{self.company_id}] {label} {action} failed: {e}")
+                item["elapsed_ms"] = round((finished.get(index, now) - started.get(index, now)) * 1000, 2)
+
+            deadlines = []
+            for future in list(waiting):
+                index = futures[future]
+                began = started.get(index)
+                if began is not None:
+                    deadline = began + self.attachment_timeout
+                elif future.running():
+                    deadline = now + self.attachment_timeout  # arrancó y aún no registró su inicio
+                else:
+                    deadline = submitted_at + self.attachment_timeout  # tope de espera en cola
+                # cancel() sólo detiene tareas que todavía no empezaron
+                if now < deadline or (began is None and not future.cancel()):
+                    deadlines.append(max(deadline, now))
+                    continue
+                waiting.discard(future)
+                texts[index] = self._abandon_attachment(future, pending[index], began, now)
+
+            if waiting:
+                wait(waiting, timeout=max(0.0, min(deadlines) - time.time()), return_when=FIRST_COMPLETED)
+
+        counters = {"image": 0, "audio": 0}
+        sections = []
+        for index, item in enumerate(pending):
+            counters[item["type"]] += 1
+            sections.append((item["type"], counters[item["type"]], labels[item["type"]], texts[index]))
+
+        types = {item["type"] for item in pending}
+        media_type = pending[0]["type"] if len(types) == 1 else "mixed"
+
+        if len(sections) == 1:
+            media_context = sections[0][3]
+        else:
+            media_context = "\n\n".join(
+                f"[{label} {number}] {text}" for _, number, label, text in sections
+            )
+
+        logger.info(
+            f"📎 [{self.company_id}] {len(pending)} attachments processed in "
+            f"{round((time.time() - submitted_at) * 1000, 2)}ms (media_type: {media_type})"
+        )
+
+        return media_context, media_type, pending
+
+    def _abandon_attachment(self, future, item: Dict[str, Any], began: Optional[float], now: float) -> str:
+        """Stop waiting for an attachment past its deadline; a late result is only logged"""
+        label = "Audio" if item["type"] == "audio" else "Image"
+        item["status"] = "timeout"
+        item["elapsed_ms"] = round((now - began) * 1000, 2) if began else 0.0
+        stage = "processing" if began else "queued"
+        logger.error(
+            f"⏱️ [{self.company_id}] {label} timed out while {stage} after "
+            f"{self.attachment_timeout}s: {item['url']}"
+        )
+
+        if began:
+            company_id = self.company_id
+
+            def _late(done_future):
+                outcome = "failed" if done_future.exception() else "finished"
+                logger.warning(f"⏱️ [{company_id}] {label} {outcome} after its timeout, result discarded: {item['url']}")
+
+            future.add_done_callback(_late)
+
+        return f"[{label} file - processing timed out]"
+
     def process_incoming_message(self, data: Dict[str, Any],
                                  conversation_manager: ConversationManager,
-                                 orchestrator: MultiAgentOrchestrator) -> Dict[str, Any]:
+                                 orchestrator: 'MultiAgentOrchestrator') -> Dict[str, Any]:
         """Process incoming message with multi-tenant context"""
         try:
             # Validar que el orquestador sea del company correcto
@@ -349,125 +587,123 @@ class ChatwootService:
             message_id = data.get("id")
             attachments = data.get("attachments", [])
 
-            logger.info(f"📎 [{self.company_id}] Attachments received: {len(attachments)}")
-
-            # Check for duplicate processing
-            if message_id and self.is_message_already_processed(message_id, conversation_id):
-                return {"status": "already_processed", "ignored": True, "company_id": self.company_id}
+            if attachments:
+                logger.info("📎 [%s] Attachments received: %d", self.company_id, len(attachments))
 
-            # Extract contact information
-            contact_id, extraction_method, is_valid = self.extract_contact_id(data)
-            if not is_valid or not contact_id:
-                raise ValueError("Could not extract valid contact_id from webhook data")
-
-            # Generate user_id with company context
-            user_id = conversation_manager._create_user_id(contact_id)
-
-            logger.info(f"🔄 [{self.company_id}] Processing message from conversation {conversation_id}")
-            logger.info(f"👤 User: {user_id} (contact: {contact_id}, method: {extraction_method})")
-            logger.info(f"💬 Message: {content[:100]}...")
-
-            # Process multimedia attachments
-            media_context = None
-            media_type = "text"
-            processed_attachment = None
-
-            for attachment in attachments:
-                try:
-                    processed_attachment = self.process_attachment(attachment)
-                    
-                    if not processed_attachment:
-                        continue
-                    
-                    attachment_type = processed_attachment.get("type")
-                    url = processed_attachment.get("url")
-                    
-                    if not attachment_type or not url:
-                        continue
-
-                    if attachment_type in ["image", "audio"]:
-                        media_type = attachment_type
-                        
-                        logger.info(f"🎯 [{self.company_id}] Processing {media_type}: {url}")
-
-                        if media_type == "audio":
-                            try:
-                                media_context = self.transcribe_audio_from_url(url)
-                                logger.info(f"🎵 [{self.company_id}] Audio transcribed: {media_context[:100]}...")
-                            except Exception as audio_error:
-                                logger.error(f"❌ [{self.company_id}] Audio transcription failed: {audio_error}")
-                                media_context = f"[Audio file - transcription failed: {str(audio_error)}]"
-
-                        elif media_type == "image":
-                            try:
-                                media_context = self.analyze_image_from_url(url)
-                                logger.info(f"🖼️ [{self.company_id}] Image analyzed: {media_context[:100]}...")
-                            except Exception as image_error:
-                                logger.error(f"❌ [{self.company_id}] Image analysis failed: {image_error}")
-                                media_context = f"[Image file - analysis failed: {str(image_error)}]"
-
-                        break
-
-                except Exception as e:
-                    logger.error(f"❌ [{self.company_id}] Error processing attachment {attachment}: {e}")
-                    continue
-
-            # Validate processable content
-            if not content and not media_context:
-                return {
-                    "status": "success",
-                    "message": "Empty message handled",
-                    "conversation_id": str(conversation_id),
-                    "company_id": self.company_id,
-                    "assistant_reply": f"Por favor, envía un mensaje con contenido para poder ayudarte en {self.company_config.company_name if self.company_config else self.company_id}. 😊"
-                }
+            # Reclamo atómico del evento: reintentos concurrentes de Chatwoot → una sola ejecución
+            store = get_idempotency_store()
+            claim = None
+            if message_id:
+                claim = store.claim(self.company_id, "processed_message", f"{conversation_id}:{message_id}")
+                if claim.duplicate:
+                    return self._duplicate_event_result(claim)
 
-            # Use media context as primary content if no text
-            if not content and media_context:
-                content = media_context
-
-            # Generate response with company-specific orchestrator
-            logger.info(f"🤖 [{self.company_id}] Generating response with media_type: {media_type}")
-            assistant_reply, agent_used = orchestrator.get_response(
-                question=content,
-                user_id=user_id,
-                conversation_manager=conversation_manager,
-                media_type=media_type,
-                media_context=media_context
-            )
-
-            if not assistant_reply or not assistant_reply.strip():
-                company_name = self.company_config.company_name if self.company_config else self.company_id
-                assistant_reply = f"Disculpa, no pude procesar tu mensaje. ¿Podrías intentar de nuevo en {company_name}? 😊"
-
-            logger.info(f"🤖 [{self.company_id}] Assistant response: {assistant_reply[:100]}...")
-
-            # Send response to Chatwoot
-            success = self.send_message(conversation_id, assistant_reply)
+            try:
+                result = self._process_claimed_message(
+                    data, conversation_manager, orchestrator,
+                    conversation_id, conversation_status, content, message_id, attachments
+                )
+            except Exception:
+                if claim is not None:
+                    store.release(claim)
+                raise
+
+            if claim is not None:
+                store.complete(claim, result)
+            return result
 
-            if not success:
-                raise ValueError("Failed to send response to Chatwoot")
+        except Exception as e:
+            logger.exception(f"💥 [{self.company_id}] Error procesando mensaje (ID: {data.get('id', 'unknown')})")
+            raise
 
-            logger.info(f"✅ [{self.company_id}] Successfully processed message for conversation {conversation_id}")
+    def _duplicate_event_result(self, claim) -> Dict[str, Any]:
+        """Reintento de un evento ya reclamado: resultado guardado o aviso de que sigue en curso"""
+        if claim.status == DONE and isinstance(claim.result, dict):
+            return {**claim.result, "idempotent_replay": True}
+        return {
+            "status": "already_processed" if claim.status == DONE else "already_processing",
+            "ignored": True,
+            "company_id": self.company_id
+        }
 
+    def _process_claimed_message(self, data: Dict[str, Any], conversation_manager: ConversationManager,
+                                 orchestrator: 'MultiAgentOrchestrator', conversation_id: Any,
+                                 conversation_status: str, content: str, message_id: Any,
+                                 attachments: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Contacto, adjuntos y respuesta de un evento ya reclamado"""
+        # Extract contact information
+        contact_id, extraction_method, is_valid = self.extract_contact_id(data)
+        if not is_valid or not contact_id:
+            raise ValueError("Could not extract valid contact_id from webhook data")
+
+        # Generate user_id with company context
+        user_id = conversation_manager._create_user_id(contact_id)
+
+        logger.info(
+            "🔄 [%s] Processing message from conversation %s (user: %s, contact: %s, method: %s)",
+            self.company_id, conversation_id, user_id, contact_id, extraction_method
+        )
+        logger.debug("💬 Message: %.100s", content)
+
+        # Process multimedia attachments (all of them, concurrently)
+        media_context, media_type, processed_attachments = self.process_attachments(attachments)
+        processed_attachment = processed_attachments[0] if processed_attachments else None
+
+        # Validate processable content
+        if not content and not media_context:
             return {
                 "status": "success",
-                "message": "Response sent successfully",
-                "company_id": self.company_id,
+                "message": "Empty message handled",
                 "conversation_id": str(conversation_id),
+                "company_id": self.company_id,
+                "assistant_reply": f"Por favor, envía un mensaje con contenido para poder ayudarte en {self.company_config.company_name if self.company_config else self.company_id}. 😊"
+            }
+
+        # Ráfagas: varios mensajes seguidos se responden en un solo turno
+        coalescer = get_burst_coalescer()
+        if coalescer.accepts():
+            result = coalescer.add(self.company_id, conversation_id, user_id, {
+                "message_id": message_id,
+                "text": content,
+                "media_type": media_type,
+                "media_context": media_context
+            })
+            result.update({
+                "company_id": self.company_id,
                 "user_id": user_id,
-                "contact_id": contact_id,
-                "contact_extraction_method": extraction_method,
-                "conversation_status": conversation_status,
                 "message_id": message_id,
-                "bot_active": True,
-                "agent_used": agent_used,
-                "message_length": len(content),
-                "response_length": len(assistant_reply),
                 "media_processed": media_type if media_context else None,
-                "processed_attachment": processed_attachment
-            }
-
-        except Exception as e:
-            logger.exception(f"💥 [{self.company_id}] Error procesando mensaje (ID: {data.get('id', 'unknown')})")
-            raise
+                "processed_attachments": processed_attachments
+            })
+            return result
+
+        # Use media context as primary content if no text
+        if not content and media_context:
+            content = media_context
+
+        assistant_reply, agent_used = self.reply_with_orchestrator(
+            conversation_id, user_id, content, conversation_manager, orchestrator,
+            media_type=media_type, media_context=media_context,
+            idempotency_key=f"reply:{message_id}" if message_id else None
+        )
+
+        logger.info("✅ [%s] Successfully processed message for conversation %s", self.company_id, conversation_id)
+
+        return {
+            "status": "success",
+            "message": "Response sent successfully",
+            "company_id": self.company_id,
+            "conversation_id": str(conversation_id),
+            "user_id": user_id,
+            "contact_id": contact_id,
+            "contact_extraction_method": extraction_method,
+            "conversation_status": conversation_status,
+            "message_id": message_id,
+            "bot_active": True,
+            "agent_used": agent_used,
+            "message_length": len(content),
+            "response_length": len(assistant_reply),
+            "media_processed": media_type if media_context else None,
+            "processed_attachment": processed_attachment,
+            "processed_attachments": processed_attachments
+        }
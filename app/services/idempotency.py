@@ -0,0 +1,246 @@
+"""
+Idempotencia de eventos entrantes y envíos salientes
+
+Chatwoot reintenta webhooks y los reintentos pueden llegar juntos. Un
+EXISTS seguido de SET deja pasar a ambos: los dos corren el pipeline de
+LLM y envían respuestas duplicadas.
+
+Cada evento se reclama con un SET NX atómico sobre su clave:
+- processing: {"state": "processing", "token": ...} con TTL = lease. Si el
+  worker muere, la clave expira y un reintento posterior puede reclamarla.
+- done: {"state": "done", "result": ...} con TTL largo. Un reintento de un
+  evento terminado recibe el resultado guardado sin volver a ejecutarlo.
+
+complete() y release() solo actúan si el token sigue siendo el del dueño
+(script Lua): un worker cuyo lease expiró no pisa al que lo reemplazó.
+
+Ejemplo:
+    claim = store.claim(company_id, "processed_message", f"{conversation_id}:{message_id}")
+    if claim.duplicate:
+        return claim.result or {"status": "already_processing"}
+    try:
+        result = procesar()
+        store.complete(claim, result)
+    except Exception:
+        store.release(claim)
+        raise
+"""
+
+from typing import Dict, Any, Optional
+from dataclasses import dataclass
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from app.config.constants import REDIS_KEY_PATTERNS, REDIS_TTL
+from app.config.settings import app_config_overlay
+from app.services.redis_service import ProcessRedisClient, get_company_redis_prefix, resolve_redis_url
+
+logger = logging.getLogger(__name__)
+
+ACQUIRED = "acquired"
+PROCESSING = "processing"
+DONE = "done"
+
+# KEYS[1] = clave; ARGV = token del dueño, valor final (vacío = borrar), ttl
+FINISH_CLAIM_LUA = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    local ok, data = pcall(cjson.decode, current)
+    if not ok or data['token'] ~= ARGV[1] then
+        return 0
+    end
+end
+if ARGV[2] == '' then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', tonumber(ARGV[3]))
+end
+return 1
+"""
+
+
+def idempotency_config() -> Dict[str, Any]:
+    defaults = {
+        "IDEMPOTENCY_LEASE_SECONDS": int(os.getenv('IDEMPOTENCY_LEASE_SECONDS', '180')),
+        "IDEMPOTENCY_RESULT_TTL": int(os.getenv('IDEMPOTENCY_RESULT_TTL', str(REDIS_TTL["processed_message"])))
+    }
+    return app_config_overlay(defaults)
+
+
+@dataclass
+class IdempotencyClaim:
+    """Resultado de claim(): status ACQUIRED (ejecutar), PROCESSING o DONE (duplicado)"""
+    status: str
+    company_id: str
+    scope: str
+    key: Optional[str] = None
+    token: Optional[str] = None
+    result: Any = None
+
+    @property
+    def acquired(self) -> bool:
+        return self.status == ACQUIRED
+
+    @property
+    def duplicate(self) -> bool:
+        return self.status != ACQUIRED
+
+
+class IdempotencyStore(ProcessRedisClient):
+    """
+    Reclamos atómicos por (empresa, scope, id) en Redis.
+
+    Scopes (patrones de REDIS_KEY_PATTERNS):
+    - processed_message: webhooks entrantes ("{conversation_id}:{message_id}")
+    - outbound_message: envíos a Chatwoot (clave de idempotencia del envío)
+
+    Si Redis falla se ejecuta igual (fail-open, como el chequeo anterior).
+    """
+
+    def __init__(self, lease_seconds: int = 180, result_ttl: int = 3600, redis_client=None):
+        self.lease_seconds = lease_seconds
+        self.result_ttl = result_ttl
+
+        self._redis_url = resolve_redis_url()
+        self._use_client(redis_client)
+        self._script = None
+        self._script_client = None
+
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def key_for(self, company_id: str, scope: str, identifier: Any) -> str:
+        return REDIS_KEY_PATTERNS[scope].format(company_prefix=get_company_redis_prefix(company_id)) + str(identifier)
+
+    # === RECLAMO === #
+
+    def claim(self, company_id: str, scope: str, identifier: Any, lease_seconds: int = None) -> IdempotencyClaim:
+        """Reclamar un evento; solo un llamador obtiene ACQUIRED mientras no expire el lease"""
+        key = self.key_for(company_id, scope, identifier)
+        token = uuid.uuid4().hex
+        processing = json.dumps({"state": PROCESSING, "token": token, "started_at": time.time()})
+
+        try:
+            # Dos intentos: la clave puede expirar entre el SET NX y el GET
+            for _ in range(2):
+                if self.redis.set(key, processing, nx=True, ex=lease_seconds or self.lease_seconds):
+                    self._count(scope, "acquired")
+                    return IdempotencyClaim(ACQUIRED, company_id, scope, key, token)
+
+                raw = self.redis.get(key)
+                if raw is None:
+                    continue
+                data = self._decode(raw)
+                if data.get("state") == DONE:
+                    self._count(scope, "replayed", company_id)
+                    logger.info("[%s] Duplicate %s %s: returning stored result", company_id, scope, identifier)
+                    return IdempotencyClaim(DONE, company_id, scope, key, result=data.get("result"))
+
+                self._count(scope, "suppressed_in_flight", company_id)
+                logger.info("[%s] Duplicate %s %s while the first one is still processing", company_id, scope, identifier)
+                return IdempotencyClaim(PROCESSING, company_id, scope, key)
+        except Exception as e:
+            self._count(scope, "errors")
+            logger.error("[%s] Idempotency claim failed for %s %s, processing anyway: %s", company_id, scope, identifier, e)
+            return IdempotencyClaim(ACQUIRED, company_id, scope)
+
+        self._count(scope, "acquired")
+        return IdempotencyClaim(ACQUIRED, company_id, scope)
+
+    def complete(self, claim: IdempotencyClaim, result: Any = None, ttl: int = None) -> bool:
+        """Marcar como terminado y guardar el resultado para los reintentos"""
+        done = json.dumps({"state": DONE, "token": claim.token, "result": result, "completed_at": time.time()},
+                          ensure_ascii=False, default=str)
+        return self._finish(claim, done, ttl or self.result_ttl)
+
+    def release(self, claim: IdempotencyClaim) -> bool:
+        """Liberar tras un fallo: el próximo reintento vuelve a ejecutar"""
+        released = self._finish(claim, "", 0)
+        if released:
+            self._count(claim.scope, "released")
+        return released
+
+    def _finish(self, claim: IdempotencyClaim, value: str, ttl: int) -> bool:
+        if not claim.acquired or not claim.key:
+            return False
+        try:
+            client = self.redis
+            if self._script is None or self._script_client is not client:
+                self._script = client.register_script(FINISH_CLAIM_LUA)
+                self._script_client = client
+            finished = bool(int(self._script(keys=[claim.key], args=[claim.token, value, ttl])))
+            if not finished:
+                self._count(claim.scope, "lease_lost")
+                logger.warning("[%s] Idempotency lease lost for %s before finishing", claim.company_id, claim.key)
+            return finished
+        except Exception as e:
+            self._count(claim.scope, "errors")
+            logger.error("[%s] Could not finish idempotency claim %s: %s", claim.company_id, claim.key, e)
+            return False
+
+    @staticmethod
+    def _decode(raw: str) -> Dict[str, Any]:
+        try:
+            data = json.loads(raw)
+            return data if isinstance(data, dict) else {"state": DONE}
+        except (TypeError, ValueError):
+            # Marcas antiguas ("1") de is_message_already_processed: evento ya procesado
+            return {"state": DONE}
+
+    # === STATS === #
+
+    def _count(self, scope: str, field: str, company_id: str = None):
+        with self._lock:
+            counters = self._stats.setdefault(scope, {})
+            counters[field] = counters.get(field, 0) + 1
+        if company_id:
+            # Duplicados suprimidos por empresa, compartido entre workers
+            try:
+                self.redis.hincrby(
+                    REDIS_KEY_PATTERNS["idempotency_stats"].format(company_prefix=get_company_redis_prefix(company_id)),
+                    f"{scope}:{field}", 1
+                )
+            except Exception:
+                pass
+
+    def get_stats(self, company_id: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = {"worker": {scope: dict(counters) for scope, counters in self._stats.items()}}
+        for counters in stats["worker"].values():
+            counters["suppressed"] = counters.get("replayed", 0) + counters.get("suppressed_in_flight", 0)
+        if company_id:
+            try:
+                raw = self.redis.hgetall(
+                    REDIS_KEY_PATTERNS["idempotency_stats"].format(company_prefix=get_company_redis_prefix(company_id))
+                )
+                stats["company"] = {field: int(value) for field, value in (raw or {}).items()}
+            except Exception as e:
+                stats["redis_error"] = str(e)
+        return stats
+
+
+# ============================================================================
+# SINGLETON POR WORKER
+# ============================================================================
+
+_store: Optional[IdempotencyStore] = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Obtener el store del worker (lee la configuración de la app si existe)"""
+    global _store
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = idempotency_config()
+                _store = IdempotencyStore(
+                    lease_seconds=config["IDEMPOTENCY_LEASE_SECONDS"],
+                    result_ttl=config["IDEMPOTENCY_RESULT_TTL"]
+                )
+    return _store
@@ -0,0 +1,495 @@
+"""
+MessageBurstCoalescer - Una respuesta por ráfaga de mensajes
+
+En WhatsApp es común enviar varios mensajes cortos seguidos ("hola" /
+"quería saber" / "precio del botox"). Sin agrupar, cada uno dispara un
+orchestrator.get_response y una respuesta distinta en Chatwoot.
+
+- El webhook deja el mensaje (ya validado, deduplicado y con sus adjuntos
+  procesados) en el buffer de la conversación (`message_burst:`) y agenda
+  su vaciado en una cola global (ZSET) a `ahora + ventana`. Cada mensaje
+  nuevo corre el vencimiento, nunca más allá de `inicio de ráfaga + tope`
+  (MESSAGE_BURST_MAX_WAIT_MS acota la latencia).
+- Un thread por worker reclama conversaciones vencidas (un script Lua las
+  mueve de la cola a `message_burst:inflight` con un lease: solo un worker
+  gana cada una), une el buffer en una sola pregunta y llama al
+  orquestador. Al terminar se retira del inflight; si el worker muere a
+  mitad del turno, el lease vence y otro worker la vuelve a encolar.
+  Una conversación se vacía de a una vez (`message_burst_lock`); si ya hay
+  un vaciado en curso se re-agenda.
+- Si llega otro mensaje mientras se genera la respuesta, esa respuesta se
+  descarta antes de guardarse en el historial y de enviarse (superseded):
+  el nuevo vaciado responde la ráfaga completa. Pasado el tope la
+  respuesta se confirma igual, para que un usuario que no deja de escribir
+  reciba respuesta.
+- Si el turno termina sin pasar por el commit (pregunta vacía, error del
+  orquestador), los mensajes leídos se retiran igual: de lo contrario se
+  unirían a la ráfaga siguiente y se responderían dos veces. El lock de
+  vaciado lleva un token y solo lo libera su dueño.
+
+El commit (¿sigue siendo la última versión de la ráfaga? → retirar los
+mensajes consumidos) es un script Lua atómico.
+"""
+
+from typing import Dict, Any, List, Optional, Tuple, Callable
+from contextlib import nullcontext
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from app.config.constants import REDIS_KEY_PATTERNS
+from app.config.settings import app_config_overlay
+from app.services.redis_service import MOVE_DUE_LUA, ProcessRedisClient, get_company_redis_prefix, resolve_redis_url
+from app.utils.logging_config import log_context
+
+logger = logging.getLogger(__name__)
+
+# KEYS = buffer (LIST), meta (HASH); ARGV = seq esperado, mensajes consumidos, forzar, ahora
+COMMIT_BURST_LUA = """
+local seq = redis.call('HGET', KEYS[2], 'seq')
+if seq ~= ARGV[1] and ARGV[3] ~= '1' then
+    return 0
+end
+redis.call('LTRIM', KEYS[1], tonumber(ARGV[2]), -1)
+if redis.call('LLEN', KEYS[1]) == 0 then
+    redis.call('HDEL', KEYS[2], 'first_at')
+else
+    redis.call('HSET', KEYS[2], 'first_at', ARGV[4])
+end
+return 1
+"""
+
+# KEYS = lock; ARGV = token. Solo el dueño libera (un lock vencido pudo pasar a otro worker)
+RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+BURST_TTL = 3600
+# Tope de un vaciado (orquestador + envío); luego otro worker puede tomar la conversación
+FLUSH_LOCK_TTL = 180
+# Lease de una conversación reclamada; vencido (worker caído) vuelve a la cola
+FLUSH_LEASE_SECONDS = FLUSH_LOCK_TTL + 30
+
+
+def burst_config() -> Dict[str, Any]:
+    defaults = {
+        "MESSAGE_BURST_ENABLED": os.getenv('MESSAGE_BURST_ENABLED', 'false').lower() == 'true',
+        "MESSAGE_BURST_WINDOW_MS": int(os.getenv('MESSAGE_BURST_WINDOW_MS', '2500')),
+        "MESSAGE_BURST_MAX_WAIT_MS": int(os.getenv('MESSAGE_BURST_MAX_WAIT_MS', '8000')),
+        "MESSAGE_BURST_CONCURRENCY": int(os.getenv('MESSAGE_BURST_CONCURRENCY', '4')),
+        "MESSAGE_BURST_POLL_INTERVAL": float(os.getenv('MESSAGE_BURST_POLL_INTERVAL', '0.2'))
+    }
+    return app_config_overlay(defaults)
+
+
+def merge_burst(entries: List[Dict[str, Any]]) -> Tuple[str, str, Optional[str]]:
+    """(pregunta, media_type, media_context) de una ráfaga, en orden de llegada"""
+    texts = [entry["text"] for entry in entries if entry.get("text")]
+    contexts = [entry["media_context"] for entry in entries if entry.get("media_context")]
+    media_types = [entry["media_type"] for entry in entries if entry.get("media_type", "text") != "text"]
+
+    media_context = "\n\n".join(contexts) if contexts else None
+    if not media_types:
+        media_type = "text"
+    elif len(set(media_types)) == 1 and len(contexts) == 1:
+        media_type = media_types[0]
+    else:
+        media_type = "mixed"
+
+    question = "\n".join(texts) if texts else (media_context or "")
+    return question, media_type, media_context
+
+
+class MessageBurstCoalescer(ProcessRedisClient):
+    """
+    Ventana de agrupación por conversación.
+
+    - add(): buffer + agenda (webhook, no bloquea)
+    - flush_once(): reclama conversaciones vencidas y las responde con
+      hasta `concurrency` threads por worker
+    - QUEUE_KEY: ZSET "company_id|conversation_id" → vencimiento
+    - INFLIGHT_KEY: ZSET de conversaciones reclamadas → vencimiento del lease
+    """
+
+    QUEUE_KEY = "message_burst:queue"
+    INFLIGHT_KEY = "message_burst:inflight"
+
+    def __init__(self, window_ms: int = 2500, max_wait_ms: int = 8000, concurrency: int = 4,
+                 poll_interval: float = 0.2, enabled: bool = True,
+                 respond: Optional[Callable[..., Tuple[Optional[str], str]]] = None):
+        self.window = window_ms / 1000.0
+        self.max_wait = max(max_wait_ms, window_ms) / 1000.0
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.enabled = enabled and window_ms > 0
+
+        # Orquestador + envío a Chatwoot de una ráfaga; inyectable en tests
+        self._respond = respond or _respond_with_orchestrator
+
+        self._redis_url = resolve_redis_url()
+        self._commit_script = None
+        self._commit_client = None
+        self._release_script = None
+        self._release_client = None
+        self._move_script = None
+        self._move_client = None
+
+        self._app = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+
+        self._stats = {
+            "messages": 0,
+            "turns": 0,
+            "superseded": 0,
+            "forced": 0,
+            "uncommitted": 0,
+            "requeued": 0,
+            "llm_calls": 0,
+            "errors": 0
+        }
+
+    def burst_keys(self, company_id: str, conversation_id: Any) -> Tuple[str, str, str]:
+        """(buffer de mensajes, metadata de la ráfaga, lock de vaciado) de una conversación"""
+        prefix = get_company_redis_prefix(company_id)
+        return tuple(
+            REDIS_KEY_PATTERNS[key_type].format(company_prefix=prefix) + str(conversation_id)
+            for key_type in ("message_burst", "message_burst_meta", "message_burst_lock")
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._pid == os.getpid() and bool(self._thread and self._thread.is_alive())
+
+    def accepts(self) -> bool:
+        """Sin thread de vaciado en este proceso el webhook responde en línea"""
+        return self.enabled and self.running
+
+    # === WEBHOOK === #
+
+    def add(self, company_id: str, conversation_id: Any, user_id: str, entry: Dict[str, Any],
+            now: float = None) -> Dict[str, Any]:
+        """Agregar un mensaje a la ráfaga y (re)agendar su vaciado"""
+        now = now or time.time()
+        buffer_key, meta_key, _ = self.burst_keys(company_id, conversation_id)
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.rpush(buffer_key, json.dumps({**entry, "received_at": now}, ensure_ascii=False))
+        pipe.hincrby(meta_key, "seq", 1)
+        pipe.hsetnx(meta_key, "first_at", now)
+        pipe.hset(meta_key, "user_id", user_id)
+        pipe.hget(meta_key, "first_at")
+        pipe.expire(buffer_key, BURST_TTL)
+        pipe.expire(meta_key, BURST_TTL)
+        burst_size, seq, _, _, first_at = pipe.execute()[:5]
+
+        due_at = min(now + self.window, float(first_at or now) + self.max_wait)
+        self.redis.zadd(self.QUEUE_KEY, {self.queue_member(company_id, conversation_id): due_at})
+        self._stats["messages"] += 1
+
+        logger.debug(
+            "[%s] Message buffered for conversation %s (burst size %d, flush in %.0fms)",
+            company_id, conversation_id, burst_size, (due_at - now) * 1000
+        )
+        return {
+            "status": "buffered",
+            "conversation_id": str(conversation_id),
+            "burst_size": burst_size,
+            "burst_seq": seq,
+            "flush_in_ms": round(max(0.0, due_at - now) * 1000)
+        }
+
+    @staticmethod
+    def queue_member(company_id: str, conversation_id: Any) -> str:
+        return f"{company_id}|{conversation_id}"
+
+    # === VACIADO === #
+
+    def claim_due(self, now: float = None, limit: int = None) -> List[str]:
+        """Reclamar conversaciones vencidas con un lease (solo un worker gana cada una)"""
+        now = now or time.time()
+        return list(self._move(self.QUEUE_KEY, self.INFLIGHT_KEY, now, now + FLUSH_LEASE_SECONDS,
+                               limit or self.concurrency))
+
+    def ack(self, member: str):
+        self.redis.zrem(self.INFLIGHT_KEY, member)
+
+    def requeue_expired(self, now: float = None) -> int:
+        """Devolver a la cola las conversaciones de workers que murieron a mitad del turno"""
+        now = now or time.time()
+        requeued = len(self._move(self.INFLIGHT_KEY, self.QUEUE_KEY, now, now, self.concurrency))
+        if requeued:
+            self._stats["requeued"] += requeued
+            logger.warning("Re-queued %d message bursts whose flush lease expired", requeued)
+        return requeued
+
+    def flush_once(self, now: float = None) -> int:
+        """Un ciclo: re-encolar leases vencidos, reclamar conversaciones vencidas y responderlas. Retorna reclamadas."""
+        self.requeue_expired(now)
+
+        with self._lock:
+            self._inflight = {member: future for member, future in self._inflight.items() if not future.done()}
+            free = self.concurrency - len(self._inflight)
+        if free <= 0:
+            return 0
+
+        claimed = self.claim_due(now, free)
+        for member in claimed:
+            if self._executor is None:
+                self._flush_claimed(member)
+                continue
+            future = self._executor.submit(self._flush_in_context, member)
+            with self._lock:
+                self._inflight[member] = future
+        return len(claimed)
+
+    def _flush_claimed(self, member: str):
+        try:
+            self.flush_conversation(member)
+        finally:
+            self.ack(member)
+
+    def _flush_in_context(self, member: str):
+        company_id = member.partition("|")[0]
+        with self._app_context(), log_context(company_id=company_id):
+            self._flush_claimed(member)
+
+    def flush_conversation(self, member: str) -> Optional[str]:
+        """Responder la ráfaga de una conversación. Retorna el estado del turno."""
+        company_id, _, conversation_id = member.partition("|")
+        buffer_key, meta_key, lock_key = self.burst_keys(company_id, conversation_id)
+
+        token = f"{os.getpid()}:{uuid.uuid4().hex}"
+        if not self.redis.set(lock_key, token, nx=True, ex=FLUSH_LOCK_TTL):
+            # Vaciado en curso: al terminar (o ser superado) se retoma lo que quede
+            self.redis.zadd(self.QUEUE_KEY, {member: time.time() + self.window})
+            return "busy"
+
+        committed = {}
+        raw_entries = []
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.hgetall(meta_key)
+            pipe.lrange(buffer_key, 0, -1)
+            meta, raw_entries = pipe.execute()
+            if not raw_entries:
+                return None
+
+            entries = [json.loads(raw) for raw in raw_entries]
+            seq = meta.get("seq")
+            first_at = float(meta.get("first_at") or time.time())
+            question, media_type, media_context = merge_burst(entries)
+
+            def should_commit() -> bool:
+                """Llamado por el orquestador antes de guardar el historial"""
+                committed["called"] = True
+                forced = time.time() - first_at >= self.max_wait
+                committed["ok"] = self._commit(buffer_key, meta_key, seq, len(raw_entries), forced)
+                committed["forced"] = forced
+                return committed["ok"]
+
+            from app.services.openai_service import count_llm_calls
+            with count_llm_calls() as llm_calls:
+                self._respond(
+                    company_id=company_id,
+                    conversation_id=conversation_id,
+                    user_id=meta.get("user_id"),
+                    question=question,
+                    media_type=media_type,
+                    media_context=media_context,
+                    should_commit=should_commit,
+                    # Una respuesta por ráfaga: la identifica su último mensaje
+                    idempotency_key=f"burst:{entries[-1].get('message_id') or seq}"
+                )
+            self._stats["llm_calls"] += llm_calls[0]
+
+            if not committed.get("called"):
+                # El orquestador respondió sin llegar al commit (pregunta vacía, usuario
+                # inválido, error interno): la ráfaga igual se da por atendida
+                self._discard_burst(member, buffer_key, meta_key, len(raw_entries))
+                self._stats["uncommitted"] += 1
+                logger.info(
+                    "[%s] Burst for conversation %s handled without commit; %d messages consumed",
+                    company_id, conversation_id, len(raw_entries)
+                )
+                return "uncommitted"
+
+            if not committed["ok"]:
+                self._stats["superseded"] += 1
+                logger.info(
+                    "[%s] Reply for conversation %s superseded by newer messages (%d LLM calls discarded)",
+                    company_id, conversation_id, llm_calls[0]
+                )
+                return "superseded"
+
+            self._stats["turns"] += 1
+            self._stats["forced"] += int(committed["forced"])
+            logger.info(
+                "[%s] Burst of %d messages answered in one turn for conversation %s (%d LLM calls, %.1fs since first message)",
+                company_id, len(entries), conversation_id, llm_calls[0], time.time() - first_at
+            )
+            return "answered"
+
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.exception("[%s] Error flushing message burst for conversation %s: %s", company_id, conversation_id, e)
+            if raw_entries and not committed.get("called"):
+                # Sin consumir, los mensajes se volverían a unir (y responder) en el próximo turno
+                try:
+                    self._discard_burst(member, buffer_key, meta_key, len(raw_entries))
+                except Exception as discard_error:
+                    logger.warning("[%s] Could not discard failed burst for conversation %s: %s",
+                                   company_id, conversation_id, discard_error)
+            return "error"
+        finally:
+            self._release_lock(lock_key, token)
+
+    def _discard_burst(self, member: str, buffer_key: str, meta_key: str, consumed: int):
+        """Retirar los mensajes ya procesados y re-agendar los que llegaron después"""
+        self._commit(buffer_key, meta_key, None, consumed, forced=True)
+        if self.redis.llen(buffer_key):
+            self.redis.zadd(self.QUEUE_KEY, {member: time.time() + self.window})
+
+    def _move(self, source: str, destination: str, now: float, score: float, limit: int) -> List[str]:
+        client = self.redis
+        if self._move_script is None or self._move_client is not client:
+            self._move_script = client.register_script(MOVE_DUE_LUA)
+            self._move_client = client
+        return self._move_script(keys=[source, destination], args=[now, score, limit])
+
+    def _release_lock(self, lock_key: str, token: str):
+        client = self.redis
+        if self._release_script is None or self._release_client is not client:
+            self._release_script = client.register_script(RELEASE_LOCK_LUA)
+            self._release_client = client
+        self._release_script(keys=[lock_key], args=[token])
+
+    def _commit(self, buffer_key: str, meta_key: str, seq: Any, consumed: int, forced: bool) -> bool:
+        client = self.redis
+        if self._commit_script is None or self._commit_client is not client:
+            self._commit_script = client.register_script(COMMIT_BURST_LUA)
+            self._commit_client = client
+        return bool(int(self._commit_script(
+            keys=[buffer_key, meta_key],
+            args=[str(seq), consumed, "1" if forced else "0", time.time()]
+        )))
+
+    # === THREAD === #
+
+    def start(self, app=None):
+        """Arrancar el thread de vaciado (uno por proceso, re-arranca tras fork)"""
+        if not self.enabled or self.running:
+            return
+
+        with self._lock:
+            if self.running:
+                return
+
+            self._app = app
+            self._stop_event = threading.Event()
+            self._inflight = {}
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix="message-burst"
+            )
+            self._thread = threading.Thread(target=self._run, name="message-burst-coalescer", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+        logger.info(
+            "MessageBurstCoalescer started (pid=%s, window=%.1fs, max_wait=%.1fs)",
+            self._pid, self.window, self.max_wait
+        )
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False)
+
+    def _app_context(self):
+        return self._app.app_context() if self._app is not None else nullcontext()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.flush_once()
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning("MessageBurstCoalescer cycle error: %s", e)
+
+            self._stop_event.wait(self.poll_interval)
+
+    # === STATS === #
+
+    def get_stats(self) -> Dict[str, Any]:
+        turns = self._stats["turns"]
+        stats = {
+            "enabled": self.enabled,
+            "running": self.running,
+            "window_ms": round(self.window * 1000),
+            "max_wait_ms": round(self.max_wait * 1000),
+            **self._stats,
+            "messages_per_turn": round(self._stats["messages"] / turns, 2) if turns else None,
+            "llm_calls_per_turn": round(self._stats["llm_calls"] / turns, 2) if turns else None
+        }
+        try:
+            stats["pending_conversations"] = self.redis.zcard(self.QUEUE_KEY)
+        except Exception as e:
+            stats["redis_error"] = str(e)
+        return stats
+
+
+def _respond_with_orchestrator(company_id: str, conversation_id: Any, user_id: str, question: str,
+                               media_type: str, media_context: Optional[str],
+                               should_commit: Callable[[], bool], idempotency_key: str = None) -> Tuple[Optional[str], str]:
+    """Orquestador + envío a Chatwoot (requiere app context)"""
+    from app.services.chatwoot_service import ChatwootService
+    from app.services.multi_agent_factory import get_orchestrator_for_company
+    from app.models.conversation import ConversationManager
+
+    orchestrator = get_orchestrator_for_company(company_id)
+    if not orchestrator:
+        raise RuntimeError(f"Orchestrator not available for company {company_id}")
+    return ChatwootService(company_id=company_id).reply_with_orchestrator(
+        conversation_id, user_id, question, ConversationManager(company_id=company_id), orchestrator,
+        media_type=media_type, media_context=media_context, should_commit=should_commit,
+        idempotency_key=idempotency_key
+    )
+
+
+# ============================================================================
+# SINGLETON POR WORKER
+# ============================================================================
+
+_coalescer: Optional[MessageBurstCoalescer] = None
+_coalescer_lock = threading.Lock()
+
+
+def get_burst_coalescer() -> MessageBurstCoalescer:
+    """Obtener el coalescer del worker (lee la configuración de la app si existe)"""
+    global _coalescer
+
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                config = burst_config()
+                _coalescer = MessageBurstCoalescer(
+                    window_ms=config["MESSAGE_BURST_WINDOW_MS"],
+                    max_wait_ms=config["MESSAGE_BURST_MAX_WAIT_MS"],
+                    concurrency=config["MESSAGE_BURST_CONCURRENCY"],
+                    poll_interval=config["MESSAGE_BURST_POLL_INTERVAL"],
+                    enabled=config["MESSAGE_BURST_ENABLED"]
+                )
+    return _coalescer
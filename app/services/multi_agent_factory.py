@@ -1,22 +1,80 @@
 # app/services/multi_agent_factory.py
-from typing import Dict, Any, List, Optional, Tuple
-from app.services.multi_agent_orchestrator import MultiAgentOrchestrator
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Tuple, TYPE_CHECKING
 from app.services.openai_service import OpenAIService
-from app.services.vectorstore_service import VectorstoreService
-from app.services.chatwoot_service import ChatwootService
-from app.services.multimedia_service import MultimediaService
-from app.services.calendar_integration_service import CalendarIntegrationService
-from app.workflows.tool_executor import ToolExecutor
 from app.config.company_config import get_company_manager, get_company_config
 from app.config.extended_company_config import ExtendedCompanyConfig
+from app.config.settings import app_config_overlay
+from app.utils.deadline import DeadlineExceeded
+from app.utils.single_flight import SingleFlight
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
 import logging
+import os
+import threading
+import time
+
+# Agentes, LangGraph, vectorstore e integraciones (Google Calendar, email,
+# multimedia) se importan al construir el primer orquestador: los blueprints
+# importan este módulo y no deben arrastrarlos al arrancar
+if TYPE_CHECKING:
+    from app.services.multi_agent_orchestrator import MultiAgentOrchestrator
+    from app.services.vectorstore_service import VectorstoreService
+    from app.services.chatwoot_service import ChatwootService
+    from app.services.multimedia_service import MultimediaService
+    from app.services.calendar_integration_service import CalendarIntegrationService
+    from app.workflows.tool_executor import ToolExecutor
 
 logger = logging.getLogger(__name__)
 
+
+class WarmupState(Enum):
+    """Estado de preparación del orquestador de una empresa"""
+    COLD = "cold"
+    WARMING = "warming"
+    READY = "ready"
+    FAILED = "failed"
+
+
+@dataclass
+class CompanyWarmup:
+    """Estado + tiempos de construcción (ms por componente) de una empresa"""
+    state: WarmupState = WarmupState.COLD
+    attempts: int = 0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    duration_ms: Optional[float] = None
+    components_ms: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+    waiters: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state.value,
+            "attempts": self.attempts,
+            "started_at": datetime.utcfromtimestamp(self.started_at).isoformat() if self.started_at else None,
+            "finished_at": datetime.utcfromtimestamp(self.finished_at).isoformat() if self.finished_at else None,
+            "duration_ms": self.duration_ms,
+            "components_ms": dict(self.components_ms),
+            "error": self.error,
+            "waiters": self.waiters
+        }
+
+
 class MultiAgentFactory:
-    """Factory para crear y gestionar orquestadores multi-agente por empresa"""
+    """
+    Factory para crear y gestionar orquestadores multi-agente por empresa.
+    
+    La construcción de cada empresa (agentes, vectorstore, grafo LangGraph,
+    tools) es single-flight: una sola construcción en vuelo por empresa;
+    requests concurrentes esperan esa construcción en lugar de duplicarla.
+    Estados: cold → warming → ready | failed (se reintenta tras
+    `failed_retry_after` segundos).
+    """
     
-    def __init__(self):
+    def __init__(self, wait_timeout: float = 120.0, failed_retry_after: float = 10.0):
         self._orchestrators: Dict[str, MultiAgentOrchestrator] = {}
         self._openai_service = None
         self._vectorstore_services: Dict[str, VectorstoreService] = {}
@@ -25,52 +83,160 @@ class MultiAgentFactory:
         # Servicios compartidos (no específicos por empresa)
         self._multimedia_service = None
         self._chatwoot_services: Dict[str, ChatwootService] = {}
+        
+        # Warmup: single-flight por empresa + máquina de estados
+        self.wait_timeout = wait_timeout
+        self.failed_retry_after = failed_retry_after
+        self._warmups: Dict[str, CompanyWarmup] = {}
+        self._flight = SingleFlight()
+        self._lock = threading.RLock()
     
     def get_orchestrator(self, company_id: str) -> Optional[MultiAgentOrchestrator]:
-        """Obtener o crear orquestador para una empresa"""
+        """Obtener o crear orquestador para una empresa (espera un warmup en curso)"""
+        orchestrator = self._orchestrators.get(company_id)
+        if orchestrator is not None:
+            return orchestrator
+        
+        with self._lock:
+            warmup = self._warmups.setdefault(company_id, CompanyWarmup())
+            if (warmup.state == WarmupState.FAILED
+                    and time.time() - (warmup.finished_at or 0) < self.failed_retry_after):
+                # No reconstruir en cada webhook mientras la empresa sigue fallando
+                return None
+            waiting = warmup.state == WarmupState.WARMING
+            if waiting:
+                warmup.waiters += 1
+        
+        if waiting:
+            logger.info(f"[{company_id}] Waiting for in-progress orchestrator warmup")
+        
+        try:
+            return self._flight.do(company_id, lambda: self._build_orchestrator(company_id), timeout=self.wait_timeout)
+        except DeadlineExceeded:
+            logger.warning(f"[{company_id}] Orchestrator warmup still running after {self.wait_timeout}s")
+            return None
+        except Exception as e:
+            logger.error(f"Error creating orchestrator for {company_id}: {e}")
+            return None
+        finally:
+            if waiting:
+                with self._lock:
+                    warmup.waiters -= 1
+    
+    def warmup_async(self, company_id: str, app=None) -> bool:
+        """
+        Disparar el warmup de una empresa en background si está fría (o su
+        fallo ya puede reintentarse). No-op si está lista o calentándose.
+        """
+        with self._lock:
+            warmup = self._warmups.setdefault(company_id, CompanyWarmup())
+            if warmup.state in (WarmupState.READY, WarmupState.WARMING):
+                return False
+            if (warmup.state == WarmupState.FAILED
+                    and time.time() - (warmup.finished_at or 0) < self.failed_retry_after):
+                return False
+            # Marcar antes de crear el thread: un burst de webhooks dispara un solo warmup
+            warmup.state = WarmupState.WARMING
+        
+        def _run():
+            with app.app_context() if app is not None else nullcontext():
+                self.get_orchestrator(company_id)
+        
+        threading.Thread(target=_run, name=f"warmup-{company_id}", daemon=True).start()
+        return True
+    
+    def _build_orchestrator(self, company_id: str) -> Optional[MultiAgentOrchestrator]:
+        """Construcción real (leader del single-flight)"""
+        orchestrator = self._orchestrators.get(company_id)
+        if orchestrator is not None:
+            return orchestrator
+        
+        with self._lock:
+            warmup = self._warmups.setdefault(company_id, CompanyWarmup())
+            warmup.state = WarmupState.WARMING
+            warmup.attempts += 1
+            warmup.started_at = time.time()
+            warmup.finished_at = None
+            warmup.error = None
+            warmup.components_ms = {}
+        
+        start = time.perf_counter()
+        components: Dict[str, float] = {}
+        
+        def _timed(component: str, fn):
+            component_start = time.perf_counter()
+            try:
+                return fn()
+            finally:
+                components[component] = round((time.perf_counter() - component_start) * 1000, 1)
+        
+        orchestrator = None
+        error = None
         try:
-            # Verificar si ya existe
-            if company_id in self._orchestrators:
-                return self._orchestrators[company_id]
-            
             # Validar empresa
             company_manager = get_company_manager()
             if not company_manager.validate_company_id(company_id):
-                logger.error(f"Invalid company_id: {company_id}")
-                return None
+                raise ValueError(f"Invalid company_id: {company_id}")
+            
+            openai_service = _timed("openai_service", self._get_openai_service)
             
-            # Crear OpenAI service si no existe
-            if not self._openai_service:
-                self._openai_service = OpenAIService()
+            from app.services.multi_agent_orchestrator import MultiAgentOrchestrator
             
-            # Crear orquestador
-            orchestrator = MultiAgentOrchestrator(
+            # Crear orquestador (agentes + grafo)
+            orchestrator = _timed("orchestrator", lambda: MultiAgentOrchestrator(
                 company_id=company_id,
-                openai_service=self._openai_service
-            )
+                openai_service=openai_service
+            ))
             
             # ✅ 1. Crear y configurar vectorstore específico
-            vectorstore_service = self._get_vectorstore_service(company_id)
-            orchestrator.set_vectorstore_service(vectorstore_service)
+            vectorstore_service = _timed("vectorstore", lambda: self._get_vectorstore_service(company_id))
+            _timed("vectorstore_injection", lambda: orchestrator.set_vectorstore_service(vectorstore_service))
             
             # ✅ 2. Crear y configurar tool_executor con todos los servicios
-            tool_executor = self._create_tool_executor(company_id, vectorstore_service)
+            tool_executor = _timed("tool_executor", lambda: self._create_tool_executor(company_id, vectorstore_service))
             orchestrator.set_tool_executor(tool_executor)
             
             # Guardar en cache
             self._orchestrators[company_id] = orchestrator
             
-            logger.info(f"✅ Created orchestrator for {company_id} with all services")
-            return orchestrator
-            
         except Exception as e:
+            orchestrator = None
+            error = str(e)
             logger.error(f"Error creating orchestrator for {company_id}: {e}")
-            return None
+        
+        duration_ms = round((time.perf_counter() - start) * 1000, 1)
+        with self._lock:
+            warmup.state = WarmupState.READY if orchestrator is not None else WarmupState.FAILED
+            warmup.finished_at = time.time()
+            warmup.duration_ms = duration_ms
+            warmup.components_ms = components
+            warmup.error = error
+        
+        if orchestrator is not None:
+            logger.info(f"✅ Created orchestrator for {company_id} with all services in {duration_ms}ms {components}")
+        return orchestrator
+    
+    def _get_openai_service(self) -> OpenAIService:
+        """OpenAI service compartido (creado una sola vez aunque varias empresas calienten a la vez)"""
+        if self._openai_service is None:
+            with self._lock:
+                if self._openai_service is None:
+                    self._openai_service = OpenAIService()
+        return self._openai_service
+    
+    def get_warmup_status(self, company_id: str = None) -> Dict[str, Any]:
+        """Estado de warmup por empresa (o de una empresa)"""
+        with self._lock:
+            if company_id is not None:
+                return self._warmups.get(company_id, CompanyWarmup()).to_dict()
+            return {cid: warmup.to_dict() for cid, warmup in self._warmups.items()}
     
     def _create_tool_executor(self, company_id: str, vectorstore_service: VectorstoreService) -> ToolExecutor:
         """
         Crear tool executor con todos los servicios inyectados
         """
+        from app.workflows.tool_executor import ToolExecutor
+        
         try:
             # Verificar cache
             if company_id in self._tool_executors:
@@ -118,6 +284,8 @@ class MultiAgentFactory:
     
     def _get_vectorstore_service(self, company_id: str) -> VectorstoreService:
         """Obtener o crear servicio de vectorstore específico para empresa"""
+        from app.services.vectorstore_service import VectorstoreService
+        
         try:
             # Verificar cache
             if company_id in self._vectorstore_services:
@@ -140,12 +308,17 @@ class MultiAgentFactory:
     def _get_multimedia_service(self) -> MultimediaService:
         """Obtener servicio multimedia (compartido entre empresas)"""
         if not self._multimedia_service:
-            self._multimedia_service = MultimediaService()
-            logger.info("Created shared multimedia service")
+            with self._lock:
+                if not self._multimedia_service:
+                    from app.services.multimedia_service import MultimediaService
+                    self._multimedia_service = MultimediaService()
+                    logger.info("Created shared multimedia service")
         return self._multimedia_service
     
     def _get_chatwoot_service(self, company_id: str) -> ChatwootService:
         """Obtener o crear servicio de Chatwoot específico para empresa"""
+        from app.services.chatwoot_service import ChatwootService
+        
         try:
             # Verificar cache
             if company_id in self._chatwoot_services:
@@ -189,7 +362,8 @@ class MultiAgentFactory:
                 # No hay configuración de calendario
                 return None
             
-            # Crear servicio de calendario
+            # Crear servicio de calendario (el cliente de Google API se importa aquí)
+            from app.services.calendar_integration_service import CalendarIntegrationService
             calendar_service = CalendarIntegrationService(extended_config)
             
             logger.info(f"Created Calendar service ({extended_config.integration_type}) for {company_id}")
@@ -220,6 +394,9 @@ class MultiAgentFactory:
         if company_id in self._chatwoot_services:
             del self._chatwoot_services[company_id]
             logger.info(f"Cleared Chatwoot cache for company: {company_id}")
+        
+        with self._lock:
+            self._warmups.pop(company_id, None)
     
     def clear_all_cache(self):
         """Limpiar todo el cache"""
@@ -227,6 +404,8 @@ class MultiAgentFactory:
         self._vectorstore_services.clear()
         self._tool_executors.clear()
         self._chatwoot_services.clear()
+        with self._lock:
+            self._warmups.clear()
         logger.info("Cleared all caches")
     
     def health_check_all(self) -> Dict[str, Any]:
@@ -254,16 +433,30 @@ class MultiAgentFactory:
 
 # Instancia global del factory
 _multi_agent_factory: Optional[MultiAgentFactory] = None
+_multi_agent_factory_lock = threading.Lock()
 
 def get_multi_agent_factory() -> MultiAgentFactory:
     """Obtener instancia global del factory"""
     global _multi_agent_factory
     
     if _multi_agent_factory is None:
-        _multi_agent_factory = MultiAgentFactory()
+        with _multi_agent_factory_lock:
+            if _multi_agent_factory is None:
+                config = _warmup_config()
+                _multi_agent_factory = MultiAgentFactory(
+                    wait_timeout=config["ORCHESTRATOR_WARMUP_WAIT_TIMEOUT"],
+                    failed_retry_after=config["ORCHESTRATOR_WARMUP_RETRY_AFTER"]
+                )
     
     return _multi_agent_factory
 
+def _warmup_config() -> Dict[str, Any]:
+    defaults = {
+        "ORCHESTRATOR_WARMUP_WAIT_TIMEOUT": float(os.getenv('ORCHESTRATOR_WARMUP_WAIT_TIMEOUT', '120')),
+        "ORCHESTRATOR_WARMUP_RETRY_AFTER": float(os.getenv('ORCHESTRATOR_WARMUP_RETRY_AFTER', '10'))
+    }
+    return app_config_overlay(defaults)
+
 def get_orchestrator_for_company(company_id: str) -> Optional[MultiAgentOrchestrator]:
     """Función de conveniencia para obtener orquestador"""
     factory = get_multi_agent_factory()
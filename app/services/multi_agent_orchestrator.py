@@ -22,7 +22,7 @@ COMPATIBILIDAD:
 - ✅ Mismos retornos
 """
 
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple, Callable
 from app.config.company_config import CompanyConfig, get_company_config
 from app.agents import (
     RouterAgent, EmergencyAgent, SalesAgent,
@@ -41,6 +41,9 @@ from app.services.shared_state_store import SharedStateStore
 
 logger = logging.getLogger(__name__)
 
+# agent_used de una respuesta descartada por should_commit
+SUPERSEDED_AGENT = "superseded"
+
 
 class MultiAgentOrchestrator:
     """
@@ -266,7 +269,9 @@ class MultiAgentOrchestrator:
         user_id: str,
         conversation_manager: ConversationManager,
         media_type: str = "text",
-        media_context: str = None
+        media_context: str = None,
+        should_commit: Optional[Callable[[], bool]] = None,
+        conversation_id: Any = None
     ) -> Tuple[str, str]:
         """
         Método principal para obtener respuesta del sistema multi-agente
@@ -280,9 +285,15 @@ class MultiAgentOrchestrator:
             conversation_manager: Gestor de conversación
             media_type: Tipo de media (text, image, voice)
             media_context: Contexto multimedia
+            should_commit: Se consulta antes de guardar el historial; si
+                retorna False la respuesta quedó obsoleta (llegaron mensajes
+                nuevos) y se descarta sin guardarla
+            conversation_id: Conversación de Chatwoot (avisos de reintentos
+                que terminan en segundo plano)
 
         Returns:
-            Tupla (response: str, agent_used: str)
+            Tupla (response: str, agent_used: str); (None, "superseded") si
+            should_commit la descartó
         """
 
         try:
@@ -301,10 +312,8 @@ class MultiAgentOrchestrator:
             if not user_id or not user_id.strip():
                 return "Error interno: ID de usuario inválido.", "error"
 
-            # Obtener historial de conversación
-            chat_history = conversation_manager.get_chat_history(
-                user_id, format_type="messages"
-            )
+            # Historial: resumen de turnos anteriores + últimos turnos
+            chat_history = conversation_manager.get_context_history(user_id)
 
             # ✅ USAR GRAFO DE LANGGRAPH SI ESTÁ DISPONIBLE
             if self.graph:
@@ -316,7 +325,8 @@ class MultiAgentOrchestrator:
                     question=processed_question.strip(),
                     user_id=user_id,
                     chat_history=chat_history,
-                    context=""
+                    context="",
+                    conversation_id=conversation_id
                 )
             else:
                 # Fallback a implementación directa
@@ -331,6 +341,10 @@ class MultiAgentOrchestrator:
                     "company_id": self.company_id
                 })
 
+            if should_commit is not None and not should_commit():
+                logger.info(f"[{self.company_id}] Response for user {user_id} superseded, not saved")
+                return None, SUPERSEDED_AGENT
+
             # Guardar en conversación
             conversation_manager.add_message(user_id, "user", processed_question)
             conversation_manager.add_message(user_id, "assistant", response)
@@ -396,6 +410,8 @@ class MultiAgentOrchestrator:
             return f"Contexto visual: {media_context}\n\nPregunta: {question}"
         elif media_type == "voice" and media_context:
             return f"Transcripción de voz: {media_context}\n\nPregunta: {question}"
+        elif media_type == "mixed" and media_context and media_context != question:
+            return f"Contexto multimedia:\n{media_context}\n\nPregunta: {question}"
         else:
             return question
 
@@ -234,10 +234,8 @@ class MultiAgentOrchestrator:
             if not user_id or not user_id.strip():
                 return "Error interno: ID de usuario inválido.", "error"
 
-            # Obtener historial de conversación
-            chat_history = conversation_manager.get_chat_history(
-                user_id, format_type="messages"
-            )
+            # Historial: resumen de turnos anteriores + últimos turnos
+            chat_history = conversation_manager.get_context_history(user_id)
 
             # ✅ USAR GRAFO DE LANGGRAPH SI ESTÁ DISPONIBLE
             if self.graph:
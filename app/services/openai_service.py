@@ -1,16 +1,187 @@
 from openai import OpenAI
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_core.runnables import RunnableLambda
 from flask import current_app
+from dataclasses import dataclass
 import requests
 import tempfile
+import hashlib
+import json
 import os
 import logging
-from typing import Optional, Dict, Any
-from PIL import Image
+import threading
+from typing import Optional, Dict, Any, Callable, List, Tuple
+from contextlib import contextmanager
+import contextvars
+from app.utils.deadline import deadline_timeout
+from app.utils.single_flight import SingleFlight
 import io
 
 logger = logging.getLogger(__name__)
 
+
+# ============================================================================
+# REGISTRO DE MODELOS POR AGENTE
+# ============================================================================
+
+@dataclass(frozen=True)
+class ModelProfile:
+    """Modelo y parámetros de generación (None = heredar del nivel anterior)"""
+    model: Optional[str] = None
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+
+    def merged(self, override: Optional["ModelProfile"]) -> "ModelProfile":
+        if override is None:
+            return self
+        return ModelProfile(
+            model=override.model or self.model,
+            max_tokens=override.max_tokens if override.max_tokens is not None else self.max_tokens,
+            temperature=override.temperature if override.temperature is not None else self.temperature
+        )
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> Optional["ModelProfile"]:
+        if not data:
+            return None
+        return cls(
+            model=data.get("model"),
+            max_tokens=data.get("max_tokens"),
+            temperature=data.get("temperature")
+        )
+
+
+# Alias resueltos con la configuración de la app (SMALL_MODEL_NAME / REASONING_MODEL_NAME)
+MODEL_ALIAS_SMALL = "small"
+MODEL_ALIAS_REASONING = "reasoning"
+
+# Perfiles por agente sobre el default de la app (MODEL_NAME/MAX_TOKENS/TEMPERATURE).
+# Cada empresa puede sobrescribirlos con `agent_models` en su configuración
+# ({"router_agent": {"model": "...", "max_tokens": 100}, "default": {...}}).
+AGENT_MODEL_PROFILES: Dict[str, ModelProfile] = {
+    # Salida = etiqueta JSON corta: modelo pequeño y determinista
+    "router_agent": ModelProfile(model=MODEL_ALIAS_SMALL, max_tokens=150, temperature=0.0),
+    "validation": ModelProfile(model=MODEL_ALIAS_SMALL, max_tokens=300, temperature=0.0),
+    "planner": ModelProfile(model=MODEL_ALIAS_REASONING, temperature=0.2),
+    "planner_decision": ModelProfile(model=MODEL_ALIAS_SMALL, temperature=0.0),
+    "config_parsing": ModelProfile(model=MODEL_ALIAS_SMALL, temperature=0.2),
+}
+
+
+# ============================================================================
+# POOL DE CLIENTES + SINGLE-FLIGHT (compartidos por todas las instancias)
+# ============================================================================
+
+_client_pool: Dict[Tuple, Any] = {}
+_client_pool_pid: Optional[int] = None
+_client_pool_lock = threading.Lock()
+
+# Completions idénticas en vuelo (reintentos de Chatwoot, doble webhook) → una sola llamada
+_completion_flight = SingleFlight()
+
+
+def _pooled(key: Tuple, factory: Callable[[], Any]) -> Any:
+    """Cliente compartido por clave (se recrea tras fork: los sockets no se heredan)"""
+    global _client_pool_pid
+    with _client_pool_lock:
+        if _client_pool_pid != os.getpid():
+            _client_pool.clear()
+            _client_pool_pid = os.getpid()
+        client = _client_pool.get(key)
+        if client is None:
+            client = _client_pool[key] = factory()
+        return client
+
+
+def _flight_key(profile: ModelProfile, messages: Any) -> str:
+    """Hash del prompt completo (modelo + parámetros + mensajes)"""
+    if hasattr(messages, "to_messages"):
+        messages = messages.to_messages()
+    if isinstance(messages, str):
+        items = [["human", messages]]
+    else:
+        items = [
+            [message.get("role"), message.get("content")] if isinstance(message, dict)
+            else [getattr(message, "type", None), getattr(message, "content", None)]
+            for message in messages
+        ]
+    payload = json.dumps([profile.model, profile.max_tokens, profile.temperature, items], ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode("utf-8", "ignore"), digest_size=16).hexdigest()
+
+
+def _estimate_tokens(profile: ModelProfile, messages: Any) -> int:
+    """Tokens a reservar antes de la llamada: prompt (tiktoken, cacheado) + max_tokens"""
+    from app.services.prompt_budgeter import get_prompt_budgeter
+    if hasattr(messages, "to_messages"):
+        messages = messages.to_messages()
+    budgeter = get_prompt_budgeter()
+    if isinstance(messages, str):
+        prompt_tokens = budgeter.count(messages)
+    else:
+        prompt_tokens = sum(budgeter.count_message(message) for message in messages)
+    return prompt_tokens + (profile.max_tokens or 0)
+
+
+# Llamadas LLM del turno en curso (MessageBurstCoalescer reporta llamadas por turno)
+_llm_call_counter: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("llm_call_counter", default=None)
+
+
+@contextmanager
+def count_llm_calls():
+    """
+    Ejemplo:
+        with count_llm_calls() as calls:
+            orchestrator.get_response(...)
+        calls[0]  # llamadas LLM (incluye hilos creados con copy_context)
+    """
+    counter = [0]
+    token = _llm_call_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _llm_call_counter.reset(token)
+
+
+def _admit_llm_call(company_id: Optional[str], profile: ModelProfile, messages: Any):
+    """Cuota de tokens/min de la empresa (espera acotada o TenantRateLimited)"""
+    counter = _llm_call_counter.get()
+    if counter is not None:
+        counter[0] += 1
+    if company_id:
+        from app.services.admission_control import get_tenant_limiter
+        get_tenant_limiter().throttle(company_id, "llm_tokens", cost=_estimate_tokens(profile, messages))
+
+
+def _coalesced_invoke(model, profile: ModelProfile, messages, config=None, company_id: str = None):
+    def _invoke():
+        # Solo el leader llama a OpenAI: los seguidores no consumen cuota
+        _admit_llm_call(company_id, profile, messages)
+        return model.invoke(messages, config)
+
+    return _completion_flight.do(
+        _flight_key(profile, messages),
+        _invoke,
+        timeout=deadline_timeout(60)
+    )
+
+
+def reset_client_pool():
+    """Descartar los clientes del pool (hook post-fork; también ocurre solo al cambiar el pid)"""
+    global _client_pool_pid
+    with _client_pool_lock:
+        _client_pool.clear()
+        _client_pool_pid = os.getpid()
+
+
+def get_openai_pool_stats() -> Dict[str, Any]:
+    with _client_pool_lock:
+        pooled = [key[0] for key in _client_pool]
+    return {
+        "pooled_clients": len(pooled),
+        "chat_models": pooled.count("chat"),
+        "single_flight": _completion_flight.get_stats()
+    }
+
 def init_openai(app):
     """Initialize OpenAI configuration"""
     try:
@@ -38,27 +209,72 @@ class OpenAIService:
         self.embedding_model = current_app.config.get('EMBEDDING_MODEL', 'text-embedding-3-small')
         self.max_tokens = current_app.config.get('MAX_TOKENS', 1500)
         self.temperature = current_app.config.get('TEMPERATURE', 0.7)
+        self.model_aliases = {
+            MODEL_ALIAS_SMALL: current_app.config.get('SMALL_MODEL_NAME', 'gpt-4o-mini'),
+            MODEL_ALIAS_REASONING: current_app.config.get('REASONING_MODEL_NAME', 'gpt-4o')
+        }
         
-        self.client = OpenAI(api_key=self.api_key)
+        api_key = self.api_key
+        self.client = _pooled(("openai", api_key), lambda: OpenAI(api_key=api_key))
         
         # Voice and image enabled flags
         self.voice_enabled = current_app.config.get('VOICE_ENABLED', False)
         self.image_enabled = current_app.config.get('IMAGE_ENABLED', False)
     
-    def get_chat_model(self):
-        """Get LangChain ChatOpenAI model"""
-        return ChatOpenAI(
-            api_key=self.api_key,
-            model=self.model_name,
-            max_tokens=self.max_tokens,
-            temperature=self.temperature
-        )
+    def get_model_profile(self, agent_key: str = None, company_id: str = None) -> ModelProfile:
+        """
+        Perfil efectivo de un agente:
+        default de la app < perfil del agente < `agent_models` de la empresa
+        ("default" y luego el del agente).
+        """
+        profile = ModelProfile(self.model_name, self.max_tokens, self.temperature)
+        profile = profile.merged(AGENT_MODEL_PROFILES.get(agent_key))
+        
+        if company_id:
+            from app.config.company_config import get_company_config
+            company_config = get_company_config(company_id)
+            agent_models = getattr(company_config, 'agent_models', None) or {}
+            profile = profile.merged(ModelProfile.from_dict(agent_models.get("default")))
+            profile = profile.merged(ModelProfile.from_dict(agent_models.get(agent_key)))
+        
+        model = self.model_aliases.get(profile.model, profile.model)
+        return ModelProfile(model, profile.max_tokens, profile.temperature)
+    
+    def get_chat_model(self, agent_key: str = None, company_id: str = None):
+        """Get LangChain ChatOpenAI model for an agent (pooled per profile)"""
+        profile = self.get_model_profile(agent_key, company_id)
+        api_key = self.api_key
+        return _pooled(("chat", api_key, profile), lambda: ChatOpenAI(
+            api_key=api_key,
+            model=profile.model,
+            max_tokens=profile.max_tokens,
+            temperature=profile.temperature
+        ))
+    
+    def get_coalesced_chat_model(self, agent_key: str = None, company_id: str = None):
+        """
+        Runnable sobre el ChatOpenAI del agente (el modelo por defecto de
+        BaseAgent, PlanningAgent y ConfigAgent; solo invoke/cadenas).
+        
+        Invocaciones idénticas concurrentes comparten una sola llamada
+        upstream (single-flight por hash del prompt); solo esa llamada se
+        descuenta de la cuota de tokens/min de la empresa. No es un ChatOpenAI: quien necesite
+        bind_tools/with_structured_output usa get_chat_model.
+        """
+        profile = self.get_model_profile(agent_key, company_id)
+        model = self.get_chat_model(agent_key, company_id)
+        return _pooled(("coalesced", self.api_key, profile, company_id), lambda: RunnableLambda(
+            lambda messages, config=None: _coalesced_invoke(model, profile, messages, config, company_id),
+            name=f"coalesced_{profile.model}"
+        ))
     
-    def get_embeddings(self):
-        """Get LangChain OpenAI embeddings"""
+    def get_embeddings(self, dimensions: Optional[int] = None):
+        """Get LangChain OpenAI embeddings (dimensions: tamaño reducido de text-embedding-3-*)"""
+        kwargs = {"dimensions": dimensions} if dimensions else {}
         return OpenAIEmbeddings(
             api_key=self.api_key,
-            model=self.embedding_model
+            model=self.embedding_model,
+            **kwargs
         )
     
     def test_connection(self):
@@ -85,17 +301,34 @@ class OpenAIService:
             logger.error(f"OpenAI validation failed: {e}")
             return False
     
-    def generate_response(self, messages: list, **kwargs) -> str:
-        """Generate response using OpenAI Chat API"""
+    def generate_response(self, messages: list, agent_key: str = None, company_id: str = None, **kwargs) -> str:
+        """Generate response using OpenAI Chat API (identical in-flight calls are coalesced)"""
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                max_tokens=kwargs.get('max_tokens', self.max_tokens),
-                temperature=kwargs.get('temperature', self.temperature)
+            profile = self.get_model_profile(agent_key, company_id)
+            profile = ModelProfile(
+                profile.model,
+                kwargs.get('max_tokens', profile.max_tokens),
+                kwargs.get('temperature', profile.temperature)
             )
             
-            return response.choices[0].message.content
+            def _create():
+                # Cuota solo para el leader (los seguidores comparten su respuesta)
+                _admit_llm_call(company_id, profile, messages)
+                response = self.client.chat.completions.create(
+                    model=profile.model,
+                    messages=messages,
+                    max_tokens=profile.max_tokens,
+                    temperature=profile.temperature,
+                    # Presupuesto restante de la request (si hay deadline activo)
+                    timeout=deadline_timeout(kwargs.get('timeout', 60))
+                )
+                return response.choices[0].message.content
+            
+            return _completion_flight.do(
+                _flight_key(profile, messages),
+                _create,
+                timeout=deadline_timeout(kwargs.get('timeout', 60))
+            )
             
         except Exception as e:
             logger.error(f"Error generating OpenAI response: {e}")
@@ -0,0 +1,355 @@
+"""
+PromptBudgeter - Ensamblado de prompts con presupuesto de tokens
+
+Cada agente tiene un presupuesto de tokens de entrada repartido entre
+system prompt, historial, contexto RAG y pregunta. El historial conserva
+los turnos más recientes (descarta los más antiguos) y el contexto conserva
+los chunks en orden de relevancia (recorta/descarta los de menor valor).
+Lo que una sección no usa queda disponible para el contexto.
+
+Los conteos usan tiktoken (encoding del modelo) y se cachean por mensaje:
+el historial se re-envía en cada turno, así que casi todos los conteos
+salen de la caché.
+"""
+
+from typing import Dict, Any, List, Optional, Iterable
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Caracteres aproximados por token cuando tiktoken no está disponible
+_FALLBACK_CHARS_PER_TOKEN = 4
+
+# Tokens extra por mensaje de chat (rol + separadores del formato ChatML)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Un chunk recortado a menos de esto no aporta: se descarta
+MIN_CHUNK_TOKENS = 48
+
+# Marca (additional_kwargs del mensaje, o clave del dict) de los mensajes que
+# fit_history conserva siempre, p.ej. el resumen de la conversación previa
+PINNED_MESSAGE_KWARG = "pinned"
+
+
+@dataclass(frozen=True)
+class AgentBudget:
+    """Presupuesto de tokens de entrada de un agente"""
+    max_input_tokens: int
+    history_tokens: int
+    context_tokens: int
+    question_tokens: int
+
+
+DEFAULT_BUDGET = AgentBudget(max_input_tokens=6000, history_tokens=1500, context_tokens=2500, question_tokens=800)
+
+AGENT_BUDGETS: Dict[str, AgentBudget] = {
+    "router_agent": AgentBudget(max_input_tokens=2500, history_tokens=600, context_tokens=0, question_tokens=600),
+    "sales_agent": DEFAULT_BUDGET,
+    "support_agent": DEFAULT_BUDGET,
+    "emergency_agent": AgentBudget(max_input_tokens=5000, history_tokens=1000, context_tokens=2000, question_tokens=800),
+    "schedule_agent": AgentBudget(max_input_tokens=6000, history_tokens=2000, context_tokens=2000, question_tokens=800),
+    "availability_agent": AgentBudget(max_input_tokens=4000, history_tokens=800, context_tokens=1500, question_tokens=600),
+}
+
+
+@dataclass
+class PromptAllocation:
+    """Tokens asignados a una llamada concreta (se completa a medida que se arma el prompt)"""
+    agent_key: str
+    budget: AgentBudget
+    system_tokens: int = 0
+    history_tokens: int = 0
+    context_tokens: int = 0
+    question_tokens: int = 0
+    dropped_turns: int = 0
+    dropped_chunks: int = 0
+    trimmed: List[str] = field(default_factory=list)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.system_tokens + self.history_tokens + self.context_tokens + self.question_tokens
+
+    def context_allowance(self) -> int:
+        """Tokens disponibles para contexto: su cupo + lo que no usaron las demás secciones"""
+        free = self.budget.max_input_tokens - self.total_tokens
+        return max(0, min(free, self.budget.context_tokens + max(0, self.budget.history_tokens - self.history_tokens)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "agent": self.agent_key,
+            "input_tokens": self.total_tokens,
+            "system_tokens": self.system_tokens,
+            "history_tokens": self.history_tokens,
+            "context_tokens": self.context_tokens,
+            "question_tokens": self.question_tokens,
+            "dropped_turns": self.dropped_turns,
+            "dropped_chunks": self.dropped_chunks,
+            "trimmed": list(self.trimmed)
+        }
+
+
+class PromptBudgeter:
+    """
+    Conteo de tokens con caché + recorte de secciones del prompt.
+
+    Ejemplo de uso:
+        budgeter = get_prompt_budgeter()
+        allocation = budgeter.allocate("sales_agent", system_prompt=template_text)
+        history = budgeter.fit_history(chat_history, allocation)
+        question = budgeter.fit_question(question, allocation)
+        context = budgeter.fit_context(chunks, allocation)   # ya en orden de relevancia
+        budgeter.record(company_id, allocation)
+    """
+
+    def __init__(self, model_name: str = "gpt-4o-mini", cache_size: int = 8192):
+        self.model_name = model_name
+        self._encoding = None
+        self._encoding_loaded = False
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+        # Métrica: tokens de entrada por llamada, por empresa/agente
+        self._metrics: Dict[str, Dict[str, Any]] = {}
+
+    # === CONTEO === #
+
+    def _get_encoding(self):
+        if not self._encoding_loaded:
+            self._encoding_loaded = True
+            try:
+                import tiktoken
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.model_name)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                logger.warning(f"tiktoken not available, using character estimate: {e}")
+                self._encoding = None
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        """Tokens de un texto (cacheado por contenido)"""
+        if not text:
+            return 0
+
+        key = hashlib.blake2b(text.encode("utf-8", "ignore"), digest_size=16).hexdigest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        encoding = self._get_encoding()
+        if encoding is not None:
+            tokens = len(encoding.encode(text, disallowed_special=()))
+        else:
+            tokens = (len(text) + _FALLBACK_CHARS_PER_TOKEN - 1) // _FALLBACK_CHARS_PER_TOKEN
+
+        with self._lock:
+            self._cache[key] = tokens
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def count_message(self, message: Any) -> int:
+        """Tokens de un mensaje de chat (BaseMessage de LangChain o dict role/content)"""
+        content = getattr(message, "content", None)
+        if content is None and isinstance(message, dict):
+            content = message.get("content")
+        if not isinstance(content, str):
+            content = str(content or "")
+        return self.count(content) + MESSAGE_OVERHEAD_TOKENS
+
+    def trim_text(self, text: str, max_tokens: int) -> str:
+        """Recortar un texto a max_tokens (conserva el inicio)"""
+        if max_tokens <= 0 or not text:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+
+        encoding = self._get_encoding()
+        if encoding is not None:
+            return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+        return text[:max_tokens * _FALLBACK_CHARS_PER_TOKEN]
+
+    # === ASIGNACIÓN === #
+
+    def get_budget(self, agent_key: str) -> AgentBudget:
+        return AGENT_BUDGETS.get(agent_key, DEFAULT_BUDGET)
+
+    def allocate(self, agent_key: str, system_prompt: str = "", budget: AgentBudget = None) -> PromptAllocation:
+        """Iniciar la asignación de una llamada (el system prompt es fijo)"""
+        allocation = PromptAllocation(agent_key=agent_key, budget=budget or self.get_budget(agent_key))
+        allocation.system_tokens = self.count(system_prompt)
+        return allocation
+
+    def fit_question(self, question: str, allocation: PromptAllocation) -> str:
+        """La pregunta se conserva completa salvo que exceda su cupo"""
+        fitted = question
+        if self.count(question) > allocation.budget.question_tokens:
+            fitted = self.trim_text(question, allocation.budget.question_tokens)
+            allocation.trimmed.append("question")
+        allocation.question_tokens = self.count(fitted)
+        return fitted
+
+    @staticmethod
+    def _is_pinned_message(message: Any) -> bool:
+        if isinstance(message, dict):
+            return message.get("role") == "system" or bool(message.get(PINNED_MESSAGE_KWARG))
+        if getattr(message, "type", None) == "system":
+            return True
+        return bool((getattr(message, "additional_kwargs", None) or {}).get(PINNED_MESSAGE_KWARG))
+
+    def fit_history(self, messages: Optional[List[Any]], allocation: PromptAllocation) -> List[Any]:
+        """
+        Conservar los turnos más recientes que quepan en el cupo de historial.
+
+        Los mensajes iniciales de sistema o marcados con PINNED_MESSAGE_KWARG
+        (resumen de la conversación previa) se conservan siempre y descuentan
+        su tamaño del cupo.
+        """
+        if not messages:
+            return []
+
+        pinned: List[Any] = []
+        for message in messages:
+            if not self._is_pinned_message(message):
+                break
+            pinned.append(message)
+
+        limit = allocation.budget.history_tokens
+        used = sum(self.count_message(message) for message in pinned)
+        kept: List[Any] = []
+        for message in reversed(messages[len(pinned):]):
+            tokens = self.count_message(message)
+            if used + tokens > limit:
+                break
+            kept.append(message)
+            used += tokens
+
+        kept.reverse()
+        kept = pinned + kept
+        allocation.history_tokens = used
+        allocation.dropped_turns = len(messages) - len(kept)
+        if allocation.dropped_turns:
+            allocation.trimmed.append("history")
+        return kept
+
+    def fit_context(
+        self,
+        chunks: Iterable[str],
+        allocation: Optional[PromptAllocation] = None,
+        max_tokens: Optional[int] = None,
+        separator: str = "\n\n"
+    ) -> str:
+        """
+        Unir chunks (en orden de relevancia) dentro del cupo de contexto.
+
+        Duplicados exactos se omiten; el primer chunk que no cabe se recorta
+        si aún aporta (>= MIN_CHUNK_TOKENS) y los siguientes se descartan.
+        """
+        if max_tokens is None:
+            max_tokens = allocation.context_allowance() if allocation else DEFAULT_BUDGET.context_tokens
+
+        separator_tokens = self.count(separator)
+        selected: List[str] = []
+        seen = set()
+        used = 0
+        dropped = 0
+
+        for chunk in chunks:
+            if not chunk or chunk in seen:
+                continue
+            seen.add(chunk)
+
+            separator_cost = separator_tokens if selected else 0
+            remaining = max_tokens - used - separator_cost
+            tokens = self.count(chunk)
+            if tokens <= remaining:
+                selected.append(chunk)
+                used += separator_cost + tokens
+            elif remaining >= MIN_CHUNK_TOKENS:
+                selected.append(self.trim_text(chunk, remaining))
+                used = max_tokens
+            else:
+                dropped += 1
+
+        context = separator.join(selected)
+        if allocation is not None:
+            allocation.context_tokens = self.count(context)
+            allocation.dropped_chunks += dropped
+            if dropped or used >= max_tokens:
+                allocation.trimmed.append("context")
+        return context
+
+    # === MÉTRICAS === #
+
+    def record(self, company_id: str, allocation: PromptAllocation):
+        """Registrar los tokens de entrada de una llamada"""
+        key = f"{company_id}:{allocation.agent_key}"
+        with self._lock:
+            metric = self._metrics.setdefault(key, {
+                "calls": 0,
+                "input_tokens_total": 0,
+                "input_tokens_max": 0,
+                "input_tokens_last": 0,
+                "trimmed_calls": 0,
+                "dropped_turns": 0,
+                "dropped_chunks": 0
+            })
+            metric["calls"] += 1
+            metric["input_tokens_total"] += allocation.total_tokens
+            metric["input_tokens_last"] = allocation.total_tokens
+            metric["input_tokens_max"] = max(metric["input_tokens_max"], allocation.total_tokens)
+            metric["dropped_turns"] += allocation.dropped_turns
+            metric["dropped_chunks"] += allocation.dropped_chunks
+            if allocation.trimmed:
+                metric["trimmed_calls"] += 1
+
+        logger.debug(f"[{company_id}] Prompt tokens: {allocation.to_dict()}")
+
+    def get_metrics(self, company_id: Optional[str] = None) -> Dict[str, Any]:
+        """Tokens de entrada por llamada (promedio/máx/último) por empresa y agente"""
+        with self._lock:
+            items = [
+                (key, dict(metric)) for key, metric in self._metrics.items()
+                if company_id is None or key.startswith(f"{company_id}:")
+            ]
+
+        result = {}
+        for key, metric in items:
+            metric["input_tokens_avg"] = (
+                metric["input_tokens_total"] / metric["calls"] if metric["calls"] else 0.0
+            )
+            result[key] = metric
+
+        return {
+            "model": self.model_name,
+            "token_cache_size": len(self._cache),
+            "agents": result
+        }
+
+
+_budgeter: Optional[PromptBudgeter] = None
+_budgeter_lock = threading.Lock()
+
+
+def get_prompt_budgeter(model_name: Optional[str] = None) -> PromptBudgeter:
+    """Budgeter compartido del proceso (la caché de conteos es común a todos los agentes)"""
+    global _budgeter
+    with _budgeter_lock:
+        if _budgeter is None:
+            if model_name is None:
+                try:
+                    from flask import current_app, has_app_context
+                    if has_app_context():
+                        model_name = current_app.config.get("MODEL_NAME")
+                except Exception:
+                    pass
+            _budgeter = PromptBudgeter(model_name=model_name or "gpt-4o-mini")
+        return _budgeter
@@ -1,10 +1,29 @@
 
 import redis
-from flask import current_app, g
+from flask import current_app, g, has_app_context
+from typing import Any, Dict, Optional
 import logging
+import os
+import threading
 
 logger = logging.getLogger(__name__)
 
+# KEYS = origen, destino (ZSETs); ARGV = score máximo, nuevo score, límite.
+# Mover de un ZSET a otro en un solo paso (reclamar con lease, re-encolar
+# leases vencidos): un crash entre ZREM y ZADD perdería el trabajo
+MOVE_DUE_LUA = """
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[3]))
+for _, member in ipairs(members) do
+    redis.call('ZREM', KEYS[1], member)
+    redis.call('ZADD', KEYS[2], ARGV[2], member)
+end
+return members
+"""
+
+_process_clients: Dict[str, Any] = {}
+_process_clients_pid: Optional[int] = None
+_process_clients_lock = threading.Lock()
+
 def get_redis_client():
     """Get Redis client from Flask g object or create new one"""
     if 'redis_client' not in g:
@@ -14,6 +33,57 @@ def get_redis_client():
         )
     return g.redis_client
 
+def resolve_redis_url() -> str:
+    """REDIS_URL de la app si hay app context; si no (threads de background), del entorno"""
+    try:
+        if has_app_context():
+            return current_app.config['REDIS_URL']
+    except KeyError:
+        pass
+    return os.getenv('REDIS_URL', 'redis://localhost:6379')
+
+def get_process_redis_client(redis_url: str = None):
+    """
+    Cliente compartido por el proceso (uno por URL) para servicios con
+    threads de background, que no tienen `g`. Tras un fork se crean de
+    nuevo: el pool de conexiones del padre no se comparte.
+    """
+    global _process_clients_pid
+    redis_url = redis_url or resolve_redis_url()
+
+    client = _process_clients.get(redis_url)
+    if client is not None and _process_clients_pid == os.getpid():
+        return client
+
+    with _process_clients_lock:
+        if _process_clients_pid != os.getpid():
+            _process_clients.clear()
+            _process_clients_pid = os.getpid()
+        client = _process_clients.get(redis_url)
+        if client is None:
+            client = _process_clients[redis_url] = redis.from_url(redis_url, decode_responses=True)
+        return client
+
+class ProcessRedisClient:
+    """
+    Mixin: `self.redis` es el cliente del proceso para `self._redis_url`, o
+    el inyectado con _use_client() (tests) mientras no haya fork.
+    """
+
+    _redis_url: str = ""
+    _client = None
+    _client_pid: Optional[int] = None
+
+    @property
+    def redis(self):
+        if self._client is not None and self._client_pid == os.getpid():
+            return self._client
+        return get_process_redis_client(self._redis_url)
+
+    def _use_client(self, client):
+        self._client = client
+        self._client_pid = os.getpid() if client is not None else None
+
 def init_redis(app):
     """Initialize Redis connection"""
     try:
@@ -31,16 +101,18 @@ def close_redis(e=None):
     if client is not None:
         client.close()
 
+def get_company_redis_prefix(company_id: str) -> str:
+    """Prefijo de claves de la empresa (`{company_id}:` si no tiene configuración)"""
+    from app.config.company_config import get_company_config
+    
+    config = get_company_config(company_id)
+    return config.redis_prefix if config else f"{company_id}:"
+
 def get_company_redis_key(company_id: str, key_type: str, identifier: str = "") -> str:
     """Generate company-specific Redis key"""
-    from app.config.company_config import get_company_config
     from app.config.constants import REDIS_KEY_PATTERNS
     
-    config = get_company_config(company_id)
-    if config:
-        prefix = config.redis_prefix
-    else:
-        prefix = f"{company_id}:"
+    prefix = get_company_redis_prefix(company_id)
     
     pattern = REDIS_KEY_PATTERNS.get(key_type, "{company_prefix}{key_type}:")
     base_key = pattern.format(company_prefix=prefix, company_id=company_id, key_type=key_type)
@@ -1,5 +1,13 @@
 from app.services.redis_service import get_redis_client
 from app.config.company_config import get_company_config
+from app.services.vector_index import VectorIndexAlias, count_tenant_documents, ensure_shared_index
+from app.services.vector_health import (
+    publish_health,
+    read_document_count,
+    read_health,
+    reconcile_document_count,
+    request_health_check
+)
 from flask import current_app
 import logging
 import json
@@ -10,26 +18,41 @@ from typing import Dict, Any, List, Optional
 
 logger = logging.getLogger(__name__)
 
+
+def _is_missing_index_error(error: Exception) -> bool:
+    """FT.INFO sobre un índice inexistente (no un error transitorio de Redis)"""
+    message = str(error).lower()
+    return "unknown index name" in message or "no such index" in message
+
+
 class RedisVectorAutoRecovery:
     """
     Sistema de auto-recuperación para vectorstore Redis - Multi-tenant
+    
+    La verificación (check_now) la corre VectorHealthMonitor en background;
+    verify_index_health() solo lee el estado que publica.
     """
     
+    # Segundos que el proceso reutiliza el estado publicado antes de releerlo
+    STATUS_CACHE_SECONDS = 5.0
+    # Verificaciones seguidas con el índice inexistente/vacío antes de reconstruir
+    RECOVERY_CONFIRMATIONS = 3
+    
     def __init__(self, company_id: str = "default"):
         self.company_id = company_id
         self.company_config = get_company_config(company_id)
         
         if self.company_config:
-            self.index_name = self.company_config.vectorstore_index
+            self.base_index_name = self.company_config.vectorstore_index
             self.redis_prefix = self.company_config.redis_prefix
         else:
-            self.index_name = f"{company_id}_documents"
+            self.base_index_name = f"{company_id}_documents"
             self.redis_prefix = f"{company_id}:"
         
         self.redis_client = get_redis_client()
-        self.metadata_key = f"__recovery_metadata__{self.index_name}"
-        self.backup_key = f"__backup_docs__{self.index_name}"
-        self.documents_pattern = f"{self.index_name}:*"
+        self.index_alias = VectorIndexAlias(self.redis_client, company_id, self.redis_prefix, self.base_index_name)
+        self.metadata_key = f"__recovery_metadata__{self.base_index_name}"
+        self.backup_key = f"__backup_docs__{self.base_index_name}"
         self.health_cache = {"last_check": 0, "status": None}
         self._recovery_lock = threading.Lock()
         
@@ -38,29 +61,67 @@ class RedisVectorAutoRecovery:
         self.recovery_timeout = current_app.config.get('VECTORSTORE_RECOVERY_TIMEOUT', 60)
         self.auto_recovery_enabled = current_app.config.get('VECTORSTORE_AUTO_RECOVERY', True)
         
-        logger.info(f"Auto-recovery initialized for company: {company_id} (index: {self.index_name})")
+        logger.info(f"Auto-recovery initialized for company: {company_id} (index: {self.base_index_name})")
     
-    def verify_index_health(self) -> Dict[str, Any]:
-        """Verificar estado del índice con cache inteligente multi-tenant"""
-        current_time = time.time()
+    @property
+    def index_name(self) -> str:
+        """Índice físico activo del alias (cambia tras un re-index)"""
+        try:
+            return self.index_alias.active_index()
+        except Exception:
+            return self.base_index_name
+    
+    @property
+    def key_prefix(self) -> str:
+        return self.index_alias.key_prefix_for(self.index_name)
+    
+    @property
+    def documents_pattern(self) -> str:
+        return f"{self.key_prefix}:*"
+    
+    def stored_document_count(self, reconcile: bool = False) -> Optional[int]:
+        """Documentos almacenados según el contador; reconcile recuenta con SCAN (solo en background)"""
+        key_prefix = self.key_prefix
+        count = None if reconcile else read_document_count(self.redis_client, self.redis_prefix, key_prefix)
+        if count is None and reconcile:
+            count = reconcile_document_count(self.redis_client, self.redis_prefix, key_prefix)
+        return count
+    
+    def probe_index_health(self, reconcile: bool = False) -> Dict[str, Any]:
+        """
+        Verificar el índice contra Redis: FT.INFO (o FT.SEARCH por TAG) + contador, sin SCAN salvo reconcile.
         
-        # Cache for health_check_interval seconds
-        if (current_time - self.health_cache["last_check"]) < self.health_check_interval and self.health_cache["status"]:
-            return self.health_cache["status"]
+        Solo un índice confirmado como inexistente o vacío con documentos
+        almacenados marca needs_recovery; cualquier otro error (Redis caído,
+        timeout de FT.SEARCH) se reporta como status "unknown".
+        """
+        current_time = time.time()
+        index_name = self.index_name
         
         try:
-            # Verificar índice específico de empresa
-            info = self.redis_client.ft(self.index_name).info()
-            doc_count = info.get('num_docs', 0)
+            # Verificar índice específico de empresa (en el compartido, solo sus documentos)
+            index_exists = True
+            if self.index_alias.is_shared(index_name):
+                doc_count = count_tenant_documents(self.redis_client, index_name, self.company_id)
+            else:
+                try:
+                    info = self.redis_client.ft(index_name).info()
+                    doc_count = int(info.get('num_docs', 0))
+                except Exception as e:
+                    if not _is_missing_index_error(e):
+                        raise
+                    index_exists, doc_count = False, 0
             
-            # Contar documentos almacenados específicos de empresa
-            stored_keys = list(self.redis_client.scan_iter(match=self.documents_pattern))
-            stored_count = len(stored_keys)
+            # Sin contador todavía (lo crea la primera reconciliación) se asume consistente
+            stored_count = self.stored_document_count(reconcile)
+            if stored_count is None:
+                stored_count = doc_count
             
-            health_status = {
+            return {
                 "company_id": self.company_id,
-                "index_name": self.index_name,
-                "index_exists": True,
+                "index_name": index_name,
+                "status": "healthy" if doc_count > 0 else "needs_recovery" if stored_count > 0 else "empty",
+                "index_exists": index_exists,
                 "index_functional": doc_count > 0,
                 "stored_documents": stored_count,
                 "index_doc_count": doc_count,
@@ -69,24 +130,90 @@ class RedisVectorAutoRecovery:
                 "timestamp": current_time
             }
             
-            self.health_cache = {"last_check": current_time, "status": health_status}
-            return health_status
-            
         except Exception as e:
             logger.error(f"[{self.company_id}] Error checking index health: {e}")
-            health_status = {
+            return {
                 "company_id": self.company_id,
-                "index_name": self.index_name,
-                "index_exists": False,
+                "index_name": index_name,
+                "status": "unknown",
+                "index_exists": None,
                 "index_functional": False,
-                "stored_documents": 0,
-                "needs_recovery": True,
+                "stored_documents": None,
+                "needs_recovery": False,
                 "healthy": False,
                 "error": str(e),
                 "timestamp": current_time
             }
-            self.health_cache = {"last_check": current_time, "status": health_status}
-            return health_status
+    
+    def check_now(self, reconcile: bool = False) -> Dict[str, Any]:
+        """
+        Verificar, reconstruir si hace falta y publicar el estado (monitor y admin, nunca el request path).
+        
+        Reconstruye solo tras RECOVERY_CONFIRMATIONS verificaciones seguidas
+        que confirman el índice inexistente o vacío, y nunca un índice
+        compartido (ahí solo alerta).
+        """
+        try:
+            if not reconcile and read_document_count(self.redis_client, self.redis_prefix, self.key_prefix) is None:
+                # Índice nuevo (p.ej. tras un re-index) todavía sin contador
+                reconcile = True
+        except Exception as e:
+            logger.warning(f"[{self.company_id}] Could not read document counter: {e}")
+        health = self.probe_index_health(reconcile)
+        
+        if health["needs_recovery"]:
+            try:
+                previous = read_health(self.redis_client, self.redis_prefix) or {}
+            except Exception:
+                previous = {}
+            confirmations = previous.get("recovery_confirmations", 0) + 1 if previous.get("needs_recovery") else 1
+            health["recovery_confirmations"] = confirmations
+            
+            if self.index_alias.is_shared(health["index_name"]):
+                logger.error(
+                    f"[{self.company_id}] Shared index {health['index_name']} returns no documents for this "
+                    f"company ({health['stored_documents']} stored); not rebuilding automatically"
+                )
+            elif confirmations >= self.RECOVERY_CONFIRMATIONS and self.auto_recovery_enabled:
+                logger.warning(f"[{self.company_id}] Index needs recovery ({confirmations} checks), attempting reconstruction...")
+                recovered = self.reconstruct_index_from_stored_data()
+                health = {**self.probe_index_health(), "recovery_attempted": True, "recovered": recovered}
+        
+        try:
+            publish_health(self.redis_client, self.redis_prefix, health, ttl=self.health_check_interval * 3)
+        except Exception as e:
+            logger.warning(f"[{self.company_id}] Could not publish index health: {e}")
+        
+        self.health_cache = {"last_check": time.time(), "status": health}
+        return health
+    
+    def verify_index_health(self) -> Dict[str, Any]:
+        """Estado publicado por el monitor (cacheado en el proceso); sin SCAN ni recuperación"""
+        current_time = time.time()
+        
+        if (current_time - self.health_cache["last_check"]) < self.STATUS_CACHE_SECONDS and self.health_cache["status"]:
+            return self.health_cache["status"]
+        
+        try:
+            health = read_health(self.redis_client, self.redis_prefix)
+        except Exception as e:
+            logger.warning(f"[{self.company_id}] Could not read published index health: {e}")
+            health = None
+        
+        if health is None:
+            # Monitor apagado o aún sin publicar: verificación liviana (sin SCAN ni recuperación)
+            health = self.probe_index_health()
+        
+        self.health_cache = {"last_check": current_time, "status": health}
+        return health
+    
+    def request_check(self):
+        """Pedir al monitor una verificación inmediata (p.ej. tras un error en el request path)"""
+        self.health_cache = {"last_check": 0, "status": None}
+        try:
+            request_health_check(self.redis_client, self.company_id)
+        except Exception as e:
+            logger.warning(f"[{self.company_id}] Could not request index health check: {e}")
     
     def reconstruct_index_from_stored_data(self) -> bool:
         """Reconstruir índice desde datos almacenados específico de empresa"""
@@ -98,21 +225,23 @@ class RedisVectorAutoRecovery:
             try:
                 logger.info(f"[{self.company_id}] Starting index reconstruction...")
                 
-                # Obtener documentos almacenados de esta empresa
-                stored_docs = self._get_stored_documents()
-                if not stored_docs:
+                # Documentos almacenados de esta empresa
+                stored_count = self.stored_document_count(reconcile=True)
+                if not stored_count:
                     logger.warning(f"[{self.company_id}] No stored documents found")
                     return False
                 
-                # Eliminar índice corrupto específico de empresa
+                index_name = self.index_name
+                if self.index_alias.is_shared(index_name):
+                    return self._ensure_shared_index(index_name)
+                
+                # Eliminar índice corrupto específico de empresa (FT.DROPINDEX es sincrónico)
                 try:
-                    self.redis_client.ft(self.index_name).dropindex(delete_documents=False)
-                    logger.info(f"[{self.company_id}] Dropped corrupted index: {self.index_name}")
+                    self.redis_client.ft(index_name).dropindex(delete_documents=False)
+                    logger.info(f"[{self.company_id}] Dropped corrupted index: {index_name}")
                 except:
                     pass
                 
-                time.sleep(1)
-                
                 # Recrear índice usando VectorstoreService específico de empresa
                 try:
                     from app.services.vectorstore_service import VectorstoreService
@@ -122,7 +251,7 @@ class RedisVectorAutoRecovery:
                     # Limpiar cache
                     self.health_cache = {"last_check": 0, "status": None}
                     
-                    logger.info(f"[{self.company_id}] Index reconstructed: {len(stored_docs)} docs available")
+                    logger.info(f"[{self.company_id}] Index reconstructed: {stored_count} docs available")
                     return True
                     
                 except Exception as e:
@@ -133,45 +262,36 @@ class RedisVectorAutoRecovery:
                 logger.error(f"[{self.company_id}] Error in reconstruction: {e}")
                 return False
     
-    def _get_stored_documents(self) -> List[Dict]:
-        """Obtener documentos almacenados específicos de empresa"""
+    def _ensure_shared_index(self, index_name: str) -> bool:
+        """
+        El índice compartido sirve a todas las empresas: nunca se elimina por
+        una sola. Solo se recrea el esquema si falta; si existe y aun así no
+        ve los documentos de la empresa, se alerta para revisión manual.
+        """
         try:
-            docs = []
-            keys = list(self.redis_client.scan_iter(match=self.documents_pattern))
-            
-            for key in keys:
-                try:
-                    doc_data = self.redis_client.hgetall(key)
-                    if doc_data:
-                        doc = {}
-                        for k, v in doc_data.items():
-                            key_str = k.decode() if isinstance(k, bytes) else k
-                            val_str = v.decode() if isinstance(v, bytes) else v
-                            doc[key_str] = val_str
-                        
-                        # Verificar que pertenece a esta empresa
-                        doc_company_id = doc.get('company_id', '')
-                        if doc_company_id == self.company_id or not doc_company_id:
-                            docs.append(doc)
-                        
-                except Exception as e:
-                    logger.warning(f"[{self.company_id}] Error processing document {key}: {e}")
-                    continue
-            
-            return docs
-            
+            created = ensure_shared_index(current_app.config['REDIS_URL'], index_name, self.index_alias.shared_settings())
         except Exception as e:
-            logger.error(f"[{self.company_id}] Error getting stored documents: {e}")
-            return []
+            logger.error(f"[{self.company_id}] Could not ensure shared index {index_name}: {e}")
+            return False
+        
+        if created:
+            self.health_cache = {"last_check": 0, "status": None}
+            logger.warning(f"[{self.company_id}] Shared index {index_name} was missing and has been recreated")
+            return True
+        
+        logger.error(
+            f"[{self.company_id}] Shared index {index_name} exists but has no documents for this company; "
+            f"refusing to drop it (manual review required)"
+        )
+        return False
     
     def ensure_index_healthy(self) -> bool:
-        """Método principal de recuperación específico de empresa"""
+        """Estado publicado; si necesita recuperación la pide al monitor en lugar de reconstruir aquí"""
         try:
             health = self.verify_index_health()
             
             if health["needs_recovery"] and self.auto_recovery_enabled:
-                logger.warning(f"[{self.company_id}] Index needs recovery, attempting reconstruction...")
-                return self.reconstruct_index_from_stored_data()
+                self.request_check()
             
             return health["healthy"]
             
@@ -208,33 +328,31 @@ class VectorstoreProtectionMiddleware:
         self.company_id = auto_recovery.company_id
         
     def apply_protection(self, vectorstore_service) -> bool:
-        """Aplicar protección automática a métodos críticos multi-tenant"""
+        """
+        Aplicar protección a métodos críticos multi-tenant.
+        
+        Los wrappers solo leen el estado cacheado del monitor: nunca verifican
+        contra Redis ni reconstruyen dentro de la petición. Un error pide una
+        verificación inmediata al monitor.
+        """
         try:
             # Proteger vectorstore.add_texts
             if hasattr(vectorstore_service.vectorstore, 'add_texts'):
                 original_add_texts = vectorstore_service.vectorstore.add_texts
                 
                 def protected_add_texts(texts, metadatas=None, **kwargs):
+                    if self.auto_recovery.auto_recovery_enabled:
+                        self.auto_recovery.ensure_index_healthy()
+                    
                     try:
-                        # Verificar salud antes de agregar
-                        if self.auto_recovery.auto_recovery_enabled:
-                            self.auto_recovery.ensure_index_healthy()
-                        
                         result = original_add_texts(texts, metadatas, **kwargs)
                         logger.debug(f"[{self.company_id}] Protected add_texts: {len(texts)} texts")
                         return result
                         
                     except Exception as e:
                         logger.error(f"[{self.company_id}] Protected add_texts failed: {e}")
-                        
-                        # Recovery y retry
-                        if self.auto_recovery.ensure_index_healthy():
-                            try:
-                                return original_add_texts(texts, metadatas, **kwargs)
-                            except Exception as retry_error:
-                                logger.error(f"[{self.company_id}] Retry failed: {retry_error}")
-                        
-                        raise e
+                        self.auto_recovery.request_check()
+                        raise
                 
                 vectorstore_service.vectorstore.add_texts = protected_add_texts
                 self._original_methods['add_texts'] = original_add_texts
@@ -247,24 +365,15 @@ class VectorstoreProtectionMiddleware:
                     original_invoke = retriever.invoke
                     
                     def protected_retriever_invoke(input_query, config=None, **kwargs):
+                        if self.auto_recovery.auto_recovery_enabled:
+                            self.auto_recovery.ensure_index_healthy()
+                        
                         try:
-                            # Verificar salud antes de buscar
-                            if self.auto_recovery.auto_recovery_enabled:
-                                health = self.auto_recovery.verify_index_health()
-                                if not health["healthy"] and health["stored_documents"] > 0:
-                                    self.auto_recovery.ensure_index_healthy()
-                            
                             return original_invoke(input_query, config, **kwargs)
                             
                         except Exception as e:
                             logger.error(f"[{self.company_id}] Protected retriever failed: {e}")
-                            
-                            # Recovery y retry
-                            if self.auto_recovery.reconstruct_index_from_stored_data():
-                                try:
-                                    return original_invoke(input_query, config, **kwargs)
-                                except:
-                                    logger.error(f"[{self.company_id}] Final retry failed")
+                            self.auto_recovery.request_check()
                             
                             # Retornar vacío para no romper
                             logger.warning(f"[{self.company_id}] Returning empty results due to failure")
@@ -397,7 +506,7 @@ def get_health_recommendations(health: Dict) -> List[str]:
     company_id = health.get("company_id", "unknown")
     
     if health.get("needs_recovery"):
-        recommendations.append(f"Index for {company_id} needs reconstruction - will auto-repair on next operation")
+        recommendations.append(f"Index for {company_id} needs reconstruction - the background health monitor will repair it")
     
     if not health.get("index_exists"):
         recommendations.append(f"Index missing for {company_id} - will be recreated from stored documents")
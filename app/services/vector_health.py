@@ -0,0 +1,348 @@
+"""
+Monitor de salud de los índices vectoriales fuera del request path
+
+VectorstoreProtectionMiddleware verificaba la salud dentro de cada búsqueda
+e inserción: al vencer su cache corría FT.INFO más un scan_iter completo de
+los documentos de la empresa, y si hacía falta reconstruía el índice (con
+un sleep) sobre la misma petición. Con miles de chunks eso se veía como
+picos de latencia en la búsqueda.
+
+- Los documentos almacenados se cuentan con contadores mantenidos
+  ({prefix}vector_doc_count, un campo por prefijo de claves del índice):
+  VectorstoreService los ajusta al agregar/borrar vectores y el monitor los
+  reconcilia con un SCAN cada VECTOR_HEALTH_RECONCILE_SECONDS (o cuando un
+  índice nuevo aún no tiene contador, p.ej. tras un re-index).
+- Un thread por worker compite por un lease en Redis; solo el leader
+  verifica cada VECTORSTORE_HEALTH_CHECK_INTERVAL segundos (FT.INFO +
+  contador), reconstruye si hace falta y publica el estado en
+  {prefix}vector_health.
+- El request path solo lee ese estado publicado (cacheado unos segundos en
+  el proceso). Ante un error, el middleware pide una verificación inmediata
+  (vector_health:pending) en lugar de recuperar en línea.
+"""
+
+from typing import Dict, Any, Optional, List, Callable
+from contextlib import nullcontext
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from app.config.constants import REDIS_KEY_PATTERNS
+from app.config.settings import app_config_overlay
+from app.services.redis_service import ProcessRedisClient, resolve_redis_url
+
+logger = logging.getLogger(__name__)
+
+# KEYS = lease; ARGV = token, ttl. Renueva si ya es el dueño, si no intenta tomarlo
+LEADER_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+# KEYS = contadores; ARGV = prefijo, delta. Sin contador previo no se crea uno parcial
+ADJUST_COUNT_LUA = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+end
+return false
+"""
+
+
+def health_monitor_config() -> Dict[str, Any]:
+    defaults = {
+        "VECTOR_HEALTH_MONITOR_ENABLED": os.getenv('VECTOR_HEALTH_MONITOR_ENABLED', 'true').lower() == 'true',
+        "VECTORSTORE_HEALTH_CHECK_INTERVAL": int(os.getenv('VECTORSTORE_HEALTH_CHECK_INTERVAL', '30')),
+        "VECTORSTORE_RECOVERY_TIMEOUT": int(os.getenv('VECTORSTORE_RECOVERY_TIMEOUT', '60')),
+        "VECTOR_HEALTH_RECONCILE_SECONDS": int(os.getenv('VECTOR_HEALTH_RECONCILE_SECONDS', '3600')),
+        "VECTOR_HEALTH_POLL_INTERVAL": float(os.getenv('VECTOR_HEALTH_POLL_INTERVAL', '2.0'))
+    }
+    return app_config_overlay(defaults)
+
+
+# ============================================================================
+# CONTADORES DE DOCUMENTOS Y ESTADO PUBLICADO
+# ============================================================================
+
+def document_count_key(redis_prefix: str) -> str:
+    return REDIS_KEY_PATTERNS["vector_doc_count"].format(company_prefix=redis_prefix)
+
+
+def health_key(redis_prefix: str) -> str:
+    return REDIS_KEY_PATTERNS["vector_health"].format(company_prefix=redis_prefix)
+
+
+def adjust_document_count(redis_client, redis_prefix: str, key_prefix: str, delta: int):
+    """Ajustar el contador de key_prefix (solo si ya fue reconciliado; nunca falla la escritura)"""
+    if not delta:
+        return
+    try:
+        redis_client.register_script(ADJUST_COUNT_LUA)(keys=[document_count_key(redis_prefix)], args=[key_prefix, delta])
+    except Exception as e:
+        logger.warning("Could not adjust vector document count for %s: %s", key_prefix, e)
+
+
+def read_document_count(redis_client, redis_prefix: str, key_prefix: str) -> Optional[int]:
+    """Documentos almacenados bajo key_prefix según el contador (None si aún no existe)"""
+    value = redis_client.hget(document_count_key(redis_prefix), key_prefix)
+    return int(value) if value is not None else None
+
+
+def reconcile_document_count(redis_client, redis_prefix: str, key_prefix: str, batch: int = 1000) -> int:
+    """
+    Recontar con SCAN y fijar el contador (solo desde el monitor).
+
+    Escrituras concurrentes con el SCAN pueden quedar contadas de más o de
+    menos; la próxima reconciliación lo corrige.
+    """
+    count = sum(1 for _ in redis_client.scan_iter(match=f"{key_prefix}:*", count=batch))
+    redis_client.hset(document_count_key(redis_prefix), key_prefix, count)
+    return count
+
+
+def publish_health(redis_client, redis_prefix: str, health: Dict[str, Any], ttl: int):
+    """Publicar el estado; expira si el monitor deja de refrescarlo"""
+    redis_client.set(health_key(redis_prefix), json.dumps(health), ex=ttl)
+
+
+def read_health(redis_client, redis_prefix: str) -> Optional[Dict[str, Any]]:
+    raw = redis_client.get(health_key(redis_prefix))
+    return json.loads(raw) if raw else None
+
+
+def request_health_check(redis_client, company_id: str):
+    """Pedir al leader una verificación inmediata de la empresa"""
+    redis_client.sadd(REDIS_KEY_PATTERNS["vector_health_pending"], company_id)
+
+
+def _check_with_auto_recovery(company_id: str, reconcile: bool) -> Dict[str, Any]:
+    """Verificación real (requiere app context)"""
+    from app.services.vector_auto_recovery import get_auto_recovery_instance
+
+    instance = get_auto_recovery_instance(company_id)
+    if instance is None:
+        raise RuntimeError(f"Auto-recovery instance not available for {company_id}")
+    return instance.check_now(reconcile=reconcile)
+
+
+def _configured_companies() -> List[str]:
+    from app.config.company_config import get_company_manager
+    return list(get_company_manager().get_all_companies().keys())
+
+
+# ============================================================================
+# MONITOR
+# ============================================================================
+
+class VectorHealthMonitor(ProcessRedisClient):
+    """
+    Verificación periódica de los índices de todas las empresas.
+
+    - run_once(): si este worker tiene el lease, verifica las empresas con
+      verificación pedida y, cada `interval`, todas
+    - LEADER_KEY: lease compartido por los workers (renovado en cada ciclo)
+    - PENDING_KEY: SET de empresas con verificación pedida por el request path
+    """
+
+    LEADER_KEY = REDIS_KEY_PATTERNS["vector_health_leader"]
+    PENDING_KEY = REDIS_KEY_PATTERNS["vector_health_pending"]
+
+    def __init__(self, interval: int = 30, reconcile_seconds: int = 3600, poll_interval: float = 2.0,
+                 recovery_timeout: int = 60, enabled: bool = True,
+                 check: Optional[Callable[[str, bool], Dict[str, Any]]] = None,
+                 companies: Optional[Callable[[], List[str]]] = None):
+        self.interval = max(1, interval)
+        self.reconcile_seconds = reconcile_seconds
+        self.poll_interval = poll_interval
+        self.enabled = enabled
+        # Un leader ocupado en una reconstrucción no debe perder el lease
+        self.lease_seconds = self.interval * 2 + recovery_timeout
+
+        # Verificación de una empresa y listado de empresas; inyectables en tests
+        self._check = check or _check_with_auto_recovery
+        self._companies = companies or _configured_companies
+
+        self._redis_url = resolve_redis_url()
+        self._lease_script = None
+        self._lease_client = None
+
+        self._app = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+        self._is_leader = False
+        self._last_full_check = 0.0
+        self._reconciled_at: Dict[str, float] = {}
+        self._stats = {
+            "cycles": 0,
+            "checks": 0,
+            "unhealthy": 0,
+            "recoveries": 0,
+            "errors": 0,
+            "last_cycle_ms": None
+        }
+
+    @property
+    def token(self) -> str:
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    @property
+    def running(self) -> bool:
+        return self._pid == os.getpid() and bool(self._thread and self._thread.is_alive())
+
+    # === LEASE === #
+
+    def acquire_leadership(self) -> bool:
+        client = self.redis
+        if self._lease_script is None or self._lease_client is not client:
+            self._lease_script = client.register_script(LEADER_LEASE_LUA)
+            self._lease_client = client
+        is_leader = bool(int(self._lease_script(keys=[self.LEADER_KEY], args=[self.token, self.lease_seconds])))
+        if is_leader != self._is_leader:
+            logger.info("Vector health monitor %s (pid=%s)", "leader" if is_leader else "follower", os.getpid())
+            if is_leader:
+                # Un leader nuevo reconcilia los contadores de todas las empresas
+                self._last_full_check = 0.0
+                self._reconciled_at = {}
+        self._is_leader = is_leader
+        return is_leader
+
+    def release_leadership(self):
+        try:
+            if self._is_leader and self.redis.get(self.LEADER_KEY) == self.token:
+                self.redis.delete(self.LEADER_KEY)
+        except Exception as e:
+            logger.debug("Could not release vector health lease: %s", e)
+        self._is_leader = False
+
+    # === CICLO === #
+
+    def _due_companies(self, now: float) -> List[str]:
+        due = set(self.redis.spop(self.PENDING_KEY, 100) or [])
+        if now - self._last_full_check >= self.interval:
+            due.update(self._companies())
+            self._last_full_check = now
+        return sorted(due)
+
+    def run_once(self, now: float = None) -> int:
+        """Verificar las empresas vencidas (solo el leader); devuelve cuántas se verificaron"""
+        if not self.acquire_leadership():
+            return 0
+
+        now = now if now is not None else time.time()
+        start = time.perf_counter()
+        due = self._due_companies(now)
+
+        for company_id in due:
+            reconciled_at = self._reconciled_at.get(company_id)
+            reconcile = reconciled_at is None or now - reconciled_at >= self.reconcile_seconds
+            try:
+                health = self._check(company_id, reconcile)
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning("[%s] Vector health check failed: %s", company_id, e)
+                continue
+
+            self._stats["checks"] += 1
+            if reconcile:
+                self._reconciled_at[company_id] = now
+            if health.get("recovery_attempted"):
+                self._stats["recoveries"] += 1
+            if not health.get("healthy", False):
+                self._stats["unhealthy"] += 1
+
+        if due:
+            self._stats["cycles"] += 1
+            self._stats["last_cycle_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return len(due)
+
+    # === THREAD === #
+
+    def start(self, app=None):
+        """Arrancar el thread del monitor (uno por proceso, re-arranca tras fork)"""
+        if not self.enabled or self.running:
+            return
+
+        with self._lock:
+            if self.running:
+                return
+
+            self._app = app
+            self._stop_event = threading.Event()
+            self._is_leader = False
+            self._thread = threading.Thread(target=self._run, name="vector-health-monitor", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+        logger.info("VectorHealthMonitor started (pid=%s, interval=%ss)", self._pid, self.interval)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self.release_leadership()
+
+    def _app_context(self):
+        return self._app.app_context() if self._app is not None else nullcontext()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                with self._app_context():
+                    self.run_once()
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning("VectorHealthMonitor cycle error: %s", e)
+
+            self._stop_event.wait(self.poll_interval)
+
+    # === STATS === #
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {
+            "enabled": self.enabled,
+            "running": self.running,
+            "leader": self._is_leader,
+            "interval": self.interval,
+            **self._stats
+        }
+        try:
+            stats["pending_checks"] = self.redis.scard(self.PENDING_KEY)
+        except Exception as e:
+            stats["redis_error"] = str(e)
+        return stats
+
+
+# ============================================================================
+# SINGLETON POR WORKER
+# ============================================================================
+
+_monitor: Optional[VectorHealthMonitor] = None
+_monitor_lock = threading.Lock()
+
+
+def get_vector_health_monitor() -> VectorHealthMonitor:
+    """Obtener el monitor del worker (lee la configuración de la app si existe)"""
+    global _monitor
+
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                config = health_monitor_config()
+                _monitor = VectorHealthMonitor(
+                    interval=config["VECTORSTORE_HEALTH_CHECK_INTERVAL"],
+                    reconcile_seconds=config["VECTOR_HEALTH_RECONCILE_SECONDS"],
+                    poll_interval=config["VECTOR_HEALTH_POLL_INTERVAL"],
+                    recovery_timeout=config["VECTORSTORE_RECOVERY_TIMEOUT"],
+                    enabled=config["VECTOR_HEALTH_MONITOR_ENABLED"]
+                )
+    return _monitor
@@ -0,0 +1,669 @@
+"""
+Almacenamiento compacto de vectores por empresa
+
+Cada empresa puede reducir la memoria de su índice en Redis con
+CompanyConfig.vector_settings (sobre los defaults VECTOR_* de la app):
+
+    {"dimensions": 768, "dtype": "float16", "algorithm": "hnsw",
+     "m": 16, "ef_construction": 200, "ef_runtime": 10}
+
+text-embedding-3-* acepta `dimensions` y el vector reducido equivale al
+completo truncado y renormalizado: pasar de 1536 float32 (6 KB por chunk) a
+768 float16 (1.5 KB) no exige volver a llamar a OpenAI para lo ya indexado.
+
+vectorstore_index pasa a ser un nombre lógico. El hash {prefix}vector_index
+guarda el índice físico activo, el destino de un re-index en curso y la
+configuración con la que se creó cada índice: un índice existente se sigue
+abriendo con la suya aunque la empresa cambie vector_settings, hasta
+re-indexar.
+
+Modo compartido ({"mode": "shared"}): con cientos de empresas pequeñas el
+número de índices y su overhead dominan. Esas empresas comparten un único
+índice (VECTOR_SHARED_INDEX) con un campo TAG company_id, y cada consulta se
+pre-filtra por empresa dentro de RediSearch. Los clientes grandes siguen con
+índice propio ("dedicated").
+
+Re-index en línea (VectorReindexer.run), también para cambiar de modo:
+1. Crea v{n}_{vectorstore_index} (o usa el compartido) con la configuración
+   nueva y lo marca como destino; desde ese momento VectorstoreService
+   escribe en ambos.
+2. Espera a que todos los workers vean el destino y copia los vectores
+   existentes (truncar + convertir; re-embebe solo si se suben dimensiones).
+3. Swap: el destino pasa a ser el activo. Tras el período de gracia se
+   elimina el índice anterior con sus documentos (del compartido, solo los
+   de la empresa).
+"""
+
+from typing import Dict, Any, Optional, List, Callable, Iterable
+from dataclasses import dataclass, asdict, fields, replace
+import json
+import logging
+import math
+import os
+import re
+import struct
+import threading
+import time
+
+from app.config.constants import REDIS_KEY_PATTERNS
+from app.config.settings import app_config_overlay
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIMENSIONS = 1536
+VECTOR_DTYPES = {"float32": ("f", 4), "float16": ("e", 2)}  # formato struct, bytes por componente
+VECTOR_ALGORITHMS = ("flat", "hnsw")
+CONTENT_FIELD = "text"
+EMBEDDING_FIELD = "embedding"
+TENANT_FIELD = "company_id"
+DEDICATED_MODE = "dedicated"
+SHARED_MODE = "shared"
+INDEX_MODES = (DEDICATED_MODE, SHARED_MODE)
+
+
+def vector_index_config() -> Dict[str, Any]:
+    defaults = {
+        "EMBEDDING_MODEL": os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small'),
+        "VECTOR_DIMENSIONS": int(os.getenv('VECTOR_DIMENSIONS', str(DEFAULT_DIMENSIONS))),
+        "VECTOR_DTYPE": os.getenv('VECTOR_DTYPE', 'float32'),
+        "VECTOR_ALGORITHM": os.getenv('VECTOR_ALGORITHM', 'flat'),
+        "VECTOR_HNSW_M": int(os.getenv('VECTOR_HNSW_M', '16')),
+        "VECTOR_HNSW_EF_CONSTRUCTION": int(os.getenv('VECTOR_HNSW_EF_CONSTRUCTION', '200')),
+        "VECTOR_HNSW_EF_RUNTIME": int(os.getenv('VECTOR_HNSW_EF_RUNTIME', '10')),
+        "VECTOR_INDEX_MODE": os.getenv('VECTOR_INDEX_MODE', DEDICATED_MODE),
+        "VECTOR_SHARED_INDEX": os.getenv('VECTOR_SHARED_INDEX', 'shared_documents'),
+        "VECTOR_INDEX_REFRESH_SECONDS": float(os.getenv('VECTOR_INDEX_REFRESH_SECONDS', '30')),
+        "VECTOR_REINDEX_BATCH_SIZE": int(os.getenv('VECTOR_REINDEX_BATCH_SIZE', '200'))
+    }
+    return app_config_overlay(defaults)
+
+
+@dataclass(frozen=True)
+class VectorSettings:
+    """Forma del campo vectorial de un índice físico"""
+    dimensions: int = DEFAULT_DIMENSIONS
+    dtype: str = "float32"
+    algorithm: str = "flat"
+    m: int = 16
+    ef_construction: int = 200
+    ef_runtime: int = 10
+    distance_metric: str = "cosine"
+
+    def __post_init__(self):
+        if self.dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {self.dtype} (expected one of {list(VECTOR_DTYPES)})")
+        if self.algorithm not in VECTOR_ALGORITHMS:
+            raise ValueError(f"Unsupported vector algorithm: {self.algorithm} (expected one of {list(VECTOR_ALGORITHMS)})")
+        if self.dimensions <= 0:
+            raise ValueError(f"Vector dimensions must be positive: {self.dimensions}")
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]], base: 'VectorSettings' = None) -> 'VectorSettings':
+        known = {field.name for field in fields(cls)}
+        values = {key: value for key, value in (data or {}).items() if key in known}
+        for key in ("dtype", "algorithm", "distance_metric"):
+            if key in values:
+                values[key] = str(values[key]).lower()
+        for key in ("dimensions", "m", "ef_construction", "ef_runtime"):
+            if key in values:
+                values[key] = int(values[key])
+        return replace(base, **values) if base else cls(**values)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @property
+    def bytes_per_vector(self) -> int:
+        return self.dimensions * VECTOR_DTYPES[self.dtype][1]
+
+    @property
+    def request_dimensions(self) -> Optional[int]:
+        """`dimensions` para la API de embeddings (None = tamaño nativo del modelo)"""
+        return self.dimensions if self.dimensions != DEFAULT_DIMENSIONS else None
+
+    def vector_attrs(self) -> Dict[str, Any]:
+        attrs = {
+            "dims": self.dimensions,
+            "distance_metric": self.distance_metric,
+            "algorithm": self.algorithm,
+            "datatype": self.dtype
+        }
+        if self.algorithm == "hnsw":
+            attrs.update(m=self.m, ef_construction=self.ef_construction, ef_runtime=self.ef_runtime)
+        return attrs
+
+    def index_schema(self, index_name: str, prefix: str = None, shared: bool = False) -> Dict[str, Any]:
+        """
+        Schema redisvl del índice (mismos campos que crea langchain_redis por defecto).
+        prefix: prefijo de claves del vectorstore ({índice}:{company_id} en el compartido).
+        """
+        schema_fields = [
+            {"name": CONTENT_FIELD, "type": "text"},
+            {"name": EMBEDDING_FIELD, "type": "vector", "attrs": self.vector_attrs()}
+        ]
+        if shared:
+            schema_fields.append({"name": TENANT_FIELD, "type": "tag"})
+        return {
+            "index": {"name": index_name, "prefix": prefix or index_name, "storage_type": "hash"},
+            "fields": schema_fields
+        }
+
+
+# Índices creados antes de vector_settings: 1536 float32 FLAT
+LEGACY_SETTINGS = VectorSettings()
+
+
+def default_vector_settings(config: Dict[str, Any] = None) -> VectorSettings:
+    config = config or vector_index_config()
+    return VectorSettings(
+        dimensions=config["VECTOR_DIMENSIONS"],
+        dtype=str(config["VECTOR_DTYPE"]).lower(),
+        algorithm=str(config["VECTOR_ALGORITHM"]).lower(),
+        m=config["VECTOR_HNSW_M"],
+        ef_construction=config["VECTOR_HNSW_EF_CONSTRUCTION"],
+        ef_runtime=config["VECTOR_HNSW_EF_RUNTIME"]
+    )
+
+
+def settings_for_company(company_config) -> VectorSettings:
+    """Configuración deseada de la empresa: defaults de la app + vector_settings"""
+    config = vector_index_config()
+    settings = VectorSettings.from_dict(
+        getattr(company_config, 'vector_settings', None), base=default_vector_settings(config)
+    )
+    if settings.dimensions != DEFAULT_DIMENSIONS and not str(config["EMBEDDING_MODEL"]).startswith("text-embedding-3"):
+        logger.warning(
+            "[%s] %s does not support reduced dimensions, keeping %d",
+            getattr(company_config, 'company_id', '?'), config["EMBEDDING_MODEL"], DEFAULT_DIMENSIONS
+        )
+        settings = replace(settings, dimensions=DEFAULT_DIMENSIONS)
+    return settings
+
+
+def index_mode_for_company(company_config) -> str:
+    """dedicated (índice propio) o shared (índice compartido filtrado por company_id)"""
+    mode = str((getattr(company_config, 'vector_settings', None) or {}).get(
+        "mode", vector_index_config()["VECTOR_INDEX_MODE"]
+    )).lower()
+    if mode not in INDEX_MODES:
+        raise ValueError(f"Unsupported vector index mode: {mode} (expected one of {list(INDEX_MODES)})")
+    return mode
+
+
+# ============================================================================
+# CONVERSIÓN DE VECTORES
+# ============================================================================
+
+def decode_vector(raw: bytes, dtype: str) -> List[float]:
+    code, size = VECTOR_DTYPES[dtype]
+    return list(struct.unpack(f"<{len(raw) // size}{code}", raw))
+
+
+def encode_vector(vector: Iterable[float], dtype: str) -> bytes:
+    values = list(vector)
+    return struct.pack(f"<{len(values)}{VECTOR_DTYPES[dtype][0]}", *values)
+
+
+def convert_vector(raw: bytes, source: VectorSettings, target: VectorSettings) -> Optional[bytes]:
+    """
+    Truncar, renormalizar y convertir un vector almacenado a la forma destino.
+    None si el destino tiene más dimensiones (hay que volver a embeber el texto).
+    """
+    vector = decode_vector(raw, source.dtype)
+    if target.dimensions > len(vector):
+        return None
+    vector = vector[:target.dimensions]
+    norm = math.sqrt(sum(value * value for value in vector))
+    if norm:
+        vector = [value / norm for value in vector]
+    return encode_vector(vector, target.dtype)
+
+
+def _as_bytes(value) -> bytes:
+    return value.encode() if isinstance(value, str) else value
+
+
+def mirror_key(key, source_prefix: str, target_prefix: str) -> bytes:
+    """{source_prefix}:{id} -> {target_prefix}:{id}: la copia conserva el id del documento"""
+    key = _as_bytes(key)
+    return _as_bytes(target_prefix) + key[len(_as_bytes(source_prefix)):]
+
+
+def copy_vectors(raw_client, keys: List, source_prefix: str, source_settings: VectorSettings,
+                 target_prefix: str, target_settings: VectorSettings,
+                 embed: Callable[[List[str]], List[List[float]]] = None,
+                 fields_override: Dict[str, str] = None) -> int:
+    """
+    Copiar documentos al prefijo de claves destino convirtiendo el vector.
+
+    raw_client no decodifica respuestas (el campo embedding es binario).
+    fields_override reescribe campos del hash (index_name, company_id del TAG).
+    Si un documento se borró mientras se copiaba, se borra también la copia.
+    """
+    if not keys:
+        return 0
+
+    pipe = raw_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.hgetall(key)
+    rows = pipe.execute()
+
+    overrides = {_as_bytes(field): _as_bytes(value) for field, value in (fields_override or {}).items()}
+    writes, pending = {}, []
+    embedding_field = EMBEDDING_FIELD.encode()
+    for key, row in zip(keys, rows):
+        if not row:
+            continue
+        mapping = {**row, **overrides}
+        dest = mirror_key(key, source_prefix, target_prefix)
+        vector = convert_vector(mapping[embedding_field], source_settings, target_settings) \
+            if embedding_field in mapping else None
+        if vector is None:
+            pending.append((dest, mapping))
+            continue
+        mapping[embedding_field] = vector
+        writes[dest] = mapping
+
+    if pending:
+        if embed is None:
+            raise ValueError(f"Re-embedding required to copy into {target_prefix} but no embeddings were provided")
+        texts = [mapping.get(CONTENT_FIELD.encode(), b"").decode("utf-8") for _, mapping in pending]
+        for (dest, mapping), vector in zip(pending, embed(texts)):
+            mapping[embedding_field] = encode_vector(vector, target_settings.dtype)
+            writes[dest] = mapping
+
+    pipe = raw_client.pipeline(transaction=False)
+    for dest, mapping in writes.items():
+        pipe.hset(dest, mapping=mapping)
+    pipe.execute()
+
+    # Borrados durante la copia: el origen ya no existe, la copia tampoco debe
+    pipe = raw_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.exists(key)
+    orphans = [mirror_key(key, source_prefix, target_prefix) for key, exists in zip(keys, pipe.execute()) if not exists]
+    orphans = [dest for dest in orphans if dest in writes]
+    if orphans:
+        raw_client.delete(*orphans)
+
+    return len(writes) - len(orphans)
+
+
+# ============================================================================
+# ALIAS: NOMBRE LÓGICO -> ÍNDICE FÍSICO
+# ============================================================================
+
+@dataclass
+class IndexRoute:
+    """Índice activo (lecturas y escrituras) y destino de un re-index en curso (solo escrituras)"""
+    index: str
+    settings: VectorSettings
+    key_prefix: str
+    shared: bool = False
+    target: Optional[str] = None
+    target_settings: Optional[VectorSettings] = None
+    target_key_prefix: Optional[str] = None
+
+
+class VectorIndexAlias:
+    """
+    Hash {prefix}vector_index:
+    - active / target: índices físicos (propios o el compartido)
+    - settings:{índice}: VectorSettings con las que se creó
+    - version: contador para nombrar índices nuevos
+    - reindex: progreso del último re-index (JSON)
+
+    En el índice compartido las claves de la empresa son
+    {índice}:{company_id}:{id}; en uno propio, {índice}:{id}.
+    """
+
+    def __init__(self, redis_client, company_id: str, redis_prefix: str, base_index: str, shared_index: str = None):
+        self.redis = redis_client
+        self.company_id = company_id
+        self.base_index = base_index
+        self.shared_index = shared_index or vector_index_config()["VECTOR_SHARED_INDEX"]
+        self.key = REDIS_KEY_PATTERNS["vector_index"].format(company_prefix=redis_prefix)
+
+    @staticmethod
+    def _settings(state: Dict[str, str], index_name: Optional[str]) -> Optional[VectorSettings]:
+        raw = state.get(f"settings:{index_name}") if index_name else None
+        return VectorSettings.from_dict(json.loads(raw)) if raw else None
+
+    def _index_exists(self, index_name: str) -> bool:
+        try:
+            self.redis.ft(index_name).info()
+            return True
+        except Exception:
+            return False
+
+    def is_shared(self, index_name: Optional[str]) -> bool:
+        return index_name == self.shared_index
+
+    def key_prefix_for(self, index_name: Optional[str]) -> Optional[str]:
+        if not index_name:
+            return None
+        return f"{index_name}:{self.company_id}" if self.is_shared(index_name) else index_name
+
+    def shared_settings(self) -> VectorSettings:
+        """Forma del índice compartido: global, fijada por quien lo crea primero"""
+        key = REDIS_KEY_PATTERNS["vector_shared_index"]
+        field = f"settings:{self.shared_index}"
+        self.redis.hsetnx(key, field, json.dumps(default_vector_settings().to_dict()))
+        return VectorSettings.from_dict(json.loads(self.redis.hget(key, field)))
+
+    def active_index(self) -> str:
+        return self.redis.hget(self.key, "active") or self.base_index
+
+    def resolve(self, configured: VectorSettings, shared: bool = False) -> IndexRoute:
+        state = self.redis.hgetall(self.key) or {}
+        active = state.get("active")
+        if not active:
+            active = self.base_index
+            if shared and not self._index_exists(self.base_index):
+                # Empresa nueva en modo compartido: nunca crea índice propio
+                self.redis.hsetnx(self.key, "active", self.shared_index)
+                active = self.redis.hget(self.key, "active")
+        settings = self._settings(state, active)
+
+        if settings is None:
+            # Primera vez: un índice propio que ya existe se creó con la configuración anterior
+            if self.is_shared(active):
+                settings = self.shared_settings()
+            else:
+                settings = LEGACY_SETTINGS if self._index_exists(active) else configured
+            self.redis.hsetnx(self.key, f"settings:{active}", json.dumps(settings.to_dict()))
+            state[f"settings:{active}"] = self.redis.hget(self.key, f"settings:{active}")
+            settings = self._settings(state, active)
+
+        target = state.get("target")
+        return IndexRoute(
+            active, settings, self.key_prefix_for(active), self.is_shared(active),
+            target, self._settings(state, target), self.key_prefix_for(target)
+        )
+
+    def begin(self, settings: VectorSettings, shared: bool = False) -> str:
+        """Reservar un índice destino; falla si ya hay un re-index en curso"""
+        if shared:
+            target = self.shared_index
+        else:
+            # v{n}_ delante: el PREFIX de RediSearch es un prefijo de string y el índice
+            # anterior indexaría también claves {base}_v{n}:*. El índice base cuenta como v1
+            target = f"v{self.redis.hincrby(self.key, 'version', 1) + 1}_{self.base_index}"
+        self.redis.hset(self.key, f"settings:{target}", json.dumps(settings.to_dict()))
+        if not self.redis.hsetnx(self.key, "target", target):
+            if target != self.active_index():
+                self.redis.hdel(self.key, f"settings:{target}")
+            raise RuntimeError(f"Re-index already in progress ({self.redis.hget(self.key, 'target')})")
+        return target
+
+    def swap(self, target: str) -> str:
+        """El destino pasa a ser el activo; devuelve el índice anterior"""
+        previous = self.active_index()
+        if self.redis.hget(self.key, "target") != target:
+            raise RuntimeError(f"{target} is not the current re-index target")
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(self.key, "active", target)
+        pipe.hset(self.key, "retired", previous)
+        pipe.hdel(self.key, "target")
+        pipe.execute()
+        return previous
+
+    def abort(self, target: str):
+        if self.redis.hget(self.key, "target") == target:
+            self.redis.hdel(self.key, "target", f"settings:{target}")
+
+    def forget(self, index_name: str):
+        """El índice retirado ya se eliminó"""
+        self.redis.hdel(self.key, f"settings:{index_name}", "retired")
+
+    def set_progress(self, **progress):
+        self.redis.hset(self.key, "reindex", json.dumps({**progress, "updated_at": time.time()}))
+
+    def get_state(self) -> Dict[str, Any]:
+        state = self.redis.hgetall(self.key) or {}
+        active = state.get("active") or self.base_index
+        return {
+            "active": active,
+            "mode": SHARED_MODE if self.is_shared(active) else DEDICATED_MODE,
+            "target": state.get("target"),
+            "retired": state.get("retired"),
+            "settings": {
+                field.split(":", 1)[1]: json.loads(value)
+                for field, value in state.items() if field.startswith("settings:")
+            },
+            "reindex": json.loads(state["reindex"]) if state.get("reindex") else None
+        }
+
+
+def ensure_shared_index(redis_url: str, index_name: str, settings: VectorSettings) -> bool:
+    """Crear el índice compartido (PREFIX común a todas las empresas) si no existe; True si lo creó"""
+    from redisvl.index import SearchIndex
+    from redisvl.schema import IndexSchema
+
+    index = SearchIndex(IndexSchema.from_dict(settings.index_schema(index_name, shared=True)), redis_url=redis_url)
+    if index.exists():
+        return False
+    index.create(overwrite=False)
+    logger.info("Created shared vector index %s (%s)", index_name, settings.to_dict())
+    return True
+
+
+def tenant_filter_query(company_id: str) -> str:
+    """Filtro TAG de RediSearch para las consultas en el índice compartido"""
+    return "@%s:{%s}" % (TENANT_FIELD, re.sub(r"([^A-Za-z0-9_])", r"\\\1", company_id))
+
+
+# ============================================================================
+# RE-INDEX EN LÍNEA
+# ============================================================================
+
+_raw_clients: Dict[int, Any] = {}
+
+
+def raw_redis_client():
+    """Cliente sin decode_responses para leer/escribir el campo binario embedding"""
+    client = _raw_clients.get(os.getpid())
+    if client is None:
+        import redis
+        from flask import current_app
+        client = redis.from_url(current_app.config['REDIS_URL'])
+        _raw_clients.clear()
+        _raw_clients[os.getpid()] = client
+    return client
+
+
+class VectorReindexer:
+    """
+    Migrar los vectores de una empresa sin cortar el servicio: a otra
+    VectorSettings, o entre índice propio y compartido (mode).
+    """
+
+    # Esperas por TenantRateLimited antes de abortar (alias.abort + _retire)
+    max_throttle_retries = 20
+
+    def __init__(self, company_id: str, batch_size: int = None, grace_seconds: float = None):
+        config = vector_index_config()
+        self.company_id = company_id
+        self.batch_size = batch_size or config["VECTOR_REINDEX_BATCH_SIZE"]
+        # Más que el intervalo de refresco: todos los workers ven el cambio de alias
+        self.grace_seconds = config["VECTOR_INDEX_REFRESH_SECONDS"] + 5 if grace_seconds is None else grace_seconds
+
+    def run(self, settings: VectorSettings = None, mode: str = None, drop_old: bool = True) -> Dict[str, Any]:
+        from app.services.vectorstore_service import VectorstoreService
+
+        service = VectorstoreService(company_id=self.company_id)
+        alias = service.index_alias
+        route = service.refresh_route(force=True)
+        mode = mode or service.index_mode
+        shared = mode == SHARED_MODE
+        # La forma del índice compartido es global; settings solo aplica a índices propios
+        settings = alias.shared_settings() if shared else settings or settings_for_company(service.company_config)
+
+        if route.shared == shared and (shared or settings == route.settings):
+            return {"status": "unchanged", "company_id": self.company_id, "index": route.index, "mode": mode}
+
+        target = alias.begin(settings, shared=shared)
+        target_prefix = alias.key_prefix_for(target)
+        started_at = time.time()
+        progress = {"company_id": self.company_id, "source": route.index, "target": target, "mode": mode,
+                    "settings": settings.to_dict(), "started_at": started_at}
+        logger.info("[%s] Re-index %s -> %s started (%s, %s)", self.company_id, route.index, target, mode, settings.to_dict())
+
+        def embed(texts: List[str]) -> List[List[float]]:
+            embeddings = service.openai_service.get_embeddings(dimensions=settings.request_dimensions)
+            return self._embed_throttled(embeddings, texts)
+
+        fields_override = {"index_name": target, TENANT_FIELD: self.company_id}
+        try:
+            service.build_vectorstore(target, settings, key_prefix=target_prefix)  # crea el índice destino
+            alias.set_progress(state="dual_write", copied=0, **progress)
+            time.sleep(self.grace_seconds)
+
+            raw_client = raw_redis_client()
+            copied, batch = 0, []
+            for key in raw_client.scan_iter(match=f"{route.key_prefix}:*", count=self.batch_size):
+                batch.append(key)
+                if len(batch) >= self.batch_size:
+                    copied += copy_vectors(raw_client, batch, route.key_prefix, route.settings,
+                                           target_prefix, settings, embed, fields_override)
+                    batch = []
+                    alias.set_progress(state="copying", copied=copied, **progress)
+            copied += copy_vectors(raw_client, batch, route.key_prefix, route.settings,
+                                   target_prefix, settings, embed, fields_override)
+
+            previous = alias.swap(target)
+            alias.set_progress(state="swapped", copied=copied, **progress)
+            logger.info("[%s] Re-index swapped %s -> %s (%d docs)", self.company_id, previous, target, copied)
+        except Exception as e:
+            logger.error("[%s] Re-index into %s failed: %s", self.company_id, target, e)
+            alias.abort(target)
+            self._retire(service.redis_client, alias, target)
+            alias.set_progress(state="failed", error=str(e), **progress)
+            raise
+
+        if drop_old:
+            time.sleep(self.grace_seconds)
+            self._retire(service.redis_client, alias, previous)
+            alias.forget(previous)
+
+        result = {"status": "completed", "copied": copied, "previous": previous,
+                  "duration_seconds": round(time.time() - started_at, 1), **progress}
+        alias.set_progress(state="completed", copied=copied, previous=previous, **progress)
+        return result
+
+    def _embed_throttled(self, embeddings, texts: List[str]) -> List[List[float]]:
+        """
+        Re-embeber respetando la cuota "embeddings" de la empresa.
+
+        Trozos de como máximo la ráfaga del bucket (un lote mayor nunca
+        cabría) y reintentos acotados: TenantRateLimited tras
+        ``max_throttle_retries`` esperas aborta el re-index.
+        """
+        from app.services.admission_control import get_tenant_limiter, TenantRateLimited
+
+        limiter = get_tenant_limiter()
+        limit = limiter.get_limit(self.company_id, "embeddings")
+        chunk_size = max(1, len(texts) if limit.unlimited else int(limit.burst))
+
+        vectors = []
+        for start in range(0, len(texts), chunk_size):
+            chunk = texts[start:start + chunk_size]
+            for attempt in range(self.max_throttle_retries + 1):
+                try:
+                    limiter.throttle(self.company_id, "embeddings", cost=len(chunk))
+                    break
+                except TenantRateLimited as e:
+                    if attempt >= self.max_throttle_retries:
+                        raise
+                    time.sleep(e.retry_after)
+            vectors.extend(embeddings.embed_documents(chunk))
+        return vectors
+
+    def _retire(self, redis_client, alias: VectorIndexAlias, index_name: str):
+        """Eliminar un índice propio con sus documentos, o solo los de la empresa si es el compartido"""
+        try:
+            if alias.is_shared(index_name):
+                deleted, batch = 0, []
+                for key in redis_client.scan_iter(match=f"{alias.key_prefix_for(index_name)}:*", count=self.batch_size):
+                    batch.append(key)
+                    if len(batch) >= self.batch_size:
+                        deleted += redis_client.delete(*batch)
+                        batch = []
+                if batch:
+                    deleted += redis_client.delete(*batch)
+                logger.info("[%s] Removed %d documents from shared index %s", self.company_id, deleted, index_name)
+            else:
+                redis_client.ft(index_name).dropindex(delete_documents=True)
+                logger.info("[%s] Dropped vector index %s", self.company_id, index_name)
+        except Exception as e:
+            logger.warning("[%s] Could not retire vector index %s: %s", self.company_id, index_name, e)
+
+
+_reindex_threads: Dict[str, threading.Thread] = {}
+_reindex_lock = threading.Lock()
+
+
+def start_reindex(app, company_id: str, settings: VectorSettings = None, mode: str = None,
+                  drop_old: bool = True) -> bool:
+    """Lanzar el re-index de la empresa en un thread; False si ya hay uno en este worker"""
+    with _reindex_lock:
+        thread = _reindex_threads.get(company_id)
+        if thread and thread.is_alive():
+            return False
+
+        def run():
+            with app.app_context():
+                try:
+                    VectorReindexer(company_id).run(settings, mode=mode, drop_old=drop_old)
+                except Exception as e:
+                    logger.error("[%s] Background re-index failed: %s", company_id, e)
+
+        thread = threading.Thread(target=run, daemon=True, name=f"vector-reindex-{company_id}")
+        _reindex_threads[company_id] = thread
+        thread.start()
+        return True
+
+
+def count_tenant_documents(redis_client, index_name: str, company_id: str) -> int:
+    """Documentos de la empresa indexados en el índice compartido (FT.SEARCH LIMIT 0 0)"""
+    from redis.commands.search.query import Query
+    return int(redis_client.ft(index_name).search(Query(tenant_filter_query(company_id)).paging(0, 0)).total)
+
+
+def get_vector_index_status(company_id: str) -> Dict[str, Any]:
+    """Estado del alias, configuración deseada y memoria del índice activo"""
+    from app.config.company_config import get_company_config
+    from app.services.redis_service import get_redis_client
+
+    company_config = get_company_config(company_id)
+    if not company_config:
+        return {"company_id": company_id, "error": "unknown company"}
+
+    redis_client = get_redis_client()
+    alias = VectorIndexAlias(redis_client, company_id, company_config.redis_prefix, company_config.vectorstore_index)
+    state = alias.get_state()
+    configured_mode = index_mode_for_company(company_config)
+    configured = alias.shared_settings() if configured_mode == SHARED_MODE else settings_for_company(company_config)
+    active_settings = state["settings"].get(state["active"])
+
+    status = {
+        "company_id": company_id,
+        **state,
+        "configured_mode": configured_mode,
+        "configured_settings": configured.to_dict(),
+        "reindex_required": configured_mode != state["mode"] or (
+            active_settings is not None and VectorSettings.from_dict(active_settings) != configured
+        )
+    }
+    try:
+        info = redis_client.ft(state["active"]).info()
+        status["index"] = {
+            "num_docs": int(info.get("num_docs", 0)),
+            "vector_index_sz_mb": float(info.get("vector_index_sz_mb", 0) or 0),
+            "total_index_memory_sz_mb": float(info.get("total_index_memory_sz_mb", 0) or 0)
+        }
+        if state["mode"] == SHARED_MODE:
+            status["index"]["company_docs"] = count_tenant_documents(redis_client, state["active"], company_id)
+    except Exception as e:
+        status["index_error"] = str(e)
+    return status
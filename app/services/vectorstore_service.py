@@ -1,6 +1,5 @@
 # app/services/vectorstore_service.py
 
-from langchain_redis import RedisVectorStore
 from langchain.text_splitter import RecursiveCharacterTextSplitter, MarkdownHeaderTextSplitter
 from app.services.redis_service import get_redis_client
 from app.services.openai_service import OpenAIService
@@ -9,14 +8,39 @@ from flask import current_app
 import logging
 import json
 import hashlib
+import time
 from datetime import datetime
 from typing import List, Dict, Any, Tuple, Optional
+from app.utils.logging_config import LogSampler
+from app.services.admission_control import get_tenant_limiter
+from app.services.vector_health import adjust_document_count, read_document_count
+from app.services.vector_index import (
+    SHARED_MODE,
+    TENANT_FIELD,
+    IndexRoute,
+    VectorIndexAlias,
+    VectorSettings,
+    copy_vectors,
+    count_tenant_documents,
+    ensure_shared_index,
+    index_mode_for_company,
+    mirror_key,
+    raw_redis_client,
+    settings_for_company,
+    vector_index_config
+)
 
 logger = logging.getLogger(__name__)
 
+# Como máximo 5 docs por empresa cada 10s en el log de DEBUG
+_rag_sampler = LogSampler(limit=5, interval=10.0)
+
 class VectorstoreService:
     """Servicio de vectorstore multi-tenant"""
     
+    index_alias: Optional[VectorIndexAlias] = None
+    route: Optional[IndexRoute] = None
+    
     def __init__(self, company_id: str = None):
         self.company_id = company_id or "default"
         self.company_config = get_company_config(self.company_id)
@@ -37,61 +61,133 @@ class VectorstoreService:
         
         self.redis_client = get_redis_client()
         self.openai_service = OpenAIService()
-        self.embeddings = self.openai_service.get_embeddings()
         
-        # Configuración específica de la empresa
-        self.index_name = self.company_config.vectorstore_index
-        self.vector_dim = 1536
+        # vectorstore_index es un alias: el índice físico activo (propio o compartido) y su
+        # VectorSettings se leen de Redis y se revisan cada VECTOR_INDEX_REFRESH_SECONDS (re-index en línea)
+        self.index_alias = VectorIndexAlias(
+            self.redis_client, self.company_id, self.company_config.redis_prefix, self.company_config.vectorstore_index
+        )
+        self.index_mode = index_mode_for_company(self.company_config)
+        self.configured_settings = (
+            self.index_alias.shared_settings() if self.index_mode == SHARED_MODE
+            else settings_for_company(self.company_config)
+        )
+        self._route_ttl = vector_index_config()["VECTOR_INDEX_REFRESH_SECONDS"]
+        self._route_checked_at = 0.0
+        self.route = self.index_alias.resolve(self.configured_settings, shared=self.index_mode == SHARED_MODE)
+        self._apply_route(self.route)
         
         self._initialize_vectorstore()
         
         logger.info(f"VectorstoreService initialized for company: {self.company_id} with index: {self.index_name}")
     
+    def _apply_route(self, route: IndexRoute):
+        self.route = route
+        self.index_name = route.index
+        self.key_prefix = route.key_prefix
+        self.vector_settings = route.settings
+        self.vector_dim = route.settings.dimensions
+        self.embeddings = self.openai_service.get_embeddings(dimensions=route.settings.request_dimensions)
+        self._route_checked_at = time.monotonic()
+    
+    def refresh_route(self, force: bool = False) -> Optional[IndexRoute]:
+        """Seguir al alias tras un swap y activar el dual-write durante un re-index"""
+        if self.index_alias is None:
+            return self.route
+        if not force and time.monotonic() - self._route_checked_at < self._route_ttl:
+            return self.route
+        
+        try:
+            route = self.index_alias.resolve(self.configured_settings, shared=self.index_mode == SHARED_MODE)
+        except Exception as e:
+            logger.warning("[%s] Could not resolve vector index alias: %s", self.company_id, e)
+            self._route_checked_at = time.monotonic()
+            return self.route
+        
+        if route.index != self.index_name or route.settings != self.vector_settings:
+            logger.info("[%s] Vector index alias now points to %s", self.company_id, route.index)
+            self._apply_route(route)
+            self._initialize_vectorstore()
+        else:
+            self.route = route
+            self._route_checked_at = time.monotonic()
+        return route
+    
+    def build_vectorstore(self, index_name: str, settings: VectorSettings, key_prefix: str = None, embeddings=None):
+        """RedisVectorStore con el schema de settings (crea el índice si no existe)"""
+        # langchain_redis (y redisvl) se importan al crear el primer vectorstore
+        from langchain_redis import RedisConfig, RedisVectorStore
+        from redisvl.schema import IndexSchema
+        
+        shared = self.index_alias.is_shared(index_name)
+        if shared:
+            # El índice compartido indexa {índice}:* de todas las empresas; el vectorstore
+            # de esta empresa escribe bajo {índice}:{company_id}
+            ensure_shared_index(current_app.config['REDIS_URL'], index_name, settings)
+        
+        config = RedisConfig.from_schema(
+            IndexSchema.from_dict(settings.index_schema(index_name, prefix=key_prefix or index_name, shared=shared)),
+            redis_url=current_app.config['REDIS_URL']
+        )
+        return RedisVectorStore(embeddings or self.embeddings, config=config)
+    
     def _initialize_vectorstore(self):
         """Inicializar vectorstore específico de la empresa"""
         try:
-            self.vectorstore = RedisVectorStore(
-                self.embeddings,
-                redis_url=current_app.config['REDIS_URL'],
-                index_name=self.index_name,
-                vector_dim=self.vector_dim
+            self.vectorstore = self.build_vectorstore(self.index_name, self.vector_settings, self.key_prefix)
+            logger.info(
+                "Vectorstore initialized for %s: %s (%d dims, %s, %s%s)",
+                self.company_id, self.index_name, self.vector_dim,
+                self.vector_settings.dtype, self.vector_settings.algorithm,
+                ", shared" if self.route.shared else ""
             )
-            logger.info(f"Vectorstore initialized for {self.company_id}: {self.index_name}")
         except Exception as e:
             logger.error(f"Error initializing vectorstore for {self.company_id}: {e}")
             raise
     
+    def _tenant_filter(self) -> Dict[str, Any]:
+        """En el índice compartido, pre-filtro TAG por empresa dentro de RediSearch"""
+        if not (self.route and self.route.shared):
+            return {}
+        from redisvl.query.filter import Tag
+        return {"filter": Tag(TENANT_FIELD) == self.company_id}
+    
+    @property
+    def documents_pattern(self) -> str:
+        """Patrón de claves de los vectores de esta empresa"""
+        return f"{self.key_prefix}:*"
+    
+    def indexed_document_count(self) -> int:
+        """Documentos de la empresa en el índice (FT.INFO en uno propio, FT.SEARCH por TAG en el compartido)"""
+        if self.route and self.route.shared:
+            return count_tenant_documents(self.redis_client, self.index_name, self.company_id)
+        return int(self.redis_client.ft(self.index_name).info().get('num_docs', 0))
+    
     def get_retriever(self, k: int = 3):
         """Obtener retriever específico de la empresa"""
-        return self.vectorstore.as_retriever(search_kwargs={"k": k})
+        self.refresh_route()
+        return self.vectorstore.as_retriever(search_kwargs={"k": k, **self._tenant_filter()})
     
     def search_by_company(self, query: str, company_id: str = None, k: int = 3) -> List[Any]:
         """Buscar documentos filtrados por empresa - CORREGIDO para devolver objetos LangChain"""
+        target_company = company_id or self.company_id
         try:
-            # 🆕 LOGS DE RAG DETALLADOS - INICIO
-            target_company = company_id or self.company_id
-            logger.info(f"🔍 [{target_company}] RAG SEARCH START:")
-            logger.info(f"   → Query: {query[:100]}...")
-            logger.info(f"   → Requested documents: {k}")
-            logger.info(f"   → Target company: {target_company}")
-            logger.info(f"   → Current company: {self.company_id}")
-            if hasattr(self, 'vectorstore_index'):
-                logger.info(f"   → Vectorstore index: {self.vectorstore_index}")
-            
             # Verificar que coincida la empresa
             if target_company != self.company_id:
-                logger.warning(f"❌ [{target_company}] Company ID mismatch: {target_company} != {self.company_id}")
+                logger.warning("❌ [%s] Company ID mismatch: %s != %s", target_company, target_company, self.company_id)
                 return []
             
             if not self.vectorstore:
-                logger.warning(f"   → Vectorstore not available for {target_company}")
+                logger.warning("   → Vectorstore not available for %s", target_company)
                 return []
             
-            # Realizar búsqueda usando el vectorstore directamente
-            logger.info(f"   → Executing similarity search...")
-            docs = self.vectorstore.similarity_search(query, k=k)
+            self.refresh_route()
             
-            logger.info(f"   → Initial documents retrieved: {len(docs)}")
+            # Cuota de embeddings de la empresa; si se agota, la respuesta sigue sin contexto RAG
+            get_tenant_limiter().throttle(self.company_id, "embeddings")
+            
+            started_at = time.perf_counter()
+            docs = self.vectorstore.similarity_search(query, k=k, **self._tenant_filter())
             
             # CORREGIDO: Filtrar por empresa pero mantener objetos Document de LangChain
             filtered_docs = []
@@ -103,23 +199,26 @@ class VectorstoreService:
                 if doc_company == self.company_id:
                     filtered_docs.append(doc)
             
-            # 🆕 LOGS DE RAG DETALLADOS - RESULTADOS
-            logger.info(f"📄 [{self.company_id}] RAG RESULTS:")
-            logger.info(f"   → Documents found after filtering: {len(filtered_docs)}")
+            logger.info(
+                "📄 [%s] RAG search: %d/%d docs (k=%d, index=%s) in %.1fms",
+                self.company_id, len(filtered_docs), len(docs), k, self.index_name,
+                (time.perf_counter() - started_at) * 1000
+            )
             
-            for i, doc in enumerate(filtered_docs):
-                doc_preview = doc.page_content[:100].replace('\n', ' ') if hasattr(doc, 'page_content') else 'No content'
-                metadata = getattr(doc, 'metadata', {})
-                logger.info(f"   → Doc {i+1}: {doc_preview}...")
-                logger.info(f"      Metadata: {metadata}")
+            # Detalle por documento solo en DEBUG y muestreado (loop caliente)
+            if logger.isEnabledFor(logging.DEBUG):
+                for i, doc in enumerate(filtered_docs):
+                    _rag_sampler.log(
+                        logger, logging.DEBUG, f"{self.company_id}:rag_doc",
+                        "   → Doc %d: %s | metadata=%s",
+                        i + 1, getattr(doc, 'page_content', 'No content')[:100].replace('\n', ' '),
+                        getattr(doc, 'metadata', {})
+                    )
             
-            logger.info(f"✅ [{self.company_id}] RAG search completed successfully")
-            logger.info(f"Found {len(filtered_docs)} documents for company {self.company_id}")
             return filtered_docs
             
         except Exception as e:
-            logger.error(f"❌ [{target_company if 'target_company' in locals() else 'unknown'}] RAG search error: {e}")
-            logger.error(f"Error searching documents for {self.company_id}: {e}")
+            logger.error("❌ [%s] RAG search error: %s", target_company, e)
             return []
     
     def add_texts(self, texts: List[str], metadatas: List[Dict[str, Any]] = None):
@@ -129,6 +228,8 @@ class VectorstoreService:
             if metadatas is None:
                 metadatas = [{} for _ in texts]
             
+            route = self.refresh_route()
+            
             enhanced_metadatas = []
             for metadata in metadatas:
                 enhanced_metadata = metadata.copy()
@@ -139,9 +240,18 @@ class VectorstoreService:
                 })
                 enhanced_metadatas.append(enhanced_metadata)
             
-            self.vectorstore.add_texts(texts, metadatas=enhanced_metadatas)
+            get_tenant_limiter().throttle(self.company_id, "embeddings", cost=len(texts))
+            keys = self.vectorstore.add_texts(texts, metadatas=enhanced_metadatas)
             logger.info(f"Added {len(texts)} texts for company {self.company_id}")
             
+            # Contador de documentos almacenados (el monitor de salud no recorre las claves)
+            adjust_document_count(self.redis_client, self.company_config.redis_prefix, self.key_prefix, len(keys))
+            
+            if route and route.target:
+                self._mirror_to_target(route, keys)
+            
+            return keys
+            
         except Exception as e:
             logger.error(f"Error adding texts for {self.company_id}: {e}")
             raise
@@ -273,7 +383,7 @@ class VectorstoreService:
     
     def find_vectors_by_doc_id(self, doc_id: str) -> List[str]:
         """Encontrar vectores por doc_id específicos de la empresa"""
-        pattern = f"{self.index_name}:*"
+        pattern = self.documents_pattern
         keys = self.redis_client.keys(pattern)
         vectors_to_find = []
         
@@ -301,10 +411,31 @@ class VectorstoreService:
         
         return vectors_to_find
     
+    def _mirror_to_target(self, route: IndexRoute, keys: List[str]):
+        """Dual-write: copiar al índice destino del re-index los vectores recién escritos"""
+        def embed(texts: List[str]) -> List[List[float]]:
+            get_tenant_limiter().throttle(self.company_id, "embeddings", cost=len(texts))
+            embeddings = self.openai_service.get_embeddings(dimensions=route.target_settings.request_dimensions)
+            return embeddings.embed_documents(texts)
+        
+        try:
+            copy_vectors(raw_redis_client(), keys, route.key_prefix, route.settings,
+                         route.target_key_prefix, route.target_settings, embed,
+                         {"index_name": route.target, TENANT_FIELD: self.company_id})
+        except Exception as e:
+            # El re-index vuelve a recorrer el origen; un fallo aquí no pierde el documento
+            logger.error("[%s] Dual-write into %s failed: %s", self.company_id, route.target, e)
+    
     def delete_vectors(self, vector_keys: List[str]) -> int:
         """Eliminar vectores específicos"""
         if vector_keys:
-            self.redis_client.delete(*vector_keys)
+            route = self.refresh_route()
+            if route and route.target:
+                # Dual-write: el borrado también aplica a las copias del índice destino
+                mirrors = [mirror_key(key, route.key_prefix, route.target_key_prefix).decode() for key in vector_keys]
+                self.redis_client.delete(*mirrors)
+            deleted = self.redis_client.delete(*vector_keys)
+            adjust_document_count(self.redis_client, self.company_config.redis_prefix, self.key_prefix, -int(deleted or 0))
             logger.info(f"Deleted {len(vector_keys)} vectors for company {self.company_id}")
             return len(vector_keys)
         return 0
@@ -312,13 +443,13 @@ class VectorstoreService:
     def check_health(self) -> Dict[str, Any]:
         """Verificar salud del vectorstore específico de empresa"""
         try:
-            # Get index info
-            info = self.redis_client.ft(self.index_name).info()
-            doc_count = info.get('num_docs', 0)
+            # Documentos indexados de esta empresa
+            doc_count = self.indexed_document_count()
             
-            # Count stored documents for this company
-            stored_keys = list(self.redis_client.scan_iter(match=f"{self.index_name}:*"))
-            stored_count = len(stored_keys)
+            # Documentos almacenados según el contador que reconcilia el monitor de salud (sin SCAN)
+            stored_count = read_document_count(self.redis_client, self.company_config.redis_prefix, self.key_prefix)
+            if stored_count is None:
+                stored_count = doc_count
             
             return {
                 "company_id": self.company_id,
@@ -0,0 +1,145 @@
+"""
+Deadline por request
+
+Un Deadline representa el presupuesto total de tiempo de una respuesta.
+Se crea al entrar a get_response(), viaja en OrchestratorState como
+'deadline_at' (epoch, serializable) y se publica en un ContextVar para que
+las llamadas LLM/HTTP de más abajo usen el presupuesto RESTANTE como timeout
+en lugar de sus timeouts fijos.
+"""
+
+from typing import Any, Callable, Optional
+from contextlib import contextmanager
+import concurrent.futures
+import contextvars
+import os
+import threading
+import time
+
+
+class DeadlineExceeded(TimeoutError):
+    """Se agotó el presupuesto de tiempo de la request"""
+    pass
+
+
+class Deadline:
+    """
+    Presupuesto de tiempo absoluto (epoch) de una request.
+
+    Ejemplo:
+        deadline = Deadline(budget_ms=25000)
+        timeout = deadline.timeout(30)        # min(30s, restante)
+        if deadline.has_budget(3000): ...     # ¿vale la pena otro paso?
+    """
+
+    __slots__ = ("expires_at", "budget_ms")
+
+    def __init__(self, budget_ms: float, expires_at: Optional[float] = None):
+        self.budget_ms = budget_ms
+        self.expires_at = expires_at if expires_at is not None else time.time() + budget_ms / 1000.0
+
+    @classmethod
+    def at(cls, expires_at: float) -> "Deadline":
+        return cls(budget_ms=max(0.0, (expires_at - time.time()) * 1000), expires_at=expires_at)
+
+    @classmethod
+    def from_state(cls, state: Any) -> Optional["Deadline"]:
+        """Deadline guardado en un estado de LangGraph ('deadline_at'), si hay"""
+        expires_at = state.get("deadline_at") if state else None
+        return cls.at(expires_at) if expires_at else None
+
+    def remaining_ms(self) -> float:
+        return max(0.0, (self.expires_at - time.time()) * 1000)
+
+    def remaining_seconds(self) -> float:
+        return self.remaining_ms() / 1000.0
+
+    def expired(self) -> bool:
+        return time.time() >= self.expires_at
+
+    def has_budget(self, min_ms: float) -> bool:
+        """True si quedan al menos min_ms (margen para un paso completo)"""
+        return self.remaining_ms() >= min_ms
+
+    def timeout(self, cap_seconds: Optional[float] = None) -> float:
+        """Timeout para una llamada: el restante, acotado por cap_seconds"""
+        remaining = self.remaining_seconds()
+        return remaining if cap_seconds is None else min(cap_seconds, remaining)
+
+    def __repr__(self) -> str:
+        return f"Deadline(remaining={self.remaining_ms():.0f}ms of {self.budget_ms:.0f}ms)"
+
+
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar(
+    "request_deadline", default=None
+)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Deadline activo en este contexto (None fuera de una request con presupuesto)"""
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    """Publicar un deadline para las llamadas anidadas (LLM, HTTP, tools)"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def deadline_timeout(default_seconds: float) -> float:
+    """
+    Timeout para una llamada LLM/HTTP: el default de la llamada, acotado por
+    el presupuesto restante si hay un deadline activo.
+
+    Raises:
+        DeadlineExceeded: si el deadline activo ya expiró (no vale la pena llamar)
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return default_seconds
+    if deadline.expired():
+        raise DeadlineExceeded("Request deadline exceeded before call")
+    return deadline.timeout(default_seconds)
+
+
+# Pool para llamadas que no aceptan timeout propio (chains de LangChain):
+# el thread de la request deja de esperar al vencer el deadline.
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=int(os.getenv("DEADLINE_CALL_MAX_WORKERS", "32")),
+                thread_name_prefix="deadline-call"
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def call_with_timeout(fn: Callable[..., Any], timeout_seconds: float, *args, **kwargs) -> Any:
+    """
+    Ejecutar fn(*args, **kwargs) esperando como máximo timeout_seconds.
+
+    Copia los contextvars (app context de Flask, deadline) al thread. Si vence,
+    la llamada queda huérfana (su resultado se descarta) y se lanza
+    DeadlineExceeded.
+    """
+    if timeout_seconds <= 0:
+        raise DeadlineExceeded("No time budget left for call")
+
+    ctx = contextvars.copy_context()
+    future = _get_executor().submit(ctx.run, fn, *args, **kwargs)
+    try:
+        return future.result(timeout=timeout_seconds)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise DeadlineExceeded(f"Call exceeded {timeout_seconds * 1000:.0f}ms budget")
@@ -0,0 +1,281 @@
+"""
+Logging estructurado de baja sobrecarga
+
+- Los hilos de request solo encolan el LogRecord (QueueHandler, sin
+  formatear); un QueueListener lo formatea y escribe a stdout en su propio
+  hilo, así un stdout lento no bloquea el webhook. Si la cola se llena se descarta el
+  record (y se cuenta) en lugar de bloquear.
+- LOG_FORMAT=json emite un objeto JSON por línea con request_id y
+  company_id tomados del contexto de la request (log_context).
+- LOG_LEVELS fija niveles por módulo: "app.langgraph_adapters=WARNING,httpx=WARNING".
+- LogSampler limita eventos de depuración repetidos en loops calientes.
+
+Los módulos deben pasar argumentos en lugar de f-strings
+(logger.debug("Doc %s: %s", i, preview)) para no formatear mensajes que el
+nivel configurado va a descartar.
+"""
+
+from typing import Any, Dict, Optional
+from contextlib import contextmanager
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] [%(name)s] [%(company_id)s %(request_id)s] %(message)s"
+
+_log_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("log_context", default={})
+
+# Atributos estándar de LogRecord: lo demás viene de extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "company_id"}
+
+
+def _logging_config(app=None) -> Dict[str, Any]:
+    defaults = {
+        "LOG_LEVEL": os.getenv('LOG_LEVEL', 'INFO'),
+        "LOG_FORMAT": os.getenv('LOG_FORMAT', 'text'),
+        "LOG_LEVELS": os.getenv('LOG_LEVELS', ''),
+        "LOG_ASYNC": os.getenv('LOG_ASYNC', 'true').lower() == 'true',
+        "LOG_QUEUE_SIZE": int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    }
+    if app is None:
+        return defaults
+    return {key: app.config.get(key, value) for key, value in defaults.items()}
+
+
+def parse_module_levels(spec: str) -> Dict[str, int]:
+    """'app.services.vectorstore_service=WARNING,httpx=ERROR' → {logger: nivel}"""
+    levels = {}
+    for item in (spec or "").split(","):
+        name, _, level = item.strip().partition("=")
+        if not name or not level:
+            continue
+        value = logging.getLevelName(level.strip().upper())
+        if isinstance(value, int):
+            levels[name.strip()] = value
+    return levels
+
+
+# ============================================================================
+# CONTEXTO DE REQUEST
+# ============================================================================
+
+def get_log_context() -> Dict[str, Any]:
+    return _log_context.get()
+
+
+def bind_log_context(**fields) -> contextvars.Token:
+    """Agregar campos al contexto actual; devuelve el token para reset_log_context"""
+    return _log_context.set({**_log_context.get(), **{k: v for k, v in fields.items() if v is not None}})
+
+
+def reset_log_context(token: contextvars.Token):
+    _log_context.reset(token)
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    Ejemplo (threads de background, que no heredan el contexto de la request):
+        with log_context(company_id=company_id):
+            ...
+    """
+    token = bind_log_context(**fields)
+    try:
+        yield
+    finally:
+        reset_log_context(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copia request_id/company_id del contexto al record (en el hilo que loguea)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        if not hasattr(record, "request_id"):
+            record.request_id = context.get("request_id", "-")
+        if not hasattr(record, "company_id"):
+            record.company_id = context.get("company_id", "-")
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+            "company_id": getattr(record, "company_id", "-"),
+            "thread": record.threadName
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que nunca bloquea al productor: con la cola llena descarta"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # QueueHandler.prepare formatea en el hilo que loguea; la cola no sale
+        # del proceso, así que el record viaja tal cual y lo formatea el listener
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# ============================================================================
+# MUESTREO PARA LOOPS CALIENTES
+# ============================================================================
+
+class LogSampler:
+    """
+    Deja pasar como máximo `limit` eventos por clave cada `interval` segundos.
+
+    Ejemplo:
+        _sampler = LogSampler(limit=1, interval=10)
+        for doc in docs:
+            _sampler.log(logger, logging.DEBUG, "rag_doc", "Doc %s: %s", doc.id, preview)
+    """
+
+    def __init__(self, limit: int = 1, interval: float = 10.0):
+        self.limit = limit
+        self.interval = interval
+        self._windows: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: str) -> Optional[int]:
+        """None si se descarta; si pasa, cuántos se descartaron desde el último"""
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                return suppressed
+            if window[1] < self.limit:
+                window[1] += 1
+                suppressed, window[2] = window[2], 0
+                return suppressed
+            window[2] += 1
+            return None
+
+    def log(self, target: logging.Logger, level: int, key: str, msg: str, *args, **kwargs):
+        if not target.isEnabledFor(level):
+            return
+        suppressed = self.allow(key)
+        if suppressed is None:
+            return
+        extra = kwargs.pop("extra", None) or {}
+        target.log(level, msg, *args, extra={**extra, "sampled_key": key, "suppressed": suppressed}, **kwargs)
+
+
+# ============================================================================
+# CONFIGURACIÓN
+# ============================================================================
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[_DroppingQueueHandler] = None
+_listener_pid: Optional[int] = None
+_configure_lock = threading.Lock()
+
+
+def configure_logging(app=None, stream=None) -> Dict[str, Any]:
+    """
+    (Re)configurar el logging raíz. Idempotente; llamarla de nuevo tras un
+    fork crea un listener propio del worker (el thread del master no
+    sobrevive al fork).
+
+    stream: destino de los records (sys.stdout por defecto)
+    """
+    global _listener, _queue_handler, _listener_pid
+
+    config = _logging_config(app)
+    with _configure_lock:
+        if _listener is not None:
+            # Heredado del master: su hilo no existe en este proceso, stop()
+            # esperaría un hilo ajeno. Se descarta junto con su cola.
+            if _listener_pid == os.getpid():
+                try:
+                    _listener.stop()
+                except Exception:
+                    pass
+            _listener = None
+            _queue_handler = None
+
+        stream_handler = logging.StreamHandler(stream or sys.stdout)
+        if str(config["LOG_FORMAT"]).lower() == "json":
+            stream_handler.setFormatter(JsonFormatter())
+        else:
+            stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+        if config["LOG_ASYNC"]:
+            _queue_handler = _DroppingQueueHandler(queue.Queue(maxsize=config["LOG_QUEUE_SIZE"]))
+            _queue_handler.addFilter(ContextFilter())
+            _listener = logging.handlers.QueueListener(_queue_handler.queue, stream_handler, respect_handler_level=True)
+            _listener.start()
+            _listener_pid = os.getpid()
+            handler = _queue_handler
+        else:
+            stream_handler.addFilter(ContextFilter())
+            handler = stream_handler
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(str(config["LOG_LEVEL"]).upper())
+
+        for name, level in parse_module_levels(config["LOG_LEVELS"]).items():
+            logging.getLogger(name).setLevel(level)
+
+    return config
+
+
+def flush_logging():
+    """Vaciar la cola (atexit y antes de medir en benchmarks)"""
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+        _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None and _listener_pid == os.getpid():
+        try:
+            _listener.stop()
+        except Exception:
+            pass
+
+
+atexit.register(_stop_listener)
+
+
+def get_logging_stats() -> Dict[str, Any]:
+    if _queue_handler is None:
+        return {"async": False}
+    return {
+        "async": True,
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped
+    }
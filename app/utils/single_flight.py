@@ -0,0 +1,79 @@
+"""
+Single-flight
+
+Llamadas idénticas concurrentes (misma clave) comparten una sola ejecución:
+la primera ("leader") ejecuta la función y las demás esperan su resultado
+(o su excepción). Al terminar la clave se libera; una llamada posterior
+vuelve a ejecutar. No es una caché.
+"""
+
+from typing import Any, Callable, Dict, Optional
+import threading
+
+from app.utils.deadline import DeadlineExceeded
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Ejemplo:
+        flight = SingleFlight()
+        result = flight.do(prompt_hash, lambda: client.chat.completions.create(...))
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"executed": 0, "coalesced": 0}
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Ejecutar fn() una vez por clave en vuelo.
+
+        timeout acota solo la espera de los seguidores (el leader corre con
+        sus propios timeouts); al vencer se lanza DeadlineExceeded.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["executed"] += 1
+            else:
+                call.waiters += 1
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise DeadlineExceeded(f"Timed out waiting for in-flight call {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls)}
@@ -16,7 +16,8 @@ from app.workflows.workflow_models import (
     # Core classes
     WorkflowNode,
     WorkflowEdge,
-    WorkflowGraph
+    WorkflowGraph,
+    ExecutionPlan
 )
 
 # ============================================================================
@@ -28,11 +29,27 @@ from app.workflows.workflow_executor import (
     ExecutionStatus
 )
 
+from app.workflows.workflow_runtime import (
+    WorkflowRuntime,
+    WorkflowConcurrencyLimitExceeded,
+    get_workflow_runtime,
+    generate_execution_id
+)
+
+from app.workflows.workflow_scheduler import (
+    WorkflowScheduler,
+    CronExpression,
+    get_workflow_scheduler
+)
+
 # ============================================================================
 # CONDITION EVALUATION - Safe expression evaluator
 # ============================================================================
 from app.workflows.condition_evaluator import (
     ConditionEvaluator,
+    CompiledCondition,
+    ConditionSyntaxError,
+    compile_condition,
     evaluate_condition,
     validate_condition
 )
@@ -68,14 +85,25 @@ __all__ = [
     'WorkflowNode',
     'WorkflowEdge',
     'WorkflowGraph',
+    'ExecutionPlan',
     
     # === EXECUTION === #
     'WorkflowExecutor',
     'WorkflowState',
     'ExecutionStatus',
+    'WorkflowRuntime',
+    'WorkflowConcurrencyLimitExceeded',
+    'get_workflow_runtime',
+    'generate_execution_id',
+    'WorkflowScheduler',
+    'CronExpression',
+    'get_workflow_scheduler',
     
     # === CONDITIONS === #
     'ConditionEvaluator',
+    'CompiledCondition',
+    'ConditionSyntaxError',
+    'compile_condition',
     'evaluate_condition',
     'validate_condition',
     
@@ -174,7 +202,6 @@ def execute_workflow_by_id(workflow_id: str, context: dict,
         ... )
         >>> print(result['status'])
     """
-    import asyncio
     from app.services.multi_agent_factory import get_orchestrator_for_company
     from app.models.conversation import ConversationManager
     
@@ -194,24 +221,24 @@ def execute_workflow_by_id(workflow_id: str, context: dict,
     if not orchestrator:
         raise ValueError(f"Orchestrator not available for company {company_id}")
     
-    # Crear executor
+    # Crear executor (durable: checkpoints + WAIT largos en el scheduler)
     executor = WorkflowExecutor(
         workflow=workflow,
         orchestrator=orchestrator,
-        conversation_manager=ConversationManager()
+        conversation_manager=ConversationManager(),
+        scheduler=get_workflow_scheduler()
     )
     
-    # Ejecutar (async)
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    
-    result = loop.run_until_complete(executor.execute(context))
+    # Ejecutar en el event loop persistente del worker
+    execution_id = generate_execution_id(workflow_id)
+    future = get_workflow_runtime().submit(
+        executor.execute(context, execution_id=execution_id),
+        workflow_key=f"{company_id}:{workflow_id}"
+    )
+    result = future.result()
     
-    # Log ejecución
-    registry.log_execution(workflow_id, result)
+    # Log ejecución (las suspendidas en un WAIT se registran al terminar)
+    registry.record_execution(workflow_id, result)
     
     return result
 
@@ -234,7 +261,7 @@ def get_module_info() -> dict:
         "version": __version__,
         "components": {
             "models": ["WorkflowGraph", "WorkflowNode", "WorkflowEdge"],
-            "execution": ["WorkflowExecutor", "WorkflowState"],
+            "execution": ["WorkflowExecutor", "WorkflowState", "WorkflowRuntime", "WorkflowScheduler"],
             "conditions": ["ConditionEvaluator"],
             "persistence": ["WorkflowRegistry"],
             "tools": ["ToolsLibrary", "ToolExecutor"]
@@ -246,6 +273,7 @@ def get_module_info() -> dict:
             "Tool execution",
             "Conditional branching",
             "Parallel execution",
+            "Durable execution (checkpoints, WAIT timers, cron triggers)",
             "PostgreSQL persistence",
             "Redis caching",
             "Versionado automático"
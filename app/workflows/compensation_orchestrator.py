@@ -8,8 +8,11 @@ Características:
 - Rollback automático de acciones compensables
 - Patrón Saga para transacciones distribuidas
 - Integración con AuditManager
-- Ejecución asíncrona de compensaciones
-- Retry con backoff exponencial
+- Saga log persistente en Redis (visible desde cualquier worker)
+- Primer intento en la request; reintentos (backoff exponencial) y
+  compensaciones fallidas en una cola diferida en segundo plano, sin sleeps
+- Idempotency keys por acción (una acción ya exitosa no se re-ejecuta)
+- Índices en Redis para sagas fallidas / por usuario
 
 Patrón Saga:
 1. Ejecutar acción principal → Registrar en audit trail
@@ -43,20 +46,30 @@ Ejemplo:
         compensator=None  # Email no se puede "desenviar"
     )
 
-    # Ejecutar saga
+    # Ejecutar saga (solo el primer intento de cada acción bloquea)
     result = orchestrator.execute_saga(saga.saga_id)
 
-    if not result["success"]:
+    if result["status"] == "retrying":
+        # Reintento programado en segundo plano; on_complete recibe el resultado final
+        ...
+    elif not result["success"]:
         # Automáticamente compensó todas las acciones
         print(f"Saga failed and rolled back: {result['error']}")
 """
 
 from typing import Dict, Any, List, Optional, Callable
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from datetime import datetime
+import heapq
+import itertools
+import json
 import logging
-import uuid
+import os
+import threading
 import time
+import uuid
+import weakref
 from enum import Enum
 
 from app.models.audit_trail import AuditManager, AuditEntry
@@ -64,16 +77,30 @@ from app.models.audit_trail import AuditManager, AuditEntry
 logger = logging.getLogger(__name__)
 
 
+def get_redis():
+    """Cliente Redis compartido de la aplicación"""
+    from app.services.redis_service import get_redis_client
+    return get_redis_client()
+
+
 class SagaStatus(Enum):
     """Estados de una Saga"""
     PENDING = "pending"
     IN_PROGRESS = "in_progress"
+    RETRYING = "retrying"          # reintento de una acción programado en segundo plano
     COMPLETED = "completed"
-    FAILED = "failed"
+    FAILED = "failed"              # fallo sin rollback completo (requiere atención)
     COMPENSATING = "compensating"
     COMPENSATED = "compensated"
 
 
+TERMINAL_STATUSES = (SagaStatus.COMPLETED, SagaStatus.FAILED, SagaStatus.COMPENSATED)
+
+
+def _unavailable_executor():
+    raise RuntimeError("Action executor not available in this worker")
+
+
 @dataclass
 class SagaAction:
     """
@@ -83,6 +110,7 @@ class SagaAction:
     - executor: Función que ejecuta la acción
     - compensator: Función que revierte la acción (opcional)
     - audit_id: ID de la entrada de auditoría
+    - idempotency_key: si ya hay un resultado exitoso para la clave, se reutiliza
     """
     action_id: str
     action_type: str
@@ -90,16 +118,56 @@ class SagaAction:
     executor: Callable[[], Dict[str, Any]]
     compensator: Optional[Callable[[Any], Dict[str, Any]]] = None
     input_params: Dict[str, Any] = field(default_factory=dict)
+    idempotency_key: Optional[str] = None
 
     # Estado de ejecución
     executed: bool = False
     execution_result: Optional[Dict[str, Any]] = None
     audit_id: Optional[str] = None
+    attempts: int = 0
+    last_error: Optional[str] = None
 
     # Estado de compensación
     compensated: bool = False
     compensation_result: Optional[Dict[str, Any]] = None
 
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializar para el saga log (sin callables)"""
+        return {
+            "action_id": self.action_id,
+            "action_type": self.action_type,
+            "action_name": self.action_name,
+            "input_params": self.input_params,
+            "idempotency_key": self.idempotency_key,
+            "compensable": self.compensator is not None,
+            "executed": self.executed,
+            "execution_result": self.execution_result,
+            "audit_id": self.audit_id,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "compensated": self.compensated,
+            "compensation_result": self.compensation_result
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SagaAction":
+        """Restaurar desde el saga log (los callables no viajan entre workers)"""
+        return cls(
+            action_id=data["action_id"],
+            action_type=data["action_type"],
+            action_name=data["action_name"],
+            executor=_unavailable_executor,
+            input_params=data.get("input_params") or {},
+            idempotency_key=data.get("idempotency_key"),
+            executed=data.get("executed", False),
+            execution_result=data.get("execution_result"),
+            audit_id=data.get("audit_id"),
+            attempts=data.get("attempts", 0),
+            last_error=data.get("last_error"),
+            compensated=data.get("compensated", False),
+            compensation_result=data.get("compensation_result")
+        )
+
 
 @dataclass
 class Saga:
@@ -115,16 +183,110 @@ class Saga:
     user_id: str
     saga_name: str
     actions: List[SagaAction] = field(default_factory=list)
+    conversation_id: Optional[str] = None
 
     status: SagaStatus = SagaStatus.PENDING
     created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
     completed_at: Optional[str] = None
 
+    # Progreso (reanudable desde la cola de reintentos)
+    current_index: int = 0
+    next_retry_at: Optional[float] = None
+    compensation_attempts: int = 0
+
     # Resultados
     success: bool = False
     error_message: Optional[str] = None
     failed_action_index: Optional[int] = None
 
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "saga_id": self.saga_id,
+            "company_id": self.company_id,
+            "user_id": self.user_id,
+            "saga_name": self.saga_name,
+            "actions": [action.to_dict() for action in self.actions],
+            "conversation_id": self.conversation_id,
+            "status": self.status.value,
+            "created_at": self.created_at,
+            "completed_at": self.completed_at,
+            "current_index": self.current_index,
+            "next_retry_at": self.next_retry_at,
+            "compensation_attempts": self.compensation_attempts,
+            "success": self.success,
+            "error_message": self.error_message,
+            "failed_action_index": self.failed_action_index
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Saga":
+        return cls(
+            saga_id=data["saga_id"],
+            company_id=data["company_id"],
+            user_id=data["user_id"],
+            saga_name=data["saga_name"],
+            actions=[SagaAction.from_dict(action) for action in data.get("actions") or []],
+            conversation_id=data.get("conversation_id"),
+            status=SagaStatus(data.get("status", SagaStatus.PENDING.value)),
+            created_at=data.get("created_at") or datetime.utcnow().isoformat(),
+            completed_at=data.get("completed_at"),
+            current_index=data.get("current_index", 0),
+            next_retry_at=data.get("next_retry_at"),
+            compensation_attempts=data.get("compensation_attempts", 0),
+            success=data.get("success", False),
+            error_message=data.get("error_message"),
+            failed_action_index=data.get("failed_action_index")
+        )
+
+
+class _SagaRetryWorker:
+    """
+    Thread único por proceso que atiende las colas de reintentos de todos los
+    CompensationOrchestrator vivos. Duerme hasta el próximo vencimiento (o el
+    próximo barrido de sagas abandonadas); nunca bloquea requests.
+    """
+
+    def __init__(self, sweep_interval: float = 60.0):
+        self.sweep_interval = sweep_interval
+        self._orchestrators: "weakref.WeakSet[CompensationOrchestrator]" = weakref.WeakSet()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def register(self, orchestrator: "CompensationOrchestrator"):
+        with self._condition:
+            self._orchestrators.add(orchestrator)
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="saga-retry-worker", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def wake(self):
+        with self._condition:
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                due_times = [
+                    due for due in (o.next_retry_due() for o in list(self._orchestrators))
+                    if due is not None
+                ]
+                timeout = self.sweep_interval
+                if due_times:
+                    timeout = max(0.0, min(min(due_times) - time.time(), timeout))
+                if timeout > 0:
+                    self._condition.wait(timeout)
+
+            for orchestrator in list(self._orchestrators):
+                try:
+                    orchestrator.run_background_cycle()
+                except Exception as e:
+                    logger.warning(f"[{orchestrator.company_id}] Saga retry cycle failed: {e}")
+
+
+_retry_worker = _SagaRetryWorker()
+
 
 class CompensationOrchestrator:
     """
@@ -133,6 +295,19 @@ class CompensationOrchestrator:
     Coordina la ejecución de acciones y su compensación
     automática en caso de errores.
 
+    Cada acción se intenta UNA vez en el thread que llama a execute_saga();
+    si falla y quedan reintentos, la saga queda en RETRYING y la acción se
+    reintenta desde la cola diferida del proceso (backoff exponencial).
+    El estado se persiste en Redis tras cada transición:
+
+    Redis Key Pattern:
+        {company_prefix}saga:{saga_id} - Saga log (JSON)
+        {company_prefix}saga:idx:user:{user_id} - ZSET saga_id -> creación
+        {company_prefix}saga:idx:failed - ZSET saga_id -> momento del fallo
+        {company_prefix}saga:idx:active - ZSET saga_id -> próximo avance esperado
+        {company_prefix}saga:idem:{idempotency_key} - Resultado exitoso de una acción
+        {company_prefix}saga:stats - HASH contadores por estado final
+
     Ejemplo de uso:
         orchestrator = CompensationOrchestrator(
             company_id="benova",
@@ -152,7 +327,8 @@ class CompensationOrchestrator:
             action_name="create_calendar_event",
             executor=create_event_func,
             compensator=delete_event_func,
-            input_params={"treatment": "toxina", "date": "2025-10-26"}
+            input_params={"treatment": "toxina", "date": "2025-10-26"},
+            idempotency_key="booking:user123:2025-10-26T10:00"
         )
 
         # Ejecutar
@@ -164,7 +340,11 @@ class CompensationOrchestrator:
         company_id: str,
         audit_manager: Optional[AuditManager] = None,
         max_retries: int = 3,
-        retry_delay: int = 2
+        retry_delay: int = 2,
+        redis_client=None,
+        saga_ttl_days: int = 7,
+        abandoned_after: int = 600,
+        recent_cache_size: int = 500
     ):
         """
         Inicializar orquestador de compensación.
@@ -172,24 +352,143 @@ class CompensationOrchestrator:
         Args:
             company_id: ID de la empresa
             audit_manager: Gestor de auditoría (opcional, se crea si no se provee)
-            max_retries: Máximo de reintentos por acción
-            retry_delay: Segundos entre reintentos
+            max_retries: Máximo de intentos por acción (incluye el primero)
+            retry_delay: Segundos base del backoff exponencial entre intentos
+            redis_client: Cliente Redis (opcional)
+            saga_ttl_days: Retención del saga log y de las idempotency keys
+            abandoned_after: Segundos de atraso tras los cuales una saga activa
+                de otro worker se considera abandonada (worker caído)
+            recent_cache_size: Sagas terminadas mantenidas en memoria (compensación manual)
         """
         self.company_id = company_id
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.saga_ttl_seconds = saga_ttl_days * 24 * 60 * 60
+        self.abandoned_after = abandoned_after
 
         # AuditManager para trazabilidad
         self.audit_manager = audit_manager or AuditManager(company_id=company_id)
 
-        # Sagas activas en memoria
+        # Saga log en Redis
+        if redis_client:
+            self.redis = redis_client
+        else:
+            try:
+                self.redis = get_redis()
+            except Exception:
+                logger.warning(f"[{company_id}] Redis not available for saga log")
+                self.redis = None
+
+        from app.config.company_config import get_company_config
+        company_config = get_company_config(company_id)
+        if company_config:
+            self.redis_prefix = company_config.redis_prefix + "saga:"
+        else:
+            self.redis_prefix = f"{company_id}:saga:"
+
+        # Sagas con callables en este proceso: activas + LRU de terminadas
         self._sagas: Dict[str, Saga] = {}
+        self._finished: "OrderedDict[str, Saga]" = OrderedDict()
+        self._recent_cache_size = recent_cache_size
+        self._callbacks: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+
+        # Cola diferida de reintentos: (vencimiento, seq, saga_id, tipo)
+        self._retry_heap: List[tuple] = []
+        self._retry_seq = itertools.count()
+        self._lock = threading.Lock()
+        self._app = None
+        self._last_sweep = time.time()
+
+        _retry_worker.register(self)
 
         logger.info(
             f"✅ CompensationOrchestrator initialized for {company_id} "
             f"(max_retries={max_retries})"
         )
 
+    # === KEYS / PERSISTENCIA === #
+
+    def _saga_key(self, saga_id: str) -> str:
+        return f"{self.redis_prefix}{saga_id}"
+
+    def _index_key(self, kind: str, value: str = None) -> str:
+        if value is None:
+            return f"{self.redis_prefix}idx:{kind}"
+        return f"{self.redis_prefix}idx:{kind}:{value}"
+
+    def _idempotency_key(self, key: str) -> str:
+        return f"{self.redis_prefix}idem:{key}"
+
+    @staticmethod
+    def _decode(raw) -> Optional[Any]:
+        """JSON desde Redis (str/bytes); cualquier otra cosa es 'sin dato'"""
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8")
+        if not isinstance(raw, str):
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def _persist(self, saga: Saga):
+        """Escribir el saga log y mantener los índices (un solo pipeline)"""
+        if not self.redis:
+            return
+
+        now = time.time()
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(self._saga_key(saga.saga_id), json.dumps(saga.to_dict(), default=str), ex=self.saga_ttl_seconds)
+
+            user_index = self._index_key("user", saga.user_id)
+            pipe.zadd(user_index, {saga.saga_id: _iso_timestamp(saga.created_at)})
+            pipe.expire(user_index, self.saga_ttl_seconds)
+
+            if saga.status in (SagaStatus.IN_PROGRESS, SagaStatus.RETRYING, SagaStatus.COMPENSATING):
+                pipe.zadd(self._index_key("active"), {saga.saga_id: saga.next_retry_at or now})
+            else:
+                pipe.zrem(self._index_key("active"), saga.saga_id)
+
+            if saga.status == SagaStatus.FAILED:
+                pipe.zadd(self._index_key("failed"), {saga.saga_id: now})
+            else:
+                pipe.zrem(self._index_key("failed"), saga.saga_id)
+
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"[{self.company_id}] Could not persist saga {saga.saga_id[:8]}: {e}")
+
+    def _load(self, saga_id: str) -> Optional[Saga]:
+        if not self.redis:
+            return None
+        try:
+            data = self._decode(self.redis.get(self._saga_key(saga_id)))
+            return Saga.from_dict(data) if data else None
+        except Exception as e:
+            logger.warning(f"[{self.company_id}] Could not load saga {saga_id[:8]}: {e}")
+            return None
+
+    def _load_many(self, saga_ids: List[Any]) -> List[Saga]:
+        if not saga_ids:
+            return []
+        ids = [s.decode("utf-8") if isinstance(s, bytes) else s for s in saga_ids]
+        sagas = []
+        for saga_id, raw in zip(ids, self.redis.mget([self._saga_key(saga_id) for saga_id in ids])):
+            local = self._local_saga(saga_id)
+            if local is not None:
+                sagas.append(local)
+                continue
+            data = self._decode(raw)
+            if data:
+                sagas.append(Saga.from_dict(data))
+        return sagas
+
+    def _local_saga(self, saga_id: str) -> Optional[Saga]:
+        return self._sagas.get(saga_id) or self._finished.get(saga_id)
+
+    # === API === #
+
     def create_saga(
         self,
         user_id: str,
@@ -213,7 +512,8 @@ class CompensationOrchestrator:
             saga_id=saga_id,
             company_id=self.company_id,
             user_id=user_id,
-            saga_name=saga_name
+            saga_name=saga_name,
+            conversation_id=conversation_id
         )
 
         self._sagas[saga_id] = saga
@@ -232,8 +532,9 @@ class CompensationOrchestrator:
         action_name: str,
         executor: Callable[[], Dict[str, Any]],
         compensator: Optional[Callable[[Any], Dict[str, Any]]] = None,
-        input_params: Dict[str, Any] = None
-    ) -> bool:
+        input_params: Dict[str, Any] = None,
+        idempotency_key: Optional[str] = None
+    ) -> Optional[SagaAction]:
         """
         Agregar una acción a una saga.
 
@@ -244,20 +545,23 @@ class CompensationOrchestrator:
             executor: Función que ejecuta la acción
             compensator: Función que compensa/revierte (opcional)
             input_params: Parámetros de entrada
+            idempotency_key: Clave de negocio (ej: "booking:user:fecha"); por
+                defecto "{saga_id}:{índice}". Un resultado exitoso previo con la
+                misma clave se reutiliza sin volver a ejecutar.
 
         Returns:
-            True si se agregó correctamente
+            SagaAction agregada, o None si la saga no existe / ya empezó
         """
         saga = self._sagas.get(saga_id)
         if not saga:
             logger.error(f"[{self.company_id}] Saga not found: {saga_id}")
-            return False
+            return None
 
         if saga.status != SagaStatus.PENDING:
             logger.error(
                 f"[{self.company_id}] Cannot add actions to saga in status: {saga.status}"
             )
-            return False
+            return None
 
         action_id = str(uuid.uuid4())
 
@@ -267,7 +571,8 @@ class CompensationOrchestrator:
             action_name=action_name,
             executor=executor,
             compensator=compensator,
-            input_params=input_params or {}
+            input_params=input_params or {},
+            idempotency_key=idempotency_key or f"{saga_id}:{len(saga.actions)}"
         )
 
         saga.actions.append(action)
@@ -277,23 +582,32 @@ class CompensationOrchestrator:
             f"{action_type}/{action_name} (compensable={compensator is not None})"
         )
 
-        return True
+        return action
 
-    def execute_saga(self, saga_id: str) -> Dict[str, Any]:
+    def execute_saga(
+        self,
+        saga_id: str,
+        on_complete: Optional[Callable[[Dict[str, Any]], Any]] = None
+    ) -> Dict[str, Any]:
         """
-        Ejecutar una saga completa.
+        Ejecutar una saga.
 
-        Ejecuta todas las acciones en secuencia. Si alguna falla,
-        compensa (rollback) todas las acciones previas ejecutadas.
+        Ejecuta las acciones en secuencia con UN intento cada una. Si una
+        falla y quedan reintentos, retorna status "retrying" y la saga
+        continúa en segundo plano; si se agotan, compensa (rollback) las
+        acciones previas ejecutadas en orden inverso.
 
         Args:
             saga_id: ID de la saga
+            on_complete: Callback con el resultado final (útil cuando la saga
+                termina en segundo plano)
 
         Returns:
             Dict con resultado:
             {
                 "success": bool,
                 "saga_id": str,
+                "status": str,
                 "actions_executed": int,
                 "actions_compensated": int,
                 "error": Optional[str]
@@ -306,90 +620,144 @@ class CompensationOrchestrator:
                 "error": f"Saga not found: {saga_id}"
             }
 
+        if saga.status != SagaStatus.PENDING:
+            return {
+                "success": False,
+                "saga_id": saga_id,
+                "status": saga.status.value,
+                "error": f"Saga already started (status: {saga.status.value})"
+            }
+
         logger.info(
             f"🚀 [{self.company_id}] Executing saga: {saga.saga_name} "
             f"({len(saga.actions)} actions)"
         )
 
+        if on_complete:
+            self._callbacks[saga_id] = on_complete
+
         saga.status = SagaStatus.IN_PROGRESS
+        return self._advance(saga)
+
+    def compensate_saga(self, saga_id: str, reason: str = "Manual compensation") -> Dict[str, Any]:
+        """
+        Compensar manualmente una saga completada.
+
+        Args:
+            saga_id: ID de la saga
+            reason: Razón de la compensación
+
+        Returns:
+            Resultado de la compensación
+        """
+        saga = self._local_saga(saga_id)
+        if not saga:
+            return {
+                "success": False,
+                "error": f"Saga not found: {saga_id}"
+            }
+
+        if saga.status not in [SagaStatus.COMPLETED, SagaStatus.FAILED]:
+            return {
+                "success": False,
+                "error": f"Cannot compensate saga in status: {saga.status}"
+            }
+
+        logger.info(
+            f"🔄 [{self.company_id}] Manually compensating saga: {saga.saga_name} - {reason}"
+        )
+
+        self._sagas[saga_id] = self._finished.pop(saga_id, saga)
+        saga.compensation_attempts = 0
+        result = self._compensate_saga(saga, reason=reason)
+        self._finish(saga)
+
+        return result
+
+    # === EJECUCIÓN === #
+
+    def _advance(self, saga: Saga) -> Dict[str, Any]:
+        """Ejecutar acciones desde saga.current_index (un intento por acción)"""
+        while saga.current_index < len(saga.actions):
+            index = saga.current_index
+            action = saga.actions[index]
 
-        # Ejecutar acciones en secuencia
-        for index, action in enumerate(saga.actions):
             logger.info(
                 f"   ▶️  [{self.company_id}] Executing action {index + 1}/{len(saga.actions)}: "
-                f"{action.action_type}/{action.action_name}"
+                f"{action.action_type}/{action.action_name} (attempt {action.attempts + 1})"
             )
 
-            # Registrar en audit trail ANTES de ejecutar
-            audit_entry = self.audit_manager.log_action(
-                user_id=saga.user_id,
-                action_type=action.action_type,
-                action_name=action.action_name,
-                input_params=action.input_params,
-                compensable=action.compensator is not None,
-                compensation_action=f"{action.action_name}.compensate" if action.compensator else None,
-                tags=[f"saga:{saga.saga_name}", f"saga_id:{saga_id}"]
-            )
-
-            action.audit_id = audit_entry.audit_id
+            # Registrar en audit trail ANTES del primer intento
+            if action.audit_id is None:
+                audit_entry = self.audit_manager.log_action(
+                    user_id=saga.user_id,
+                    action_type=action.action_type,
+                    action_name=action.action_name,
+                    input_params=action.input_params,
+                    compensable=action.compensator is not None,
+                    compensation_action=f"{action.action_name}.compensate" if action.compensator else None,
+                    tags=[f"saga:{saga.saga_name}", f"saga_id:{saga.saga_id}"]
+                )
+                action.audit_id = audit_entry.audit_id
 
-            # Ejecutar acción con reintentos
-            execution_result = self._execute_action_with_retry(action)
+            execution_result = self._attempt_action(action)
+            action.attempts += 1
 
             if execution_result["success"]:
                 # Marcar como exitosa en audit trail
                 self.audit_manager.mark_success(
-                    audit_entry.audit_id,
+                    action.audit_id,
                     result=execution_result.get("data"),
                     duration_ms=execution_result.get("duration_ms")
                 )
 
                 action.executed = True
                 action.execution_result = execution_result
+                action.last_error = None
+                saga.current_index += 1
+                saga.next_retry_at = None
+                self._persist(saga)
 
                 logger.info(
                     f"   ✅ [{self.company_id}] Action {index + 1} completed successfully"
                 )
+                continue
 
-            else:
-                # Acción falló
-                error_message = execution_result.get("error", "Unknown error")
-
-                # Marcar como fallida en audit trail
-                self.audit_manager.mark_failed(
-                    audit_entry.audit_id,
-                    error_message=error_message,
-                    duration_ms=execution_result.get("duration_ms")
-                )
-
-                logger.error(
-                    f"   ❌ [{self.company_id}] Action {index + 1} failed: {error_message}"
-                )
-
-                # Marcar saga como fallida
-                saga.status = SagaStatus.FAILED
-                saga.error_message = error_message
-                saga.failed_action_index = index
+            error_message = execution_result.get("error", "Unknown error")
+            action.last_error = error_message
 
-                # COMPENSAR todas las acciones previas ejecutadas
+            if action.attempts < self.max_retries:
+                # Reintento diferido: el thread actual no espera
+                wait_time = self.retry_delay * (2 ** (action.attempts - 1))
                 logger.warning(
-                    f"🔄 [{self.company_id}] Starting compensation (rollback) of {index} actions"
+                    f"   ⏳ [{self.company_id}] Action {index + 1} failed ({error_message}); "
+                    f"retry {action.attempts}/{self.max_retries - 1} in {wait_time}s"
                 )
+                saga.status = SagaStatus.RETRYING
+                self._schedule_retry(saga, wait_time)
+                return self._result(saga)
+
+            # Intentos agotados: marcar como fallida en audit trail
+            self.audit_manager.mark_failed(
+                action.audit_id,
+                error_message=error_message,
+                duration_ms=execution_result.get("duration_ms")
+            )
 
-                compensation_result = self._compensate_saga(saga, up_to_index=index)
+            logger.error(
+                f"   ❌ [{self.company_id}] Action {index + 1} failed: {error_message}"
+            )
 
-                saga.status = SagaStatus.COMPENSATED
-                saga.completed_at = datetime.utcnow().isoformat()
+            saga.error_message = error_message
+            saga.failed_action_index = index
 
-                return {
-                    "success": False,
-                    "saga_id": saga_id,
-                    "saga_name": saga.saga_name,
-                    "actions_executed": index,
-                    "actions_compensated": compensation_result["compensated_count"],
-                    "failed_action": action.action_name,
-                    "error": error_message
-                }
+            # COMPENSAR todas las acciones previas ejecutadas
+            logger.warning(
+                f"🔄 [{self.company_id}] Starting compensation (rollback) of {index} actions"
+            )
+
+            self._compensate_saga(saga, up_to_index=index)
+            return self._finish(saga)
 
         # Todas las acciones se ejecutaron exitosamente
         saga.status = SagaStatus.COMPLETED
@@ -401,102 +769,78 @@ class CompensationOrchestrator:
             f"({len(saga.actions)} actions)"
         )
 
-        return {
-            "success": True,
-            "saga_id": saga_id,
-            "saga_name": saga.saga_name,
-            "actions_executed": len(saga.actions),
-            "actions_compensated": 0
-        }
+        return self._finish(saga)
 
-    def compensate_saga(self, saga_id: str, reason: str = "Manual compensation") -> Dict[str, Any]:
-        """
-        Compensar manualmente una saga completada.
+    def _attempt_action(self, action: SagaAction) -> Dict[str, Any]:
+        """Un intento de la acción (reutiliza el resultado de su idempotency key)"""
+        start_time = time.time()
 
-        Args:
-            saga_id: ID de la saga
-            reason: Razón de la compensación
+        previous = self._get_idempotent_result(action)
+        if previous is not None:
+            logger.info(
+                f"      [{self.company_id}] Reusing result for idempotency key {action.idempotency_key}"
+            )
+            return dict(previous, duration_ms=0, reused=True)
 
-        Returns:
-            Resultado de la compensación
-        """
-        saga = self._sagas.get(saga_id)
-        if not saga:
+        try:
+            result = action.executor()
+        except Exception as e:
+            logger.error(f"      Action execution error (attempt {action.attempts + 1}): {e}")
             return {
                 "success": False,
-                "error": f"Saga not found: {saga_id}"
+                "error": str(e),
+                "duration_ms": (time.time() - start_time) * 1000
             }
 
-        if saga.status not in [SagaStatus.COMPLETED, SagaStatus.FAILED]:
+        duration_ms = (time.time() - start_time) * 1000
+
+        # Resultado no-dict: asumimos éxito
+        if isinstance(result, dict) and not result.get("success", True):
             return {
                 "success": False,
-                "error": f"Cannot compensate saga in status: {saga.status}"
+                "error": result.get("error", "Action returned success=False"),
+                "duration_ms": duration_ms
             }
 
-        logger.info(
-            f"🔄 [{self.company_id}] Manually compensating saga: {saga.saga_name} - {reason}"
-        )
-
-        result = self._compensate_saga(saga, reason=reason)
-
-        saga.status = SagaStatus.COMPENSATED
-        saga.completed_at = datetime.utcnow().isoformat()
-
-        return result
-
-    def _execute_action_with_retry(self, action: SagaAction) -> Dict[str, Any]:
-        """Ejecutar acción con reintentos"""
-        start_time = time.time()
-        last_error = None
-
-        for attempt in range(self.max_retries):
-            try:
-                if attempt > 0:
-                    wait_time = self.retry_delay * (2 ** (attempt - 1))
-                    logger.info(
-                        f"      Retry {attempt}/{self.max_retries - 1} "
-                        f"after {wait_time}s..."
-                    )
-                    time.sleep(wait_time)
-
-                # Ejecutar función
-                result = action.executor()
-
-                duration_ms = (time.time() - start_time) * 1000
-
-                # Validar resultado
-                if isinstance(result, dict):
-                    if result.get("success", True):
-                        return {
-                            "success": True,
-                            "data": result,
-                            "duration_ms": duration_ms,
-                            "attempts": attempt + 1
-                        }
-                    else:
-                        last_error = result.get("error", "Action returned success=False")
-                else:
-                    # Resultado no es dict, asumimos éxito
-                    return {
-                        "success": True,
-                        "data": result,
-                        "duration_ms": duration_ms,
-                        "attempts": attempt + 1
-                    }
-
-            except Exception as e:
-                last_error = str(e)
-                logger.error(f"      Action execution error (attempt {attempt + 1}): {e}")
-
-        # Todos los intentos fallaron
-        duration_ms = (time.time() - start_time) * 1000
-
-        return {
-            "success": False,
-            "error": last_error,
+        outcome = {
+            "success": True,
+            "data": result,
             "duration_ms": duration_ms,
-            "attempts": self.max_retries
+            "attempts": action.attempts + 1
         }
+        self._store_idempotent_result(action, outcome)
+        return outcome
+
+    def _get_idempotent_result(self, action: SagaAction) -> Optional[Dict[str, Any]]:
+        if not self.redis or not action.idempotency_key:
+            return None
+        try:
+            return self._decode(self.redis.get(self._idempotency_key(action.idempotency_key)))
+        except Exception as e:
+            logger.warning(f"[{self.company_id}] Idempotency lookup failed: {e}")
+            return None
+
+    def _store_idempotent_result(self, action: SagaAction, outcome: Dict[str, Any]):
+        if not self.redis or not action.idempotency_key:
+            return
+        try:
+            self.redis.set(
+                self._idempotency_key(action.idempotency_key),
+                json.dumps(outcome, default=str),
+                ex=self.saga_ttl_seconds,
+                nx=True
+            )
+        except Exception as e:
+            logger.warning(f"[{self.company_id}] Could not store idempotency key: {e}")
+
+    def _clear_idempotent_result(self, action: SagaAction):
+        # Una acción compensada puede volver a ejecutarse con la misma clave
+        if not self.redis or not action.idempotency_key:
+            return
+        try:
+            self.redis.delete(self._idempotency_key(action.idempotency_key))
+        except Exception as e:
+            logger.warning(f"[{self.company_id}] Could not clear idempotency key: {e}")
 
     def _compensate_saga(
         self,
@@ -507,6 +851,9 @@ class CompensationOrchestrator:
         """
         Compensar (rollback) acciones de una saga.
 
+        Las compensaciones que fallan se reintentan desde la cola diferida;
+        al agotar los intentos la saga queda FAILED (índice de fallidas).
+
         Args:
             saga: Saga a compensar
             up_to_index: Compensar hasta este índice (None = todas)
@@ -516,6 +863,7 @@ class CompensationOrchestrator:
             Resultado de la compensación
         """
         saga.status = SagaStatus.COMPENSATING
+        saga.compensation_attempts += 1
 
         if up_to_index is None:
             up_to_index = len(saga.actions)
@@ -527,7 +875,7 @@ class CompensationOrchestrator:
         for index in range(up_to_index - 1, -1, -1):
             action = saga.actions[index]
 
-            if not action.executed:
+            if not action.executed or action.compensated:
                 continue
 
             if not action.compensator:
@@ -542,37 +890,26 @@ class CompensationOrchestrator:
                 f"{action.action_name}"
             )
 
-            try:
-                # Ejecutar compensador
-                compensation_result = action.compensator(action.execution_result)
-
-                action.compensated = True
-                action.compensation_result = compensation_result
-
-                # Marcar en audit trail
-                if action.audit_id:
-                    self.audit_manager.compensate(
-                        action.audit_id,
-                        reason=reason,
-                        compensated_by="CompensationOrchestrator"
-                    )
-
+            result = self._compensate_action(action, reason=reason)
+            if result["success"]:
                 compensated_count += 1
-
-                logger.info(
-                    f"   ✅ [{self.company_id}] Action {index + 1} compensated successfully"
-                )
-
-            except Exception as e:
-                logger.error(
-                    f"   ❌ [{self.company_id}] Compensation failed for action {index + 1}: {e}"
-                )
+            else:
                 failed_compensations.append({
                     "action_index": index,
                     "action_name": action.action_name,
-                    "error": str(e)
+                    "error": result["error"]
                 })
 
+        if not failed_compensations:
+            saga.status = SagaStatus.COMPENSATED
+            saga.completed_at = datetime.utcnow().isoformat()
+        elif saga.compensation_attempts < self.max_retries:
+            wait_time = self.retry_delay * (2 ** (saga.compensation_attempts - 1))
+            self._schedule_retry(saga, wait_time, kind="compensate", up_to_index=up_to_index)
+        else:
+            saga.status = SagaStatus.FAILED
+            saga.completed_at = datetime.utcnow().isoformat()
+
         logger.info(
             f"🔄 [{self.company_id}] Compensation completed: "
             f"{compensated_count} actions rolled back, "
@@ -585,35 +922,266 @@ class CompensationOrchestrator:
             "failed_compensations": failed_compensations
         }
 
+    def _compensate_action(self, action: SagaAction, reason: str = "Saga failed") -> Dict[str, Any]:
+        """Ejecutar el compensador de UNA acción y registrarlo en el audit trail"""
+        if not action.compensator:
+            return {
+                "success": False,
+                "error": f"Action {action.action_name} has no compensator"
+            }
+
+        try:
+            compensation_result = action.compensator(action.execution_result)
+        except Exception as e:
+            logger.error(
+                f"   ❌ [{self.company_id}] Compensation failed for {action.action_name}: {e}"
+            )
+            return {"success": False, "error": str(e)}
+
+        action.compensated = True
+        action.compensation_result = compensation_result
+        self._clear_idempotent_result(action)
+
+        # Marcar en audit trail
+        if action.audit_id:
+            self.audit_manager.compensate(
+                action.audit_id,
+                reason=reason,
+                compensated_by="CompensationOrchestrator"
+            )
+
+        logger.info(
+            f"   ✅ [{self.company_id}] Action {action.action_name} compensated successfully"
+        )
+
+        return {"success": True, "result": compensation_result}
+
+    def _finish(self, saga: Saga) -> Dict[str, Any]:
+        """Persistir; si la saga terminó, notificar callback y archivarla en la LRU"""
+        self._persist(saga)
+        result = self._result(saga)
+
+        if saga.status not in TERMINAL_STATUSES:
+            return result
+
+        self._sagas.pop(saga.saga_id, None)
+        self._finished[saga.saga_id] = saga
+        self._finished.move_to_end(saga.saga_id)
+        while len(self._finished) > self._recent_cache_size:
+            self._finished.popitem(last=False)
+
+        if self.redis:
+            try:
+                self.redis.hincrby(f"{self.redis_prefix}stats", saga.status.value, 1)
+            except Exception:
+                pass
+
+        callback = self._callbacks.pop(saga.saga_id, None)
+        if callback:
+            try:
+                callback(result)
+            except Exception as e:
+                logger.warning(f"[{self.company_id}] Saga on_complete callback failed: {e}")
+
+        return result
+
+    def _result(self, saga: Saga) -> Dict[str, Any]:
+        result = {
+            "success": saga.status == SagaStatus.COMPLETED,
+            "saga_id": saga.saga_id,
+            "saga_name": saga.saga_name,
+            "status": saga.status.value,
+            "actions_executed": sum(1 for action in saga.actions if action.executed),
+            "actions_compensated": sum(1 for action in saga.actions if action.compensated)
+        }
+
+        if saga.status == SagaStatus.RETRYING:
+            pending = saga.actions[saga.current_index]
+            result["pending_action"] = pending.action_name
+            result["error"] = pending.last_error
+        elif saga.failed_action_index is not None:
+            result["failed_action"] = saga.actions[saga.failed_action_index].action_name
+            result["error"] = saga.error_message
+
+        if saga.next_retry_at and saga.status in (SagaStatus.RETRYING, SagaStatus.COMPENSATING):
+            result["next_retry_at"] = datetime.utcfromtimestamp(saga.next_retry_at).isoformat()
+
+        return result
+
+    def get_saga_result(self, saga_id: str) -> Optional[Dict[str, Any]]:
+        """Resultado actual de una saga (mismo formato que execute_saga)"""
+        saga = self.get_saga(saga_id)
+        return self._result(saga) if saga else None
+
+    # === COLA DIFERIDA === #
+
+    def _schedule_retry(self, saga: Saga, delay: float, kind: str = "action", up_to_index: int = None):
+        due = time.time() + delay
+        saga.next_retry_at = due
+
+        with self._lock:
+            heapq.heappush(self._retry_heap, (due, next(self._retry_seq), saga.saga_id, kind, up_to_index))
+
+        # Los reintentos corren fuera de la request: conservar el app context
+        if self._app is None:
+            self._app = _current_app()
+
+        self._persist(saga)
+        _retry_worker.wake()
+
+    def next_retry_due(self) -> Optional[float]:
+        with self._lock:
+            return self._retry_heap[0][0] if self._retry_heap else None
+
+    def process_due_retries(self, now: float = None) -> int:
+        """Ejecutar los reintentos vencidos. Retorna cuántos se procesaron."""
+        now = time.time() if now is None else now
+        processed = 0
+
+        while True:
+            with self._lock:
+                if not self._retry_heap or self._retry_heap[0][0] > now:
+                    break
+                _, _, saga_id, kind, up_to_index = heapq.heappop(self._retry_heap)
+
+            saga = self._sagas.get(saga_id)
+            if saga is None:
+                continue
+
+            try:
+                if kind == "compensate":
+                    self._compensate_saga(saga, up_to_index=up_to_index, reason="Compensation retry")
+                    self._finish(saga)
+                else:
+                    saga.status = SagaStatus.IN_PROGRESS
+                    self._advance(saga)
+            except Exception as e:
+                logger.exception(f"[{self.company_id}] Saga retry failed for {saga_id[:8]}: {e}")
+            processed += 1
+
+        return processed
+
+    def run_background_cycle(self):
+        """Ciclo del worker de reintentos: reintentos vencidos + barrido de abandonadas"""
+        context = self._app.app_context() if self._app is not None else None
+        if context is not None:
+            context.push()
+        try:
+            self.process_due_retries()
+            if time.time() - self._last_sweep >= _retry_worker.sweep_interval:
+                self._last_sweep = time.time()
+                self.recover_abandoned_sagas()
+        finally:
+            if context is not None:
+                context.pop()
+
+    def recover_abandoned_sagas(self) -> int:
+        """
+        Marcar como FAILED las sagas activas de workers que murieron (atrasadas
+        más de abandoned_after). Sus callables se perdieron con el proceso:
+        quedan en el índice de fallidas para revisión.
+        """
+        if not self.redis:
+            return 0
+
+        cutoff = time.time() - self.abandoned_after
+        recovered = 0
+        for raw_id in self.redis.zrangebyscore(self._index_key("active"), "-inf", cutoff):
+            saga_id = raw_id.decode("utf-8") if isinstance(raw_id, bytes) else raw_id
+            if saga_id in self._sagas:
+                continue
+
+            saga = self._load(saga_id)
+            if saga is None or saga.status in TERMINAL_STATUSES:
+                self.redis.zrem(self._index_key("active"), saga_id)
+                continue
+
+            saga.error_message = (
+                f"Saga abandoned in status {saga.status.value}: owning worker stopped before finishing"
+            )
+            saga.status = SagaStatus.FAILED
+            saga.completed_at = datetime.utcnow().isoformat()
+            self._persist(saga)
+            recovered += 1
+
+            logger.error(f"[{self.company_id}] Saga {saga_id[:8]} ({saga.saga_name}) abandoned, marked as failed")
+
+        return recovered
+
+    # === CONSULTAS === #
+
     def get_saga(self, saga_id: str) -> Optional[Saga]:
-        """Obtener una saga por ID"""
-        return self._sagas.get(saga_id)
-
-    def get_sagas_by_user(self, user_id: str) -> List[Saga]:
-        """Obtener todas las sagas de un usuario"""
-        return [
-            saga for saga in self._sagas.values()
-            if saga.user_id == user_id
-        ]
-
-    def get_failed_sagas(self) -> List[Saga]:
-        """Obtener sagas fallidas"""
-        return [
-            saga for saga in self._sagas.values()
-            if saga.status == SagaStatus.FAILED
-        ]
+        """Obtener una saga por ID (memoria local o saga log en Redis)"""
+        return self._local_saga(saga_id) or self._load(saga_id)
+
+    def get_sagas_by_user(self, user_id: str, limit: int = 50) -> List[Saga]:
+        """Obtener las sagas más recientes de un usuario (índice en Redis)"""
+        if not self.redis:
+            return [
+                saga for saga in list(self._sagas.values()) + list(self._finished.values())
+                if saga.user_id == user_id
+            ]
+        saga_ids = self.redis.zrevrange(self._index_key("user", user_id), 0, limit - 1)
+        return self._load_many(saga_ids)
+
+    def get_failed_sagas(self, limit: int = 100) -> List[Saga]:
+        """Obtener sagas fallidas (índice en Redis, más recientes primero)"""
+        if not self.redis:
+            return [
+                saga for saga in list(self._sagas.values()) + list(self._finished.values())
+                if saga.status == SagaStatus.FAILED
+            ]
+        saga_ids = self.redis.zrevrange(self._index_key("failed"), 0, limit - 1)
+        return self._load_many(saga_ids)
 
     def get_stats(self) -> Dict[str, Any]:
         """Obtener estadísticas de compensaciones"""
-        total_sagas = len(self._sagas)
+        local_sagas = list(self._sagas.values()) + list(self._finished.values())
         by_status = {}
 
         for status in SagaStatus:
-            count = len([s for s in self._sagas.values() if s.status == status])
+            count = len([s for s in local_sagas if s.status == status])
             by_status[status.value] = count
 
-        return {
+        stats = {
             "company_id": self.company_id,
-            "total_sagas": total_sagas,
-            "by_status": by_status
+            "total_sagas": len(local_sagas),
+            "by_status": by_status,
+            "pending_retries": len(self._retry_heap)
         }
+
+        if self.redis:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.hgetall(f"{self.redis_prefix}stats")
+                pipe.zcard(self._index_key("active"))
+                pipe.zcard(self._index_key("failed"))
+                totals, active, failed = pipe.execute()
+                stats["persistent"] = {
+                    "finished_by_status": {
+                        (k.decode() if isinstance(k, bytes) else k): int(v) for k, v in (totals or {}).items()
+                    },
+                    "active": active,
+                    "failed": failed
+                }
+            except Exception as e:
+                stats["persistent"] = {"error": str(e)}
+
+        return stats
+
+
+def _iso_timestamp(value: str) -> float:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def _current_app():
+    try:
+        from flask import current_app, has_app_context
+        if has_app_context():
+            return current_app._get_current_object()
+    except ImportError:
+        pass
+    return None
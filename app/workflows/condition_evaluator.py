@@ -1,7 +1,8 @@
 # app/workflows/condition_evaluator.py
 
 import re
-from typing import Dict, Any, Union, List
+from functools import lru_cache
+from typing import Dict, Any, Union, List, Optional, Tuple, Callable
 import logging
 
 logger = logging.getLogger(__name__)
@@ -65,285 +66,21 @@ class ConditionEvaluator:
     def evaluate(self, condition: str, context: Dict[str, Any]) -> bool:
         """
         Evaluar condición de forma segura.
+        
+        La condición se compila una sola vez (cache por texto) y luego se
+        evalúa como closure sobre el contexto.
         """
         try:
-            # Normalizar espacios
-            condition = condition.strip()
-            
-            if not condition:
-                raise ValueError("Empty condition")
-            
-            # AGREGAR: Extraer y validar variables
-            variables = self._extract_variables(condition)
-            missing = [var for var in variables if var not in context]
-            
-            if missing:
-                logger.warning(f"Missing variables in context: {missing}")
-                # En vez de fallar, asignar None a las variables faltantes
-                for var in missing:
-                    context[var] = None
-            
-            # Log para debugging
-            logger.debug(f"Evaluating condition: {condition}")
-            logger.debug(f"Context: {context}")
-            
-            # Evaluar condición (con soporte para lógicos)
-            result = self._evaluate_expression(condition, context)
-            
-            # Forzar a boolean
-            if not isinstance(result, bool):
-                result = bool(result)
-            
-            logger.debug(f"Condition result: {result}")
-            
-            return result
-            
-        except Exception as e:
+            compiled = compile_condition(condition)
+        except ConditionSyntaxError as e:
             logger.error(f"Error evaluating condition '{condition}': {e}")
             raise ValueError(f"Invalid condition: {str(e)}")
-
-    def _extract_variables(self, condition: str) -> list:
-        """Extraer variables de una condición (formato {{variable}})"""
-        import re
-        pattern = r'\{\{([^}]+)\}\}'
-        matches = re.findall(pattern, condition)
-        return [var.strip() for var in matches]
-    
-    def _evaluate_expression(self, expression: str, context: Dict[str, Any]) -> bool:
-        """
-        Evaluar expresión completa (puede contener and/or).
-        """
-        expression = expression.strip()
-        
-        # Manejar operadores lógicos (precedencia: not > and > or)
-        
-        # Paso 1: Dividir por 'or' (menor precedencia)
-        if ' or ' in expression:
-            parts = self._split_by_operator(expression, ' or ')
-            results = [self._evaluate_expression(part, context) for part in parts]
-            return any(results)
-        
-        # Paso 2: Dividir por 'and'
-        if ' and ' in expression:
-            parts = self._split_by_operator(expression, ' and ')
-            results = [self._evaluate_expression(part, context) for part in parts]
-            return all(results)
-        
-        # Paso 3: Manejar 'not'
-        if expression.startswith('not '):
-            inner = expression[4:].strip()
-            return not self._evaluate_expression(inner, context)
-        
-        # Paso 4: Evaluar comparación simple
-        return self._evaluate_comparison(expression, context)
-    
-    def _split_by_operator(self, expression: str, operator: str) -> List[str]:
-        """
-        Dividir expresión por operador, respetando paréntesis y strings.
-        """
-        parts = []
-        current = []
-        paren_depth = 0
-        in_string = False
-        string_char = None
-        i = 0
-        
-        while i < len(expression):
-            char = expression[i]
-            
-            # Manejar strings
-            if char in ['"', "'"]:
-                if not in_string:
-                    in_string = True
-                    string_char = char
-                elif char == string_char:
-                    in_string = False
-                    string_char = None
-                current.append(char)
-                i += 1
-                continue
-            
-            # Manejar paréntesis
-            if not in_string:
-                if char == '(':
-                    paren_depth += 1
-                elif char == ')':
-                    paren_depth -= 1
-            
-            # Verificar si encontramos el operador
-            if not in_string and paren_depth == 0:
-                if expression[i:i+len(operator)] == operator:
-                    # Encontrado operador, guardar parte actual
-                    parts.append(''.join(current).strip())
-                    current = []
-                    i += len(operator)
-                    continue
-            
-            current.append(char)
-            i += 1
-        
-        # Agregar última parte
-        if current:
-            parts.append(''.join(current).strip())
-        
-        return parts
-    
-    def _evaluate_comparison(self, comparison: str, context: Dict[str, Any]) -> bool:
-        """
-        Evaluar comparación simple (sin and/or).
-        """
-        comparison = comparison.strip()
-        
-        # Remover paréntesis externos si existen
-        if comparison.startswith('(') and comparison.endswith(')'):
-            comparison = comparison[1:-1].strip()
-        
-        # Buscar operador (probar en orden de longitud para evitar conflictos)
-        for op in sorted(self.all_operators.keys(), key=len, reverse=True):
-            if f' {op} ' in comparison:
-                parts = comparison.split(f' {op} ', 1)
-                if len(parts) == 2:
-                    left = self._resolve_value(parts[0].strip(), context)
-                    right = self._resolve_value(parts[1].strip(), context)
-                    
-                    # Ejecutar operador
-                    op_func = self.all_operators[op]
-                    
-                    try:
-                        result = op_func(left, right)
-                        logger.debug(f"  {left} {op} {right} = {result}")
-                        return result
-                    except Exception as e:
-                        logger.error(f"Error applying operator '{op}': {e}")
-                        raise ValueError(f"Cannot apply '{op}' to {type(left).__name__} and {type(right).__name__}")
-        
-        # Si no hay operador, evaluar como valor único (debe ser boolean)
-        value = self._resolve_value(comparison, context)
-        
-        if not isinstance(value, bool):
-            raise ValueError(f"Expression '{comparison}' must be a boolean or comparison")
-        
-        return value
-    
-    def _resolve_value(self, value_str: str, context: Dict[str, Any]) -> Any:
-        """
-        Resolver valor (variable o literal).
-        
-        Soporta:
-        - Variables: {{variable_name}}
-        - Strings: "text" o 'text'
-        - Numbers: 42, 3.14
-        - Booleans: true, false
-        - Null: null, none
-        - Arrays: [1, 2, 3], ["a", "b"]
-        """
-        value_str = value_str.strip()
-        
-        # === VARIABLES === #
-        if value_str.startswith('{{') and value_str.endswith('}}'):
-            var_name = value_str[2:-2].strip()
-            
-            # Soportar navegación de objetos: {{user.age}}
-            if '.' in var_name:
-                return self._resolve_nested_variable(var_name, context)
-            
-            # Variable simple
-            if var_name in context:
-                return context[var_name]
-            else:
-                logger.warning(f"Variable '{var_name}' not found in context, defaulting to None")
-                return None
-        
-        # === STRINGS === #
-        if (value_str.startswith('"') and value_str.endswith('"')) or \
-           (value_str.startswith("'") and value_str.endswith("'")):
-            return value_str[1:-1]
-        
-        # === BOOLEANS === #
-        if value_str.lower() == 'true':
-            return True
-        elif value_str.lower() == 'false':
-            return False
-        
-        # === NULL === #
-        if value_str.lower() in ['null', 'none']:
-            return None
         
-        # === NUMBERS === #
         try:
-            if '.' in value_str:
-                return float(value_str)
-            else:
-                return int(value_str)
-        except ValueError:
-            pass
-        
-        # === ARRAYS === #
-        if value_str.startswith('[') and value_str.endswith(']'):
-            return self._parse_array(value_str, context)
-        
-        # === DEFAULT: String literal sin comillas === #
-        # Esto permite escribir: {{status}} == active (sin comillas en active)
-        return value_str
-    
-    def _resolve_nested_variable(self, var_path: str, context: Dict[str, Any]) -> Any:
-        """
-        Resolver variable anidada (ej: user.profile.age).
-        """
-        parts = var_path.split('.')
-        value = context
-        
-        for part in parts:
-            if isinstance(value, dict):
-                value = value.get(part)
-            elif hasattr(value, part):
-                value = getattr(value, part)
-            else:
-                logger.warning(f"Cannot resolve '{part}' in path '{var_path}'")
-                return None
-            
-            if value is None:
-                return None
-        
-        return value
-    
-    def _parse_array(self, array_str: str, context: Dict[str, Any]) -> List[Any]:
-        """
-        Parsear array literal: [1, 2, 3] o ["a", "b", "c"].
-        """
-        # Remover corchetes
-        content = array_str[1:-1].strip()
-        
-        if not content:
-            return []
-        
-        # Dividir por comas (respetando strings)
-        items = []
-        current = []
-        in_string = False
-        string_char = None
-        
-        for char in content:
-            if char in ['"', "'"]:
-                if not in_string:
-                    in_string = True
-                    string_char = char
-                elif char == string_char:
-                    in_string = False
-                    string_char = None
-            
-            if char == ',' and not in_string:
-                items.append(''.join(current).strip())
-                current = []
-            else:
-                current.append(char)
-        
-        # Agregar último item
-        if current:
-            items.append(''.join(current).strip())
-        
-        # Resolver cada item
-        return [self._resolve_value(item, context) for item in items]
+            return compiled(context)
+        except Exception as e:
+            logger.error(f"Error evaluating condition '{condition}': {e}")
+            raise ValueError(f"Invalid condition: {str(e)}")
     
     def validate_syntax(self, condition: str) -> Dict[str, Any]:
         """
@@ -381,7 +118,7 @@ class ConditionEvaluator:
                     warnings.append("Condition has no operator, assuming boolean variable")
             
             # Verificar sintaxis de variables
-            var_pattern = r'\{\{([^}]+)\}\}'
+            var_pattern = r'\{\{([^}]*)\}\}'
             variables = re.findall(var_pattern, condition)
             
             for var in variables:
@@ -390,17 +127,12 @@ class ConditionEvaluator:
                 elif not re.match(r'^[a-zA-Z_][a-zA-Z0-9_\.]*$', var.strip()):
                     errors.append(f"Invalid variable name: {var}")
             
-            # Si no hay errores, intentar parsear
+            # Si no hay errores, compilar (detecta errores de sintaxis sin evaluar)
             if not errors:
                 try:
-                    # Dry-run con contexto vacío
-                    self.evaluate(condition, {})
-                except Exception as e:
-                    # Es esperado que falle si faltan variables
-                    # Solo capturamos errores de sintaxis
-                    error_msg = str(e).lower()
-                    if 'syntax' in error_msg or 'invalid' in error_msg:
-                        errors.append(str(e))
+                    compile_condition(condition)
+                except ConditionSyntaxError as e:
+                    errors.append(str(e))
             
         except Exception as e:
             errors.append(f"Unexpected validation error: {str(e)}")
@@ -423,6 +155,343 @@ class ConditionEvaluator:
         return [var.strip() for var in variables]
 
 
+# === COMPILER === #
+
+class ConditionSyntaxError(ValueError):
+    """Error de sintaxis detectado al compilar una condición"""
+    pass
+
+
+class CompiledCondition:
+    """
+    Condición compilada a un closure. Inmutable y segura para compartir
+    entre threads/ejecuciones; se evalúa con compiled(context).
+    """
+    
+    __slots__ = ("source", "variables", "_fn")
+    
+    def __init__(self, source: str, variables: List[str], fn: Callable[[Dict[str, Any]], Any]):
+        self.source = source
+        self.variables = variables
+        self._fn = fn
+    
+    def __call__(self, context: Dict[str, Any]) -> bool:
+        return bool(self._fn(context))
+    
+    evaluate = __call__
+    
+    def __deepcopy__(self, memo):
+        return self
+    
+    def __repr__(self) -> str:
+        return f"CompiledCondition({self.source!r})"
+
+
+_TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<var>\{\{[^}]*\}\})
+      | (?P<str>"[^"]*"|'[^']*')
+      | (?P<op>==|!=|>=|<=|>|<)
+      | (?P<punct>[()\[\],])
+      | (?P<word>[^\s()\[\],=!<>'"]+)
+    )""", re.VERBOSE)
+
+_KEYWORD_OPERATORS = {'contains', 'startswith', 'endswith', 'matches', 'in', 'not'}
+_LOGICAL_KEYWORDS = {'and', 'or', 'not'}
+
+
+def _tokenize(condition: str) -> List[Tuple[str, str, int]]:
+    tokens = []
+    pos = 0
+    length = len(condition)
+    
+    while pos < length:
+        if condition[pos:].isspace():
+            break
+        match = _TOKEN_PATTERN.match(condition, pos)
+        if not match or match.end() == pos:
+            raise ConditionSyntaxError(f"Unexpected character {condition[pos]!r} at position {pos}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind), match.start(kind)))
+        pos = match.end()
+    
+    return tokens
+
+
+def _literal_word(word: str) -> Any:
+    """Convertir palabra sin comillas: boolean, null, número o string"""
+    lowered = word.lower()
+    if lowered == 'true':
+        return True
+    if lowered == 'false':
+        return False
+    if lowered in ('null', 'none'):
+        return None
+    try:
+        return float(word) if '.' in word else int(word)
+    except ValueError:
+        return word
+
+
+def _variable_getter(path: str) -> Callable[[Dict[str, Any]], Any]:
+    """Closure para {{var}} o {{obj.attr.attr}} (variables faltantes → None)"""
+    if '.' not in path:
+        return lambda context: context.get(path)
+    
+    parts = path.split('.')
+    
+    def getter(context):
+        value = context
+        for part in parts:
+            if isinstance(value, dict):
+                value = value.get(part)
+            else:
+                value = getattr(value, part, None)
+            if value is None:
+                return None
+        return value
+    
+    return getter
+
+
+class _ConditionParser:
+    """
+    Parser descendente recursivo → closures.
+    
+    Gramática (precedencia de menor a mayor):
+        expr       := and_expr ('or' and_expr)*
+        and_expr   := not_expr ('and' not_expr)*
+        not_expr   := 'not' not_expr | comparison
+        comparison := operand (OPERATOR operand)?
+        operand    := '(' expr ')' | VARIABLE | STRING | ARRAY | WORD+
+    """
+    
+    def __init__(self, source: str):
+        self.source = source
+        self.tokens = _tokenize(source)
+        self.index = 0
+        self.variables: List[str] = []
+    
+    # --- Helpers --- #
+    
+    def _peek(self, offset: int = 0) -> Optional[Tuple[str, str, int]]:
+        position = self.index + offset
+        return self.tokens[position] if position < len(self.tokens) else None
+    
+    def _is_word(self, value: str, offset: int = 0) -> bool:
+        token = self._peek(offset)
+        return token is not None and token[0] == 'word' and token[1] == value
+    
+    def _is_punct(self, value: str) -> bool:
+        token = self._peek()
+        return token is not None and token[0] == 'punct' and token[1] == value
+    
+    def _advance(self) -> Tuple[str, str, int]:
+        token = self._peek()
+        if token is None:
+            raise ConditionSyntaxError("Unexpected end of condition")
+        self.index += 1
+        return token
+    
+    def _expect_punct(self, value: str):
+        token = self._peek()
+        if token is None or token[0] != 'punct' or token[1] != value:
+            found = f"{token[1]!r} at position {token[2]}" if token else "end of condition"
+            raise ConditionSyntaxError(f"Expected {value!r}, found {found}")
+        self.index += 1
+    
+    # --- Grammar --- #
+    
+    def parse(self) -> Callable[[Dict[str, Any]], Any]:
+        if not self.tokens:
+            raise ConditionSyntaxError("Empty condition")
+        
+        fn = self._parse_or()
+        
+        token = self._peek()
+        if token is not None:
+            raise ConditionSyntaxError(f"Unexpected token {token[1]!r} at position {token[2]}")
+        return fn
+    
+    def _parse_or(self):
+        parts = [self._parse_and()]
+        while self._is_word('or'):
+            self.index += 1
+            parts.append(self._parse_and())
+        
+        if len(parts) == 1:
+            return parts[0]
+        
+        def or_(context):
+            for part in parts:
+                if part(context):
+                    return True
+            return False
+        return or_
+    
+    def _parse_and(self):
+        parts = [self._parse_not()]
+        while self._is_word('and'):
+            self.index += 1
+            parts.append(self._parse_not())
+        
+        if len(parts) == 1:
+            return parts[0]
+        
+        def and_(context):
+            for part in parts:
+                if not part(context):
+                    return False
+            return True
+        return and_
+    
+    def _parse_not(self):
+        # 'not' seguido de 'in' solo es válido como operador de pertenencia
+        if self._is_word('not') and not self._is_word('in', 1):
+            self.index += 1
+            inner = self._parse_not()
+            return lambda context: not inner(context)
+        return self._parse_comparison()
+    
+    def _parse_comparison(self):
+        start = self._peek()[2] if self._peek() else len(self.source)
+        left, is_group = self._parse_operand()
+        end = self._peek()[2] if self._peek() else len(self.source)
+        
+        operator = self._parse_operator()
+        if operator is None:
+            if is_group:
+                return left
+            text = self.source[start:end].strip()
+            
+            def boolean(context):
+                value = left(context)
+                if not isinstance(value, bool):
+                    raise ValueError(f"Expression '{text}' must be a boolean or comparison")
+                return value
+            return boolean
+        
+        right, _ = self._parse_operand()
+        return self._build_operation(operator, left, right)
+    
+    def _parse_operator(self) -> Optional[str]:
+        token = self._peek()
+        if token is None:
+            return None
+        kind, value, _ = token
+        
+        if kind == 'op':
+            self.index += 1
+            return value
+        
+        if kind == 'word' and value in _KEYWORD_OPERATORS:
+            if value == 'not':
+                if not self._is_word('in', 1):
+                    return None
+                self.index += 2
+                return 'not in'
+            self.index += 1
+            return value
+        
+        return None
+    
+    def _parse_operand(self):
+        """Retorna (closure, es_grupo_entre_paréntesis)"""
+        token = self._peek()
+        if token is None:
+            raise ConditionSyntaxError("Unexpected end of condition, expected a value")
+        kind, value, position = token
+        
+        if kind == 'punct' and value == '(':
+            self.index += 1
+            inner = self._parse_or()
+            self._expect_punct(')')
+            return inner, True
+        
+        return self._parse_value(), False
+    
+    def _parse_value(self):
+        kind, value, position = self._advance()
+        
+        if kind == 'var':
+            path = value[2:-2].strip()
+            if not path:
+                raise ConditionSyntaxError(f"Empty variable name at position {position}")
+            self.variables.append(path)
+            return _variable_getter(path)
+        
+        if kind == 'str':
+            literal = value[1:-1]
+            return lambda context: literal
+        
+        if kind == 'punct' and value == '[':
+            return self._parse_array()
+        
+        if kind == 'word' and value not in _LOGICAL_KEYWORDS and value not in _KEYWORD_OPERATORS:
+            # Palabras consecutivas sin comillas forman un solo literal ("hello world")
+            words = [value]
+            while True:
+                token = self._peek()
+                if token is None or token[0] != 'word' or token[1] in _LOGICAL_KEYWORDS or token[1] in _KEYWORD_OPERATORS:
+                    break
+                words.append(self._advance()[1])
+            literal = _literal_word(" ".join(words)) if len(words) > 1 else _literal_word(value)
+            return lambda context: literal
+        
+        raise ConditionSyntaxError(f"Unexpected token {value!r} at position {position}")
+    
+    def _parse_array(self):
+        items = []
+        if not self._is_punct(']'):
+            while True:
+                items.append(self._parse_value())
+                if self._is_punct(','):
+                    self.index += 1
+                    continue
+                break
+        self._expect_punct(']')
+        return lambda context: [item(context) for item in items]
+    
+    def _build_operation(self, operator: str, left, right):
+        op_func = _OPERATORS[operator]
+        
+        def operation(context):
+            a = left(context)
+            b = right(context)
+            try:
+                return op_func(a, b)
+            except Exception:
+                raise ValueError(f"Cannot apply '{operator}' to {type(a).__name__} and {type(b).__name__}")
+        
+        return operation
+
+
+_OPERATORS = {
+    **ConditionEvaluator.COMPARISON_OPERATORS,
+    **ConditionEvaluator.STRING_OPERATORS,
+    **ConditionEvaluator.MEMBERSHIP_OPERATORS
+}
+
+
+@lru_cache(maxsize=2048)
+def _compile_cached(condition: str) -> CompiledCondition:
+    parser = _ConditionParser(condition)
+    fn = parser.parse()
+    return CompiledCondition(condition, parser.variables, fn)
+
+
+def compile_condition(condition: str) -> CompiledCondition:
+    """
+    Compilar condición a closure (cacheado por texto).
+    
+    Raises:
+        ConditionSyntaxError: Si la condición no es sintácticamente válida
+    """
+    if not condition or not condition.strip():
+        raise ConditionSyntaxError("Empty condition")
+    return _compile_cached(condition.strip())
+
+
 # === HELPER FUNCTIONS === #
 
 def evaluate_condition(condition: str, context: Dict[str, Any]) -> bool:
@@ -436,8 +505,7 @@ def evaluate_condition(condition: str, context: Dict[str, Any]) -> bool:
     Returns:
         Resultado booleano
     """
-    evaluator = ConditionEvaluator()
-    return evaluator.evaluate(condition, context)
+    return compile_condition(condition)(context)
 
 
 def validate_condition(condition: str) -> Dict[str, Any]:
@@ -2,7 +2,6 @@
 
 from typing import Dict, Any, List
 from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
 from app.agents.base_agent import BaseAgent
 from app.config.company_config import CompanyConfig
 from app.services.openai_service import OpenAIService
@@ -40,11 +39,8 @@ class ConfigAgent(BaseAgent):
         # Inicializar como BaseAgent normal
         super().__init__(company_config, openai_service)
         
-        # LLM específico para parsing (más potente)
-        self.parsing_llm = ChatOpenAI(
-            model="gpt-4o-mini",  # Cambiado a modelo disponible
-            temperature=0.2  # Bajo para consistencia
-        )
+        # LLM específico para parsing (perfil "config_parsing" del registro de modelos)
+        self.parsing_llm = openai_service.get_coalesced_chat_model("config_parsing", company_config.company_id)
         
         # State machine de LangGraph
         self.state_machine = self._build_state_machine()
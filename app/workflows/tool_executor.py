@@ -1,17 +1,22 @@
 # app/workflows/tool_executor.py - NUEVO ARCHIVO COMPLETO
 
-from typing import Dict, Any, Optional, List
+from __future__ import annotations
+from typing import Dict, Any, Optional, List, TYPE_CHECKING
 from app.workflows.tools_library import ToolsLibrary, ToolDefinition
-from app.services.vectorstore_service import VectorstoreService
-from app.services.calendar_integration_service import CalendarIntegrationService
-from app.services.chatwoot_service import ChatwootService
-from app.services.multimedia_service import MultimediaService
-from app.services.email_service import EmailService
 from app.models.conversation import ConversationManager
 from app.models.audit_trail import AuditManager
 import logging
 import time
 
+# Los servicios se inyectan ya construidos (set_*); importarlos aquí cargaría
+# Google API, LangChain Redis, etc. en cualquier proceso que use workflows
+if TYPE_CHECKING:
+    from app.services.vectorstore_service import VectorstoreService
+    from app.services.calendar_integration_service import CalendarIntegrationService
+    from app.services.chatwoot_service import ChatwootService
+    from app.services.multimedia_service import MultimediaService
+    from app.services.email_service import EmailService
+
 logger = logging.getLogger(__name__)
 
 class ToolExecutor:
@@ -0,0 +1,164 @@
+# app/workflows/trigger_index.py
+
+"""
+Índice de triggers precompilado por empresa.
+
+- KeywordAutomaton: Aho-Corasick sobre todos los keywords de todos los
+  workflows. Una sola pasada sobre el mensaje, independiente del número
+  de workflows/keywords.
+- TriggerIndex: automaton + mapa webhook_id → workflow, construido una vez
+  a partir de los workflows habilitados de la empresa.
+"""
+
+from typing import Dict, List, Optional, Any
+from collections import deque
+import time
+import logging
+
+from app.workflows.workflow_models import WorkflowGraph
+
+logger = logging.getLogger(__name__)
+
+_NO_MATCH = float("inf")
+
+
+class KeywordAutomaton:
+    """
+    Automaton Aho-Corasick (substring, case-insensitive).
+
+    Cada keyword tiene un rank (prioridad); match() retorna el menor rank
+    entre todos los keywords contenidos en el texto, o None.
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._best: List[float] = [_NO_MATCH]  # menor rank que termina en este estado (incl. fail chain)
+        self._built = False
+        self.keyword_count = 0
+
+    def add(self, keyword: str, rank: int):
+        """Agregar keyword con su prioridad (menor = más prioritario)"""
+        if self._built:
+            raise RuntimeError("Cannot add keywords after build()")
+
+        state = 0
+        for char in keyword.lower():
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(_NO_MATCH)
+            state = next_state
+
+        self._best[state] = min(self._best[state], rank)
+        self.keyword_count += 1
+
+    def build(self) -> "KeywordAutomaton":
+        """Calcular fail links (BFS) y propagar el mejor rank por la cadena de fallos"""
+        queue = deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            queue.append(state)
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+
+                # BFS garantiza que el estado de fallo ya tiene su best final
+                self._best[next_state] = min(self._best[next_state], self._best[self._fail[next_state]])
+
+        self._built = True
+        return self
+
+    def match(self, text: str) -> Optional[int]:
+        """Menor rank de los keywords contenidos en text (una pasada)"""
+        if not self._built:
+            self.build()
+
+        goto, fail, best_by_state = self._goto, self._fail, self._best
+        state = 0
+        best = _NO_MATCH
+
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            if best_by_state[state] < best:
+                best = best_by_state[state]
+                if best == 0:
+                    break  # no puede haber un match más prioritario
+
+        return None if best == _NO_MATCH else int(best)
+
+
+class TriggerIndex:
+    """
+    Índice inmutable de triggers para UNA empresa.
+
+    El rank de cada workflow es su posición en la lista recibida (mismo orden
+    que get_workflows_by_company), de modo que el resultado coincide con el
+    "primer workflow que matchea" del recorrido lineal.
+    """
+
+    def __init__(self, company_id: str, workflows: List[WorkflowGraph]):
+        self.company_id = company_id
+        self.workflows = list(workflows)
+        self.workflow_ids = {workflow.id for workflow in self.workflows}
+        self.built_at = time.time()
+
+        self._keywords = KeywordAutomaton()
+        self._webhooks: Dict[str, int] = {}
+
+        for rank, workflow in enumerate(self.workflows):
+            for trigger in workflow.triggers:
+                trigger_type = trigger.get("type")
+
+                if trigger_type == "keyword":
+                    for keyword in trigger.get("keywords", []):
+                        if keyword and keyword.strip():
+                            self._keywords.add(keyword, rank)
+
+                elif trigger_type == "webhook":
+                    webhook_id = trigger.get("webhook_id")
+                    if webhook_id and webhook_id not in self._webhooks:
+                        self._webhooks[webhook_id] = rank
+
+                # "schedule": sin matching por mensaje (cron)
+
+        self._keywords.build()
+
+    def match(self, trigger_data: Dict[str, Any]) -> Optional[WorkflowGraph]:
+        """Primer workflow (por rank) que matchea keyword o webhook_id"""
+        best = None
+
+        value = trigger_data.get("value")
+        if value:
+            best = self._keywords.match(value)
+
+        webhook_id = trigger_data.get("webhook_id")
+        if webhook_id:
+            webhook_rank = self._webhooks.get(webhook_id)
+            if webhook_rank is not None and (best is None or webhook_rank < best):
+                best = webhook_rank
+
+        return self.workflows[best] if best is not None else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "company_id": self.company_id,
+            "workflows": len(self.workflows),
+            "keywords": self._keywords.keyword_count,
+            "webhooks": len(self._webhooks),
+            "built_at": self.built_at
+        }
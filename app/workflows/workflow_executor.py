@@ -1,23 +1,34 @@
 # app/workflows/workflow_executor.py
 
-from typing import Dict, Any, List, Set, Optional
+from typing import Dict, Any, List, Set, Optional, TYPE_CHECKING
+from collections import deque
 import asyncio
+import json
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 from enum import Enum
 
 from app.workflows.workflow_models import (
-    WorkflowGraph, WorkflowNode, WorkflowEdge, NodeType, EdgeType
+    WorkflowGraph, WorkflowNode, WorkflowEdge, NodeType
 )
-from app.services.multi_agent_orchestrator import MultiAgentOrchestrator
 from app.models.conversation import ConversationManager
+from app.services.prompt_budgeter import get_prompt_budgeter
+
+# Solo para anotaciones: el orquestador llega ya construido desde la factory
+if TYPE_CHECKING:
+    from app.services.multi_agent_orchestrator import MultiAgentOrchestrator
 
 logger = logging.getLogger(__name__)
 
+# Tokens máximos del contexto de workflow agregado al mensaje del usuario
+WORKFLOW_CONTEXT_TOKENS = 800
+
 class ExecutionStatus(Enum):
     """Estados de ejecución del workflow"""
     PENDING = "pending"
     RUNNING = "running"
+    WAITING = "waiting"      # suspendida en un WAIT (durable)
     SUCCESS = "success"
     FAILED = "failed"
     CANCELLED = "cancelled"
@@ -98,6 +109,38 @@ class WorkflowState:
             "node_outputs": self.node_outputs,
             "execution_history": self.execution_history
         }
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializar para checkpoint"""
+        return {
+            "variables": self.variables,
+            "context": self.context,
+            "execution_history": self.execution_history,
+            "node_outputs": self.node_outputs,
+            "errors": self.errors,
+            "started_at": self.started_at
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "WorkflowState":
+        """Restaurar desde checkpoint"""
+        state = cls(data.get("context", {}))
+        state.variables = data.get("variables", {})
+        state.execution_history = data.get("execution_history", [])
+        state.node_outputs = data.get("node_outputs", {})
+        state.errors = data.get("errors", [])
+        state.started_at = data.get("started_at", state.started_at)
+        return state
+
+
+class _WorkflowSuspended(Exception):
+    """Un nodo WAIT suspendió su branch hasta que venza el timer"""
+    
+    def __init__(self, wait_key: str, resume_at: float, scheduled: bool):
+        super().__init__(f"Suspended at {wait_key}")
+        self.wait_key = wait_key
+        self.resume_at = resume_at
+        self.scheduled = scheduled
 
 class WorkflowExecutor:
     """
@@ -109,19 +152,30 @@ class WorkflowExecutor:
     ✅ Maneja grafos complejos (branching, loops, parallel)
     """
     
-    def __init__(self, workflow: WorkflowGraph, orchestrator: MultiAgentOrchestrator, 
-                 conversation_manager: ConversationManager = None):
+    def __init__(self, workflow: WorkflowGraph, orchestrator: 'MultiAgentOrchestrator', 
+                 conversation_manager: ConversationManager = None, scheduler=None):
         """
         Args:
             workflow: WorkflowGraph a ejecutar
             orchestrator: MultiAgentOrchestrator de la empresa
             conversation_manager: Para mantener historial (opcional)
+            scheduler: WorkflowScheduler para ejecución durable (checkpoints
+                y WAIT largos como timers). Sin scheduler los WAIT duermen en línea.
         """
         self.workflow = workflow
         self.orchestrator = orchestrator
         self.conversation_manager = conversation_manager
+        self.scheduler = scheduler
         self.state = None  # Se inicializa en execute()
         
+        # Estado durable (se inicializa en execute())
+        self.execution_id: Optional[str] = None
+        self._durable = False
+        self._replay: Dict[str, deque] = {}
+        self._fired_waits: Set[str] = set()
+        self._pending_waits: Dict[str, float] = {}
+        self._checkpoint_lock: Optional[asyncio.Lock] = None
+        
         # Validar que orchestrator es de la misma empresa
         if orchestrator.company_id != workflow.company_id:
             raise ValueError(
@@ -131,15 +185,21 @@ class WorkflowExecutor:
         
         logger.info(f"[{workflow.company_id}] WorkflowExecutor initialized for workflow: {workflow.name}")
     
-    async def execute(self, initial_context: Dict[str, Any]) -> Dict[str, Any]:
+    async def execute(self, initial_context: Dict[str, Any], execution_id: str = None,
+                      checkpoint: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         Ejecutar workflow completo.
         
         Args:
             initial_context: Contexto inicial (ej: user_message, user_id, etc.)
+            execution_id: ID de ejecución (opcional, se incluye en el resultado)
+            checkpoint: Checkpoint a reanudar. Se recorre el grafo desde el
+                inicio reutilizando los resultados ya registrados (los nodos
+                completados no se re-ejecutan).
             
         Returns:
             Resultado de ejecución con status, historial, outputs, etc.
+            Con scheduler, status "waiting" si quedó suspendida en un WAIT.
         """
         logger.info(f"🚀 [{self.workflow.company_id}] Starting workflow execution: {self.workflow.name}")
         
@@ -153,11 +213,34 @@ class WorkflowExecutor:
                 "workflow_id": self.workflow.id
             }
         
-        # Inicializar estado
-        self.state = WorkflowState(initial_context)
-        self.state.variables.update(self.workflow.variables)
+        self.execution_id = execution_id
+        self._durable = self.scheduler is not None and execution_id is not None
+        lock_token = None
+        
+        if self._durable:
+            lock_token = await self._run_blocking(
+                self.scheduler.acquire_execution, self.workflow.company_id, execution_id
+            )
+            if lock_token is None:
+                return {
+                    "execution_id": execution_id,
+                    "workflow_id": self.workflow.id,
+                    "company_id": self.workflow.company_id,
+                    "status": ExecutionStatus.RUNNING.value,
+                    "message": "Execution is being processed by another worker"
+                }
+        
+        # Inicializar estado (o restaurarlo desde el checkpoint)
+        if checkpoint:
+            self.state = WorkflowState.from_dict(checkpoint["state"])
+            self._restore_checkpoint(checkpoint)
+        else:
+            self.state = WorkflowState(initial_context)
+            self.state.variables.update(self.workflow.variables)
+        self._checkpoint_lock = asyncio.Lock()
         
         result = {
+            "execution_id": execution_id,
             "workflow_id": self.workflow.id,
             "workflow_name": self.workflow.name,
             "company_id": self.workflow.company_id,
@@ -173,8 +256,13 @@ class WorkflowExecutor:
             # Ejecutar desde start node
             await self._execute_from_node(self.workflow.start_node_id)
             
-            # Completado exitosamente
-            result["status"] = ExecutionStatus.SUCCESS.value
+            if self._pending_waits:
+                # Suspendida: el scheduler la reanuda al vencer el timer
+                result["status"] = ExecutionStatus.WAITING.value
+                result["resume_at"] = datetime.utcfromtimestamp(min(self._pending_waits.values())).isoformat()
+            else:
+                # Completado exitosamente
+                result["status"] = ExecutionStatus.SUCCESS.value
             result["final_output"] = self.state.variables
             
         except asyncio.TimeoutError:
@@ -191,6 +279,9 @@ class WorkflowExecutor:
             result["completed_at"] = datetime.utcnow().isoformat()
             result["execution_history"] = self.state.execution_history
             result["errors"].extend([err["error"] for err in self.state.errors])
+            
+            if self._durable:
+                await self._finish_durable(result["status"], lock_token)
         
         logger.info(
             f"✅ [{self.workflow.company_id}] Workflow execution completed: "
@@ -201,30 +292,80 @@ class WorkflowExecutor:
     
     async def _execute_from_node(self, node_id: str, visited: Set[str] = None):
         """
-        Ejecutar desde un nodo específico.
-        Usa DFS para traversal del grafo.
+        Ejecutar desde un nodo específico recorriendo el plan de ejecución.
+        
+        Las cadenas de un solo sucesor se recorren iterativamente; solo se
+        recursa en bifurcaciones. `visited` es el camino actual (compartido,
+        con backtracking); solo se copia para branches paralelos.
         """
         if visited is None:
             visited = set()
         
-        # Prevenir loops infinitos
-        if node_id in visited:
-            node = self.workflow.get_node(node_id)
-            # Si es un loop intencional, permitir
-            if node and node.type != NodeType.LOOP:
-                logger.warning(f"[{self.workflow.company_id}] Cycle detected at node {node_id}, skipping")
-                return
+        plan = self.workflow.get_execution_plan()
+        added: List[str] = []
+        current = node_id
         
-        visited.add(node_id)
-        
-        # Obtener nodo
-        node = self.workflow.get_node(node_id)
-        if not node:
-            raise ValueError(f"Node {node_id} not found in workflow")
-        
-        if not node.enabled:
-            logger.info(f"[{self.workflow.company_id}] Node {node.name} is disabled, skipping")
-            return
+        try:
+            while current is not None:
+                node = self.workflow.get_node(current)
+                
+                # Prevenir loops infinitos (loops intencionales permitidos)
+                if current in visited:
+                    if node and node.type != NodeType.LOOP:
+                        logger.warning(f"[{self.workflow.company_id}] Cycle detected at node {current}, skipping")
+                        return
+                else:
+                    visited.add(current)
+                    added.append(current)
+                
+                if not node:
+                    raise ValueError(f"Node {current} not found in workflow")
+                
+                if not node.enabled:
+                    logger.info(f"[{self.workflow.company_id}] Node {node.name} is disabled, skipping")
+                    return
+                
+                if not await self._run_node(node, visited):
+                    # Falló y se siguieron sus edges de error
+                    return
+                
+                # Determinar siguientes nodos (flujo normal)
+                next_node_ids = plan.next_nodes(current, self.state.get_full_context())
+                
+                logger.info(
+                    f"[{self.workflow.company_id}] Node {node.name} completed. "
+                    f"Next nodes: {next_node_ids}"
+                )
+                
+                if node.type == NodeType.PARALLEL:
+                    # Ejecutar branches en paralelo
+                    await self._execute_parallel_branches(next_node_ids, visited)
+                    return
+                
+                if len(next_node_ids) == 1:
+                    current = next_node_ids[0]
+                    continue
+                
+                # Ejecutar secuencialmente
+                for next_id in next_node_ids:
+                    await self._execute_from_node(next_id, visited)
+                return
+        finally:
+            for visited_id in added:
+                visited.discard(visited_id)
+    
+    async def _run_node(self, node: WorkflowNode, visited: Set[str]) -> bool:
+        """
+        Ejecutar un nodo y registrar el resultado.
+        Retorna False si falló y el error se manejó con edges de error.
+        """
+        # Reanudación: reutilizar el resultado registrado de esta visita
+        replayed = self._replay.get(node.id)
+        if replayed:
+            if replayed.popleft() == "success":
+                return True
+            await self._handle_node_error(node.id, RuntimeError(f"Node {node.id} failed"), visited)
+            return False
         
         logger.info(f"📍 [{self.workflow.company_id}] Executing node: {node.name} ({node.type.value})")
         
@@ -232,42 +373,24 @@ class WorkflowExecutor:
         
         try:
             # Marcar como activo
-            self.state.active_nodes.add(node_id)
+            self.state.active_nodes.add(node.id)
             
             # Ejecutar nodo según su tipo
             node_output = await self._execute_node(node)
-            
-            # Calcular duración
-            duration_ms = (datetime.utcnow() - start_time).total_seconds() * 1000
-            
-            # Registrar ejecución exitosa
-            self.state.add_execution_record(
-                node_id, 
-                node.name,
-                "success",
-                output=node_output,
-                duration_ms=duration_ms
-            )
-            
-            # Determinar siguientes nodos
-            next_node_ids = self.workflow.get_next_nodes(
-                node_id,
-                self.state.get_full_context()
-            )
-            
-            logger.info(
-                f"[{self.workflow.company_id}] Node {node.name} completed. "
-                f"Next nodes: {next_node_ids}"
-            )
-            
-            # Ejecutar siguientes nodos
-            if node.type == NodeType.PARALLEL:
-                # Ejecutar branches en paralelo
-                await self._execute_parallel_branches(next_node_ids, visited.copy())
-            else:
-                # Ejecutar secuencialmente
-                for next_id in next_node_ids:
-                    await self._execute_from_node(next_id, visited.copy())
+        
+        except _WorkflowSuspended as suspended:
+            if suspended.scheduled:
+                self.state.add_execution_record(
+                    node.id,
+                    node.name,
+                    ExecutionStatus.WAITING.value,
+                    output={
+                        "wait_key": suspended.wait_key,
+                        "resume_at": datetime.utcfromtimestamp(suspended.resume_at).isoformat()
+                    }
+                )
+                await self._checkpoint()
+            return False
         
         except Exception as e:
             # Calcular duración hasta el error
@@ -275,18 +398,35 @@ class WorkflowExecutor:
             
             logger.error(f"[{self.workflow.company_id}] Error executing node {node.name}: {e}")
             self.state.add_execution_record(
-                node_id,
+                node.id,
                 node.name,
                 "failed",
                 error=str(e),
                 duration_ms=duration_ms
             )
             
+            await self._checkpoint()
+            
             # Buscar edge de error (fallback)
-            await self._handle_node_error(node_id, e, visited)
+            await self._handle_node_error(node.id, e, visited)
+            return False
         
         finally:
-            self.state.active_nodes.discard(node_id)
+            self.state.active_nodes.discard(node.id)
+        
+        # Calcular duración
+        duration_ms = (datetime.utcnow() - start_time).total_seconds() * 1000
+        
+        # Registrar ejecución exitosa
+        self.state.add_execution_record(
+            node.id,
+            node.name,
+            "success",
+            output=node_output,
+            duration_ms=duration_ms
+        )
+        await self._checkpoint()
+        return True
     
     async def _execute_parallel_branches(self, node_ids: List[str], visited: Set[str]):
         """Ejecutar múltiples branches en paralelo"""
@@ -295,6 +435,7 @@ class WorkflowExecutor:
         
         logger.info(f"[{self.workflow.company_id}] Executing {len(node_ids)} branches in parallel")
         
+        # Cada branch necesita su propio camino (se ejecutan concurrentemente)
         tasks = [
             self._execute_from_node(node_id, visited.copy())
             for node_id in node_ids
@@ -309,20 +450,87 @@ class WorkflowExecutor:
                 logger.error(f"[{self.workflow.company_id}] Parallel branch {i} failed: {result}")
     
     async def _handle_node_error(self, node_id: str, error: Exception, visited: Set[str]):
-        """Manejar error en nodo, buscar edge de fallback"""
-        # Buscar edge de tipo ON_ERROR
-        outgoing = self.workflow.get_outgoing_edges(node_id)
-        error_edges = [e for e in outgoing if e.edge_type == EdgeType.ON_ERROR]
+        """Manejar error en nodo, seguir edges ON_ERROR/FALLBACK del plan"""
+        error_targets = self.workflow.get_execution_plan().error_targets(node_id)
         
-        if error_edges:
+        if error_targets:
             logger.info(f"[{self.workflow.company_id}] Following error edge from node {node_id}")
-            for edge in error_edges:
-                await self._execute_from_node(edge.target_node_id, visited.copy())
+            for target_id in error_targets:
+                await self._execute_from_node(target_id, visited)
         else:
             # No hay fallback, propagar error
             logger.error(f"[{self.workflow.company_id}] No error handler for node {node_id}, propagating")
             raise error
     
+    # === DURABLE EXECUTION === #
+    
+    def _restore_checkpoint(self, checkpoint: Dict[str, Any]):
+        """Preparar el replay: resultados por nodo en orden de visita y waits"""
+        self._replay = {}
+        for record in self.state.execution_history:
+            if record["status"] in (ExecutionStatus.SUCCESS.value, ExecutionStatus.FAILED.value):
+                self._replay.setdefault(record["node_id"], deque()).append(record["status"])
+        
+        self._fired_waits = set(checkpoint.get("fired_waits", []))
+        self._pending_waits = {
+            key: resume_at
+            for key, resume_at in checkpoint.get("pending_waits", {}).items()
+            if key not in self._fired_waits
+        }
+    
+    def _checkpoint_payload(self, status: str) -> str:
+        # Se serializa en el loop (los branches paralelos mutan el estado)
+        return json.dumps({
+            "execution_id": self.execution_id,
+            "workflow_id": self.workflow.id,
+            "company_id": self.workflow.company_id,
+            "status": status,
+            "state": self.state.to_dict(),
+            "fired_waits": sorted(self._fired_waits),
+            "pending_waits": self._pending_waits,
+            "updated_at": datetime.utcnow().isoformat()
+        }, default=str)
+    
+    async def _checkpoint(self):
+        """Guardar el estado tras cada nodo (no-op sin scheduler)"""
+        if not self._durable:
+            return
+        
+        async with self._checkpoint_lock:
+            payload = self._checkpoint_payload(ExecutionStatus.RUNNING.value)
+            try:
+                await self._run_blocking(
+                    self.scheduler.save_checkpoint,
+                    self.workflow.company_id, self.workflow.id, self.execution_id, payload
+                )
+            except Exception as e:
+                logger.warning(f"[{self.workflow.company_id}] Could not checkpoint execution {self.execution_id}: {e}")
+    
+    async def _finish_durable(self, status: str, lock_token: str):
+        """Dejar el checkpoint suspendido (WAIT) o borrarlo, y liberar el lock"""
+        if status == ExecutionStatus.RUNNING.value:
+            # Cancelada a mitad: el checkpoint queda y el lease/recuperación la retoma
+            return
+        
+        company_id = self.workflow.company_id
+        try:
+            async with self._checkpoint_lock:
+                if status == ExecutionStatus.WAITING.value:
+                    await self._run_blocking(
+                        self.scheduler.save_checkpoint,
+                        company_id, self.workflow.id, self.execution_id,
+                        self._checkpoint_payload(status),
+                        running=False,
+                        resume_at=max(self._pending_waits.values())
+                    )
+                else:
+                    await self._run_blocking(
+                        self.scheduler.delete_checkpoint, company_id, self.workflow.id, self.execution_id
+                    )
+            await self._run_blocking(self.scheduler.release_execution, company_id, self.execution_id, lock_token)
+        except Exception as e:
+            logger.warning(f"[{company_id}] Could not finalize durable execution {self.execution_id}: {e}")
+    
     # === NODE EXECUTORS === #
     
     async def _execute_node(self, node: WorkflowNode) -> Any:
@@ -415,8 +623,11 @@ class WorkflowExecutor:
             f"for user {user_id}, conversation: {conversation_id}"
         )
         
-        # Ejecutar con orchestrator (YA incluye RAG, prompts, historial)
-        response, agent_used = self.orchestrator.get_response(
+        # Ejecutar con orchestrator (YA incluye RAG, prompts, historial).
+        # get_response es síncrono: se delega al pool para no bloquear el loop
+        # y permitir que branches PARALLEL se solapen.
+        response, agent_used = await self._run_blocking(
+            self.orchestrator.get_response,
             question=enriched_message,  # ← Mensaje enriquecido con contexto
             user_id=user_id,
             conversation_id=conversation_id,
@@ -453,6 +664,9 @@ class WorkflowExecutor:
         - Variables relevantes del workflow
         - Outputs de tools ejecutados
         
+        El contexto se acota a node.config["workflow_context_tokens"]
+        (default WORKFLOW_CONTEXT_TOKENS).
+        
         Args:
             user_message: Mensaje original del usuario
             node: Nodo actual que se va a ejecutar
@@ -469,30 +683,32 @@ class WorkflowExecutor:
         if not include_context:
             return user_message
         
-        # Construir contexto
+        # Construir contexto (secciones en orden de prioridad)
         context_parts = []
         
         # 1. Contexto de agentes anteriores (últimos 3)
         agent_contexts = self._extract_agent_contexts()
         if agent_contexts:
-            context_parts.append("**Contexto de agentes anteriores:**")
-            context_parts.extend(agent_contexts)
+            context_parts.append("\n".join(["**Contexto de agentes anteriores:**"] + agent_contexts))
         
         # 2. Contexto de tools ejecutados
         tool_contexts = self._extract_tool_contexts()
         if tool_contexts:
-            context_parts.append("\n**Resultados de herramientas:**")
-            context_parts.extend(tool_contexts)
+            context_parts.append("\n".join(["\n**Resultados de herramientas:**"] + tool_contexts))
         
         # 3. Variables importantes del workflow
         important_vars = self._extract_important_variables()
         if important_vars:
-            context_parts.append("\n**Información relevante:**")
-            context_parts.extend(important_vars)
+            context_parts.append("\n".join(["\n**Información relevante:**"] + important_vars))
         
         # Construir mensaje final
         if context_parts:
-            workflow_context = "\n".join(context_parts)
+            # Acotar el enriquecimiento: se recortan primero las secciones de menor prioridad
+            workflow_context = get_prompt_budgeter().fit_context(
+                context_parts,
+                max_tokens=node.config.get("workflow_context_tokens", WORKFLOW_CONTEXT_TOKENS),
+                separator="\n"
+            )
             enriched = f"""[CONTEXTO DEL WORKFLOW]
     {workflow_context}
     
@@ -635,8 +851,8 @@ class WorkflowExecutor:
             f"with params: {resolved_params}"
         )
         
-        # ✅ USAR EL ORCHESTRATOR EXISTENTE
-        result = self.orchestrator.execute_tool(tool_name, resolved_params)
+        # ✅ USAR EL ORCHESTRATOR EXISTENTE (síncrono → pool de threads)
+        result = await self._run_blocking(self.orchestrator.execute_tool, tool_name, resolved_params)
         
         # Guardar output en variable si está configurado
         output_var = node.config.get("output_variable")
@@ -692,8 +908,39 @@ class WorkflowExecutor:
             raise ValueError(f"Node {node.id}: invalid action '{action}'")
     
     async def _execute_wait_node(self, node: WorkflowNode) -> Dict[str, Any]:
-        """Ejecutar nodo de espera/delay"""
-        delay_ms = node.config.get("delay_ms", 1000)
+        """
+        Ejecutar nodo de espera/delay.
+        
+        Config: "delay_ms" o "until" (ISO datetime, admite {{variables}}) más
+        "offset_ms" opcional (ej: -86400000 = 24 h antes). Con scheduler, las
+        esperas mayores a inline_wait_max_ms suspenden el branch y se
+        reanudan desde un timer en Redis sin ocupar el worker.
+        """
+        wait_key = None
+        if self._durable:
+            # Una clave por visita (los loops pueden pasar varias veces por el nodo)
+            visits = sum(
+                1 for record in self.state.execution_history
+                if record["node_id"] == node.id and record["status"] == ExecutionStatus.SUCCESS.value
+            )
+            wait_key = f"{node.id}:{visits}"
+            
+            if wait_key in self._fired_waits:
+                return {"waited": True, "resumed": True, "wait_key": wait_key}
+            if wait_key in self._pending_waits:
+                raise _WorkflowSuspended(wait_key, self._pending_waits[wait_key], scheduled=False)
+        
+        delay_ms = self._resolve_wait_delay(node)
+        
+        if self._durable and delay_ms > self.scheduler.inline_wait_max_ms:
+            resume_at = time.time() + delay_ms / 1000
+            self._pending_waits[wait_key] = resume_at
+            await self._run_blocking(
+                self.scheduler.schedule_wait,
+                self.workflow.company_id, self.workflow.id, self.execution_id, wait_key, resume_at
+            )
+            logger.info(f"[{self.workflow.company_id}] Suspending branch at {node.name} for {delay_ms}ms")
+            raise _WorkflowSuspended(wait_key, resume_at, scheduled=True)
         
         logger.info(f"[{self.workflow.company_id}] Waiting {delay_ms}ms...")
         
@@ -701,6 +948,17 @@ class WorkflowExecutor:
         
         return {"waited_ms": delay_ms}
     
+    def _resolve_wait_delay(self, node: WorkflowNode) -> int:
+        until = node.config.get("until")
+        if not until:
+            return node.config.get("delay_ms", 1000)
+        
+        target = datetime.fromisoformat(str(self._resolve_variables(until)))
+        if target.tzinfo is None:
+            target = target.replace(tzinfo=timezone.utc)
+        target_ts = target.timestamp() + node.config.get("offset_ms", 0) / 1000
+        return max(0, int((target_ts - time.time()) * 1000))
+    
     async def _execute_webhook_node(self, node: WorkflowNode) -> Dict[str, Any]:
         """Ejecutar nodo de webhook/HTTP request"""
         import aiohttp
@@ -760,19 +1018,17 @@ class WorkflowExecutor:
             f"(max {max_iterations} iterations)"
         )
         
+        # Condición compilada una sola vez (cacheada en el grafo)
+        compiled_exit = self.workflow.get_condition(exit_condition) if exit_condition else None
+        
         iterations = 0
         for i in range(max_iterations):
             iterations = i + 1
             self.state.set_variable(loop_variable, i)
             
             # Evaluar condición de salida
-            if exit_condition:
-                from app.workflows.condition_evaluator import ConditionEvaluator
-                evaluator = ConditionEvaluator()
-                should_exit = evaluator.evaluate(
-                    exit_condition,
-                    self.state.get_full_context()
-                )
+            if compiled_exit is not None:
+                should_exit = compiled_exit(self.state.get_full_context())
                 
                 if should_exit:
                     logger.info(f"[{self.workflow.company_id}] Loop exit condition met at iteration {i}")
@@ -801,6 +1057,11 @@ class WorkflowExecutor:
     
     # === HELPERS === #
     
+    async def _run_blocking(self, func, *args, **kwargs) -> Any:
+        """Ejecutar una llamada síncrona (orchestrator/tools) en el pool del runtime"""
+        from app.workflows.workflow_runtime import get_workflow_runtime
+        return await get_workflow_runtime().run_blocking(func, *args, **kwargs)
+    
     def _resolve_variables(self, value: Any) -> Any:
         """
         Resolver variables en un valor.
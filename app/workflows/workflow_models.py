@@ -6,6 +6,11 @@ from enum import Enum
 from datetime import datetime
 import json
 import logging
+from collections import deque
+
+from app.workflows.condition_evaluator import (
+    CompiledCondition, ConditionSyntaxError, compile_condition
+)
 
 logger = logging.getLogger(__name__)
 
@@ -82,8 +87,8 @@ class WorkflowNode:
                     errors.append(f"Node {self.id}: variable_name required for set action")
         
         elif self.type == NodeType.WAIT:
-            if "delay_ms" not in self.config:
-                errors.append(f"Node {self.id}: delay_ms required")
+            if "delay_ms" not in self.config and "until" not in self.config:
+                errors.append(f"Node {self.id}: delay_ms or until required")
         
         elif self.type == NodeType.WEBHOOK:
             if "url" not in self.config:
@@ -141,6 +146,26 @@ class WorkflowEdge:
     description: Optional[str] = None
     enabled: bool = True
     
+    # Condición compilada (cache, no se serializa)
+    _compiled_condition: Optional[CompiledCondition] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    
+    def get_compiled_condition(self) -> Optional[CompiledCondition]:
+        """
+        Obtener la condición compilada (se recompila solo si cambió el texto).
+        
+        Raises:
+            ConditionSyntaxError: Si la condición no es válida
+        """
+        if not self.condition:
+            return None
+        
+        compiled = self._compiled_condition
+        if compiled is None or compiled.source != self.condition.strip():
+            compiled = self._compiled_condition = compile_condition(self.condition)
+        return compiled
+    
     def evaluate_condition(self, state: Dict[str, Any]) -> bool:
         """
         Evaluar si esta edge debe ejecutarse dado el estado actual.
@@ -149,11 +174,7 @@ class WorkflowEdge:
             return True  # Sin condición = siempre ejecutar
         
         try:
-            from app.workflows.condition_evaluator import ConditionEvaluator
-            evaluator = ConditionEvaluator()
-            result = evaluator.evaluate(self.condition, state)
-            logger.debug(f"Edge {self.id} condition '{self.condition}' evaluated to {result}")
-            return result
+            return self.get_compiled_condition()(state)
         except Exception as e:
             logger.error(f"Error evaluating condition for edge {self.id}: {e}")
             return False
@@ -185,6 +206,139 @@ class WorkflowEdge:
             enabled=data.get("enabled", True)
         )
 
+ERROR_EDGE_TYPES = (EdgeType.ON_ERROR, EdgeType.FALLBACK)
+
+
+class ExecutionPlan:
+    """
+    Plan de ejecución inmutable precomputado a partir del grafo.
+    
+    - Listas de adyacencia (solo edges habilitados) y buckets por tipo de edge
+    - Flujo normal (sin ON_ERROR/FALLBACK) y edges de error separados
+    - Orden topológico (ignorando back-edges de ciclos) y ciclos detectados
+    
+    Se construye una vez (carga/validación) y el executor lo recorre sin
+    volver a escanear edges.
+    """
+    
+    __slots__ = ("outgoing", "incoming", "by_type", "flow", "error_flow",
+                 "order", "back_edges", "cycles")
+    
+    def __init__(self, nodes: Dict[str, WorkflowNode], edges: Dict[str, WorkflowEdge],
+                 start_node_id: Optional[str]):
+        outgoing: Dict[str, List[WorkflowEdge]] = {node_id: [] for node_id in nodes}
+        incoming: Dict[str, List[WorkflowEdge]] = {node_id: [] for node_id in nodes}
+        by_type: Dict[str, Dict[EdgeType, List[WorkflowEdge]]] = {node_id: {} for node_id in nodes}
+        
+        for edge in edges.values():
+            if not edge.enabled:
+                continue
+            if edge.source_node_id in outgoing:
+                outgoing[edge.source_node_id].append(edge)
+                by_type[edge.source_node_id].setdefault(edge.edge_type, []).append(edge)
+            if edge.target_node_id in incoming:
+                incoming[edge.target_node_id].append(edge)
+        
+        self.outgoing = {node_id: tuple(items) for node_id, items in outgoing.items()}
+        self.incoming = {node_id: tuple(items) for node_id, items in incoming.items()}
+        self.by_type = {
+            node_id: {edge_type: tuple(items) for edge_type, items in buckets.items()}
+            for node_id, buckets in by_type.items()
+        }
+        self.flow = {
+            node_id: tuple(edge for edge in items if edge.edge_type not in ERROR_EDGE_TYPES)
+            for node_id, items in self.outgoing.items()
+        }
+        self.error_flow = {
+            node_id: tuple(
+                edge for edge_type in ERROR_EDGE_TYPES
+                for edge in self.by_type[node_id].get(edge_type, ())
+            )
+            for node_id in nodes
+        }
+        
+        self.back_edges, self.cycles = self._find_back_edges(nodes, start_node_id)
+        self.order = self._topological_order(nodes)
+    
+    def _find_back_edges(self, nodes, start_node_id) -> tuple:
+        """DFS iterativo (sin copiar paths): back-edges y ciclos"""
+        WHITE, GRAY, BLACK = 0, 1, 2
+        color = {node_id: WHITE for node_id in nodes}
+        back_edges = set()
+        cycles = []
+        
+        roots = [start_node_id] if start_node_id in nodes else []
+        roots.extend(node_id for node_id in nodes if node_id != start_node_id)
+        
+        for root in roots:
+            if color[root] != WHITE:
+                continue
+            
+            path: List[str] = [root]
+            position = {root: 0}
+            color[root] = GRAY
+            stack = [(root, iter(self.outgoing[root]))]
+            
+            while stack:
+                node_id, children = stack[-1]
+                edge = next(children, None)
+                
+                if edge is None:
+                    stack.pop()
+                    path.pop()
+                    del position[node_id]
+                    color[node_id] = BLACK
+                    continue
+                
+                target = edge.target_node_id
+                if target not in color:
+                    continue
+                if color[target] == WHITE:
+                    color[target] = GRAY
+                    position[target] = len(path)
+                    path.append(target)
+                    stack.append((target, iter(self.outgoing[target])))
+                elif color[target] == GRAY:
+                    back_edges.add(edge.id)
+                    cycles.append(path[position[target]:] + [target])
+        
+        return frozenset(back_edges), cycles
+    
+    def _topological_order(self, nodes) -> tuple:
+        """Kahn sobre el grafo sin back-edges"""
+        in_degree = {node_id: 0 for node_id in nodes}
+        for node_id in nodes:
+            for edge in self.outgoing[node_id]:
+                if edge.id not in self.back_edges and edge.target_node_id in in_degree:
+                    in_degree[edge.target_node_id] += 1
+        
+        ready = deque(node_id for node_id, degree in in_degree.items() if degree == 0)
+        order = []
+        while ready:
+            node_id = ready.popleft()
+            order.append(node_id)
+            for edge in self.outgoing[node_id]:
+                if edge.id in self.back_edges or edge.target_node_id not in in_degree:
+                    continue
+                in_degree[edge.target_node_id] -= 1
+                if in_degree[edge.target_node_id] == 0:
+                    ready.append(edge.target_node_id)
+        
+        return tuple(order)
+    
+    def next_nodes(self, node_id: str, state: Dict[str, Any]) -> List[str]:
+        """Siguientes nodos del flujo normal cuya condición se cumple"""
+        return [
+            edge.target_node_id
+            for edge in self.flow.get(node_id, ())
+            if edge.evaluate_condition(state)
+        ]
+    
+    def error_targets(self, node_id: str) -> List[str]:
+        """Destinos de edges ON_ERROR/FALLBACK de un nodo"""
+        return [edge.target_node_id for edge in self.error_flow.get(node_id, ())]
+
+
 @dataclass
 class WorkflowGraph:
     """
@@ -218,11 +372,20 @@ class WorkflowGraph:
     created_by: str = "system"
     updated_at: Optional[str] = None
     
+    # Condiciones compiladas de nodos (texto → CompiledCondition, no se serializa)
+    _compiled_conditions: Dict[str, CompiledCondition] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    
+    # Plan de ejecución precomputado (se invalida al modificar nodos/edges)
+    _plan: Optional[ExecutionPlan] = field(default=None, init=False, repr=False, compare=False)
+    
     # === GRAPH OPERATIONS === #
     
     def add_node(self, node: WorkflowNode):
         """Agregar nodo al grafo"""
         self.nodes[node.id] = node
+        self._plan = None
         
         # Si es el primer nodo o es TRIGGER, marcarlo como start
         if not self.start_node_id or node.type == NodeType.TRIGGER:
@@ -237,38 +400,92 @@ class WorkflowGraph:
             raise ValueError(f"Target node {edge.target_node_id} not found")
         
         self.edges[edge.id] = edge
+        self._plan = None
     
     def get_node(self, node_id: str) -> Optional[WorkflowNode]:
         """Obtener nodo por ID"""
         return self.nodes.get(node_id)
     
+    def get_execution_plan(self) -> ExecutionPlan:
+        """
+        Obtener el plan de ejecución (adyacencias, buckets, orden topológico).
+        Se construye una vez; si se modifican nodos/edges directamente
+        (sin add_node/add_edge) llamar a rebuild_execution_plan().
+        """
+        plan = self._plan
+        if plan is None:
+            plan = self._plan = ExecutionPlan(self.nodes, self.edges, self.start_node_id)
+        return plan
+    
+    def rebuild_execution_plan(self) -> ExecutionPlan:
+        self._plan = None
+        return self.get_execution_plan()
+    
     def get_outgoing_edges(self, node_id: str) -> List[WorkflowEdge]:
         """Obtener edges que salen de un nodo"""
-        return [
-            edge for edge in self.edges.values()
-            if edge.source_node_id == node_id and edge.enabled
-        ]
+        return list(self.get_execution_plan().outgoing.get(node_id, ()))
     
     def get_incoming_edges(self, node_id: str) -> List[WorkflowEdge]:
         """Obtener edges que llegan a un nodo"""
-        return [
-            edge for edge in self.edges.values()
-            if edge.target_node_id == node_id and edge.enabled
-        ]
+        return list(self.get_execution_plan().incoming.get(node_id, ()))
+    
+    def get_edges_by_type(self, node_id: str, edge_type: EdgeType) -> List[WorkflowEdge]:
+        """Obtener edges salientes de un tipo (ej: ON_ERROR)"""
+        return list(self.get_execution_plan().by_type.get(node_id, {}).get(edge_type, ()))
     
     def get_next_nodes(self, node_id: str, state: Dict[str, Any]) -> List[str]:
         """
         Determinar siguientes nodos a ejecutar basado en estado actual.
-        Evalúa condiciones de edges.
+        Evalúa condiciones de edges del flujo normal (ON_ERROR/FALLBACK
+        solo se siguen cuando el nodo falla).
         """
-        outgoing = self.get_outgoing_edges(node_id)
-        next_nodes = []
+        return self.get_execution_plan().next_nodes(node_id, state)
+    
+    # === CONDITIONS === #
+    
+    def get_condition(self, condition: str) -> CompiledCondition:
+        """
+        Obtener condición compilada (ej: exit_condition de un LOOP).
+        
+        Raises:
+            ConditionSyntaxError: Si la condición no es válida
+        """
+        compiled = self._compiled_conditions.get(condition)
+        if compiled is None:
+            compiled = self._compiled_conditions[condition] = compile_condition(condition)
+        return compiled
+    
+    def compile_conditions(self) -> List[str]:
+        """
+        Compilar todas las condiciones del grafo (edges, CONDITION y LOOP).
+        Retorna lista de errores de sintaxis (vacía si todo OK).
+        """
+        errors = []
         
-        for edge in outgoing:
-            if edge.evaluate_condition(state):
-                next_nodes.append(edge.target_node_id)
+        for edge in self.edges.values():
+            if not edge.condition:
+                continue
+            try:
+                edge.get_compiled_condition()
+            except ConditionSyntaxError as e:
+                errors.append(f"Edge {edge.id}: invalid condition '{edge.condition}': {e}")
+        
+        for node in self.nodes.values():
+            if node.type == NodeType.CONDITION:
+                condition = node.config.get("condition")
+            elif node.type == NodeType.LOOP:
+                condition = node.config.get("exit_condition")
+            else:
+                continue
+            
+            if not condition:
+                continue
+            try:
+                self.get_condition(condition)
+            except ConditionSyntaxError as e:
+                errors.append(f"Node {node.id}: invalid condition '{condition}': {e}")
         
-        return next_nodes
+        return errors
     
     # === VALIDATION === #
     
@@ -294,18 +511,19 @@ class WorkflowGraph:
             node_errors = node.validate()
             errors.extend(node_errors)
         
+        # Plan precomputado (adyacencias + orden topológico)
+        plan = self.get_execution_plan()
+        
         # 4. Detectar nodos huérfanos (sin incoming edges, excepto start)
         for node_id in self.nodes.keys():
             if node_id != self.start_node_id:
-                incoming = self.get_incoming_edges(node_id)
-                if not incoming:
+                if not plan.incoming[node_id]:
                     warnings.append(f"Node {node_id} ({self.nodes[node_id].name}) is orphaned (no incoming edges)")
         
         # 5. Detectar nodos sin salida (dead ends, excepto END)
         for node_id, node in self.nodes.items():
             if node.type != NodeType.END:
-                outgoing = self.get_outgoing_edges(node_id)
-                if not outgoing:
+                if not plan.outgoing[node_id]:
                     warnings.append(f"Node {node_id} ({node.name}) has no outgoing edges (dead end)")
         
         # 6. Detectar ciclos (loops sin condición de salida pueden ser infinitos)
@@ -322,41 +540,17 @@ class WorkflowGraph:
             if edge.target_node_id not in self.nodes:
                 errors.append(f"Edge {edge.id} references non-existent target node: {edge.target_node_id}")
         
+        # 8. Validar sintaxis de condiciones (compila y deja en cache)
+        errors.extend(self.compile_conditions())
+        
         return {"errors": errors, "warnings": warnings}
     
     def _detect_cycles(self) -> List[List[str]]:
         """
-        Detectar ciclos en el grafo usando DFS.
+        Detectar ciclos en el grafo (DFS iterativo del plan de ejecución).
         Retorna lista de ciclos encontrados.
         """
-        visited = set()
-        rec_stack = set()
-        cycles = []
-        
-        def dfs(node_id: str, path: List[str]):
-            visited.add(node_id)
-            rec_stack.add(node_id)
-            path.append(node_id)
-            
-            for edge in self.get_outgoing_edges(node_id):
-                next_node = edge.target_node_id
-                
-                if next_node not in visited:
-                    dfs(next_node, path.copy())
-                elif next_node in rec_stack:
-                    # Ciclo detectado
-                    cycle_start = path.index(next_node)
-                    cycle = path[cycle_start:] + [next_node]
-                    cycles.append(cycle)
-            
-            rec_stack.remove(node_id)
-        
-        # Ejecutar DFS desde cada nodo no visitado
-        for node_id in self.nodes.keys():
-            if node_id not in visited:
-                dfs(node_id, [])
-        
-        return cycles
+        return list(self.get_execution_plan().cycles)
     
     # === SERIALIZATION === #
     
@@ -424,6 +618,12 @@ class WorkflowGraph:
             edge = WorkflowEdge.from_dict(edge_data)
             workflow.add_edge(edge)
         
+        # Compilar condiciones y plan de ejecución una sola vez al cargar
+        condition_errors = workflow.compile_conditions()
+        if condition_errors:
+            logger.warning(f"Workflow {workflow.id} has invalid conditions: {condition_errors}")
+        workflow.get_execution_plan()
+        
         return workflow
     
     @classmethod
@@ -1,15 +1,20 @@
 # app/workflows/workflow_registry.py
 
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Callable
 from datetime import datetime
 import json
 import logging
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
 
 from app.workflows.workflow_models import WorkflowGraph
-from app.services.redis_service import get_redis_client
+from app.workflows.trigger_index import TriggerIndex
+from app.services.redis_service import get_redis_client, resolve_redis_url
 
 logger = logging.getLogger(__name__)
 
@@ -24,11 +29,42 @@ class WorkflowRegistry:
     ✅ Versionado de workflows
     """
     
+    # Canal pub/sub para invalidar estructuras en memoria en todos los workers
+    INVALIDATION_CHANNEL = "workflow_registry:invalidate"
+    
+    # Cache L2 (Redis): workflow_cache:{company_id}:{workflow_id}:{version}
+    CACHE_OWNERS_KEY = "workflow_cache:owners"  # HASH workflow_id → company_id
+    
     def __init__(self):
         self.redis_client = get_redis_client()
         self.cache_ttl = 3600  # 1 hora
         self.db_url = os.getenv('DATABASE_URL')
         
+        # Cache L1 (en proceso): LRU de WorkflowGraph ya deserializados/compilados.
+        # Los objetos se comparten entre requests: tratarlos como inmutables.
+        self.l1_cache_size = int(os.getenv('WORKFLOW_L1_CACHE_SIZE', '512'))
+        self._l1_cache: "OrderedDict[str, tuple]" = OrderedDict()  # workflow_id → (company_id, version, graph)
+        self._l1_lock = threading.Lock()
+        self._company_versions: Dict[str, int] = {}  # última versión conocida por empresa
+        self._cache_stats: Dict[str, Dict[str, int]] = {}
+        
+        # Índices de triggers por empresa (en memoria, invalidados por pub/sub)
+        self.trigger_index_max_age = 600  # red de seguridad si se pierde un mensaje
+        self._trigger_indexes: Dict[str, TriggerIndex] = {}
+        self._trigger_index_locks: Dict[str, threading.Lock] = {}
+        self._trigger_index_guard = threading.Lock()
+        
+        # Listener pub/sub (un thread por proceso)
+        self._redis_url = resolve_redis_url()
+        self._instance_id = uuid.uuid4().hex
+        self._invalidation_handlers: List[Callable[[str, Optional[str]], None]] = [
+            self._drop_trigger_index,
+            self._evict_company_from_l1
+        ]
+        self._listener_thread: Optional[threading.Thread] = None
+        self._listener_pid: Optional[int] = None
+        self._listener_lock = threading.Lock()
+        
         if not self.db_url:
             logger.warning("DATABASE_URL not configured - WorkflowRegistry will have limited functionality")
         
@@ -75,10 +111,14 @@ class WorkflowRegistry:
             
             if exists:
                 # Update
-                return self._update_in_database(workflow, workflow_json, created_by)
+                saved = self._update_in_database(workflow, workflow_json, created_by)
             else:
                 # Insert
-                return self._insert_in_database(workflow, workflow_json, created_by)
+                saved = self._insert_in_database(workflow, workflow_json, created_by)
+            
+            if saved:
+                self._sync_schedules(workflow)
+            return saved
             
         except Exception as e:
             logger.exception(f"Error saving workflow {workflow.id}: {e}")
@@ -89,21 +129,27 @@ class WorkflowRegistry:
         Obtener workflow por ID.
         
         Flujo:
-        1. Buscar en Redis (si use_cache=True)
+        1. Buscar en L1 (memoria) y luego en L2 (Redis) si use_cache=True
         2. Buscar en PostgreSQL
-        3. Guardar en Redis
+        3. Guardar en cache
+        
+        Con use_cache=True el objeto retornado puede estar compartido (L1):
+        no mutarlo. Con use_cache=False se retorna siempre una copia nueva
+        desde PostgreSQL (apta para editar) y solo se refresca L2.
         
         Args:
             workflow_id: ID del workflow
-            use_cache: Si usar cache Redis
+            use_cache: Si usar cache L1/L2
             
         Returns:
             WorkflowGraph o None si no existe
         """
         try:
+            version = None
+            
             # 1. Intentar desde cache
             if use_cache:
-                cached = self._get_from_cache(workflow_id)
+                cached, company_id, version = self._cache_lookup(workflow_id)
                 if cached:
                     logger.debug(f"Workflow {workflow_id} loaded from cache")
                     return cached
@@ -112,8 +158,12 @@ class WorkflowRegistry:
             workflow = self._get_from_database(workflow_id)
             
             if workflow:
-                # 3. Guardar en cache
-                self._save_to_cache(workflow)
+                if use_cache:
+                    self._record_cache_event(workflow.company_id, "misses")
+                
+                # 3. Guardar en cache (versión leída ANTES de cargar: si hubo
+                # una invalidación en medio, la entrada queda inalcanzable)
+                self._save_to_cache(workflow, version=version, populate_l1=use_cache)
                 logger.info(f"Workflow {workflow_id} loaded from PostgreSQL")
                 return workflow
             
@@ -196,16 +246,19 @@ class WorkflowRegistry:
                     modified_at = NOW(),
                     modified_by = %s
                 WHERE workflow_id = %s
+                RETURNING company_id
             """
             
             cursor.execute(query, (deleted_by, workflow_id))
+            row = cursor.fetchone()
             conn.commit()
             
             cursor.close()
             conn.close()
             
-            # Invalidar cache
-            self._invalidate_cache(workflow_id)
+            # Invalidar cache (versión de la empresa + pub/sub)
+            if row:
+                self._invalidate_company_cache(row[0], workflow_id)
             
             logger.info(f"Workflow {workflow_id} disabled by {deleted_by}")
             return True
@@ -222,6 +275,10 @@ class WorkflowRegistry:
         """
         Encontrar workflow que matchee un trigger específico.
         
+        Usa el índice precompilado de la empresa (automaton de keywords +
+        mapa de webhook_id): una sola pasada sobre el mensaje, sin consultar
+        PostgreSQL en cada llamada.
+        
         Args:
             company_id: ID de la empresa
             trigger_data: Datos del trigger (ej: {"type": "keyword", "value": "botox"})
@@ -230,12 +287,12 @@ class WorkflowRegistry:
             Primer workflow que matchee o None
         """
         try:
-            workflows = self.get_workflows_by_company(company_id, enabled_only=True)
+            index = self.get_trigger_index(company_id)
+            workflow = index.match(trigger_data)
             
-            for workflow in workflows:
-                if self._matches_trigger(workflow, trigger_data):
-                    logger.info(f"Workflow {workflow.id} matches trigger")
-                    return workflow
+            if workflow:
+                logger.info(f"Workflow {workflow.id} matches trigger")
+                return workflow
             
             logger.debug(f"No workflow found for trigger: {trigger_data}")
             return None
@@ -247,31 +304,163 @@ class WorkflowRegistry:
     def _matches_trigger(self, workflow: WorkflowGraph, 
                         trigger_data: Dict[str, Any]) -> bool:
         """
-        Verificar si workflow matchea un trigger.
+        Verificar si UN workflow matchea un trigger (mismo criterio que el índice).
         """
-        for trigger in workflow.triggers:
-            trigger_type = trigger.get("type")
-            
-            if trigger_type == "keyword":
-                # Trigger por keyword
-                keywords = trigger.get("keywords", [])
-                value = trigger_data.get("value", "").lower()
-                
-                if any(kw.lower() in value for kw in keywords):
-                    return True
+        return TriggerIndex(workflow.company_id, [workflow]).match(trigger_data) is not None
+    
+    def _sync_schedules(self, workflow: WorkflowGraph):
+        """Programar los triggers cron del workflow en el scheduler de timers"""
+        try:
+            from app.workflows.workflow_scheduler import get_workflow_scheduler
+            get_workflow_scheduler().sync_workflow_schedules(workflow)
+        except Exception as e:
+            logger.warning(f"Could not sync schedule triggers for workflow {workflow.id}: {e}")
+    
+    # === TRIGGER INDEX === #
+    
+    def get_trigger_index(self, company_id: str) -> TriggerIndex:
+        """Obtener (o construir una vez) el índice de triggers de la empresa"""
+        self._ensure_invalidation_listener()
+        
+        index = self._trigger_indexes.get(company_id)
+        if index is not None and time.time() - index.built_at < self.trigger_index_max_age:
+            return index
+        
+        with self._trigger_index_guard:
+            lock = self._trigger_index_locks.setdefault(company_id, threading.Lock())
+        
+        # Un solo build concurrente por empresa; los demás esperan y reutilizan
+        with lock:
+            index = self._trigger_indexes.get(company_id)
+            if index is not None and time.time() - index.built_at < self.trigger_index_max_age:
+                return index
             
-            elif trigger_type == "webhook":
-                # Trigger por webhook
-                webhook_id = trigger.get("webhook_id")
-                if webhook_id == trigger_data.get("webhook_id"):
-                    return True
+            workflows = self.get_workflows_by_company(company_id, enabled_only=True)
+            index = TriggerIndex(company_id, workflows)
+            self._trigger_indexes[company_id] = index
             
-            elif trigger_type == "schedule":
-                # Trigger por schedule (cron)
-                # TODO: Implementar matching de cron
-                pass
+            logger.info(f"[{company_id}] Trigger index built: {index.get_stats()}")
+            return index
+    
+    def preload(self, company_ids: List[str]) -> Dict[str, Any]:
+        """
+        Construir planes de ejecución e índices de triggers de varias empresas
+        sin arrancar el listener pub/sub.
         
-        return False
+        Pensado para el master de gunicorn (--preload): los workers heredan
+        estas estructuras inmutables por copy-on-write y cada uno arranca su
+        listener al usar el registry (el max_age cubre lo publicado entre
+        el preload y ese momento).
+        """
+        stats = {"companies": 0, "workflows": 0, "plans": 0}
+        for company_id in company_ids:
+            workflows = self.get_workflows_by_company(company_id, enabled_only=True)
+            for workflow in workflows:
+                try:
+                    workflow.get_execution_plan()
+                    stats["plans"] += 1
+                except Exception as e:
+                    logger.warning(f"[{company_id}] Could not compile plan for workflow {workflow.id}: {e}")
+            self._trigger_indexes[company_id] = TriggerIndex(company_id, workflows)
+            stats["companies"] += 1
+            stats["workflows"] += len(workflows)
+        return stats
+    
+    def _drop_trigger_index(self, company_id: str, workflow_id: Optional[str] = None):
+        if self._trigger_indexes.pop(company_id, None) is not None:
+            logger.debug(f"[{company_id}] Trigger index invalidated")
+    
+    # === INVALIDATION (pub/sub) === #
+    
+    def add_invalidation_handler(self, handler: Callable[[str, Optional[str]], None]):
+        """Registrar callback(company_id, workflow_id) para invalidaciones locales y remotas"""
+        self._invalidation_handlers.append(handler)
+    
+    def _apply_invalidation(self, company_id: str, workflow_id: Optional[str], version: Optional[int] = None):
+        if version is not None:
+            self._note_company_version(company_id, version)
+        
+        for handler in self._invalidation_handlers:
+            try:
+                handler(company_id, workflow_id)
+            except Exception as e:
+                logger.error(f"Invalidation handler failed for {company_id}: {e}")
+    
+    def _publish_invalidation(self, company_id: str, workflow_id: Optional[str] = None,
+                              version: Optional[int] = None):
+        """Invalidar localmente y notificar al resto de workers/instancias"""
+        self._apply_invalidation(company_id, workflow_id, version)
+        
+        try:
+            self.redis_client.publish(self.INVALIDATION_CHANNEL, json.dumps({
+                "company_id": company_id,
+                "workflow_id": workflow_id,
+                "version": version,
+                "origin": self._instance_id
+            }))
+        except Exception as e:
+            logger.error(f"Error publishing workflow invalidation for {company_id}: {e}")
+    
+    def _ensure_invalidation_listener(self):
+        """Arrancar el thread suscriptor (uno por proceso, re-arranca tras fork)"""
+        if self._listener_pid == os.getpid() and self._listener_thread and self._listener_thread.is_alive():
+            return
+        
+        with self._listener_lock:
+            if self._listener_pid == os.getpid() and self._listener_thread and self._listener_thread.is_alive():
+                return
+            
+            # Estructuras heredadas de otro proceso pudieron perder mensajes
+            if self._listener_pid is not None and self._listener_pid != os.getpid():
+                self._trigger_indexes.clear()
+                with self._l1_lock:
+                    self._l1_cache.clear()
+            
+            self._listener_thread = threading.Thread(
+                target=self._listen_for_invalidations,
+                name="workflow-registry-invalidation",
+                daemon=True
+            )
+            self._listener_pid = os.getpid()
+            self._listener_thread.start()
+    
+    def _listen_for_invalidations(self):
+        import redis
+        
+        reconnecting = False
+        while True:
+            try:
+                client = redis.from_url(self._redis_url, decode_responses=True)
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.INVALIDATION_CHANNEL)
+                
+                # Mensajes perdidos mientras no había suscripción: invalidar todo
+                if reconnecting:
+                    companies = set(self._trigger_indexes)
+                    with self._l1_lock:
+                        companies.update(entry[0] for entry in self._l1_cache.values())
+                    for company_id in companies:
+                        self._apply_invalidation(company_id, None)
+                reconnecting = True
+                
+                for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        payload = json.loads(message["data"])
+                    except (TypeError, ValueError):
+                        continue
+                    
+                    if payload.get("origin") == self._instance_id:
+                        continue  # ya aplicado localmente
+                    
+                    self._apply_invalidation(
+                        payload.get("company_id"), payload.get("workflow_id"), payload.get("version")
+                    )
+            
+            except Exception as e:
+                logger.warning(f"Workflow invalidation listener error, reconnecting: {e}")
+                time.sleep(1)
     
     # === DATABASE OPERATIONS === #
     
@@ -324,7 +513,7 @@ class WorkflowRegistry:
             conn.close()
             
             # Invalidar cache
-            self._invalidate_company_cache(workflow.company_id)
+            self._invalidate_company_cache(workflow.company_id, workflow.id)
             
             logger.info(f"✅ Workflow {workflow.id} inserted successfully")
             return True
@@ -384,8 +573,7 @@ class WorkflowRegistry:
             conn.close()
             
             # Invalidar cache
-            self._invalidate_cache(workflow.id)
-            self._invalidate_company_cache(workflow.company_id)
+            self._invalidate_company_cache(workflow.company_id, workflow.id)
             
             logger.info(f"✅ Workflow {workflow.id} updated successfully")
             return True
@@ -430,77 +618,160 @@ class WorkflowRegistry:
     
     # === CACHE OPERATIONS === #
     
-    def _get_from_cache(self, workflow_id: str) -> Optional[WorkflowGraph]:
-        """Obtener workflow desde Redis cache"""
+    def _l2_key(self, company_id: str, workflow_id: str, version: int) -> str:
+        return f"workflow_cache:{company_id}:{workflow_id}:{version}"
+    
+    def _version_key(self, company_id: str) -> str:
+        return f"workflow_cache_version:{company_id}"
+    
+    def _get_company_version(self, company_id: str) -> int:
+        """Versión actual del cache de la empresa (Redis es la fuente de verdad)"""
+        version = int(self.redis_client.get(self._version_key(company_id)) or 0)
+        self._note_company_version(company_id, version)
+        return version
+    
+    def _note_company_version(self, company_id: str, version: int):
+        if version > self._company_versions.get(company_id, -1):
+            self._company_versions[company_id] = version
+    
+    def _record_cache_event(self, company_id: str, event: str):
+        stats = self._cache_stats.get(company_id)
+        if stats is None:
+            stats = self._cache_stats.setdefault(company_id, {"l1_hits": 0, "l2_hits": 0, "misses": 0})
+        stats[event] += 1
+    
+    def _l1_get(self, workflow_id: str) -> Optional[tuple]:
+        self._ensure_invalidation_listener()
+        
+        with self._l1_lock:
+            entry = self._l1_cache.get(workflow_id)
+            if entry is None:
+                return None
+            
+            company_id, version, _ = entry
+            if version < self._company_versions.get(company_id, 0):
+                del self._l1_cache[workflow_id]  # versión obsoleta
+                return None
+            
+            self._l1_cache.move_to_end(workflow_id)
+            return entry
+    
+    def _l1_put(self, workflow: WorkflowGraph, version: int):
+        with self._l1_lock:
+            # No reinsertar una versión ya invalidada (carga concurrente con invalidación)
+            if version < self._company_versions.get(workflow.company_id, 0):
+                return
+            
+            self._l1_cache[workflow.id] = (workflow.company_id, version, workflow)
+            self._l1_cache.move_to_end(workflow.id)
+            
+            while len(self._l1_cache) > self.l1_cache_size:
+                self._l1_cache.popitem(last=False)
+    
+    def _evict_company_from_l1(self, company_id: str, workflow_id: Optional[str] = None):
+        with self._l1_lock:
+            stale = [wid for wid, entry in self._l1_cache.items() if entry[0] == company_id]
+            for wid in stale:
+                del self._l1_cache[wid]
+    
+    def _cache_lookup(self, workflow_id: str) -> tuple:
+        """
+        Buscar en L1 y luego en L2.
+        
+        Returns:
+            (WorkflowGraph o None, company_id o None, versión o None)
+        """
+        entry = self._l1_get(workflow_id)
+        if entry is not None:
+            company_id, version, workflow = entry
+            self._record_cache_event(company_id, "l1_hits")
+            return workflow, company_id, version
+        
         try:
-            cache_key = f"workflow:{workflow_id}"
-            cached_json = self.redis_client.get(cache_key)
+            company_id = self.redis_client.hget(self.CACHE_OWNERS_KEY, workflow_id)
+            if not company_id:
+                return None, None, None
+            
+            version = self._get_company_version(company_id)
+            cached_json = self.redis_client.get(self._l2_key(company_id, workflow_id, version))
             
             if cached_json:
-                workflow_data = json.loads(cached_json)
-                return WorkflowGraph.from_dict(workflow_data)
+                workflow = WorkflowGraph.from_dict(json.loads(cached_json))
+                self._l1_put(workflow, version)
+                self._record_cache_event(company_id, "l2_hits")
+                return workflow, company_id, version
             
-            return None
+            return None, company_id, version
             
         except Exception as e:
             logger.error(f"Error reading workflow {workflow_id} from cache: {e}")
-            return None
+            return None, None, None
     
-    def _save_to_cache(self, workflow: WorkflowGraph):
-        """Guardar workflow en Redis cache"""
+    def _get_from_cache(self, workflow_id: str) -> Optional[WorkflowGraph]:
+        """Obtener workflow desde cache (L1 → L2)"""
+        workflow, _, _ = self._cache_lookup(workflow_id)
+        return workflow
+    
+    def _save_to_cache(self, workflow: WorkflowGraph, version: Optional[int] = None,
+                       populate_l1: bool = True):
+        """Guardar workflow en L2 (Redis, con versión de empresa) y opcionalmente en L1"""
         try:
-            cache_key = f"workflow:{workflow.id}"
-            workflow_json = workflow.to_json()
+            if version is None:
+                version = self._get_company_version(workflow.company_id)
             
-            self.redis_client.setex(
-                cache_key,
-                self.cache_ttl,
-                workflow_json
-            )
+            pipe = self.redis_client.pipeline()
+            pipe.setex(self._l2_key(workflow.company_id, workflow.id, version), self.cache_ttl, workflow.to_json())
+            pipe.hset(self.CACHE_OWNERS_KEY, workflow.id, workflow.company_id)
+            pipe.execute()
             
-            logger.debug(f"Workflow {workflow.id} cached in Redis")
+            if populate_l1:
+                self._l1_put(workflow, version)
+            
+            logger.debug(f"Workflow {workflow.id} cached (version {version})")
             
         except Exception as e:
             logger.error(f"Error caching workflow {workflow.id}: {e}")
     
-    def _invalidate_cache(self, workflow_id: str):
-        """Invalidar cache de un workflow"""
+    def _invalidate_company_cache(self, company_id: str, workflow_id: Optional[str] = None):
+        """
+        Invalidar cache de los workflows de UNA empresa.
+        
+        Incrementa la versión de la empresa: las entradas L2 anteriores quedan
+        inalcanzables (expiran por TTL) sin SCAN, y los workers descartan su L1
+        vía pub/sub.
+        """
+        version = None
         try:
-            cache_key = f"workflow:{workflow_id}"
-            self.redis_client.delete(cache_key)
-            
-            logger.debug(f"Cache invalidated for workflow {workflow_id}")
-            
+            version = self.redis_client.incr(self._version_key(company_id))
         except Exception as e:
-            logger.error(f"Error invalidating cache for {workflow_id}: {e}")
+            logger.error(f"Error invalidating company cache for {company_id}: {e}")
+        
+        self._publish_invalidation(company_id, workflow_id, version)
+        logger.debug(f"[{company_id}] Workflow cache invalidated (version {version})")
     
-    def _invalidate_company_cache(self, company_id: str):
-        """Invalidar cache de todos los workflows de una empresa"""
-        try:
-            # Buscar todas las keys de workflows de esta empresa
-            pattern = f"workflow:*"
-            
-            # Redis SCAN para encontrar keys
-            cursor = 0
-            invalidated = 0
-            
-            while True:
-                cursor, keys = self.redis_client.scan(cursor, match=pattern, count=100)
-                
-                for key in keys:
-                    # Verificar si pertenece a la empresa (requiere cargar)
-                    # Por performance, simplemente invalidar todas
-                    self.redis_client.delete(key)
-                    invalidated += 1
-                
-                if cursor == 0:
-                    break
-            
-            if invalidated > 0:
-                logger.info(f"Cache invalidated for {invalidated} workflows")
-            
-        except Exception as e:
-            logger.error(f"Error invalidating company cache: {e}")
+    def get_cache_stats(self, company_id: Optional[str] = None) -> Dict[str, Any]:
+        """Hit/miss por empresa del cache de dos niveles"""
+        def _summary(stats: Dict[str, int]) -> Dict[str, Any]:
+            total = stats["l1_hits"] + stats["l2_hits"] + stats["misses"]
+            return {
+                **stats,
+                "requests": total,
+                "hit_rate": round((stats["l1_hits"] + stats["l2_hits"]) / total, 4) if total else 0.0,
+                "l1_hit_rate": round(stats["l1_hits"] / total, 4) if total else 0.0
+            }
+        
+        with self._l1_lock:
+            l1_entries = len(self._l1_cache)
+        
+        if company_id:
+            stats = self._cache_stats.get(company_id, {"l1_hits": 0, "l2_hits": 0, "misses": 0})
+            return {"company_id": company_id, "version": self._company_versions.get(company_id, 0), **_summary(stats)}
+        
+        return {
+            "l1_entries": l1_entries,
+            "l1_capacity": self.l1_cache_size,
+            "tenants": {cid: _summary(stats) for cid, stats in self._cache_stats.items()}
+        }
     
     # === EXECUTION LOGS === #
     
@@ -521,7 +792,7 @@ class WorkflowRegistry:
             
             # Generar execution_id
             import time
-            execution_id = f"exec_{workflow_id}_{int(time.time())}"
+            execution_id = execution_result.get("execution_id") or f"exec_{workflow_id}_{int(time.time())}"
             
             # Calcular duración
             started = datetime.fromisoformat(execution_result["started_at"])
@@ -569,6 +840,31 @@ class WorkflowRegistry:
                 conn.close()
             return False
     
+    def record_execution(self, workflow_id: str, execution_result: Dict[str, Any]) -> bool:
+        """
+        Registrar el resultado final de una ejecución (log + estadísticas).
+        Las ejecuciones suspendidas en un WAIT se registran al terminar.
+        """
+        if execution_result.get("status") == "waiting":
+            return False
+        
+        logged = self.log_execution(workflow_id, execution_result)
+        
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT update_workflow_execution_stats(%s, %s)",
+                (workflow_id, execution_result['status'])
+            )
+            conn.commit()
+            cursor.close()
+            conn.close()
+        except Exception as e:
+            logger.warning(f"Could not update execution stats: {e}")
+        
+        return logged
+    
     def get_execution_history(self, workflow_id: str, 
                              limit: int = 50) -> List[Dict[str, Any]]:
         """
@@ -662,7 +958,8 @@ class WorkflowRegistry:
                 "total_workflows": row['total'] or 0,
                 "enabled_workflows": row['enabled'] or 0,
                 "companies_with_workflows": row.get('companies', 0),
-                "company_id": company_id
+                "company_id": company_id,
+                "cache": self.get_cache_stats(company_id)
             }
             
         except Exception as e:
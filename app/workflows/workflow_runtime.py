@@ -0,0 +1,377 @@
+# app/workflows/workflow_runtime.py
+
+"""
+Runtime persistente para ejecución de workflows.
+
+Cada worker mantiene UN event loop de larga vida en un thread dedicado.
+Las requests envían coroutines a ese loop (en lugar de crear/reutilizar
+un loop por request) y los cuerpos bloqueantes de los nodos (orchestrator,
+tools) se delegan a un pool de threads acotado, de modo que los branches
+PARALLEL realmente se solapan.
+"""
+
+from typing import Dict, Any, Optional, Callable, Coroutine
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from app.config.constants import REDIS_KEY_PATTERNS, REDIS_TTL
+from app.config.settings import app_config_overlay
+
+logger = logging.getLogger(__name__)
+
+
+class WorkflowConcurrencyLimitExceeded(Exception):
+    """El workflow alcanzó su límite de ejecuciones concurrentes"""
+    pass
+
+
+class WorkflowRuntime:
+    """
+    Event loop de larga vida + pool de threads para nodos bloqueantes.
+
+    - submit(): programa una coroutine en el loop y retorna un Future
+      (concurrent.futures) que el thread de la request puede esperar.
+    - submit_background(): igual, pero registra el estado de la ejecución
+      en Redis y retorna inmediatamente un execution_id.
+    - run_blocking(): awaitable que ejecuta una función síncrona en el pool.
+    - Límite de ejecuciones concurrentes por workflow (semáforo por
+      company_id:workflow_id).
+    """
+
+    def __init__(self, max_workers: int = 8, max_concurrent_per_workflow: int = 4,
+                 execution_ttl: int = None):
+        self.max_workers = max_workers
+        self.max_concurrent_per_workflow = max_concurrent_per_workflow
+        self.execution_ttl = execution_ttl or REDIS_TTL["workflow_execution"]
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._blocking_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+        # Contadores por workflow (se leen/escriben solo desde el loop)
+        self._running: Dict[str, int] = {}
+        self._waiting: Dict[str, int] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+        self._stats = {
+            "submitted": 0,
+            "background_submitted": 0,
+            "rejected": 0,
+            "completed": 0,
+            "failed": 0
+        }
+
+    # === LIFECYCLE === #
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """Arrancar (o re-arrancar tras un fork) el loop y el pool"""
+        if self._loop is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return self._loop
+
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return self._loop
+
+            # Tras un fork el thread del padre no existe en el hijo: empezar de cero
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            thread = threading.Thread(target=_run_loop, name="workflow-runtime-loop", daemon=True)
+            thread.start()
+            ready.wait()
+
+            self._blocking_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="workflow-node"
+            )
+            self._semaphores = {}
+            self._running = {}
+            self._waiting = {}
+            self._loop = loop
+            self._thread = thread
+            self._pid = os.getpid()
+
+            logger.info(
+                f"WorkflowRuntime started (pid={self._pid}, node_workers={self.max_workers}, "
+                f"max_concurrent_per_workflow={self.max_concurrent_per_workflow})"
+            )
+            return loop
+
+    def shutdown(self, timeout: float = 5.0):
+        """Detener el loop y el pool (idempotente)"""
+        with self._lock:
+            loop, thread, pool = self._loop, self._thread, self._blocking_executor
+            self._loop = self._thread = self._blocking_executor = None
+
+        if loop is not None and self._pid == os.getpid():
+            loop.call_soon_threadsafe(loop.stop)
+            if thread is not None:
+                thread.join(timeout)
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._ensure_started()
+
+    # === BLOCKING OFFLOAD === #
+
+    async def run_blocking(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Ejecutar una función síncrona en el pool acotado sin bloquear el loop.
+        Propaga los contextvars (incluido el app context de Flask).
+        """
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, func, *args, **kwargs)
+        return await loop.run_in_executor(self._blocking_executor, call)
+
+    # === SUBMISSION === #
+
+    def submit(self, coro: Coroutine, workflow_key: str = None,
+               wait_for_slot: bool = True) -> concurrent.futures.Future:
+        """
+        Programar una coroutine en el loop persistente.
+
+        Args:
+            coro: Coroutine a ejecutar (ej: executor.execute(context))
+            workflow_key: "company_id:workflow_id" para aplicar el límite de concurrencia
+            wait_for_slot: Si False y el workflow está al límite, falla con
+                WorkflowConcurrencyLimitExceeded en lugar de encolar
+
+        Returns:
+            concurrent.futures.Future con el resultado de la coroutine
+        """
+        loop = self._ensure_started()
+        app = self._current_app()
+        self._stats["submitted"] += 1
+
+        wrapped = self._guarded(coro, workflow_key, wait_for_slot, app)
+        return asyncio.run_coroutine_threadsafe(wrapped, loop)
+
+    def submit_background(self, coro: Coroutine, company_id: str, workflow_id: str,
+                          on_complete: Callable[[Dict[str, Any]], Any] = None,
+                          execution_id: str = None) -> str:
+        """
+        Ejecutar en background y retornar inmediatamente un execution_id.
+
+        El estado (pending → running → success/failed/...) se guarda en Redis
+        y puede consultarse con get_execution_status() desde cualquier worker.
+        on_complete (síncrono) se ejecuta en el pool con el resultado final.
+        """
+        execution_id = execution_id or generate_execution_id(workflow_id)
+        workflow_key = f"{company_id}:{workflow_id}"
+        record = {
+            "execution_id": execution_id,
+            "workflow_id": workflow_id,
+            "company_id": company_id,
+            "status": "pending",
+            "submitted_at": datetime.utcnow().isoformat(),
+            "result": None
+        }
+
+        # Persistir "pending" antes de responder para que el polling nunca dé 404
+        self._store_execution(record)
+        self._stats["background_submitted"] += 1
+
+        tracked = self._tracked(coro, record, on_complete)
+        future = self.submit(tracked, workflow_key=workflow_key)
+        future.add_done_callback(functools.partial(self._log_background_failure, execution_id))
+        return execution_id
+
+    async def _guarded(self, coro: Coroutine, workflow_key: Optional[str],
+                       wait_for_slot: bool, app=None) -> Any:
+        """Aplicar app context + límite por workflow alrededor de la coroutine"""
+        if app is not None:
+            with app.app_context():
+                return await self._limited(coro, workflow_key, wait_for_slot)
+        return await self._limited(coro, workflow_key, wait_for_slot)
+
+    async def _limited(self, coro: Coroutine, workflow_key: Optional[str], wait_for_slot: bool) -> Any:
+        if not workflow_key:
+            return await coro
+
+        semaphore = self._semaphores.get(workflow_key)
+        if semaphore is None:
+            semaphore = self._semaphores[workflow_key] = asyncio.Semaphore(self.max_concurrent_per_workflow)
+
+        if semaphore.locked() and not wait_for_slot:
+            coro.close()
+            self._stats["rejected"] += 1
+            raise WorkflowConcurrencyLimitExceeded(
+                f"Workflow {workflow_key} reached {self.max_concurrent_per_workflow} concurrent executions"
+            )
+
+        self._waiting[workflow_key] = self._waiting.get(workflow_key, 0) + 1
+        try:
+            await semaphore.acquire()
+        except BaseException:
+            coro.close()
+            raise
+        finally:
+            self._waiting[workflow_key] -= 1
+
+        self._running[workflow_key] = self._running.get(workflow_key, 0) + 1
+        try:
+            result = await coro
+            self._stats["completed"] += 1
+            return result
+        except BaseException:
+            self._stats["failed"] += 1
+            raise
+        finally:
+            self._running[workflow_key] -= 1
+            semaphore.release()
+
+    async def _tracked(self, coro: Coroutine, record: Dict[str, Any],
+                       on_complete: Optional[Callable]) -> Dict[str, Any]:
+        """Envolver una ejecución en background actualizando su estado en Redis"""
+        record = dict(record, status="running", started_at=datetime.utcnow().isoformat())
+        await self.run_blocking(self._store_execution, record)
+
+        try:
+            result = await coro
+        except asyncio.CancelledError:
+            await self.run_blocking(self._store_execution, dict(record, status="cancelled"))
+            raise
+        except Exception as e:
+            logger.exception(f"Background workflow execution {record['execution_id']} failed: {e}")
+            await self.run_blocking(
+                self._store_execution,
+                dict(record, status="failed", error=str(e), completed_at=datetime.utcnow().isoformat())
+            )
+            raise
+
+        result["execution_id"] = record["execution_id"]
+
+        if on_complete is not None:
+            try:
+                await self.run_blocking(on_complete, result)
+            except Exception as e:
+                logger.warning(f"on_complete failed for execution {record['execution_id']}: {e}")
+
+        await self.run_blocking(
+            self._store_execution,
+            dict(record, status=result.get("status"), completed_at=result.get("completed_at"), result=result)
+        )
+        return result
+
+    @staticmethod
+    def _log_background_failure(execution_id: str, future: concurrent.futures.Future):
+        if future.cancelled():
+            logger.warning(f"Background workflow execution {execution_id} cancelled")
+
+    @staticmethod
+    def _current_app():
+        try:
+            from flask import current_app, has_app_context
+            if has_app_context():
+                return current_app._get_current_object()
+        except ImportError:
+            pass
+        return None
+
+    # === EXECUTION STATUS (Redis) === #
+
+    @staticmethod
+    def _execution_key(company_id: str, execution_id: str) -> str:
+        from app.config.company_config import get_company_config
+        config = get_company_config(company_id)
+        company_prefix = config.redis_prefix if config else f"{company_id}:"
+        return REDIS_KEY_PATTERNS["workflow_execution"].format(company_prefix=company_prefix) + execution_id
+
+    def _store_execution(self, record: Dict[str, Any]):
+        from app.services.redis_service import get_redis_client
+        try:
+            get_redis_client().setex(
+                self._execution_key(record["company_id"], record["execution_id"]),
+                self.execution_ttl,
+                json.dumps(record, default=str)
+            )
+        except Exception as e:
+            logger.warning(f"Could not store workflow execution {record.get('execution_id')}: {e}")
+
+    def record_execution_status(self, result: Dict[str, Any]):
+        """Actualizar el estado de una ejecución reanudada (WAIT/recuperación) a partir de su resultado"""
+        self._store_execution({
+            "execution_id": result.get("execution_id"),
+            "workflow_id": result.get("workflow_id"),
+            "company_id": result.get("company_id"),
+            "status": result.get("status"),
+            "completed_at": result.get("completed_at"),
+            "result": result
+        })
+
+    def get_execution_status(self, company_id: str, execution_id: str) -> Optional[Dict[str, Any]]:
+        """Leer el estado de una ejecución en background (cualquier worker)"""
+        from app.services.redis_service import get_redis_client
+        raw = get_redis_client().get(self._execution_key(company_id, execution_id))
+        return json.loads(raw) if raw else None
+
+    # === STATS === #
+
+    def get_stats(self) -> Dict[str, Any]:
+        started = self._loop is not None and self._pid == os.getpid()
+        return {
+            "running": started and self._thread.is_alive(),
+            "pid": self._pid,
+            "node_workers": self.max_workers,
+            "max_concurrent_per_workflow": self.max_concurrent_per_workflow,
+            "active_executions": {k: v for k, v in self._running.items() if v},
+            "queued_executions": {k: v for k, v in self._waiting.items() if v},
+            **self._stats
+        }
+
+
+def generate_execution_id(workflow_id: str) -> str:
+    return f"exec_{workflow_id}_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+
+
+# ============================================================================
+# SINGLETON POR WORKER
+# ============================================================================
+
+_workflow_runtime: Optional[WorkflowRuntime] = None
+_workflow_runtime_lock = threading.Lock()
+
+
+def get_workflow_runtime() -> WorkflowRuntime:
+    """Obtener el runtime del worker (lee la configuración de la app si existe)"""
+    global _workflow_runtime
+
+    if _workflow_runtime is None:
+        with _workflow_runtime_lock:
+            if _workflow_runtime is None:
+                config = _runtime_config()
+                _workflow_runtime = WorkflowRuntime(
+                    max_workers=config["WORKFLOW_NODE_MAX_WORKERS"],
+                    max_concurrent_per_workflow=config["WORKFLOW_MAX_CONCURRENT_EXECUTIONS"],
+                    execution_ttl=config["WORKFLOW_EXECUTION_TTL"]
+                )
+    return _workflow_runtime
+
+
+def _runtime_config() -> Dict[str, Any]:
+    defaults = {
+        "WORKFLOW_NODE_MAX_WORKERS": int(os.getenv('WORKFLOW_NODE_MAX_WORKERS', '8')),
+        "WORKFLOW_MAX_CONCURRENT_EXECUTIONS": int(os.getenv('WORKFLOW_MAX_CONCURRENT_EXECUTIONS', '4')),
+        "WORKFLOW_EXECUTION_TTL": int(os.getenv('WORKFLOW_EXECUTION_TTL', str(REDIS_TTL["workflow_execution"])))
+    }
+    return app_config_overlay(defaults)
@@ -0,0 +1,625 @@
+# app/workflows/workflow_scheduler.py
+
+"""
+Ejecución durable de workflows.
+
+- Checkpoints: el estado de cada ejecución (WorkflowState + esperas
+  pendientes) se guarda en Redis después de cada nodo.
+- Timers: un sorted set global (score = timestamp de vencimiento) con los
+  trabajos diferidos: reanudar un nodo WAIT, disparar un trigger cron o
+  recuperar una ejecución cuyo worker murió. Cualquier worker los reclama
+  (el ZREM decide el ganador) y reanuda la ejecución desde su checkpoint.
+
+Una espera larga ("recordatorio 24 h antes de la cita") no ocupa ningún
+worker mientras está pendiente: es solo un miembro del sorted set.
+"""
+
+from typing import Dict, Any, Optional, List
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone as dt_timezone
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from app.config.constants import REDIS_KEY_PATTERNS, REDIS_TTL
+from app.config.settings import app_config_overlay
+from app.services.redis_service import MOVE_DUE_LUA, ProcessRedisClient, resolve_redis_url
+
+logger = logging.getLogger(__name__)
+
+JOB_RESUME = "resume"    # vencimiento de un nodo WAIT
+JOB_RECOVER = "recover"  # lease de una ejecución en curso (el worker murió si vence)
+JOB_CRON = "cron"        # próxima ocurrencia de un trigger "schedule"
+
+# KEYS = checkpoint, timers, lock; ARGV = ttl, payload, trabajo de recuperación, vencimiento, lease.
+# Sin lock (ejecución abandonada o tomada por otro worker) no se re-agenda su recuperación
+SAVE_RUNNING_CHECKPOINT_LUA = """
+if redis.call('EXISTS', KEYS[3]) == 0 then
+    return 0
+end
+redis.call('SETEX', KEYS[1], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[3])
+redis.call('EXPIRE', KEYS[3], ARGV[5])
+return 1
+"""
+
+
+class CronExpression:
+    """
+    Expresión cron de 5 campos: minuto hora día-mes mes día-semana.
+
+    Soporta *, listas (1,15), rangos (1-5) y pasos (*/10, 8-18/2).
+    Día de semana 0-6 (0 o 7 = domingo). Si día-mes y día-semana están
+    ambos restringidos basta con que coincida uno (semántica estándar).
+    """
+
+    _FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+
+    def __init__(self, expression: str):
+        parts = (expression or "").split()
+        if len(parts) != 5:
+            raise ValueError(f"Invalid cron expression '{expression}': expected 5 fields")
+
+        try:
+            values = [
+                self._parse_field(part, low, high)
+                for part, (_, low, high) in zip(parts, self._FIELDS)
+            ]
+        except ValueError as e:
+            raise ValueError(f"Invalid cron expression '{expression}': {e}") from None
+
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = values
+        self.weekdays = frozenset(0 if day == 7 else day for day in weekdays)
+        self._day_restricted = parts[2] != "*"
+        self._weekday_restricted = parts[4] != "*"
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> frozenset:
+        values = set()
+        for item in field.split(","):
+            step = 1
+            if "/" in item:
+                item, step_text = item.split("/", 1)
+                step = int(step_text)
+                if step <= 0:
+                    raise ValueError(f"invalid step in '{field}'")
+
+            if item == "*":
+                start, end = low, high
+            elif "-" in item:
+                start, end = (int(value) for value in item.split("-", 1))
+            else:
+                start = int(item)
+                end = high if step != 1 else start  # "5/15" = desde 5 cada 15
+
+            if start < low or end > high or start > end:
+                raise ValueError(f"'{field}' out of range {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return frozenset(values)
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_match = moment.day in self.days
+        weekday_match = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._day_restricted and self._weekday_restricted:
+            return day_match or weekday_match
+        return day_match and weekday_match
+
+    def next_after(self, after: datetime) -> datetime:
+        """Primer minuto estrictamente posterior a `after` (naive, hora local)"""
+        candidate = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+
+        while candidate < limit:
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+    def next_timestamp(self, after: float, timezone: Optional[str] = None) -> float:
+        """Próxima ocurrencia (epoch) evaluando la expresión en `timezone` (UTC por defecto)"""
+        if timezone:
+            from zoneinfo import ZoneInfo
+            tz = ZoneInfo(timezone)
+        else:
+            tz = dt_timezone.utc
+        local = datetime.fromtimestamp(after, tz).replace(tzinfo=None)
+        return self.next_after(local).replace(tzinfo=tz).timestamp()
+
+
+class WorkflowScheduler(ProcessRedisClient):
+    """
+    Checkpoints + scheduler de timers en Redis (uno por worker).
+
+    - save_checkpoint()/load_checkpoint(): estado reanudable por ejecución.
+    - acquire_execution()/release_execution(): lock con lease para que una
+      ejecución avance en un solo worker a la vez.
+    - schedule()/claim_due()/ack(): sorted set de trabajos diferidos. Los
+      trabajos reclamados pasan a un sorted set "inflight" con lease; si el
+      worker muere antes del ack vuelven a la cola.
+    - start(): thread que hace polling y despacha los trabajos vencidos al
+      WorkflowRuntime del worker.
+    """
+
+    TIMERS_KEY = "workflow_scheduler:timers"      # ZSET job → vencimiento
+    INFLIGHT_KEY = "workflow_scheduler:inflight"  # ZSET job → fin del lease del worker que lo reclamó
+
+    def __init__(self, poll_interval: float = 1.0, execution_lease: int = 600,
+                 inline_wait_max_ms: int = 1000, checkpoint_ttl: int = None,
+                 batch_size: int = 50, retry_delay: float = 5.0):
+        self.poll_interval = poll_interval
+        self.execution_lease = execution_lease
+        self.inline_wait_max_ms = inline_wait_max_ms
+        self.checkpoint_ttl = checkpoint_ttl or REDIS_TTL["workflow_checkpoint"]
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+
+        self._redis_url = resolve_redis_url()
+        self._scripts: Dict[str, Any] = {}
+        self._scripts_client = None
+
+        self._app = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+        self._stats = {
+            "scheduled": 0,
+            "claimed": 0,
+            "resumed": 0,
+            "recovered": 0,
+            "cron_fired": 0,
+            "requeued": 0,
+            "errors": 0
+        }
+
+    def _script(self, source: str):
+        client = self.redis
+        if self._scripts_client is not client:
+            self._scripts = {}
+            self._scripts_client = client
+        if source not in self._scripts:
+            self._scripts[source] = client.register_script(source)
+        return self._scripts[source]
+
+    # === KEYS === #
+
+    @staticmethod
+    def _company_key(pattern: str, company_id: str, suffix: str) -> str:
+        from app.config.company_config import get_company_config
+        config = get_company_config(company_id)
+        company_prefix = config.redis_prefix if config else f"{company_id}:"
+        return REDIS_KEY_PATTERNS[pattern].format(company_prefix=company_prefix) + suffix
+
+    def _checkpoint_key(self, company_id: str, execution_id: str) -> str:
+        return self._company_key("workflow_checkpoint", company_id, execution_id)
+
+    def _lock_key(self, company_id: str, execution_id: str) -> str:
+        return self._company_key("workflow_execution_lock", company_id, execution_id)
+
+    @staticmethod
+    def _encode_job(job: Dict[str, Any]) -> str:
+        # Miembro determinista: el mismo trabajo nunca aparece dos veces en el ZSET
+        return json.dumps(job, sort_keys=True)
+
+    @staticmethod
+    def _recover_job(company_id: str, workflow_id: str, execution_id: str) -> Dict[str, Any]:
+        return {
+            "kind": JOB_RECOVER,
+            "company_id": company_id,
+            "workflow_id": workflow_id,
+            "execution_id": execution_id
+        }
+
+    # === CHECKPOINTS === #
+
+    def save_checkpoint(self, company_id: str, workflow_id: str, execution_id: str,
+                        payload: str, running: bool = True, resume_at: float = None):
+        """
+        Guardar el checkpoint serializado de una ejecución.
+
+        running=True: la ejecución sigue en este worker; se renueva su lock y
+        su trabajo de recuperación (vence si el worker muere).
+        running=False: la ejecución quedó suspendida (WAIT); se retira el
+        trabajo de recuperación y el TTL cubre la espera pendiente.
+        """
+        ttl = self.checkpoint_ttl + max(0, int((resume_at or 0) - time.time()))
+        recover_member = self._encode_job(self._recover_job(company_id, workflow_id, execution_id))
+
+        if running:
+            self._script(SAVE_RUNNING_CHECKPOINT_LUA)(
+                keys=[self._checkpoint_key(company_id, execution_id), self.TIMERS_KEY,
+                      self._lock_key(company_id, execution_id)],
+                args=[ttl, payload, recover_member, time.time() + self.execution_lease, self.execution_lease]
+            )
+            return
+
+        pipe = self.redis.pipeline()
+        pipe.setex(self._checkpoint_key(company_id, execution_id), ttl, payload)
+        pipe.zrem(self.TIMERS_KEY, recover_member)
+        pipe.execute()
+
+    def load_checkpoint(self, company_id: str, execution_id: str) -> Optional[Dict[str, Any]]:
+        raw = self.redis.get(self._checkpoint_key(company_id, execution_id))
+        return json.loads(raw) if raw else None
+
+    def delete_checkpoint(self, company_id: str, workflow_id: str, execution_id: str):
+        """Ejecución terminada: borrar checkpoint y trabajo de recuperación"""
+        recover_member = self._encode_job(self._recover_job(company_id, workflow_id, execution_id))
+        pipe = self.redis.pipeline()
+        pipe.delete(self._checkpoint_key(company_id, execution_id))
+        pipe.zrem(self.TIMERS_KEY, recover_member)
+        pipe.execute()
+
+    def abandon_execution(self, company_id: str, workflow_id: str, execution_id: str):
+        """
+        Ejecución abandonada por quien la esperaba (timeout de /execute): sin
+        checkpoint, trabajo de recuperación ni lock, el scheduler no la
+        vuelve a correr y los checkpoints tardíos de la tarea cancelada se
+        descartan.
+        """
+        recover_member = self._encode_job(self._recover_job(company_id, workflow_id, execution_id))
+        pipe = self.redis.pipeline()
+        pipe.delete(self._checkpoint_key(company_id, execution_id))
+        pipe.zrem(self.TIMERS_KEY, recover_member)
+        pipe.zrem(self.INFLIGHT_KEY, recover_member)
+        pipe.delete(self._lock_key(company_id, execution_id))
+        pipe.execute()
+
+    def acquire_execution(self, company_id: str, execution_id: str) -> Optional[str]:
+        """Lock con lease sobre la ejecución; retorna el token o None si otro worker la tiene"""
+        token = uuid.uuid4().hex
+        if self.redis.set(self._lock_key(company_id, execution_id), token, nx=True, ex=self.execution_lease):
+            return token
+        return None
+
+    def release_execution(self, company_id: str, execution_id: str, token: str):
+        key = self._lock_key(company_id, execution_id)
+        if self.redis.get(key) == token:
+            self.redis.delete(key)
+
+    # === TIMERS === #
+
+    def schedule(self, job: Dict[str, Any], run_at: float, only_if_new: bool = False) -> bool:
+        """Programar un trabajo (only_if_new: no mover uno ya programado)"""
+        added = self.redis.zadd(self.TIMERS_KEY, {self._encode_job(job): run_at}, nx=only_if_new)
+        self._stats["scheduled"] += 1
+        return bool(added)
+
+    def schedule_wait(self, company_id: str, workflow_id: str, execution_id: str,
+                      wait_key: str, resume_at: float):
+        """Programar la reanudación de un nodo WAIT"""
+        self.schedule({
+            "kind": JOB_RESUME,
+            "company_id": company_id,
+            "workflow_id": workflow_id,
+            "execution_id": execution_id,
+            "wait_key": wait_key
+        }, resume_at)
+
+    def claim_due(self, now: float = None) -> List[str]:
+        """Reclamar trabajos vencidos (solo un worker gana cada uno)"""
+        now = now or time.time()
+        claimed = list(self._script(MOVE_DUE_LUA)(
+            keys=[self.TIMERS_KEY, self.INFLIGHT_KEY],
+            args=[now, now + self.execution_lease, self.batch_size]
+        ))
+
+        self._stats["claimed"] += len(claimed)
+        return claimed
+
+    def ack(self, member: str):
+        self.redis.zrem(self.INFLIGHT_KEY, member)
+
+    def requeue_expired(self, now: float = None) -> int:
+        """Devolver a la cola trabajos reclamados por workers que murieron"""
+        now = now or time.time()
+        requeued = len(self._script(MOVE_DUE_LUA)(
+            keys=[self.INFLIGHT_KEY, self.TIMERS_KEY],
+            args=[now, now, self.batch_size]
+        ))
+
+        self._stats["requeued"] += requeued
+        return requeued
+
+    # === CRON TRIGGERS === #
+
+    @staticmethod
+    def _cron_job(workflow, trigger: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "kind": JOB_CRON,
+            "company_id": workflow.company_id,
+            "workflow_id": workflow.id,
+            "cron": trigger["cron"],
+            "timezone": trigger.get("timezone")
+        }
+
+    def sync_workflow_schedules(self, workflow) -> int:
+        """
+        Programar (si no existe ya) la próxima ocurrencia de cada trigger cron.
+        Los trabajos de crons eliminados se descartan al vencer.
+        """
+        if not workflow.enabled:
+            return 0
+
+        scheduled = 0
+        for trigger in workflow.triggers:
+            if trigger.get("type") != "schedule" or not trigger.get("cron"):
+                continue
+            try:
+                next_run = CronExpression(trigger["cron"]).next_timestamp(time.time(), trigger.get("timezone"))
+            except Exception as e:
+                logger.warning(f"[{workflow.company_id}] Workflow {workflow.id} has invalid schedule trigger: {e}")
+                continue
+
+            self.schedule(self._cron_job(workflow, trigger), next_run, only_if_new=True)
+            scheduled += 1
+
+        return scheduled
+
+    def sync_all_schedules(self) -> int:
+        """Programar los crons de todos los workflows (al arrancar el scheduler)"""
+        from app.config.company_config import get_company_manager
+        from app.workflows.workflow_registry import get_workflow_registry
+
+        registry = get_workflow_registry()
+        scheduled = 0
+        for company_id in get_company_manager().get_all_companies():
+            for workflow in registry.get_workflows_by_company(company_id):
+                scheduled += self.sync_workflow_schedules(workflow)
+
+        if scheduled:
+            logger.info(f"WorkflowScheduler synced {scheduled} schedule triggers")
+        return scheduled
+
+    # === POLLING === #
+
+    def start(self, app=None):
+        """Arrancar el thread de polling (uno por proceso, re-arranca tras fork)"""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+
+            self._app = app
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="workflow-scheduler", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+        logger.info(f"WorkflowScheduler started (pid={self._pid}, poll_interval={self.poll_interval}s)")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+
+    def _app_context(self):
+        return self._app.app_context() if self._app is not None else nullcontext()
+
+    def _run(self):
+        synced = False
+        while not self._stop_event.is_set():
+            try:
+                with self._app_context():
+                    if not synced:
+                        self.sync_all_schedules()
+                        synced = True
+                    self.poll_once()
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning(f"WorkflowScheduler poll error: {e}")
+
+            self._stop_event.wait(self.poll_interval)
+
+    def poll_once(self, now: float = None) -> int:
+        """Reclamar y despachar los trabajos vencidos. Retorna cuántos se reclamaron."""
+        self.requeue_expired(now)
+        claimed = self.claim_due(now)
+
+        for member in claimed:
+            try:
+                self._dispatch(member, json.loads(member))
+            except Exception as e:
+                # Queda en inflight: se reintenta cuando venza su lease
+                self._stats["errors"] += 1
+                logger.exception(f"WorkflowScheduler could not dispatch job {member}: {e}")
+
+        return len(claimed)
+
+    def _dispatch(self, member: str, job: Dict[str, Any]):
+        kind = job.get("kind")
+        if kind == JOB_CRON:
+            self._fire_cron(member, job)
+        elif kind in (JOB_RESUME, JOB_RECOVER):
+            self._resume(member, job)
+        else:
+            logger.warning(f"WorkflowScheduler dropping unknown job: {member}")
+            self.ack(member)
+
+    # === DISPATCH === #
+
+    def _build_executor(self, workflow):
+        from app.workflows.workflow_executor import WorkflowExecutor
+        from app.services.multi_agent_factory import get_orchestrator_for_company
+        from app.models.conversation import ConversationManager
+
+        orchestrator = get_orchestrator_for_company(workflow.company_id)
+        if not orchestrator:
+            raise RuntimeError(f"Orchestrator not available for company {workflow.company_id}")
+
+        return WorkflowExecutor(
+            workflow=workflow,
+            orchestrator=orchestrator,
+            conversation_manager=ConversationManager(),
+            scheduler=self
+        )
+
+    def _load_workflow(self, company_id: str, workflow_id: str):
+        from app.workflows.workflow_registry import get_workflow_registry
+
+        workflow = get_workflow_registry().get_workflow(workflow_id)
+        if not workflow or workflow.company_id != company_id:
+            return None
+        return workflow
+
+    def _resume(self, member: str, job: Dict[str, Any]):
+        """Reanudar una ejecución desde su checkpoint en el runtime de este worker"""
+        from app.workflows.workflow_runtime import get_workflow_runtime
+
+        company_id, workflow_id, execution_id = job["company_id"], job["workflow_id"], job["execution_id"]
+
+        checkpoint = self.load_checkpoint(company_id, execution_id)
+        workflow = self._load_workflow(company_id, workflow_id) if checkpoint else None
+        if checkpoint is None or workflow is None:
+            logger.warning(f"[{company_id}] Nothing to resume for execution {execution_id}, dropping job")
+            self.ack(member)
+            return
+
+        if job["kind"] == JOB_RESUME:
+            fired = checkpoint.setdefault("fired_waits", [])
+            if job["wait_key"] not in fired:
+                fired.append(job["wait_key"])
+            self._stats["resumed"] += 1
+        else:
+            logger.warning(f"[{company_id}] Recovering execution {execution_id} (worker lease expired)")
+            self._stats["recovered"] += 1
+
+        executor = self._build_executor(workflow)
+        get_workflow_runtime().submit(
+            self._run_resumed(member, job, executor, checkpoint),
+            workflow_key=f"{company_id}:{workflow_id}"
+        )
+
+    async def _run_resumed(self, member: str, job: Dict[str, Any], executor, checkpoint: Dict[str, Any]):
+        from app.workflows.workflow_runtime import get_workflow_runtime
+        from app.workflows.workflow_executor import ExecutionStatus
+
+        runtime = get_workflow_runtime()
+        try:
+            result = await executor.execute(
+                checkpoint["state"].get("context", {}),
+                execution_id=job["execution_id"],
+                checkpoint=checkpoint
+            )
+
+            if result.get("status") == ExecutionStatus.RUNNING.value:
+                # Otro worker tiene la ejecución: reintentar más tarde
+                await runtime.run_blocking(self.schedule, job, time.time() + self.retry_delay)
+            else:
+                await runtime.run_blocking(self._record_result, job["workflow_id"], result)
+        finally:
+            await runtime.run_blocking(self.ack, member)
+
+    def _record_result(self, workflow_id: str, result: Dict[str, Any]):
+        from app.workflows.workflow_registry import get_workflow_registry
+        from app.workflows.workflow_runtime import get_workflow_runtime
+
+        get_workflow_runtime().record_execution_status(result)
+        get_workflow_registry().record_execution(workflow_id, result)
+
+    def _fire_cron(self, member: str, job: Dict[str, Any]):
+        """Disparar un trigger cron y programar su siguiente ocurrencia"""
+        from app.workflows.workflow_registry import get_workflow_registry
+        from app.workflows.workflow_runtime import get_workflow_runtime, generate_execution_id
+
+        company_id, workflow_id = job["company_id"], job["workflow_id"]
+        workflow = self._load_workflow(company_id, workflow_id)
+
+        still_scheduled = workflow is not None and workflow.enabled and any(
+            trigger.get("type") == "schedule"
+            and trigger.get("cron") == job["cron"]
+            and trigger.get("timezone") == job.get("timezone")
+            for trigger in workflow.triggers
+        )
+        if not still_scheduled:
+            logger.info(f"[{company_id}] Dropping stale schedule trigger '{job['cron']}' for workflow {workflow_id}")
+            self.ack(member)
+            return
+
+        # La siguiente ocurrencia se programa antes de ejecutar: no se pierde si la ejecución falla
+        next_run = CronExpression(job["cron"]).next_timestamp(time.time(), job.get("timezone"))
+        self.schedule(job, next_run)
+
+        executor = self._build_executor(workflow)
+        execution_id = generate_execution_id(workflow_id)
+        context = {
+            "trigger": "schedule",
+            "cron": job["cron"],
+            "scheduled_at": datetime.utcnow().isoformat()
+        }
+
+        get_workflow_runtime().submit_background(
+            executor.execute(context, execution_id=execution_id),
+            company_id=company_id,
+            workflow_id=workflow_id,
+            on_complete=lambda result: get_workflow_registry().record_execution(workflow_id, result),
+            execution_id=execution_id
+        )
+        self._stats["cron_fired"] += 1
+        self.ack(member)
+
+        logger.info(f"[{company_id}] Schedule trigger fired for workflow {workflow_id}: {execution_id}")
+
+    # === STATS === #
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {
+            "running": self._pid == os.getpid() and bool(self._thread and self._thread.is_alive()),
+            "poll_interval": self.poll_interval,
+            "execution_lease": self.execution_lease,
+            **self._stats
+        }
+        try:
+            stats["pending_jobs"] = self.redis.zcard(self.TIMERS_KEY)
+            stats["inflight_jobs"] = self.redis.zcard(self.INFLIGHT_KEY)
+        except Exception as e:
+            stats["redis_error"] = str(e)
+        return stats
+
+
+# ============================================================================
+# SINGLETON POR WORKER
+# ============================================================================
+
+_workflow_scheduler: Optional[WorkflowScheduler] = None
+_workflow_scheduler_lock = threading.Lock()
+
+
+def get_workflow_scheduler() -> WorkflowScheduler:
+    """Obtener el scheduler del worker (lee la configuración de la app si existe)"""
+    global _workflow_scheduler
+
+    if _workflow_scheduler is None:
+        with _workflow_scheduler_lock:
+            if _workflow_scheduler is None:
+                config = _scheduler_config()
+                _workflow_scheduler = WorkflowScheduler(
+                    poll_interval=config["WORKFLOW_SCHEDULER_POLL_INTERVAL"],
+                    execution_lease=config["WORKFLOW_EXECUTION_LEASE"],
+                    inline_wait_max_ms=config["WORKFLOW_INLINE_WAIT_MAX_MS"]
+                )
+    return _workflow_scheduler
+
+
+def _scheduler_config() -> Dict[str, Any]:
+    defaults = {
+        "WORKFLOW_SCHEDULER_POLL_INTERVAL": float(os.getenv('WORKFLOW_SCHEDULER_POLL_INTERVAL', '1.0')),
+        "WORKFLOW_EXECUTION_LEASE": int(os.getenv('WORKFLOW_EXECUTION_LEASE', '600')),
+        "WORKFLOW_INLINE_WAIT_MAX_MS": int(os.getenv('WORKFLOW_INLINE_WAIT_MAX_MS', '1000'))
+    }
+    return app_config_overlay(defaults)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+BENCHMARK DE ARRANQUE - PRELOAD VS WORKERS INDEPENDIENTES
+=========================================================
+
+Arranca gunicorn (gunicorn.conf.py) con distintos números de workers, con y
+sin GUNICORN_PRELOAD, y mide:
+- Tiempo hasta que /api/health responde
+- Memoria exclusiva (USS) de cada worker y RSS total del árbol de procesos
+
+USO:
+    python benchmark_boot.py --workers 1 2 4 --settle 10
+
+Requiere las mismas variables de entorno que la app (REDIS_URL,
+OPENAI_API_KEY, ...). Cada arranque usa un puerto distinto.
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, Any, List
+
+import psutil
+import requests
+
+
+def _wait_for_health(port: int, timeout: float) -> float:
+    """Segundos hasta que /api/health responde 200 (o timeout)"""
+    start = time.time()
+    while time.time() - start < timeout:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/api/health", timeout=2).status_code == 200:
+                return time.time() - start
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"Health check not ready after {timeout}s")
+
+
+def _memory(master: psutil.Process) -> Dict[str, Any]:
+    workers = master.children(recursive=False)
+    worker_uss = [round(worker.memory_full_info().uss / (1024 * 1024), 1) for worker in workers]
+    total_rss = master.memory_info().rss + sum(worker.memory_info().rss for worker in workers)
+    return {
+        "master_uss_mb": round(master.memory_full_info().uss / (1024 * 1024), 1),
+        "worker_uss_mb": worker_uss,
+        "avg_worker_uss_mb": round(sum(worker_uss) / len(worker_uss), 1) if worker_uss else None,
+        "total_rss_mb": round(total_rss / (1024 * 1024), 1)
+    }
+
+
+def run_once(workers: int, preload: bool, port: int, settle: float, timeout: float) -> Dict[str, Any]:
+    env = dict(os.environ, GUNICORN_WORKERS=str(workers), GUNICORN_PRELOAD=str(preload).lower(), PORT=str(port))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        boot_seconds = _wait_for_health(port, timeout)
+        # Dejar que los warmups en background de cada worker terminen
+        time.sleep(settle)
+        result = {"workers": workers, "preload": preload, "boot_seconds": round(boot_seconds, 2)}
+        result.update(_memory(psutil.Process(process.pid)))
+        return result
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Boot time / per-worker USS benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--settle", type=float, default=10.0, help="segundos tras el health check antes de medir")
+    parser.add_argument("--timeout", type=float, default=180.0)
+    parser.add_argument("--base-port", type=int, default=18080)
+    parser.add_argument("--json", action="store_true", help="imprimir resultados en JSON")
+    args = parser.parse_args()
+
+    results: List[Dict[str, Any]] = []
+    port = args.base_port
+    for workers in args.workers:
+        for preload in (False, True):
+            results.append(run_once(workers, preload, port, args.settle, args.timeout))
+            port += 1
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'workers':>7} {'preload':>7} {'boot_s':>7} {'avg_worker_uss_mb':>18} {'total_rss_mb':>13}")
+    for result in results:
+        print(
+            f"{result['workers']:>7} {str(result['preload']):>7} {result['boot_seconds']:>7} "
+            f"{str(result['avg_worker_uss_mb']):>18} {result['total_rss_mb']:>13}"
+        )
+
+
+if __name__ == "__main__":
+    main()
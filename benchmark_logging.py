@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+BENCHMARK DE LOGGING - SOBRECARGA POR WEBHOOK
+=============================================
+
+Ejecuta el camino caliente de un webhook (búsqueda RAG de
+VectorstoreService.search_by_company + router y agente especialista vía
+AgentAdapter) con backends falsos, y mide el tiempo en el hilo de la
+request bajo tres configuraciones:
+
+- off:        logging deshabilitado (línea base)
+- legacy:     StreamHandler síncrono en texto a INFO, reproduciendo las
+              sentencias de log anteriores (f-strings, ~10 líneas por
+              búsqueda RAG más metadata por documento, 4 por agente)
+- structured: código actual con configure_logging() (cola async, JSON,
+              formateo perezoso, detalle por documento muestreado en DEBUG)
+
+La sobrecarga de logging por webhook es (modo - off). El sink simula un
+stdout lento (--sink-latency-us por write), como un pipe de Railway lleno.
+
+USO:
+    python benchmark_logging.py --webhooks 500 --sink-latency-us 50
+"""
+
+import argparse
+import json
+import logging
+import time
+from types import SimpleNamespace
+from typing import Dict, Any
+
+from app.utils.logging_config import configure_logging, flush_logging, log_context
+
+class SlowSink:
+    """Destino de logs que tarda latency_us por write y cuenta líneas"""
+
+    def __init__(self, latency_us: float):
+        self.latency = latency_us / 1e6
+        self.lines = 0
+
+    def write(self, data: str):
+        self.lines += data.count("\n")
+        if self.latency:
+            time.sleep(self.latency)
+
+    def flush(self):
+        pass
+
+
+class _FakeStore:
+    def similarity_search(self, query, k=3):
+        return [
+            SimpleNamespace(
+                page_content=f"## Tratamiento {i}\nBotox preventivo, sesión de 30 minutos, precio desde $350.000. " * 3,
+                metadata={"company_id": "benova", "treatment": f"tratamiento_{i}", "chunk": i, "source": "catalogo.md"}
+            )
+            for i in range(k)
+        ]
+
+
+class _FakeAgent:
+    company_config = SimpleNamespace(company_id="benova")
+
+    def invoke(self, inputs):
+        return "Claro, el botox preventivo tiene un valor desde $350.000. ¿Deseas agendar una cita?"
+
+
+def _webhook_path():
+    from app.services.vectorstore_service import VectorstoreService
+    from app.langgraph_adapters.agent_adapter import AgentAdapter
+
+    vectorstore = VectorstoreService.__new__(VectorstoreService)
+    vectorstore.company_id = "benova"
+    vectorstore.index_name = "benova_documents"
+    vectorstore.vectorstore = _FakeStore()
+
+    router = AgentAdapter(_FakeAgent(), "router")
+    sales = AgentAdapter(_FakeAgent(), "sales")
+
+    def run(question: str):
+        with log_context(request_id="bench", company_id="benova"):
+            router.invoke({"question": question, "chat_history": []})
+            docs = vectorstore.search_by_company(question, k=3)
+            sales.invoke({"question": question, "chat_history": [], "context": docs})
+
+    return run
+
+
+def _legacy_webhook_path():
+    """Mismo trabajo con las sentencias de log previas (INFO, f-strings)"""
+    rag_logger = logging.getLogger("app.services.vectorstore_service")
+    adapter_logger = logging.getLogger("app.langgraph_adapters.agent_adapter")
+    store, agent = _FakeStore(), _FakeAgent()
+    company_id, index_name = "benova", "benova_documents"
+
+    def agent_call(agent_name: str, inputs: Dict[str, Any]):
+        start = time.time()
+        question = inputs.get("question", "")
+        adapter_logger.info(f"🤖 [{company_id}] {agent_name}.invoke() started")
+        adapter_logger.info(f"   → Question: {question[:100]}...")
+        adapter_logger.info(f"   → Has history: {bool(inputs.get('chat_history'))}")
+        adapter_logger.info(f"   → Has context: {bool(inputs.get('context'))}")
+        output = agent.invoke(inputs)
+        duration_ms = (time.time() - start) * 1000
+        adapter_logger.info(f"✅ [{company_id}] {agent_name} completed successfully")
+        adapter_logger.info(f"   → Duration: {duration_ms:.2f}ms")
+        adapter_logger.info(f"   → Output length: {len(output)} chars")
+        adapter_logger.info(f"   → Average duration: {duration_ms:.2f}ms")
+
+    def search(query: str, k: int = 3):
+        rag_logger.info(f"🔍 [{company_id}] RAG SEARCH START:")
+        rag_logger.info(f"   → Query: {query[:100]}...")
+        rag_logger.info(f"   → Requested documents: {k}")
+        rag_logger.info(f"   → Target company: {company_id}")
+        rag_logger.info(f"   → Current company: {company_id}")
+        rag_logger.info("   → Executing similarity search...")
+        docs = store.similarity_search(query, k=k)
+        rag_logger.info(f"   → Initial documents retrieved: {len(docs)}")
+        filtered_docs = [doc for doc in docs if doc.metadata.get('company_id', company_id) == company_id]
+        rag_logger.info(f"📄 [{company_id}] RAG RESULTS:")
+        rag_logger.info(f"   → Documents found after filtering: {len(filtered_docs)}")
+        for i, doc in enumerate(filtered_docs):
+            doc_preview = doc.page_content[:100].replace('\n', ' ')
+            rag_logger.info(f"   → Doc {i+1}: {doc_preview}...")
+            rag_logger.info(f"      Metadata: {doc.metadata}")
+        rag_logger.info(f"✅ [{company_id}] RAG search completed successfully")
+        rag_logger.info(f"Found {len(filtered_docs)} documents for company {company_id} (index {index_name})")
+        return filtered_docs
+
+    def run(question: str):
+        agent_call("router", {"question": question, "chat_history": []})
+        docs = search(question, k=3)
+        agent_call("sales", {"question": question, "chat_history": [], "context": docs})
+
+    return run
+
+
+def _configure(mode: str, sink: SlowSink):
+    root = logging.getLogger()
+    logging.disable(logging.NOTSET)
+
+    if mode == "off":
+        logging.disable(logging.CRITICAL)
+    elif mode == "legacy":
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] [%(name)s] %(message)s"))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+    else:
+        configure_logging(SimpleNamespace(config={"LOG_FORMAT": "json", "LOG_ASYNC": True}), stream=sink)
+
+
+def run_mode(mode: str, webhooks: int, latency_us: float) -> Dict[str, Any]:
+    sink = SlowSink(latency_us)
+    _configure(mode, sink)
+    run = _legacy_webhook_path() if mode == "legacy" else _webhook_path()
+
+    for _ in range(20):
+        run("¿Cuánto cuesta el botox?")
+    flush_logging()
+    sink.lines = 0
+
+    start = time.perf_counter()
+    for _ in range(webhooks):
+        run("¿Cuánto cuesta el botox?")
+    elapsed = time.perf_counter() - start
+    flush_logging()
+
+    return {
+        "mode": mode,
+        "us_per_webhook": round(elapsed / webhooks * 1e6, 1),
+        "lines_per_webhook": round(sink.lines / webhooks, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Logging overhead per webhook")
+    parser.add_argument("--webhooks", type=int, default=500)
+    parser.add_argument("--sink-latency-us", type=float, default=50.0, help="latencia simulada de stdout por write")
+    parser.add_argument("--json", action="store_true", help="imprimir resultados en JSON")
+    args = parser.parse_args()
+
+    results = [run_mode(mode, args.webhooks, args.sink_latency_us) for mode in ("off", "legacy", "structured")]
+    baseline = results[0]["us_per_webhook"]
+    for result in results:
+        result["logging_overhead_us"] = round(result["us_per_webhook"] - baseline, 1)
+
+    logging.disable(logging.NOTSET)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':>10} {'us/webhook':>11} {'overhead_us':>12} {'lines':>6}")
+    for result in results:
+        print(
+            f"{result['mode']:>10} {result['us_per_webhook']:>11} "
+            f"{result['logging_overhead_us']:>12} {result['lines_per_webhook']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
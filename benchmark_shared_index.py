@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+BENCHMARK DE ÍNDICE COMPARTIDO - ÍNDICE POR EMPRESA VS TAG company_id
+=====================================================================
+
+Con N empresas pequeñas (--chunks-per-tenant chunks cada una) compara:
+
+- dedicated: un índice RediSearch por empresa (modo actual)
+- shared:    un único índice con TAG company_id; cada consulta KNN se
+             pre-filtra por empresa en RediSearch ((@company_id:{x})=>[KNN ...])
+
+y mide para 10, 100 y 1000 empresas:
+- Tiempo de creación de schemas e índices (FT.CREATE)
+- Memoria total (used_memory) y por empresa
+- Latencia de consulta KNN filtrada (p50/p95, ms)
+- recall@k contra la búsqueda exacta dentro de la empresa
+
+Los vectores son sintéticos (benchmark_vectorstore.synthetic_corpus) y se
+guardan con la forma de --settings.
+
+USO:
+    python benchmark_shared_index.py --tenants 10 100 1000 --chunks-per-tenant 50
+
+Requiere REDIS_URL apuntando a un Redis Stack desechable (crea y borra
+índices bench_*) y numpy.
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Dict, Any, List
+
+import numpy as np
+import redis
+
+from app.services.vector_index import VectorSettings, EMBEDDING_FIELD, TENANT_FIELD, convert_vector, encode_vector
+from benchmark_vectorstore import parse_settings, synthetic_corpus, _create_index, _wait_indexed
+
+
+def _drop(client, name: str):
+    try:
+        client.execute_command("FT.DROPINDEX", name, "DD")
+    except redis.ResponseError:
+        pass
+
+
+def _tenant_truth(corpus: np.ndarray, query_vectors: np.ndarray, query_tenants: List[int],
+                  chunks_per_tenant: int, k: int) -> List[set]:
+    truth = []
+    for query_vector, tenant in zip(query_vectors, query_tenants):
+        start = tenant * chunks_per_tenant
+        scores = corpus[start:start + chunks_per_tenant] @ query_vector
+        truth.append({start + int(i) for i in np.argsort(-scores)[:k]})
+    return truth
+
+
+def run_mode(client, mode: str, tenants: int, settings: VectorSettings, corpus: np.ndarray,
+             query_vectors: np.ndarray, query_tenants: List[int], truth: List[set],
+             chunks_per_tenant: int, k: int) -> Dict[str, Any]:
+    shared = mode == "shared"
+    names = ["bench_shared"] if shared else [f"bench_t{tenant}" for tenant in range(tenants)]
+    for name in names:
+        _drop(client, name)
+
+    memory_before = client.info("memory")["used_memory"]
+    start = time.perf_counter()
+    for name in names:
+        _create_index(client, name, settings, tenant_tag=shared)
+    create_ms = (time.perf_counter() - start) * 1000
+
+    source = VectorSettings()
+    pipe = client.pipeline(transaction=False)
+    for i, vector in enumerate(corpus):
+        tenant = i // chunks_per_tenant
+        blob = convert_vector(encode_vector(vector, "float32"), source, settings)
+        if shared:
+            pipe.hset(f"bench_shared:t{tenant}:{i}", mapping={EMBEDDING_FIELD: blob, TENANT_FIELD: f"t{tenant}"})
+        else:
+            pipe.hset(f"bench_t{tenant}:{i}", EMBEDDING_FIELD, blob)
+        if i % 1000 == 999:
+            pipe.execute()
+    pipe.execute()
+    for name in names:
+        _wait_indexed(client, name)
+    memory_mb = (client.info("memory")["used_memory"] - memory_before) / 1024 / 1024
+
+    latencies, hits = [], 0
+    for query_vector, tenant, expected in zip(query_vectors, query_tenants, truth):
+        blob = convert_vector(encode_vector(query_vector, "float32"), source, settings)
+        if shared:
+            name, query = "bench_shared", f"(@{TENANT_FIELD}:{{t{tenant}}})=>[KNN {k} @{EMBEDDING_FIELD} $vec AS score]"
+        else:
+            name, query = f"bench_t{tenant}", f"*=>[KNN {k} @{EMBEDDING_FIELD} $vec AS score]"
+        start = time.perf_counter()
+        result = client.execute_command(
+            "FT.SEARCH", name, query, "PARAMS", 2, "vec", blob,
+            "RETURN", 1, "score", "SORTBY", "score", "LIMIT", 0, k, "DIALECT", 2
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        found = {int(key.decode().rsplit(":", 1)[1]) for key in result[1::2]}
+        hits += len(found & expected)
+
+    for name in names:
+        _drop(client, name)
+
+    return {
+        "mode": mode,
+        "tenants": tenants,
+        "indexes": len(names),
+        "create_ms": round(create_ms, 1),
+        "memory_mb": round(memory_mb, 2),
+        "memory_kb_per_tenant": round(memory_mb * 1024 / tenants, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        f"recall@{k}": round(hits / (len(truth) * k), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dedicated vs shared vector index at increasing tenant counts")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379"))
+    parser.add_argument("--tenants", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--chunks-per-tenant", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--settings", default="1536:float32:flat", help="dimensions:dtype:algorithm")
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef-runtime", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="imprimir resultados en JSON")
+    args = parser.parse_args()
+
+    client = redis.from_url(args.redis_url)
+    settings = parse_settings(args.settings, args.m, args.ef_construction, args.ef_runtime)
+    rng = np.random.default_rng(11)
+
+    results = []
+    for tenants in args.tenants:
+        corpus, _ = synthetic_corpus(tenants * args.chunks_per_tenant, 1)
+        picks = rng.integers(0, len(corpus), args.queries)
+        noise = rng.standard_normal((args.queries, corpus.shape[1])).astype(np.float32) * 0.02
+        query_vectors = corpus[picks] + noise
+        query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+        query_tenants = [int(pick) // args.chunks_per_tenant for pick in picks]
+        truth = _tenant_truth(corpus, query_vectors, query_tenants, args.chunks_per_tenant, args.k)
+
+        for mode in ("dedicated", "shared"):
+            results.append(run_mode(client, mode, tenants, settings, corpus, query_vectors,
+                                    query_tenants, truth, args.chunks_per_tenant, args.k))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    recall = f"recall@{args.k}"
+    print(f"{'mode':>10} {'tenants':>8} {'indexes':>8} {'create ms':>10} {'memory MB':>10} "
+          f"{'KB/tenant':>10} {'p50 ms':>7} {'p95 ms':>7} {recall:>9}")
+    for result in results:
+        print(
+            f"{result['mode']:>10} {result['tenants']:>8} {result['indexes']:>8} {result['create_ms']:>10} "
+            f"{result['memory_mb']:>10} {result['memory_kb_per_tenant']:>10} {result['p50_ms']:>7} "
+            f"{result['p95_ms']:>7} {result[recall]:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+BENCHMARK DE ALMACENAMIENTO VECTORIAL - DIMENSIONES, FLOAT16, FLAT VS HNSW
+==========================================================================
+
+Carga el mismo corpus en un índice de Redis Stack por cada VectorSettings
+(app/services/vector_index.py) y mide:
+- Memoria por 10k chunks: vector_index_sz_mb de FT.INFO y used_memory total
+  (hashes + índice) normalizados a 10.000 documentos
+- Latencia de consulta KNN (p50/p95, ms) vista desde el cliente
+- recall@k contra la búsqueda exacta con los vectores 1536 float32 originales
+
+Los vectores se reducen como en el re-index (convert_vector: truncar,
+renormalizar y convertir). Por defecto son sintéticos con espectro
+decreciente, como los embeddings Matryoshka de text-embedding-3-*; con
+--texts se embeben las líneas de un archivo con OpenAI (EMBEDDING_MODEL)
+y las consultas son las primeras --queries líneas.
+
+USO:
+    python benchmark_vectorstore.py --chunks 10000 --queries 200 --k 5
+    python benchmark_vectorstore.py --texts catalogo.txt --settings 1536:float32:flat 768:float16:hnsw
+
+Requiere REDIS_URL apuntando a un Redis Stack desechable (crea y borra
+índices bench_*) y numpy.
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Dict, Any, List
+
+import numpy as np
+import redis
+
+from app.services.vector_index import VectorSettings, EMBEDDING_FIELD, TENANT_FIELD, convert_vector, encode_vector
+
+DEFAULT_SETTINGS = [
+    "1536:float32:flat",
+    "1536:float16:flat",
+    "768:float32:flat",
+    "768:float16:flat",
+    "768:float16:hnsw",
+    "512:float16:hnsw",
+]
+
+
+def parse_settings(spec: str, m: int, ef_construction: int, ef_runtime: int) -> VectorSettings:
+    dimensions, dtype, algorithm = spec.split(":")
+    return VectorSettings(int(dimensions), dtype, algorithm, m, ef_construction, ef_runtime)
+
+
+def synthetic_corpus(chunks: int, queries: int, seed: int = 7):
+    """Vectores con varianza decreciente por dimensión; consultas = chunks con ruido"""
+    rng = np.random.default_rng(seed)
+    scale = (1.0 + np.arange(1536) / 64.0) ** -0.75
+    corpus = rng.standard_normal((chunks, 1536)).astype(np.float32) * scale
+    picks = rng.integers(0, chunks, queries)
+    query_vectors = corpus[picks] + rng.standard_normal((queries, 1536)).astype(np.float32) * scale * 0.8
+    return _normalize(corpus), _normalize(query_vectors)
+
+
+def openai_corpus(path: str, queries: int):
+    from langchain_openai import OpenAIEmbeddings
+
+    with open(path, encoding="utf-8") as f:
+        texts = [line.strip() for line in f if line.strip()]
+    embeddings = OpenAIEmbeddings(model=os.getenv("EMBEDDING_MODEL", "text-embedding-3-small"))
+    corpus = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+    query_vectors = np.array(embeddings.embed_documents(texts[:queries]), dtype=np.float32)
+    return _normalize(corpus), _normalize(query_vectors)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_top_k(corpus: np.ndarray, query_vectors: np.ndarray, k: int) -> List[set]:
+    scores = query_vectors @ corpus.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def _create_index(client, name: str, settings: VectorSettings, tenant_tag: bool = False):
+    """FT.CREATE sobre {name}:*; tenant_tag agrega el TAG company_id del índice compartido"""
+    attrs = {
+        "TYPE": settings.dtype.upper(),
+        "DIM": settings.dimensions,
+        "DISTANCE_METRIC": settings.distance_metric.upper(),
+    }
+    if settings.algorithm == "hnsw":
+        attrs.update(M=settings.m, EF_CONSTRUCTION=settings.ef_construction, EF_RUNTIME=settings.ef_runtime)
+    args = [item for pair in attrs.items() for item in pair]
+    client.execute_command(
+        "FT.CREATE", name, "ON", "HASH", "PREFIX", 1, f"{name}:",
+        "SCHEMA", EMBEDDING_FIELD, "VECTOR", settings.algorithm.upper(), len(args), *args,
+        *((TENANT_FIELD, "TAG") if tenant_tag else ())
+    )
+
+
+def _index_info(client, name: str) -> Dict[str, Any]:
+    raw = client.execute_command("FT.INFO", name)
+    return {
+        (raw[i].decode() if isinstance(raw[i], bytes) else raw[i]): raw[i + 1]
+        for i in range(0, len(raw) - 1, 2)
+    }
+
+
+def _wait_indexed(client, name: str, timeout: float = 600.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if not int(_index_info(client, name).get("indexing", 0)):
+            return
+        time.sleep(0.2)
+
+
+def run_setting(client, settings: VectorSettings, corpus: np.ndarray, query_vectors: np.ndarray,
+                truth: List[set], k: int) -> Dict[str, Any]:
+    name = f"bench_{settings.dimensions}_{settings.dtype}_{settings.algorithm}"
+    source = VectorSettings()
+    try:
+        client.execute_command("FT.DROPINDEX", name, "DD")
+    except redis.ResponseError:
+        pass
+
+    memory_before = client.info("memory")["used_memory"]
+    _create_index(client, name, settings)
+
+    pipe = client.pipeline(transaction=False)
+    for i, vector in enumerate(corpus):
+        pipe.hset(f"{name}:{i}", EMBEDDING_FIELD, convert_vector(encode_vector(vector, "float32"), source, settings))
+        if i % 1000 == 999:
+            pipe.execute()
+    pipe.execute()
+    _wait_indexed(client, name)
+
+    info = _index_info(client, name)
+    memory_after = client.info("memory")["used_memory"]
+    per_10k = 10000 / len(corpus)
+
+    latencies, hits = [], 0
+    query = f"*=>[KNN {k} @{EMBEDDING_FIELD} $vec AS score]"
+    for query_vector, expected in zip(query_vectors, truth):
+        blob = convert_vector(encode_vector(query_vector, "float32"), source, settings)
+        start = time.perf_counter()
+        result = client.execute_command(
+            "FT.SEARCH", name, query, "PARAMS", 2, "vec", blob,
+            "RETURN", 1, "score", "SORTBY", "score", "LIMIT", 0, k, "DIALECT", 2
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        found = {int(key.decode().rsplit(":", 1)[1]) for key in result[1::2]}
+        hits += len(found & expected)
+
+    client.execute_command("FT.DROPINDEX", name, "DD")
+
+    return {
+        "settings": f"{settings.dimensions}:{settings.dtype}:{settings.algorithm}",
+        "bytes_per_vector": settings.bytes_per_vector,
+        "vector_index_mb_per_10k": round(float(info.get("vector_index_sz_mb", 0)) * per_10k, 2),
+        "used_memory_mb_per_10k": round((memory_after - memory_before) / 1024 / 1024 * per_10k, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        f"recall@{k}": round(hits / (len(truth) * k), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector storage memory, latency and recall per setting")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379"))
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--settings", nargs="+", default=DEFAULT_SETTINGS, help="dimensions:dtype:algorithm")
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef-runtime", type=int, default=10)
+    parser.add_argument("--texts", help="archivo con un chunk por línea (embeddings reales de OpenAI)")
+    parser.add_argument("--json", action="store_true", help="imprimir resultados en JSON")
+    args = parser.parse_args()
+
+    client = redis.from_url(args.redis_url)
+    if args.texts:
+        corpus, query_vectors = openai_corpus(args.texts, args.queries)
+    else:
+        corpus, query_vectors = synthetic_corpus(args.chunks, args.queries)
+    truth = exact_top_k(corpus, query_vectors, args.k)
+
+    results = [
+        run_setting(client, parse_settings(spec, args.m, args.ef_construction, args.ef_runtime),
+                    corpus, query_vectors, truth, args.k)
+        for spec in args.settings
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    recall = f"recall@{args.k}"
+    print(f"{'settings':>20} {'B/vector':>9} {'index MB/10k':>13} {'memory MB/10k':>14} {'p50 ms':>7} {'p95 ms':>7} {recall:>9}")
+    for result in results:
+        print(
+            f"{result['settings']:>20} {result['bytes_per_vector']:>9} {result['vector_index_mb_per_10k']:>13} "
+            f"{result['used_memory_mb_per_10k']:>14} {result['p50_ms']:>7} {result['p95_ms']:>7} {result[recall]:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
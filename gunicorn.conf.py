@@ -0,0 +1,57 @@
+"""
+Configuración de Gunicorn
+
+GUNICORN_PRELOAD=true activa el modo preload-and-fork:
+- El master importa la app (LangChain/LangGraph incluidos), valida OpenAI y
+  Redis una sola vez y construye el estado inmutable por empresa
+  (app.preload_shared_state) antes de crear los workers.
+- Cada worker nace por fork y comparte ese estado copy-on-write; en
+  post_fork descarta los clientes heredados y arranca sus propios threads
+  (app.reinitialize_after_fork).
+- Reemplazar un worker (max_requests) es un fork, no un arranque completo.
+
+Sin GUNICORN_PRELOAD cada worker importa y construye todo por su cuenta.
+"""
+
+import os
+import time
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv('GUNICORN_WORKERS', os.getenv('WEB_CONCURRENCY', '2')))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+keepalive = 2
+max_requests = 1000
+max_requests_jitter = 100
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'false').lower() == 'true'
+
+_boot_started = time.time()
+
+
+def _unique_rss_mb(pid: int):
+    """Memoria exclusiva del proceso (USS): lo que no comparte con el master"""
+    try:
+        import psutil
+        return round(psutil.Process(pid).memory_full_info().uss / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+
+def when_ready(server):
+    server.log.info(
+        f"Boot completed in {time.time() - _boot_started:.2f}s "
+        f"(workers={workers}, preload={preload_app}, master_uss_mb={_unique_rss_mb(os.getpid())})"
+    )
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app import reinitialize_after_fork
+        reinitialize_after_fork(server.app.wsgi())
+
+
+def post_worker_init(worker):
+    worker.log.info(
+        f"Worker {worker.pid} ready {time.time() - _boot_started:.2f}s after boot "
+        f"(uss_mb={_unique_rss_mb(worker.pid)}, preload={preload_app})"
+    )
@@ -50,7 +50,8 @@ class TestToolsIntegration:
             mock_get_redis.return_value = redis_mock
             orch = CompensationOrchestrator(
                 company_id="test_company",
-                audit_manager=audit_manager
+                audit_manager=audit_manager,
+                max_retries=1  # no deferred retries: compensate within the same call
             )
             orch.redis = redis_mock
             return orch
@@ -401,7 +402,8 @@ class TestEndToEndScenarios:
 
                 compensation_orchestrator = CompensationOrchestrator(
                     company_id="benova",
-                    audit_manager=audit_manager
+                    audit_manager=audit_manager,
+                    max_retries=1
                 )
                 compensation_orchestrator.redis = redis_mock
 
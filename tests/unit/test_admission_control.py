@@ -0,0 +1,319 @@
+"""
+Unit tests for per-tenant admission control
+
+Redis token buckets per company and resource, deferral of over-limit
+webhooks with a single holding reply per conversation, and weighted
+round-robin dispatch of the deferred queues.
+"""
+
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.services import admission_control
+from app.services.admission_control import (
+    AdmissionDispatcher,
+    RateLimit,
+    TenantLimiter,
+    TenantRateLimited,
+    BUSY_REPLY,
+    HOLDING_REPLY
+)
+
+
+class _FakeRedis:
+    """Dict-backed Redis with lists, sets, sorted sets and Python versions of the scripts"""
+
+    def __init__(self):
+        self.data = {}
+        self.hashes = {}
+        self.lists = {}
+        self.sets = {}
+        self.zsets = {}
+
+    def register_script(self, source):
+        if "LPOP" in source:
+            def claim(keys, args):
+                raw = self.lpop(keys[0])
+                if raw is not None:
+                    self.zadd(keys[1], {raw: float(args[0])})
+                return raw
+            return claim
+
+        if "ZRANGEBYSCORE" in source:
+            def requeue(keys, args):
+                expired = [raw for raw, score in self.zsets.get(keys[0], {}).items() if score <= float(args[0])]
+                for raw in expired[:int(args[1])]:
+                    self.zrem(keys[0], raw)
+                    self.lpush(keys[1], raw)
+                return len(expired[:int(args[1])])
+            return requeue
+
+        def bucket(keys, args):
+            rate, capacity, now, cost = (float(arg) for arg in args)
+            state = self.hashes.setdefault(keys[0], {})
+            tokens = float(state.get("tokens", capacity))
+            tokens = min(capacity, tokens + max(0.0, now - float(state.get("ts", now))) * rate)
+            allowed, retry_after = 0, 0.0
+            if tokens >= cost:
+                tokens, allowed = tokens - cost, 1
+            else:
+                retry_after = (cost - tokens) / rate
+            state.update(tokens=tokens, ts=now)
+            return [allowed, str(tokens), str(retry_after)]
+        return bucket
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def hincrby(self, key, field, amount=1):
+        state = self.hashes.setdefault(key, {})
+        state[field] = int(state.get(field, 0)) + amount
+        return state[field]
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(values)
+        return len(self.lists[key])
+
+    def lpush(self, key, *values):
+        for value in values:
+            self.lists.setdefault(key, []).insert(0, value)
+        return len(self.lists[key])
+
+    def lpop(self, key):
+        items = self.lists.get(key)
+        return items.pop(0) if items else None
+
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zrem(self, key, *members):
+        for member in members:
+            self.zsets.get(key, {}).pop(member, None)
+
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(members)
+
+    def srem(self, key, *members):
+        self.sets.get(key, set()).difference_update(members)
+
+    def smembers(self, key):
+        return set(self.sets.get(key, set()))
+
+    def pipeline(self, transaction=False):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((getattr(self.redis, name), args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+COMPANY_LIMITS = {
+    "flood": {"weight": 2, "webhook": {"per_minute": 60, "burst": 2}},
+    "quiet": {},
+}
+
+
+@pytest.fixture(autouse=True)
+def companies():
+    with patch.object(admission_control, "get_company_redis_prefix", lambda company_id: f"{company_id}:"), \
+            patch.object(admission_control, "_company_rate_limits", lambda company_id: COMPANY_LIMITS.get(company_id, {})):
+        yield
+
+
+@pytest.fixture
+def redis_client():
+    return _FakeRedis()
+
+
+@pytest.fixture
+def limiter(redis_client):
+    defaults = {
+        "webhook": RateLimit(per_minute=120, burst=30),
+        "llm_tokens": RateLimit(per_minute=6000, burst=1500),
+    }
+    return TenantLimiter(defaults, max_wait=0.05, redis_client=redis_client)
+
+
+class TestTenantLimiter:
+    """Test suite for the Redis token buckets"""
+
+    def test_burst_then_throttle_then_refill(self, limiter):
+        """Test the bucket admits its burst, throttles and refills over time"""
+        results = [limiter.acquire("flood", "webhook", now=100.0) for _ in range(3)]
+
+        assert [decision.allowed for decision in results] == [True, True, False]
+        assert results[-1].retry_after == pytest.approx(1.0)
+        assert limiter.acquire("flood", "webhook", now=101.0).allowed
+
+    def test_company_overrides_and_weight(self, limiter):
+        """Test rate_limits overrides defaults and sets the dispatch weight"""
+        assert limiter.get_limit("flood", "webhook") == RateLimit(60, 2)
+        assert limiter.get_limit("quiet", "webhook") == RateLimit(120, 30)
+        assert limiter.get_weight("flood") == 2
+        assert limiter.get_weight("quiet") == 1
+
+    def test_tenants_do_not_share_buckets(self, limiter):
+        """Test one tenant exhausting its bucket leaves others untouched"""
+        for _ in range(3):
+            limiter.acquire("flood", "webhook", now=100.0)
+
+        assert limiter.acquire("quiet", "webhook", now=100.0).allowed
+        assert limiter.get_stats("flood")["events"] == {"webhook:throttled": 1}
+
+    def test_throttle_raises_when_wait_exceeds_budget(self, limiter):
+        """Test dependencies give up with TenantRateLimited instead of queueing forever"""
+        limiter.throttle("quiet", "llm_tokens", cost=1500)
+
+        with pytest.raises(TenantRateLimited) as error:
+            limiter.throttle("quiet", "llm_tokens", cost=1500)
+        assert error.value.resource == "llm_tokens"
+
+    def test_fails_open_when_redis_is_down(self, limiter, redis_client):
+        """Test a Redis failure admits traffic"""
+        redis_client.register_script = lambda source: (_ for _ in ()).throw(ConnectionError("down"))
+
+        assert limiter.acquire("quiet", "webhook").allowed
+        assert limiter.get_stats()["worker"]["quiet"]["webhook:errors"] == 1
+
+
+class TestAdmissionDispatcher:
+    """Test suite for deferral, holding replies and weighted dispatch"""
+
+    def _dispatcher(self, limiter, redis_client, **kwargs):
+        self.processed, self.replies = [], []
+        return AdmissionDispatcher(
+            limiter,
+            redis_client=redis_client,
+            handler=lambda company_id, data: self.processed.append((company_id, data["id"])),
+            reply=lambda company_id, conversation_id, text: self.replies.append((conversation_id, text)) or True,
+            **kwargs
+        )
+
+    @staticmethod
+    def _message(message_id, conversation_id=7):
+        return {"id": message_id, "message_type": "incoming", "conversation": {"id": conversation_id, "status": "open"}}
+
+    def test_over_limit_messages_are_deferred_in_order(self, limiter, redis_client):
+        """Test over-limit messages queue behind each other with one holding reply"""
+        dispatcher = self._dispatcher(limiter, redis_client)
+
+        results = [dispatcher.admit("flood", self._message(i)) for i in range(4)]
+
+        assert results[0] is None and results[1] is None
+        assert [result["status"] for result in results[2:]] == ["deferred", "deferred"]
+        assert results[3]["queue_depth"] == 2
+        assert self.replies == [(7, HOLDING_REPLY)]
+        assert dispatcher.get_stats("flood")["queue_depth"] == {"flood": 2}
+
+    def test_full_queue_rejects_with_busy_reply(self, limiter, redis_client):
+        """Test the deferred queue is bounded"""
+        dispatcher = self._dispatcher(limiter, redis_client, max_deferred=1)
+        for i in range(3):
+            dispatcher.admit("flood", self._message(i))
+
+        result = dispatcher.admit("flood", self._message(3, conversation_id=8))
+
+        assert result["status"] == "throttled"
+        assert (8, BUSY_REPLY) in self.replies
+        assert redis_client.hgetall("flood:admission_stats")["webhook:rejected"] == 1
+
+    def test_weighted_round_robin_across_tenants(self, limiter, redis_client):
+        """Test each round dispatches up to `weight` messages per tenant"""
+        dispatcher = self._dispatcher(limiter, redis_client, concurrency=10)
+        limiter.defaults["webhook"] = RateLimit(per_minute=0, burst=0)
+        COMPANY_LIMITS["flood"]["webhook"] = {"per_minute": 0}
+        try:
+            for company_id in ("flood", "quiet"):
+                for i in range(3):
+                    redis_client.rpush(dispatcher.deferred_key(company_id), f'{{"data": {{"id": {i}}}, "deferred_at": 0}}')
+                redis_client.sadd(dispatcher.ACTIVE_KEY, company_id)
+
+            assert dispatcher.dispatch_once() == 3
+            assert self.processed == [("flood", 0), ("flood", 1), ("quiet", 0)]
+
+            while dispatcher.dispatch_once():
+                pass
+            assert len(self.processed) == 6
+            assert redis_client.smembers(dispatcher.ACTIVE_KEY) == set()
+        finally:
+            COMPANY_LIMITS["flood"]["webhook"] = {"per_minute": 60, "burst": 2}
+
+    def test_failed_message_is_requeued(self, limiter, redis_client):
+        """Test a handler failure puts the message back for another attempt"""
+        dispatcher = AdmissionDispatcher(
+            limiter, redis_client=redis_client,
+            handler=lambda company_id, data: (_ for _ in ()).throw(RuntimeError("warming up")),
+            reply=lambda *args: True
+        )
+        redis_client.rpush(dispatcher.deferred_key("quiet"), '{"data": {"id": 1}, "deferred_at": 0}')
+        redis_client.sadd(dispatcher.ACTIVE_KEY, "quiet")
+
+        dispatcher.dispatch_once()
+
+        assert redis_client.llen(dispatcher.deferred_key("quiet")) == 1
+        assert '"attempts": 1' in redis_client.lists[dispatcher.deferred_key("quiet")][0]
+        assert redis_client.zcard(dispatcher.inflight_key("quiet")) == 0
+
+    def test_message_is_leased_until_handled(self, limiter, redis_client):
+        """Test a dispatched message stays in Redis while the handler runs"""
+        leased = []
+        dispatcher = AdmissionDispatcher(
+            limiter, redis_client=redis_client,
+            handler=lambda company_id, data: leased.append(redis_client.zcard(dispatcher.inflight_key(company_id))),
+            reply=lambda *args: True
+        )
+        redis_client.rpush(dispatcher.deferred_key("quiet"), '{"data": {"id": 1}, "deferred_at": 0}')
+        redis_client.sadd(dispatcher.ACTIVE_KEY, "quiet")
+
+        assert dispatcher.dispatch_once() == 1
+
+        assert leased == [1]
+        assert redis_client.zcard(dispatcher.inflight_key("quiet")) == 0
+        assert redis_client.llen(dispatcher.deferred_key("quiet")) == 0
+
+    def test_message_of_a_crashed_worker_is_reclaimed(self, limiter, redis_client):
+        """Test a message claimed by a worker that died is dispatched again once its lease expires"""
+        crashed = self._dispatcher(limiter, redis_client, lease_seconds=60)
+        redis_client.rpush(crashed.deferred_key("quiet"), '{"data": {"id": 1}, "deferred_at": 0}')
+        redis_client.sadd(crashed.ACTIVE_KEY, "quiet")
+        assert crashed._next_message("quiet") is not None
+
+        # An empty queue with a message in flight keeps the tenant active
+        assert crashed._next_message("quiet") is None
+        assert redis_client.smembers(crashed.ACTIVE_KEY) == {"quiet"}
+        assert crashed.requeue_expired() == 0
+
+        restarted = self._dispatcher(limiter, redis_client)
+        assert restarted.requeue_expired(now=time.time() + 61) == 1
+        restarted.dispatch_once()
+
+        assert self.processed == [("quiet", 1)]
+        assert redis_client.zcard(restarted.inflight_key("quiet")) == 0
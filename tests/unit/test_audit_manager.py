@@ -5,6 +5,7 @@ Tests for audit trail functionality including logging actions,
 marking success/failure, compensation tracking, and querying.
 """
 
+import json
 import pytest
 import time
 from datetime import datetime, timedelta
@@ -420,5 +421,75 @@ class TestAuditEntryDataclass:
         assert entry.tags == ["booking", "calendar"]
 
 
+class TestAuditWriteBehind:
+    """Test pipelined write-behind persistence and ZSET indexes"""
+
+    @pytest.fixture
+    def redis_mock(self):
+        """Mock Redis client with pipeline support"""
+        redis = MagicMock()
+        redis.pipeline.return_value = MagicMock()
+        redis.zrevrange = MagicMock(return_value=[])
+        redis.mget = MagicMock(return_value=[])
+        redis.smembers = MagicMock(return_value=set())
+        return redis
+
+    @pytest.fixture
+    def audit_manager(self, redis_mock):
+        """AuditManager in write-behind mode with mocked Redis"""
+        with patch('app.config.company_config.get_company_config', return_value=None):
+            return AuditManager(company_id="test_company", redis_client=redis_mock)
+
+    def test_log_action_does_not_touch_redis_synchronously(self, audit_manager, redis_mock):
+        """log_action only enqueues; the pipeline runs on flush"""
+        with patch.object(audit_manager._write_buffer, '_ensure_thread'):
+            audit_manager.log_action(user_id="user123", action_type="booking", action_name="calendar.create")
+
+            assert not redis_mock.set.called
+            assert not redis_mock.pipeline.return_value.execute.called
+
+            audit_manager.flush()
+
+        pipe = redis_mock.pipeline.return_value
+        assert pipe.set.call_count == 1
+        assert pipe.zadd.call_count == 3  # user, action, timeline
+        assert pipe.execute.call_count == 1
+
+    def test_mark_success_uses_recent_cache(self, audit_manager, redis_mock):
+        """mark_success does not re-read the entry from Redis"""
+        with patch.object(audit_manager._write_buffer, '_ensure_thread'):
+            entry = audit_manager.log_action(user_id="user123", action_type="api_call", action_name="test.action")
+            assert audit_manager.mark_success(entry.audit_id, result={"ok": True}) is True
+            audit_manager.flush()
+
+        assert not redis_mock.get.called
+        pipe = redis_mock.pipeline.return_value
+        # Entrada nueva + actualización colapsadas en un único SET con el último estado
+        assert pipe.set.call_count == 1
+        saved = json.loads(pipe.set.call_args[0][1])
+        assert saved["status"] == "success"
+
+    def test_get_by_user_uses_sorted_index_and_mget(self, audit_manager, redis_mock):
+        """get_by_user is one ZREVRANGE plus one MGET"""
+        entry = {
+            "audit_id": "audit_1",
+            "company_id": "test_company",
+            "user_id": "user123",
+            "action_type": "api_call",
+            "action_name": "test.action",
+            "status": "success"
+        }
+        redis_mock.zrevrange.return_value = ["audit_1"]
+        redis_mock.mget.return_value = [json.dumps(entry)]
+
+        entries = audit_manager.get_by_user("user123", limit=50)
+
+        assert len(entries) == 1
+        assert entries[0].audit_id == "audit_1"
+        redis_mock.zrevrange.assert_called_once_with("test_company:audit:idx:user:user123", 0, 49)
+        assert redis_mock.mget.call_count == 1
+        assert not redis_mock.get.called
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
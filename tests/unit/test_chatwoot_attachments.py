@@ -0,0 +1,119 @@
+"""
+Unit tests for concurrent attachment processing in ChatwootService
+
+Attachments are analyzed in the shared pool; the merged context keeps the
+original order, each deadline starts when the worker picks the attachment
+up, and a slow attachment becomes a placeholder without blocking the rest.
+"""
+
+import threading
+import time
+
+import pytest
+
+from app.services import chatwoot_service
+from app.services.chatwoot_service import ChatwootService
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool(monkeypatch):
+    monkeypatch.setattr(chatwoot_service, "_attachment_executor", None)
+    yield
+    if chatwoot_service._attachment_executor is not None:
+        chatwoot_service._attachment_executor.shutdown(wait=False)
+
+
+def _service(analyze, timeout=1.0, max_workers=4):
+    service = ChatwootService.__new__(ChatwootService)
+    service.company_id = "benova"
+    service.attachment_timeout = timeout
+    service.attachment_max_workers = max_workers
+    service._analyze_attachment = analyze
+    return service
+
+
+def _attachment(file_type, url):
+    return {"data_url": url, "file_type": file_type, "file_size": 10}
+
+
+class TestProcessAttachments:
+    """Test suite for ChatwootService.process_attachments"""
+
+    def test_context_keeps_attachment_order(self):
+        """Test results are merged in attachment order even when they finish out of order"""
+        delays = {"a.jpg": 0.15, "b.ogg": 0.0, "c.jpg": 0.05}
+
+        def analyze(attachment_type, url):
+            time.sleep(delays[url])
+            return f"{attachment_type}:{url}"
+
+        context, media_type, processed = _service(analyze).process_attachments([
+            _attachment("image/jpeg", "a.jpg"),
+            _attachment("audio/ogg", "b.ogg"),
+            _attachment("image/jpeg", "c.jpg"),
+        ])
+
+        assert context == "[Image 1] image:a.jpg\n\n[Audio 1] audio:b.ogg\n\n[Image 2] image:c.jpg"
+        assert media_type == "mixed"
+        assert [item["status"] for item in processed] == ["success"] * 3
+
+    def test_timed_out_attachment_keeps_a_placeholder(self):
+        """Test a hung attachment stops being awaited at its deadline; the others still merge"""
+        release = threading.Event()
+
+        def analyze(attachment_type, url):
+            if url == "slow.jpg":
+                release.wait(5)
+                return "too late"
+            return "transcripción"
+
+        started_at = time.time()
+        try:
+            context, _, processed = _service(analyze, timeout=0.2).process_attachments([
+                _attachment("image/jpeg", "slow.jpg"),
+                _attachment("audio/ogg", "nota.ogg"),
+            ])
+        finally:
+            release.set()
+
+        assert time.time() - started_at < 2
+        assert context == "[Image 1] [Image file - processing timed out]\n\n[Audio 1] transcripción"
+        assert [item["status"] for item in processed] == ["timeout", "success"]
+
+    def test_queue_time_does_not_count_towards_the_deadline(self):
+        """Test an attachment waiting for a free worker still gets its full timeout"""
+        def analyze(attachment_type, url):
+            time.sleep(0.2)
+            return url
+
+        context, _, processed = _service(analyze, timeout=0.3, max_workers=1).process_attachments([
+            _attachment("image/jpeg", "a.jpg"),
+            _attachment("image/jpeg", "b.jpg"),
+        ])
+
+        assert context == "[Image 1] a.jpg\n\n[Image 2] b.jpg"
+        assert [item["status"] for item in processed] == ["success", "success"]
+
+    def test_mixed_message_skips_unsupported_and_reports_failures(self):
+        """Test text-only parts are ignored and a failed analysis becomes a placeholder"""
+        def analyze(attachment_type, url):
+            if attachment_type == "audio":
+                raise RuntimeError("whisper unavailable")
+            return "una foto de la clínica"
+
+        context, media_type, processed = _service(analyze).process_attachments([
+            _attachment("text/plain", "notas.txt"),
+            _attachment("audio/ogg", "nota.ogg"),
+            _attachment("image/png", "foto.png"),
+        ])
+
+        assert context == (
+            "[Audio 1] [Audio file - transcription failed: whisper unavailable]\n\n"
+            "[Image 1] una foto de la clínica"
+        )
+        assert media_type == "mixed"
+        assert [item["status"] for item in processed] == ["failed", "success"]
+
+    def test_text_only_message(self):
+        """Test a message without media attachments stays a text message"""
+        assert _service(lambda *args: "unused").process_attachments([]) == (None, "text", [])
@@ -4,6 +4,8 @@ Unit tests for CompensationOrchestrator
 Tests for Saga pattern implementation including compensation/rollback logic.
 """
 
+import threading
+
 import pytest
 from unittest.mock import MagicMock, patch
 from app.workflows.compensation_orchestrator import (
@@ -15,6 +17,15 @@ from app.workflows.compensation_orchestrator import (
 from app.models.audit_trail import AuditManager
 
 
+def _run_to_end(orchestrator, saga_id):
+    """Execute a saga and drain its deferred retries (no real waiting)"""
+    result = orchestrator.execute_saga(saga_id)
+    while result["status"] in ("retrying", "compensating"):
+        orchestrator.process_due_retries(now=float("inf"))
+        result = orchestrator.get_saga_result(saga_id)
+    return result
+
+
 class TestCompensationOrchestrator:
     """Test suite for CompensationOrchestrator"""
 
@@ -161,7 +172,7 @@ class TestCompensationOrchestrator:
         )
 
         # Execute
-        result = orchestrator.execute_saga(saga.saga_id)
+        result = _run_to_end(orchestrator, saga.saga_id)
 
         # Verify
         assert result["success"] is False
@@ -202,7 +213,7 @@ class TestCompensationOrchestrator:
         )
 
         # Execute
-        result = orchestrator.execute_saga(saga.saga_id)
+        result = _run_to_end(orchestrator, saga.saga_id)
 
         # Verify compensation order is reversed (LIFO)
         assert result["success"] is False
@@ -229,7 +240,7 @@ class TestCompensationOrchestrator:
         )
 
         # Execute
-        result = orchestrator.execute_saga(saga.saga_id)
+        result = _run_to_end(orchestrator, saga.saga_id)
 
         # Verify - should succeed after retries
         assert result["success"] is True
@@ -256,7 +267,7 @@ class TestCompensationOrchestrator:
         orchestrator.max_retries = 3
 
         # Execute
-        result = orchestrator.execute_saga(saga.saga_id)
+        result = _run_to_end(orchestrator, saga.saga_id)
 
         # Verify
         assert result["success"] is False
@@ -294,7 +305,7 @@ class TestCompensationOrchestrator:
         )
 
         # Execute
-        result = orchestrator.execute_saga(saga.saga_id)
+        result = _run_to_end(orchestrator, saga.saga_id)
 
         # Verify - should compensate action 1, skip action 2
         assert result["success"] is False
@@ -396,6 +407,136 @@ class TestCompensationOrchestrator:
         # Final state
         assert result["status"] == "completed"
 
+    def test_failed_action_does_not_block_request(self, orchestrator):
+        """Test a failed attempt returns 'retrying' instead of sleeping"""
+        saga = orchestrator.create_saga("user123", "flaky_saga")
+        orchestrator.add_action(
+            saga_id=saga.saga_id,
+            action_type="api_call",
+            action_name="flaky_api",
+            executor=lambda: {"success": False, "error": "timeout"}
+        )
+
+        with patch('app.workflows.compensation_orchestrator.time.sleep') as sleep:
+            result = orchestrator.execute_saga(saga.saga_id)
+
+        sleep.assert_not_called()
+        assert result["status"] == "retrying"
+        assert result["success"] is False
+        assert result["error"] == "timeout"
+        assert "next_retry_at" in result
+        assert orchestrator.next_retry_due() is not None
+
+    def test_on_complete_called_after_background_retry(self, orchestrator):
+        """Test the callback receives the final result of a retried saga"""
+        saga = orchestrator.create_saga("user123", "callback_saga")
+        outcomes = iter([Exception("Transient error"), {"success": True}])
+
+        def executor():
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        orchestrator.add_action(saga.saga_id, "api_call", "flaky_api", executor=executor)
+        finished = []
+
+        assert orchestrator.execute_saga(saga.saga_id, on_complete=finished.append)["status"] == "retrying"
+        orchestrator.process_due_retries(now=float("inf"))
+
+        assert [r["status"] for r in finished] == ["completed"]
+
+    def _booking_graph(self, orchestrator, calendar_outcomes):
+        from app.langgraph_adapters.orchestrator_graph import MultiAgentOrchestratorGraph
+
+        graph = MultiAgentOrchestratorGraph.__new__(MultiAgentOrchestratorGraph)
+        graph.company_id = "test_company"
+        graph.compensation_orchestrator = orchestrator
+        self.sent = []
+
+        def execute_tool(tool_name, params, **kwargs):
+            if tool_name == "send_whatsapp":
+                self.sent.append((params["conversation_id"], params["message"]))
+                return {"success": True}
+            return next(calendar_outcomes)
+
+        graph.tool_executor = MagicMock()
+        graph.tool_executor.execute_tool.side_effect = execute_tool
+        return graph
+
+    @staticmethod
+    def _booking_state():
+        return {
+            "user_id": "user123",
+            "conversation_id": 42,
+            "shared_context": {"schedule_info": {"treatment": "Limpieza", "date": "2025-01-15", "time": "10:00"}}
+        }
+
+    def test_retried_booking_notifies_the_conversation(self, orchestrator):
+        """Test a booking finished by a background retry sends a follow-up message"""
+        orchestrator.redis.get.return_value = None
+        graph = self._booking_graph(orchestrator, iter([
+            {"success": False, "error": "calendar timeout"},
+            {"success": True, "data": {"event_id": "evt_1"}}
+        ]))
+
+        state = graph._execute_booking_tool(self._booking_state())
+        assert state["tool_errors"][0]["retrying"] is True
+        assert self.sent == []
+
+        retry = threading.Thread(target=orchestrator.process_due_retries, kwargs={"now": float("inf")})
+        retry.start()
+        retry.join()
+
+        assert len(self.sent) == 1
+        assert self.sent[0][0] == 42
+        assert "Limpieza" in self.sent[0][1] and "2025-01-15" in self.sent[0][1]
+
+    def test_first_attempt_booking_sends_no_follow_up(self, orchestrator):
+        """Test a booking confirmed in the turn itself is not announced twice"""
+        orchestrator.redis.get.return_value = None
+        graph = self._booking_graph(orchestrator, iter([{"success": True, "data": {"event_id": "evt_1"}}]))
+
+        state = graph._execute_booking_tool(self._booking_state())
+
+        assert state["tool_results"]["booking"]["success"] is True
+        assert self.sent == []
+
+    def test_idempotency_key_reuses_previous_result(self, orchestrator):
+        """Test an action with a stored result for its key is not executed again"""
+        import json
+        orchestrator.redis.get.return_value = json.dumps(
+            {"success": True, "data": {"event_id": "evt_1"}}
+        )
+        executor = MagicMock(return_value={"success": True})
+
+        saga = orchestrator.create_saga("user123", "booking_saga")
+        action = orchestrator.add_action(
+            saga.saga_id, "booking", "create_event",
+            executor=executor, idempotency_key="booking:user123:2025-01-15T10:00"
+        )
+        result = orchestrator.execute_saga(saga.saga_id)
+
+        assert result["status"] == "completed"
+        executor.assert_not_called()
+        assert action.execution_result["data"] == {"event_id": "evt_1"}
+
+    def test_get_failed_sagas_from_index(self, orchestrator):
+        """Test failed sagas are read from the Redis index, not by scanning"""
+        import json
+        saga = Saga(saga_id="saga_f", company_id="test_company", user_id="u1",
+                    saga_name="broken", status=SagaStatus.FAILED)
+        orchestrator.redis.zrevrange.return_value = [b"saga_f"]
+        orchestrator.redis.mget.return_value = [json.dumps(saga.to_dict())]
+
+        failed = orchestrator.get_failed_sagas()
+
+        assert [s.saga_id for s in failed] == ["saga_f"]
+        assert failed[0].status == SagaStatus.FAILED
+        orchestrator.redis.zrevrange.assert_called_once_with(
+            orchestrator._index_key("failed"), 0, 99
+        )
+
     def test_exponential_backoff_calculation(self, orchestrator):
         """Test exponential backoff for retries"""
         # Retry 0: 2s
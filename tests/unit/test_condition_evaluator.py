@@ -0,0 +1,115 @@
+"""
+Unit tests for the compiled condition engine
+
+Precedence, short-circuiting, syntax errors at validate time and a
+benchmark against parsing the condition on every evaluation (wall-clock,
+skipped unless RUN_BENCHMARKS=1).
+"""
+
+import os
+import time
+
+import pytest
+
+from app.workflows.condition_evaluator import (
+    ConditionEvaluator,
+    ConditionSyntaxError,
+    _ConditionParser,
+    compile_condition,
+    validate_condition
+)
+from app.workflows.workflow_models import (
+    WorkflowGraph,
+    WorkflowNode,
+    WorkflowEdge,
+    NodeType,
+    EdgeType
+)
+
+
+class TestCompiledConditions:
+    """Test suite for compile_condition"""
+
+    def test_compiled_once_per_text(self):
+        """Test identical condition text returns the cached compiled object"""
+        assert compile_condition("{{age}} >= 18") is compile_condition("  {{age}} >= 18 ")
+
+    @pytest.mark.parametrize("condition,context,expected", [
+        ("{{a}} == 1 or {{b}} == 1 and {{c}} == 1", {"a": 1, "b": 0, "c": 0}, True),
+        ("({{a}} == 1 or {{b}} == 1) and {{c}} == 1", {"a": 1, "b": 0, "c": 0}, False),
+        ("not {{a}} == 1 and {{b}} == 1", {"a": 0, "b": 1}, True),
+        ("{{role}} not in ['admin', 'moderator']", {"role": "user"}, True),
+        ("{{status}} == active", {"status": "active"}, True),
+        ("{{user.profile.age}} > 20", {"user": {"profile": {"age": 25}}}, True),
+        ("{{missing}} == null", {}, True),
+    ])
+    def test_precedence_and_semantics(self, condition, context, expected):
+        """Test not > and > or precedence and legacy literal handling"""
+        assert compile_condition(condition)(context) is expected
+
+    def test_short_circuit(self):
+        """Test right operand is not evaluated when the left decides the result"""
+        # 'name' is not a string: contains would raise if evaluated
+        context = {"flag": True, "other": False, "name": None}
+
+        assert compile_condition("{{flag}} == true or {{name}} > 5")(context) is True
+        assert compile_condition("{{other}} == true and {{name}} > 5")(context) is False
+
+    def test_non_boolean_operand_raises(self):
+        """Test a bare non-boolean value is rejected at evaluation time"""
+        with pytest.raises(ValueError):
+            ConditionEvaluator().evaluate("{{age}}", {"age": 3})
+
+    @pytest.mark.parametrize("condition", [
+        "{{a}} == ",
+        "({{a}} == 1",
+        "{{a}} == 1 and",
+        "{{a}} == 'unterminated",
+    ])
+    def test_syntax_errors(self, condition):
+        """Test malformed conditions fail to compile and fail validation"""
+        with pytest.raises(ConditionSyntaxError):
+            compile_condition(condition)
+        assert validate_condition(condition)["valid"] is False
+
+    def test_graph_validate_reports_condition_errors(self):
+        """Test WorkflowGraph.validate surfaces syntax errors in edges and loops"""
+        graph = WorkflowGraph(id="wf_1", name="test", description="", company_id="acme")
+        graph.add_node(WorkflowNode(id="start", type=NodeType.TRIGGER, name="start", config={}, position={}))
+        graph.add_node(WorkflowNode(
+            id="loop", type=NodeType.LOOP, name="loop",
+            config={"exit_condition": "{{i}} >="}, position={}
+        ))
+        graph.add_edge(WorkflowEdge(
+            id="e1", source_node_id="start", target_node_id="loop",
+            edge_type=EdgeType.CONDITIONAL, condition="{{x}} == 1 and"
+        ))
+
+        errors = graph.validate()["errors"]
+
+        assert any(error.startswith("Edge e1") for error in errors)
+        assert any(error.startswith("Node loop") for error in errors)
+
+    @pytest.mark.slow
+    @pytest.mark.skipif(not os.getenv("RUN_BENCHMARKS"), reason="wall-clock benchmark; set RUN_BENCHMARKS=1")
+    def test_benchmark_compiled_vs_parse_per_call(self):
+        """Benchmark: cached evaluation is at least 10x cheaper than re-parsing"""
+        condition = (
+            "({{age}} >= 18 and {{country}} in ['US', 'CA', 'MX']) "
+            "or ({{verified}} == true and not {{status}} == 'banned')"
+        )
+        context = {"age": 25, "country": "MX", "verified": False, "status": "active"}
+        iterations = 5000
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            _ConditionParser(condition).parse()(context)
+        parse_per_call = time.perf_counter() - start
+
+        compiled = compile_condition(condition)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            compiled(context)
+        compiled_time = time.perf_counter() - start
+
+        assert parse_per_call / compiled_time >= 10
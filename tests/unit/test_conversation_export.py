@@ -0,0 +1,77 @@
+"""
+Unit tests for the streaming conversation export
+
+NDJSON and CSV bodies are generated lazily from the records iterator:
+one JSON object per conversation, one CSV row per message with proper
+escaping, and no record is pulled before the previous one was written.
+"""
+
+import csv
+import io
+import json
+
+from app.routes.conversations_extended import EXPORT_CSV_COLUMNS, _csv_lines, _ndjson_lines
+
+
+def _records(count, pulled=None):
+    for i in range(count):
+        if pulled is not None:
+            pulled.append(i)
+        yield {
+            "company_id": "benova",
+            "user_id": f"benova_user{i}",
+            "last_activity": 100.0 + i,
+            "messages": [{"role": "user", "content": f"hola {i}"}, {"role": "assistant", "content": "¡hola!"}],
+            "cursor": f"{100.0 + i!r}:1"
+        }
+
+
+class TestNdjsonExport:
+    """Test suite for the NDJSON body"""
+
+    def test_one_json_object_per_line(self):
+        """Test every conversation is a standalone JSON line"""
+        lines = list(_ndjson_lines(_records(3)))
+
+        assert all(line.endswith("\n") for line in lines)
+        parsed = [json.loads(line) for line in lines]
+        assert [record["user_id"] for record in parsed] == ["benova_user0", "benova_user1", "benova_user2"]
+        assert parsed[0]["messages"][1]["content"] == "¡hola!"
+
+
+class TestCsvExport:
+    """Test suite for the CSV body"""
+
+    def test_header_and_one_row_per_message(self):
+        """Test the header comes first and each message becomes a row"""
+        rows = list(csv.reader(io.StringIO("".join(_csv_lines(_records(2))))))
+
+        assert rows[0] == EXPORT_CSV_COLUMNS
+        assert len(rows) == 1 + 4
+        assert rows[1] == ["benova", "benova_user0", "100.0", "0", "user", "hola 0", "100.0:1"]
+
+    def test_content_is_escaped(self):
+        """Test commas, quotes and newlines in messages survive a CSV round trip"""
+        content = 'Precio: "$120,000"\nsegunda línea'
+        record = {"company_id": "benova", "user_id": "benova_user1", "last_activity": 1.0,
+                  "messages": [{"role": "user", "content": content}], "cursor": "1.0:1"}
+
+        rows = list(csv.reader(io.StringIO("".join(_csv_lines(iter([record]))))))
+
+        assert len(rows) == 2
+        assert rows[1][5] == content
+
+
+class TestLargeExport:
+    """Test suite for memory-bounded exports"""
+
+    def test_records_are_pulled_as_the_body_is_consumed(self):
+        """Test a large export never materializes the whole tenant"""
+        for lines in (_ndjson_lines, _csv_lines):
+            pulled = []
+            body = lines(_records(100000, pulled))
+
+            for _ in range(3):
+                next(body)
+
+            assert len(pulled) <= 3
@@ -0,0 +1,311 @@
+"""
+Unit tests for the per-company conversation activity index
+
+Counters follow the stored history length (the message window trims it),
+the one-time backfill only marks the index as built when it completes,
+and cursor pagination walks every conversation exactly once.
+"""
+
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.models.conversation import ConversationManager
+
+
+class _FakeRedis:
+    """Dict-backed Redis with lists, hashes, sorted sets and the index scripts"""
+
+    def __init__(self):
+        self.data = {}
+        self.lists = {}
+        self.hashes = {}
+        self.zsets = {}
+        self.ttls = {}
+        self.fail_scan = False
+        self.lrange_calls = 0
+
+    # strings / keys
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+            self.lists.pop(key, None)
+
+    def ttl(self, key):
+        return self.ttls.get(key, -1)
+
+    def scan_iter(self, match=None, count=None):
+        if self.fail_scan:
+            raise ConnectionError("connection reset")
+        prefix = match.rstrip("*")
+        return iter([key for key in list(self.lists) if key.startswith(prefix)])
+
+    # lists (RedisChatMessageHistory: newest first)
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def lrange(self, key, start, end):
+        self.lrange_calls += 1
+        items = self.lists.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    # hashes
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        state = self.hashes.setdefault(key, {})
+        state.update(mapping or {field: value})
+
+    def hmget(self, key, fields):
+        return [self.hget(key, field) for field in fields]
+
+    def hexists(self, key, field):
+        return field in self.hashes.get(key, {})
+
+    def hincrby(self, key, field, amount=1):
+        state = self.hashes.setdefault(key, {})
+        state[field] = int(state.get(field, 0)) + amount
+        return state[field]
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    # sorted sets
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zrem(self, key, *members):
+        for member in members:
+            self.zsets.get(key, {}).pop(member, None)
+
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def zcount(self, key, low, high):
+        return len(self._range(key, low, high))
+
+    def zscore(self, key, member):
+        return self.zsets.get(key, {}).get(member)
+
+    def _range(self, key, low, high, reverse=False):
+        low, high = float(low), float(high)
+        items = sorted(self.zsets.get(key, {}).items(), key=lambda item: (item[1], item[0]), reverse=reverse)
+        return [(member, score) for member, score in items if low <= score <= high]
+
+    def zrangebyscore(self, key, low, high, start=0, num=None, withscores=False):
+        items = self._range(key, low, high)[start:start + num if num else None]
+        return items if withscores else [member for member, _ in items]
+
+    def zrevrangebyscore(self, key, high, low, start=0, num=None, withscores=False):
+        items = self._range(key, low, high, reverse=True)[start:start + num if num else None]
+        return items if withscores else [member for member, _ in items]
+
+    def zrevrange(self, key, start, end, withscores=False):
+        items = self._range(key, "-inf", "+inf", reverse=True)[start:end + 1]
+        return items if withscores else [member for member, _ in items]
+
+    def pipeline(self, transaction=False):
+        redis = self
+
+        class _Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: self.calls.append((getattr(redis, name), args, kwargs))
+
+            def execute(self):
+                return [fn(*args, **kwargs) for fn, args, kwargs in self.calls]
+
+        return _Pipeline()
+
+    def register_script(self, source):
+        if "HVALS" in source:
+            def finish(keys, args):
+                counts_key, stats_key = keys
+                total = sum(int(count) for count in self.hashes.get(counts_key, {}).values())
+                self.hset(stats_key, mapping={"total_messages": total, "index_built_at": args[0]})
+                return total
+            return finish
+
+        def sync(keys, args):
+            history_key, activity_key, counts_key, stats_key = keys
+            user_id, score, touch_stats = args
+            length = self.llen(history_key)
+            if not length:
+                return 0
+            previous = int(self.hget(counts_key, user_id) or 0)
+            if score > self.zsets.get(activity_key, {}).get(user_id, float("-inf")):
+                self.zadd(activity_key, {user_id: score})
+            self.hset(counts_key, user_id, length)
+            self.hincrby(stats_key, "total_messages", length - previous)
+            if touch_stats == "1":
+                self.hset(stats_key, "last_activity", score)
+            return length
+        return sync
+
+
+def _message(kind, content):
+    return json.dumps({"type": kind, "data": {"content": content}})
+
+
+@pytest.fixture
+def redis_client():
+    return _FakeRedis()
+
+
+@pytest.fixture
+def manager(redis_client):
+    with patch('app.models.conversation.get_company_config', return_value=MagicMock(redis_prefix="acme:")), \
+         patch('app.models.conversation.get_redis_client', return_value=redis_client):
+        return ConversationManager(company_id="acme", max_messages=4)
+
+
+def _store(redis_client, manager, user_id, messages):
+    redis_client.lists[f"{manager.redis_prefix}{user_id}"] = list(reversed(messages))
+
+
+def _mark_built(redis_client, manager):
+    redis_client.hset(manager.stats_key, "index_built_at", 1.0)
+
+
+class TestActivityCounters:
+    """Test suite for message counters"""
+
+    def test_counters_follow_the_trimmed_history(self, manager, redis_client):
+        """Test the message window never leaves inflated counters"""
+        history = []
+        for i in range(6):
+            history.append(_message("human", f"pregunta {i}"))
+            _store(redis_client, manager, "acme_user1", history[-manager.max_messages:])
+            manager._touch_activity_index("acme_user1", timestamp=100.0 + i)
+
+        assert redis_client.hget(manager.counts_key, "acme_user1") == 4
+        assert redis_client.hget(manager.stats_key, "total_messages") == 4
+        assert redis_client.zscore(manager.activity_key, "acme_user1") == 105.0
+
+    def test_clear_removes_the_conversation_from_totals(self, manager, redis_client):
+        """Test clearing a conversation subtracts its messages"""
+        _mark_built(redis_client, manager)
+        for user_id in ("acme_user1", "acme_user2"):
+            _store(redis_client, manager, user_id, [_message("human", "hola"), _message("ai", "hola!")])
+            manager._touch_activity_index(user_id, timestamp=time.time())
+
+        manager._remove_from_index(["acme_user1"])
+
+        stats = manager.get_conversation_stats()
+        assert (stats["total_conversations"], stats["total_messages"]) == (1, 2)
+
+
+class TestActivityBackfill:
+    """Test suite for the one-time backfill of pre-existing histories"""
+
+    def test_backfill_indexes_existing_histories(self, manager, redis_client):
+        """Test histories written before the index existed are indexed with their real counts"""
+        _store(redis_client, manager, "acme_user1", [_message("human", "a"), _message("ai", "b")])
+        _store(redis_client, manager, "acme_user2", [_message("human", "c")])
+        redis_client.ttls[f"{manager.redis_prefix}acme_user1"] = manager.history_ttl - 60
+
+        stats = manager.get_conversation_stats()
+
+        assert (stats["total_conversations"], stats["total_messages"]) == (2, 3)
+        assert redis_client.hexists(manager.stats_key, "index_built_at")
+        assert "acme:conversation_stats:rebuilding" not in redis_client.data
+
+    def test_failed_backfill_is_retried(self, manager, redis_client):
+        """Test a rebuild that fails midway leaves no completion marker"""
+        _store(redis_client, manager, "acme_user1", [_message("human", "a")])
+        redis_client.fail_scan = True
+
+        manager._ensure_activity_index()
+        assert not redis_client.hexists(manager.stats_key, "index_built_at")
+
+        redis_client.fail_scan = False
+        manager._ensure_activity_index()
+        assert redis_client.hexists(manager.stats_key, "index_built_at")
+        assert redis_client.zcard(manager.activity_key) == 1
+
+    def test_backfill_in_progress_is_not_duplicated(self, manager, redis_client):
+        """Test a second request does not start another rebuild"""
+        redis_client.data[f"{manager.stats_key}:rebuilding"] = "1"
+
+        with patch.object(ConversationManager, "rebuild_activity_index", side_effect=AssertionError("duplicate rebuild")):
+            manager._ensure_activity_index()
+
+
+class TestConversationListing:
+    """Test suite for cursor pagination and export iteration"""
+
+    @pytest.fixture(autouse=True)
+    def conversations(self, manager, redis_client):
+        _mark_built(redis_client, manager)
+        # user2 and user3 share a score: the cursor must not skip or repeat them
+        for user_id, score in [("acme_user1", 100.0), ("acme_user2", 200.0), ("acme_user3", 200.0),
+                               ("acme_user4", 300.0), ("acme_user5", 400.0)]:
+            _store(redis_client, manager, user_id, [_message("human", f"hola de {user_id}"), _message("ai", "hola!")])
+            manager._touch_activity_index(user_id, timestamp=score)
+
+    def test_cursor_walks_every_conversation_once(self, manager):
+        """Test next_cursor pages through all conversations, newest first"""
+        seen, cursor = [], None
+        while True:
+            page = manager.list_conversations(page_size=2, cursor=cursor, preview_size=1)
+            seen.extend(conversation["user_id"] for conversation in page["conversations"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+
+        assert sorted(seen) == [f"acme_user{i}" for i in range(1, 6)]
+        assert len(seen) == 5
+        assert seen[0] == "acme_user5" and seen[-1] == "acme_user1"
+
+    def test_preview_is_the_latest_messages_in_order(self, manager):
+        """Test previews read the newest messages (LPUSH order) chronologically"""
+        conversation = manager.list_conversations(page_size=1)["conversations"][0]
+
+        assert conversation["messages"] == [{"role": "user", "content": "hola de acme_user5"},
+                                            {"role": "assistant", "content": "hola!"}]
+        assert conversation["message_count"] == 2
+
+    def test_iteration_resumes_from_an_item_cursor(self, manager):
+        """Test the export iterator resumes right after the given item"""
+        first = list(manager.iter_conversations(batch_size=2, limit=3))
+        rest = list(manager.iter_conversations(batch_size=2, cursor=first[-1]["cursor"]))
+
+        assert [item["user_id"] for item in first + rest] == [f"acme_user{i}" for i in range(1, 6)]
+
+    def test_large_export_reads_one_batch_at_a_time(self, manager, redis_client):
+        """Test the export iterator only reads the histories of the batch being yielded"""
+        for i in range(200):
+            user_id = f"acme_bulk{i:03d}"
+            _store(redis_client, manager, user_id, [_message("human", "hola")])
+            manager._touch_activity_index(user_id, timestamp=1000.0 + i)
+        redis_client.lrange_calls = 0
+
+        records = manager.iter_conversations(since=1000.0, batch_size=25)
+        first = next(records)
+
+        assert first["user_id"] == "acme_bulk000"
+        assert redis_client.lrange_calls == 25
+        assert sum(1 for _ in records) == 199
+
+    def test_single_conversation_export_reads_history_once(self, manager, redis_client):
+        """Test the single-conversation export does one LRANGE for history and activity"""
+        redis_client.lrange_calls = 0
+
+        record = manager.get_conversation_export("user5")
+
+        assert redis_client.lrange_calls == 1
+        assert record["user_id"] == "acme_user5" and record["last_activity"] == 400.0
+        assert [message["content"] for message in record["messages"]] == ["hola de acme_user5", "hola!"]
+        assert manager.get_conversation_export("missing") is None
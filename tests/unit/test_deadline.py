@@ -0,0 +1,152 @@
+"""
+Unit tests for request deadlines
+
+Deadline budget math, AgentAdapter timeout enforcement and the graph
+skipping retry/handoff/escalation when the budget is nearly spent.
+"""
+
+import time
+import pytest
+from unittest.mock import MagicMock
+
+from app.utils.deadline import (
+    Deadline,
+    DeadlineExceeded,
+    call_with_timeout,
+    current_deadline,
+    deadline_scope,
+    deadline_timeout
+)
+from app.langgraph_adapters.agent_adapter import AgentAdapter
+from app.langgraph_adapters.orchestrator_graph import MultiAgentOrchestratorGraph
+
+
+class TestDeadline:
+    """Test suite for Deadline"""
+
+    def test_timeout_capped_by_remaining_budget(self):
+        """Test a call gets min(its own timeout, remaining budget)"""
+        deadline = Deadline(budget_ms=2000)
+
+        assert deadline.timeout(30) <= 2.0
+        assert deadline.timeout(0.5) == 0.5
+        assert deadline.has_budget(1000)
+        assert not deadline.has_budget(5000)
+
+    def test_roundtrip_through_state(self):
+        """Test the deadline survives as a serializable epoch in state"""
+        deadline = Deadline(budget_ms=1000)
+
+        restored = Deadline.from_state({"deadline_at": deadline.expires_at})
+
+        assert restored.expires_at == deadline.expires_at
+        assert Deadline.from_state({"deadline_at": None}) is None
+
+    def test_deadline_timeout_uses_scope(self):
+        """Test nested HTTP/LLM calls see the active deadline"""
+        assert deadline_timeout(30) == 30
+
+        with deadline_scope(Deadline(budget_ms=1000)):
+            assert current_deadline() is not None
+            assert deadline_timeout(30) <= 1.0
+
+        with deadline_scope(Deadline(budget_ms=0)):
+            with pytest.raises(DeadlineExceeded):
+                deadline_timeout(30)
+
+    def test_call_with_timeout_stops_waiting(self):
+        """Test the caller returns at the timeout even if the call hangs"""
+        start = time.time()
+
+        with pytest.raises(DeadlineExceeded):
+            call_with_timeout(time.sleep, 0.05, 1)
+
+        assert time.time() - start < 0.5
+
+
+class TestAgentAdapterDeadline:
+    """Test suite for AgentAdapter timeout enforcement"""
+
+    def _adapter(self, invoke, **kwargs):
+        agent = MagicMock()
+        agent.company_config.company_id = "acme"
+        agent.invoke.side_effect = invoke
+        return AgentAdapter(agent=agent, agent_name="sales", **kwargs), agent
+
+    def test_timeout_ms_is_enforced(self):
+        """Test a slow agent is cut at timeout_ms and not retried"""
+        adapter, agent = self._adapter(lambda inputs: time.sleep(1) or "late", timeout_ms=50)
+
+        start = time.time()
+        result = adapter.invoke({"question": "hola"})
+
+        assert time.time() - start < 0.5
+        assert result["success"] is False
+        assert result["timed_out"] is True
+        assert agent.invoke.call_count == 1
+        assert adapter.get_stats()["total_timeouts"] == 1
+
+    def test_no_attempt_without_budget(self):
+        """Test the agent is not called when the deadline is nearly spent"""
+        adapter, agent = self._adapter(lambda inputs: "ok", min_attempt_ms=1000)
+
+        result = adapter.invoke({"question": "hola"}, deadline=Deadline(budget_ms=100))
+
+        assert result["success"] is False
+        assert agent.invoke.call_count == 0
+
+    def test_retry_skipped_when_backoff_exceeds_budget(self):
+        """Test a failed attempt is not retried if backoff + attempt does not fit"""
+        def failing(inputs):
+            raise RuntimeError("boom")
+
+        adapter, agent = self._adapter(failing, max_retries=2, min_attempt_ms=500)
+
+        start = time.time()
+        result = adapter.invoke({"question": "hola"}, deadline=Deadline(budget_ms=1200))
+
+        assert time.time() - start < 0.5
+        assert result["success"] is False
+        assert agent.invoke.call_count == 1
+
+
+class TestGraphDeadline:
+    """Test suite for deadline-aware routing in MultiAgentOrchestratorGraph"""
+
+    @pytest.fixture
+    def graph(self):
+        graph = MultiAgentOrchestratorGraph.__new__(MultiAgentOrchestratorGraph)
+        graph.company_id = "acme"
+        graph.min_step_ms = 3000
+        graph.agent_adapters = {}
+        return graph
+
+    def _state(self, budget_ms, **overrides):
+        state = {
+            "retries": 0,
+            "should_retry": True,
+            "should_escalate": True,
+            "current_agent": "sales",
+            "agent_response": "",
+            "handoff_requested": True,
+            "handoff_to": "schedule",
+            "deadline_at": Deadline(budget_ms=budget_ms).expires_at
+        }
+        state.update(overrides)
+        return state
+
+    def test_retry_and_escalation_skipped_near_deadline(self, graph):
+        """Test no further agent steps are started with < min_step_ms left"""
+        state = self._state(budget_ms=500)
+
+        assert graph._should_retry(state) == "end"
+        assert graph._should_escalate_to_support(state) == "end"
+        assert graph._should_perform_handoff(state) == "end"
+
+    def test_steps_allowed_with_budget(self, graph):
+        """Test routing is unchanged while there is budget left"""
+        state = self._state(budget_ms=20000)
+
+        assert graph._should_retry(state) == "retry"
+        assert graph._should_escalate_to_support(state) == "escalate"
+        assert graph._should_perform_handoff(state) == "handoff_to_schedule"
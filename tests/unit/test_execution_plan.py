@@ -0,0 +1,139 @@
+"""
+Unit tests for WorkflowGraph execution plans
+
+Adjacency indexes, edge-type buckets, topological order and the
+executor walking the plan (long chains, fan-out, error edges). The
+wall-clock fan-out benchmark is skipped unless RUN_BENCHMARKS=1.
+"""
+
+import asyncio
+import os
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.workflows.workflow_executor import WorkflowExecutor
+from app.workflows.workflow_models import (
+    WorkflowGraph,
+    WorkflowNode,
+    WorkflowEdge,
+    NodeType,
+    EdgeType
+)
+
+
+def _node(node_id, node_type=NodeType.VARIABLE, config=None):
+    config = config if config is not None else {"action": "set", "variable_name": node_id, "variable_value": 1}
+    return WorkflowNode(id=node_id, type=node_type, name=node_id, config=config, position={})
+
+
+def _edge(source, target, edge_type=EdgeType.DIRECT, condition=None):
+    return WorkflowEdge(
+        id=f"{source}->{target}", source_node_id=source, target_node_id=target,
+        edge_type=edge_type, condition=condition
+    )
+
+
+def _chain(length):
+    graph = WorkflowGraph(id="wf_chain", name="chain", description="", company_id="acme")
+    graph.add_node(_node("n0", NodeType.TRIGGER, {}))
+    for i in range(1, length):
+        graph.add_node(_node(f"n{i}"))
+        graph.add_edge(_edge(f"n{i - 1}", f"n{i}"))
+    graph.add_node(_node("end", NodeType.END, {}))
+    graph.add_edge(_edge(f"n{length - 1}", "end"))
+    graph.start_node_id = "n0"
+    return graph
+
+
+def _execute(graph):
+    executor = WorkflowExecutor(graph, orchestrator=MagicMock(company_id="acme"))
+    return asyncio.run(executor.execute({}))
+
+
+class TestExecutionPlan:
+    """Test suite for ExecutionPlan"""
+
+    def test_indexes_and_buckets(self):
+        """Test adjacency lists and edge-type buckets exclude disabled edges"""
+        graph = _chain(3)
+        graph.add_node(_node("fallback"))
+        graph.add_edge(_edge("n1", "fallback", EdgeType.ON_ERROR))
+        disabled = _edge("n0", "n2")
+        disabled.enabled = False
+        graph.add_edge(disabled)
+
+        plan = graph.get_execution_plan()
+
+        assert [e.target_node_id for e in graph.get_outgoing_edges("n0")] == ["n1"]
+        assert [e.target_node_id for e in plan.flow["n1"]] == ["n2"]
+        assert plan.error_targets("n1") == ["fallback"]
+        assert graph.get_edges_by_type("n1", EdgeType.ON_ERROR)[0].target_node_id == "fallback"
+        assert plan.order.index("n0") < plan.order.index("n1") < plan.order.index("n2")
+
+    def test_plan_invalidated_on_add_edge(self):
+        """Test the cached plan is rebuilt after modifying the graph"""
+        graph = _chain(2)
+        plan = graph.get_execution_plan()
+        graph.add_node(_node("extra"))
+        graph.add_edge(_edge("n1", "extra"))
+
+        assert graph.get_execution_plan() is not plan
+        assert len(graph.get_outgoing_edges("n1")) == 2
+
+    def test_cycles_detected_iteratively(self):
+        """Test back-edges are reported without recursion limits"""
+        graph = _chain(3000)
+        graph.add_edge(_edge("n2999", "n0"))
+
+        cycles = graph._detect_cycles()
+
+        assert len(cycles) == 1
+        assert cycles[0][0] == "n0" and cycles[0][-1] == "n0"
+        assert "n2999->n0" in graph.get_execution_plan().back_edges
+
+
+class TestExecutorWalksPlan:
+    """Test suite for the executor traversal"""
+
+    def test_long_chain_executes_without_recursion(self):
+        """Test a chain longer than the recursion limit runs iteratively"""
+        result = _execute(_chain(2000))
+
+        assert result["status"] == "success"
+        assert len(result["execution_history"]) == 2001
+
+    def test_error_edge_only_followed_on_failure(self):
+        """Test ON_ERROR edges are skipped on success and taken on failure"""
+        graph = _chain(2)
+        graph.add_node(_node("handler"))
+        graph.add_edge(_edge("n1", "handler", EdgeType.ON_ERROR))
+
+        executed = [r["node_id"] for r in _execute(graph)["execution_history"]]
+        assert "handler" not in executed
+
+        graph.nodes["n1"].config = {"action": "unknown"}
+        graph.rebuild_execution_plan()
+        executed = [r["node_id"] for r in _execute(graph)["execution_history"]]
+        assert executed[-1] == "handler"
+
+    @pytest.mark.slow
+    @pytest.mark.skipif(not os.getenv("RUN_BENCHMARKS"), reason="wall-clock benchmark; set RUN_BENCHMARKS=1")
+    def test_benchmark_fan_out(self):
+        """Benchmark: wide fan-out graph executes in linear time"""
+        graph = WorkflowGraph(id="wf_fan", name="fan", description="", company_id="acme")
+        graph.add_node(_node("start", NodeType.TRIGGER, {}))
+        graph.add_node(_node("end", NodeType.END, {}))
+        graph.start_node_id = "start"
+        for i in range(500):
+            graph.add_node(_node(f"b{i}"))
+            graph.add_edge(_edge("start", f"b{i}"))
+            graph.add_edge(_edge(f"b{i}", "end"))
+
+        start = time.perf_counter()
+        result = _execute(graph)
+        elapsed = time.perf_counter() - start
+
+        assert result["status"] == "success"
+        assert elapsed < 5
@@ -0,0 +1,154 @@
+"""
+Unit tests for the idempotency layer
+
+Incoming webhook events are claimed atomically (processing/done with a
+lease), retries of completed events replay the stored result, and
+outbound Chatwoot sends are deduplicated by idempotency key.
+"""
+
+import json
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from app.services import idempotency
+from app.services.chatwoot_service import ChatwootService
+from app.services.idempotency import ACQUIRED, DONE, PROCESSING, IdempotencyStore
+
+
+class _FakeRedis:
+    """Thread-safe dict-backed Redis with SET NX and the finish script"""
+
+    def __init__(self):
+        self.data = {}
+        self.hashes = {}
+        self._lock = threading.Lock()
+
+    def set(self, key, value, nx=False, ex=None):
+        with self._lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def hincrby(self, key, field, amount=1):
+        with self._lock:
+            state = self.hashes.setdefault(key, {})
+            state[field] = state.get(field, 0) + amount
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def register_script(self, source):
+        def finish(keys, args):
+            token, value, ttl = args
+            with self._lock:
+                current = self.data.get(keys[0])
+                if current is not None and json.loads(current).get("token") != token:
+                    return 0
+                if value == "":
+                    self.data.pop(keys[0], None)
+                else:
+                    self.data[keys[0]] = value
+                return 1
+        return finish
+
+
+@pytest.fixture
+def redis_client():
+    return _FakeRedis()
+
+
+@pytest.fixture
+def store(redis_client):
+    with patch.object(idempotency, "get_company_redis_prefix", lambda company_id: f"{company_id}:"):
+        yield IdempotencyStore(lease_seconds=60, result_ttl=3600, redis_client=redis_client)
+
+
+class TestIdempotencyStore:
+    """Test suite for IdempotencyStore"""
+
+    def test_concurrent_retries_run_once(self, store):
+        """Test a retry storm yields exactly one ACQUIRED claim"""
+        barrier = threading.Barrier(16)
+        statuses = []
+
+        def retry():
+            barrier.wait()
+            statuses.append(store.claim("benova", "processed_message", "7:42").status)
+
+        threads = [threading.Thread(target=retry) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert statuses.count(ACQUIRED) == 1
+        assert statuses.count(PROCESSING) == 15
+        assert store.get_stats("benova")["company"] == {"processed_message:suppressed_in_flight": 15}
+
+    def test_completed_event_replays_stored_result(self, store):
+        """Test a retry after completion returns the cached result instantly"""
+        claim = store.claim("benova", "processed_message", "7:42")
+        assert store.complete(claim, {"status": "success", "agent_used": "sales"})
+
+        retry = store.claim("benova", "processed_message", "7:42")
+
+        assert retry.status == DONE
+        assert retry.result == {"status": "success", "agent_used": "sales"}
+        assert store.get_stats()["worker"]["processed_message"]["suppressed"] == 1
+
+    def test_released_event_can_be_retried(self, store):
+        """Test a failure releases the claim for the next retry"""
+        claim = store.claim("benova", "processed_message", "7:42")
+        store.release(claim)
+
+        assert store.claim("benova", "processed_message", "7:42").acquired
+
+    def test_expired_lease_owner_cannot_overwrite(self, store, redis_client):
+        """Test a worker whose lease expired does not clobber the new owner"""
+        stale = store.claim("benova", "processed_message", "7:42")
+        redis_client.data.clear()  # lease expired
+        fresh = store.claim("benova", "processed_message", "7:42")
+
+        assert not store.complete(stale, {"status": "stale"})
+        assert json.loads(redis_client.data[fresh.key])["token"] == fresh.token
+
+    def test_legacy_marker_counts_as_done(self, store, redis_client):
+        """Test keys written by the previous EXISTS/SET check are honoured"""
+        redis_client.data["benova:processed_message:7:42"] = "1"
+
+        assert store.claim("benova", "processed_message", "7:42").status == DONE
+
+
+class TestIdempotentSend:
+    """Test suite for ChatwootService.send_message idempotency keys"""
+
+    def test_duplicate_send_is_suppressed(self, store):
+        """Test the same reply key posts to Chatwoot once"""
+        service = ChatwootService.__new__(ChatwootService)
+        service.company_id = "benova"
+
+        with patch.object(idempotency, "_store", store), \
+                patch.object(ChatwootService, "_post_message", return_value=True) as post:
+            assert service.send_message(7, "Hola", idempotency_key="reply:42")
+            assert service.send_message(7, "Hola", idempotency_key="reply:42")
+            assert service.send_message(7, "Hola de nuevo")
+
+        assert post.call_count == 2
+
+    def test_failed_send_can_be_retried(self, store):
+        """Test a failed post releases the key"""
+        service = ChatwootService.__new__(ChatwootService)
+        service.company_id = "benova"
+
+        with patch.object(idempotency, "_store", store), \
+                patch.object(ChatwootService, "_post_message", side_effect=[False, True]) as post:
+            assert not service.send_message(7, "Hola", idempotency_key="reply:42")
+            assert service.send_message(7, "Hola", idempotency_key="reply:42")
+
+        assert post.call_count == 2
@@ -0,0 +1,107 @@
+"""
+Import-time budget tests
+
+Runs `python -X importtime` in a fresh interpreter and checks the
+cumulative import time of the entry points used by workers and CLI
+scripts, and that heavy integrations (agents, LangGraph, LangChain Redis,
+Google API client, email) stay unloaded until first use.
+"""
+
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+# Cumulative import time allowed per entry point (microseconds)
+IMPORT_BUDGETS_US = {
+    "app": 1_500_000,
+    "app.services.prompt_service": 1_000_000,  # diagnose_prompts_system.py
+    "migrate_prompts_to_postgresql": 500_000,
+    "migrate_companies_to_postgresql": 500_000,
+    "migrate_workflows_to_postgresql": 500_000,
+}
+
+# Loaded when the first orchestrator or integration is built, never on import
+LAZY_MODULES = (
+    "langgraph",
+    "langchain_redis",
+    "googleapiclient",
+    "PIL",
+    "app.agents",
+    "app.langgraph_adapters",
+    "app.services.multi_agent_orchestrator",
+    "app.services.calendar_integration_service",
+    "app.services.email_service",
+)
+
+LAZY_ENTRY_POINTS = (
+    "app",
+    "app.services.prompt_service",
+    "app.services.multi_agent_factory",
+    "app.routes.webhook",
+    "app.routes.workflows",
+    "app.routes.admin",
+)
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def _importtime(module):
+    """Return [(level, cumulative_us, name)] for `import module`"""
+    command = [sys.executable, "-X", "importtime", "-c", f"import {module}"]
+    # First run compiles .pyc files; measure the second one
+    for _ in range(2):
+        proc = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True, timeout=120)
+
+    if proc.returncode != 0:
+        missing = re.search(r"No module named '([^']+)'", proc.stderr)
+        if missing:
+            pytest.skip(f"dependency not installed: {missing.group(1)}")
+        pytest.fail(proc.stderr[-2000:])
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            cumulative, indent, name = match.group(2, 3, 4)
+            entries.append((len(indent) // 2, int(cumulative), name))
+    return entries
+
+
+def _cumulative_us(entries, module):
+    """Total time of module and its parent packages (top-level entries only)"""
+    parts = module.split(".")
+    chain = {".".join(parts[:i]) for i in range(1, len(parts) + 1)}
+    return sum(cumulative for level, cumulative, name in entries if level == 0 and name in chain)
+
+
+@pytest.mark.slow
+class TestImportTime:
+    """Test suite for the import-time budget"""
+
+    @pytest.mark.parametrize("module,budget_us", sorted(IMPORT_BUDGETS_US.items()))
+    def test_entry_point_within_budget(self, module, budget_us):
+        """Test the entry point imports within its budget"""
+        entries = _importtime(module)
+        total_us = _cumulative_us(entries, module)
+
+        slowest = sorted(entries, key=lambda entry: entry[1], reverse=True)[:10]
+        assert total_us <= budget_us, (
+            f"import {module} took {total_us / 1000:.0f}ms (budget {budget_us / 1000:.0f}ms); "
+            f"slowest: {[(name, cumulative) for _, cumulative, name in slowest]}"
+        )
+
+    @pytest.mark.parametrize("module", LAZY_ENTRY_POINTS)
+    def test_heavy_integrations_are_lazy(self, module):
+        """Test agents, LangGraph and integrations are not loaded on import"""
+        imported = {name for _, _, name in _importtime(module)}
+
+        loaded = sorted(
+            name for name in imported
+            if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES)
+        )
+        assert not loaded, f"import {module} eagerly loaded {loaded}"
@@ -0,0 +1,156 @@
+"""
+Unit tests for the structured logging subsystem
+
+Queue-based handler, JSON records with request/company context,
+per-module levels and sampling of hot-loop debug events.
+"""
+
+import io
+import json
+import logging
+import sys
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.utils import logging_config
+from app.utils.logging_config import (
+    JsonFormatter,
+    LogSampler,
+    configure_logging,
+    flush_logging,
+    get_logging_stats,
+    log_context,
+    parse_module_levels
+)
+
+
+@pytest.fixture
+def stdout():
+    """Buffer for the logging listener; restores the root logger afterwards"""
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield io.StringIO()
+    logging_config._stop_listener()
+    logging_config._listener = None
+    logging_config._queue_handler = None
+    root.handlers[:] = handlers
+    root.setLevel(level)
+    logging.getLogger("tests.noisy").setLevel(logging.NOTSET)
+
+
+def _app(**config):
+    return MagicMock(config=config)
+
+
+class TestStructuredLogging:
+    """Test suite for configure_logging and JsonFormatter"""
+
+    def test_json_records_carry_request_context(self, stdout):
+        """Test request/company ids and extra fields end up in the JSON line"""
+        configure_logging(_app(LOG_FORMAT="json", LOG_LEVEL="INFO"), stream=stdout)
+
+        with log_context(request_id="req-1", company_id="benova"):
+            logging.getLogger("tests.webhook").info("RAG search: %d docs", 3, extra={"duration_ms": 12.5})
+        flush_logging()
+
+        record = json.loads(stdout.getvalue().strip().splitlines()[-1])
+        assert record["message"] == "RAG search: 3 docs"
+        assert record["request_id"] == "req-1"
+        assert record["company_id"] == "benova"
+        assert record["duration_ms"] == 12.5
+        assert record["level"] == "INFO"
+
+    def test_module_levels_and_lazy_formatting(self, stdout):
+        """Test per-module levels drop records before their args are formatted"""
+        configure_logging(_app(LOG_LEVEL="INFO", LOG_LEVELS="tests.noisy=WARNING"), stream=stdout)
+        expensive = MagicMock()
+
+        logging.getLogger("tests.noisy").info("metadata=%s", expensive)
+        logging.getLogger("tests.other").info("kept")
+        flush_logging()
+
+        expensive.__str__.assert_not_called()
+        assert "kept" in stdout.getvalue()
+        assert "metadata" not in stdout.getvalue()
+        assert parse_module_levels("a=DEBUG, b=bogus,c") == {"a": logging.DEBUG}
+
+    def test_full_queue_drops_instead_of_blocking(self, stdout):
+        """Test a saturated queue never blocks the request thread"""
+        configure_logging(_app(LOG_QUEUE_SIZE=1), stream=stdout)
+        logging_config._listener.stop()
+
+        for i in range(5):
+            logging.getLogger("tests.burst").warning("event %d", i)
+
+        assert get_logging_stats()["dropped"] == 4
+        logging_config._listener.start()
+
+    def test_records_are_formatted_in_the_listener_thread(self, stdout):
+        """Test the request thread only enqueues; args are rendered by the listener"""
+        configure_logging(_app(LOG_LEVEL="INFO"), stream=stdout)
+        rendered_in = []
+
+        class _Arg:
+            def __str__(self):
+                rendered_in.append(threading.current_thread())
+                return "payload"
+
+        logging.getLogger("tests.lazy").info("value=%s", _Arg())
+        flush_logging()
+
+        assert "value=payload" in stdout.getvalue()
+        assert rendered_in and threading.current_thread() not in rendered_in
+
+    def test_inherited_listener_is_discarded_after_fork(self, stdout, monkeypatch):
+        """Test a worker builds its own listener without stopping the master's"""
+        configure_logging(_app(), stream=stdout)
+        inherited = logging_config._listener
+        inherited_stop = MagicMock()
+        monkeypatch.setattr(inherited, "stop", inherited_stop)
+        monkeypatch.setattr(logging_config, "_listener_pid", -1)
+
+        configure_logging(_app(), stream=stdout)
+
+        inherited_stop.assert_not_called()
+        assert logging_config._listener is not inherited
+        monkeypatch.undo()
+        inherited.stop()
+
+    def test_exception_is_serialized(self):
+        """Test exc_info is rendered as text in JSON"""
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = logging.getLogger("tests").makeRecord("tests", logging.ERROR, __file__, 1, "failed", (), sys.exc_info())
+
+        payload = json.loads(JsonFormatter().format(record))
+        assert "ValueError: boom" in payload["exc_info"]
+
+
+class TestLogSampler:
+    """Test suite for LogSampler"""
+
+    def test_limits_events_per_window_and_reports_suppressed(self):
+        """Test only `limit` events pass per interval and drops are counted"""
+        sampler = LogSampler(limit=2, interval=60)
+
+        results = [sampler.allow("rag_doc") for _ in range(5)]
+
+        assert results == [0, 0, None, None, None]
+        assert sampler.allow("other_key") == 0
+
+        sampler._windows["rag_doc"][0] -= 61
+        assert sampler.allow("rag_doc") == 3
+
+    def test_log_skips_disabled_levels(self):
+        """Test sampled debug events cost nothing when DEBUG is off"""
+        sampler = LogSampler(limit=1, interval=60)
+        target = MagicMock()
+        target.isEnabledFor.return_value = False
+
+        sampler.log(target, logging.DEBUG, "key", "doc %s", 1)
+
+        target.log.assert_not_called()
+        assert sampler._windows == {}
@@ -0,0 +1,324 @@
+"""
+Unit tests for per-conversation message burst coalescing
+
+Consecutive messages are buffered and answered in one orchestrator turn,
+the debounce window slides up to a hard cap, and a reply generated while
+new input arrived is superseded instead of being saved and sent.
+"""
+
+import json
+from unittest.mock import patch
+
+import pytest
+
+from app.services.message_burst import MessageBurstCoalescer, merge_burst
+from app.services.openai_service import ModelProfile, _admit_llm_call
+
+
+class _FakeRedis:
+    """Dict-backed Redis with lists, hashes, sorted sets and the commit script"""
+
+    def __init__(self):
+        self.data = {}
+        self.hashes = {}
+        self.lists = {}
+        self.zsets = {}
+
+    def register_script(self, source):
+        if "ZRANGEBYSCORE" in source:
+            def move(keys, args):
+                source_key, destination = keys
+                now, score, limit = args
+                members = self.zrangebyscore(source_key, "-inf", now, start=0, num=int(limit))
+                for member in members:
+                    self.zrem(source_key, member)
+                    self.zadd(destination, {member: score})
+                return members
+            return move
+
+        if "LTRIM" not in source:
+            def release(keys, args):
+                if self.data.get(keys[0]) == args[0]:
+                    self.delete(keys[0])
+                    return 1
+                return 0
+            return release
+
+        def commit(keys, args):
+            buffer_key, meta_key = keys
+            expected, consumed, forced, now = args
+            meta = self.hashes.setdefault(meta_key, {})
+            if str(meta.get("seq")) != expected and forced != "1":
+                return 0
+            self.lists[buffer_key] = self.lists.get(buffer_key, [])[int(consumed):]
+            if self.lists[buffer_key]:
+                meta["first_at"] = now
+            else:
+                meta.pop("first_at", None)
+            return 1
+        return commit
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def expire(self, key, ttl):
+        return True
+
+    def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(values)
+        return len(self.lists[key])
+
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def lrange(self, key, start, end):
+        return list(self.lists.get(key, []))
+
+    def hincrby(self, key, field, amount=1):
+        meta = self.hashes.setdefault(key, {})
+        meta[field] = int(meta.get(field, 0)) + amount
+        return meta[field]
+
+    def hsetnx(self, key, field, value):
+        meta = self.hashes.setdefault(key, {})
+        if field in meta:
+            return 0
+        meta[field] = value
+        return 1
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hgetall(self, key):
+        return {field: str(value) for field, value in self.hashes.get(key, {}).items()}
+
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zrem(self, key, member):
+        return 1 if self.zsets.get(key, {}).pop(member, None) is not None else 0
+
+    def zrangebyscore(self, key, low, high, start=0, num=None):
+        due = [member for member, score in sorted(self.zsets.get(key, {}).items(), key=lambda item: item[1]) if score <= high]
+        return due[start:start + num] if num else due
+
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def pipeline(self, transaction=False):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((getattr(self.redis, name), args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+@pytest.fixture
+def redis_client():
+    return _FakeRedis()
+
+
+@pytest.fixture
+def make_coalescer(redis_client):
+    def build(respond, **kwargs):
+        coalescer = MessageBurstCoalescer(window_ms=2000, max_wait_ms=6000, respond=respond, **kwargs)
+        coalescer._client = redis_client
+        coalescer._client_pid = __import__("os").getpid()
+        return coalescer
+
+    with patch("app.services.message_burst.get_company_redis_prefix", lambda company_id: f"{company_id}:"):
+        yield build
+
+
+def _text(text):
+    return {"text": text, "media_type": "text", "media_context": None}
+
+
+class TestMergeBurst:
+    """Test suite for merge_burst"""
+
+    def test_texts_are_joined_in_arrival_order(self):
+        """Test the burst becomes one question"""
+        question, media_type, media_context = merge_burst([_text("hola"), _text("quería saber"), _text("precio del botox")])
+
+        assert question == "hola\nquería saber\nprecio del botox"
+        assert media_type == "text" and media_context is None
+
+    def test_media_only_bursts_use_the_media_context(self):
+        """Test voice notes and images are kept as media context"""
+        entries = [
+            {"text": "", "media_type": "audio", "media_context": "quiero una cita"},
+            {"text": "", "media_type": "image", "media_context": "foto de una mancha"},
+        ]
+
+        question, media_type, media_context = merge_burst(entries)
+
+        assert media_type == "mixed"
+        assert question == media_context == "quiero una cita\n\nfoto de una mancha"
+
+
+class TestMessageBurstCoalescer:
+    """Test suite for MessageBurstCoalescer"""
+
+    def test_claimed_burst_is_leased_until_answered(self, make_coalescer, redis_client):
+        """Test a claimed conversation stays in flight during the turn and is acked after"""
+        in_flight = []
+
+        def respond(**kwargs):
+            in_flight.append(dict(redis_client.zsets[coalescer.INFLIGHT_KEY]))
+            return ("respuesta", "sales") if kwargs["should_commit"]() else (None, "superseded")
+
+        coalescer = make_coalescer(respond)
+        coalescer.add("benova", 7, "benova_user_1", _text("hola"), now=100.0)
+
+        assert coalescer.flush_once(now=200.0) == 1
+        assert list(in_flight[0]) == ["benova|7"] and in_flight[0]["benova|7"] > 200.0
+        assert redis_client.zcard(coalescer.INFLIGHT_KEY) == 0
+
+    def test_burst_of_a_crashed_worker_is_requeued(self, make_coalescer, redis_client):
+        """Test a lease left by a worker that died mid-turn sends the burst back to the queue"""
+        answered = []
+        coalescer = make_coalescer(lambda **kwargs: answered.append(kwargs["question"]) or ("ok", "sales"))
+        coalescer.add("benova", 7, "benova_user_1", _text("hola"), now=100.0)
+        assert coalescer.claim_due(now=200.0) == ["benova|7"]  # el worker muere aquí
+
+        assert coalescer.flush_once(now=250.0) == 0
+        assert coalescer.flush_once(now=1000.0) == 1
+        assert answered == ["hola"]
+        assert coalescer.get_stats()["requeued"] == 1
+
+    def test_window_slides_up_to_the_hard_cap(self, make_coalescer, redis_client):
+        """Test each message pushes the flush back, never past first message + max wait"""
+        coalescer = make_coalescer(respond=None)
+
+        first = coalescer.add("benova", 7, "benova_user_1", _text("hola"), now=100.0)
+        second = coalescer.add("benova", 7, "benova_user_1", _text("quería saber"), now=101.5)
+        last = coalescer.add("benova", 7, "benova_user_1", _text("precio"), now=105.0)
+
+        assert first["flush_in_ms"] == 2000
+        assert second["flush_in_ms"] == 2000 and second["burst_size"] == 2
+        assert last["flush_in_ms"] == 1000
+        assert redis_client.zsets[coalescer.QUEUE_KEY] == {"benova|7": 106.0}
+
+    def test_burst_is_answered_in_one_turn(self, make_coalescer, redis_client):
+        """Test one orchestrator call for the whole burst and LLM calls per turn"""
+        calls = []
+
+        def respond(**kwargs):
+            calls.append(kwargs["question"])
+            _admit_llm_call(None, ModelProfile(), [])
+            _admit_llm_call(None, ModelProfile(), [])
+            assert kwargs["should_commit"]()
+            return "respuesta", "sales"
+
+        coalescer = make_coalescer(respond)
+        for text in ("hola", "quería saber", "precio del botox"):
+            coalescer.add("benova", 7, "benova_user_1", _text(text))
+
+        assert coalescer.flush_once(now=float("inf")) == 1
+
+        assert calls == ["hola\nquería saber\nprecio del botox"]
+        assert redis_client.lists["benova:message_burst:7"] == []
+        stats = coalescer.get_stats()
+        assert stats["turns"] == 1 and stats["messages_per_turn"] == 3.0
+        assert stats["llm_calls_per_turn"] == 2.0
+
+    def test_reply_is_superseded_by_new_input(self, make_coalescer, redis_client):
+        """Test a message arriving mid-generation discards the reply and keeps the burst"""
+        def respond(**kwargs):
+            coalescer.add("benova", 7, "benova_user_1", _text("y el precio?"))
+            return (None, "superseded") if not kwargs["should_commit"]() else ("respuesta", "sales")
+
+        coalescer = make_coalescer(respond)
+        coalescer.add("benova", 7, "benova_user_1", _text("hola"))
+
+        assert coalescer.flush_conversation("benova|7") == "superseded"
+        assert len(redis_client.lists["benova:message_burst:7"]) == 2
+        assert "benova|7" in redis_client.zsets[coalescer.QUEUE_KEY]
+        assert "benova:message_burst_lock:7" not in redis_client.data
+
+    def test_reply_is_committed_past_the_hard_cap(self, make_coalescer, redis_client):
+        """Test a user who keeps typing still gets an answer after max wait"""
+        def respond(**kwargs):
+            coalescer.add("benova", 7, "benova_user_1", _text("otra cosa"))
+            return ("respuesta", "sales") if kwargs["should_commit"]() else (None, "superseded")
+
+        coalescer = make_coalescer(respond)
+        coalescer.add("benova", 7, "benova_user_1", _text("hola"), now=1.0)
+
+        assert coalescer.flush_conversation("benova|7") == "answered"
+        remaining = redis_client.lists["benova:message_burst:7"]
+        assert [json.loads(raw)["text"] for raw in remaining] == ["otra cosa"]
+        assert coalescer.get_stats()["forced"] == 1
+
+    def test_conversation_already_flushing_is_rescheduled(self, make_coalescer, redis_client):
+        """Test one flush per conversation at a time"""
+        coalescer = make_coalescer(respond=lambda **kwargs: pytest.fail("should not respond"))
+        coalescer.add("benova", 7, "benova_user_1", _text("hola"))
+        redis_client.data["benova:message_burst_lock:7"] = "1"
+
+        assert coalescer.flush_conversation("benova|7") == "busy"
+        assert "benova|7" in redis_client.zsets[coalescer.QUEUE_KEY]
+
+    def test_reply_without_commit_consumes_the_burst(self, make_coalescer, redis_client):
+        """Test an orchestrator early return does not re-answer the same messages next turn"""
+        questions = []
+
+        def respond(**kwargs):
+            questions.append(kwargs["question"])
+            coalescer.add("benova", 7, "benova_user_1", _text("gracias"))
+            return "respuesta de error", "error"  # never called should_commit
+
+        coalescer = make_coalescer(respond)
+        coalescer.add("benova", 7, "benova_user_1", _text("hola"))
+        coalescer.add("benova", 7, "benova_user_1", _text("precio botox"))
+
+        assert coalescer.flush_conversation("benova|7") == "uncommitted"
+        assert coalescer.flush_conversation("benova|7") == "uncommitted"
+        assert questions == ["hola\nprecio botox", "gracias"]
+        stats = coalescer.get_stats()
+        assert (stats["superseded"], stats["uncommitted"]) == (0, 2)
+
+    def test_failed_turn_consumes_the_burst(self, make_coalescer, redis_client):
+        """Test an orchestrator exception does not leave the messages for the next burst"""
+        def respond(**kwargs):
+            raise RuntimeError("orchestrator down")
+
+        coalescer = make_coalescer(respond)
+        coalescer.add("benova", 7, "benova_user_1", _text("hola"))
+
+        assert coalescer.flush_conversation("benova|7") == "error"
+        assert redis_client.lists["benova:message_burst:7"] == []
+
+    def test_expired_lock_taken_by_another_worker_is_kept(self, make_coalescer, redis_client):
+        """Test a slow flush whose lock expired does not release the new owner's lock"""
+        def respond(**kwargs):
+            redis_client.data["benova:message_burst_lock:7"] = "other-worker"
+            return ("respuesta", "sales") if kwargs["should_commit"]() else (None, "superseded")
+
+        coalescer = make_coalescer(respond)
+        coalescer.add("benova", 7, "benova_user_1", _text("hola"))
+
+        assert coalescer.flush_conversation("benova|7") == "answered"
+        assert redis_client.data["benova:message_burst_lock:7"] == "other-worker"
@@ -0,0 +1,176 @@
+"""
+Unit tests for the OpenAIService model registry
+
+Per-agent/per-company model profiles and single-flight coalescing of
+identical in-flight completions.
+"""
+
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services.openai_service import (
+    MODEL_ALIAS_REASONING,
+    MODEL_ALIAS_SMALL,
+    ModelProfile,
+    OpenAIService,
+    reset_client_pool
+)
+from app.utils.single_flight import SingleFlight
+
+
+@pytest.fixture
+def service():
+    instance = OpenAIService.__new__(OpenAIService)
+    instance.api_key = "sk-test"
+    instance.model_name = "gpt-4.1-mini"
+    instance.max_tokens = 1500
+    instance.temperature = 0.7
+    instance.model_aliases = {MODEL_ALIAS_SMALL: "gpt-4o-mini", MODEL_ALIAS_REASONING: "gpt-4o"}
+    instance.client = MagicMock()
+    return instance
+
+
+def _run_concurrently(fn, count=5):
+    barrier = threading.Barrier(count)
+    results, errors = [], []
+
+    def worker():
+        barrier.wait()
+        try:
+            results.append(fn())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+class TestSingleFlight:
+    """Test suite for SingleFlight"""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """Test followers get the leader's result without executing"""
+        flight = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.1)
+            return "respuesta"
+
+        results, errors = _run_concurrently(lambda: flight.do("same-prompt", slow))
+
+        assert not errors
+        assert results == ["respuesta"] * 5
+        assert len(calls) == 1
+        assert flight.get_stats()["coalesced"] == 4
+        assert flight.in_flight() == 0
+
+    def test_errors_reach_every_waiter(self):
+        """Test a failed leader call fails all coalesced callers"""
+        flight = SingleFlight()
+
+        def failing():
+            time.sleep(0.1)
+            raise RuntimeError("upstream 500")
+
+        results, errors = _run_concurrently(lambda: flight.do("same-prompt", failing))
+
+        assert not results
+        assert len(errors) == 5 and all(isinstance(e, RuntimeError) for e in errors)
+
+
+class TestModelRegistry:
+    """Test suite for OpenAIService model profiles"""
+
+    def test_router_uses_small_model(self, service):
+        """Test the router gets the small deterministic profile"""
+        profile = service.get_model_profile("router_agent")
+
+        assert profile == ModelProfile("gpt-4o-mini", 150, 0.0)
+        assert service.get_model_profile("sales_agent") == ModelProfile("gpt-4.1-mini", 1500, 0.7)
+        assert service.get_model_profile("planner").model == "gpt-4o"
+
+    def test_company_overrides_agent_profile(self, service):
+        """Test company agent_models win over the registry defaults"""
+        company_config = MagicMock(agent_models={
+            "default": {"temperature": 0.3},
+            "sales_agent": {"model": "gpt-4o", "max_tokens": 600}
+        })
+
+        with patch('app.config.company_config.get_company_config', return_value=company_config):
+            sales = service.get_model_profile("sales_agent", "acme")
+            router = service.get_model_profile("router_agent", "acme")
+
+        assert sales == ModelProfile("gpt-4o", 600, 0.3)
+        assert router == ModelProfile("gpt-4o-mini", 150, 0.3)
+
+    def test_chat_model_is_the_pooled_chat_openai(self, service):
+        """Test get_chat_model keeps returning ChatOpenAI; coalescing is a separate opt-in"""
+        class _ChatOpenAI:
+            def __init__(self, **kwargs):
+                self.kwargs = kwargs
+
+        reset_client_pool()
+        with patch('app.services.openai_service.ChatOpenAI', _ChatOpenAI):
+            model = service.get_chat_model("router_agent", "acme")
+            coalesced = service.get_coalesced_chat_model("router_agent", "acme")
+
+            assert isinstance(model, _ChatOpenAI)
+            assert model.kwargs["model"] == "gpt-4o-mini"
+            assert service.get_chat_model("router_agent", "acme") is model
+            assert not isinstance(coalesced, _ChatOpenAI)
+        reset_client_pool()
+
+    def test_identical_completions_are_coalesced(self, service):
+        """Test duplicate in-flight prompts make a single upstream call"""
+        def create(**kwargs):
+            time.sleep(0.1)
+            return MagicMock(choices=[MagicMock(message=MagicMock(content="hola"))])
+
+        service.client.chat.completions.create.side_effect = create
+        messages = [{"role": "user", "content": "¿precio del botox?"}]
+
+        results, errors = _run_concurrently(lambda: service.generate_response(messages, agent_key="router_agent"))
+
+        assert not errors
+        assert results == ["hola"] * 5
+        assert service.client.chat.completions.create.call_count == 1
+        assert service.client.chat.completions.create.call_args.kwargs["model"] == "gpt-4o-mini"
+
+    def test_only_the_leader_is_charged(self, service):
+        """Test coalesced followers consume no tenant quota and are never throttled"""
+        from app.services.admission_control import TenantRateLimited
+
+        charged = []
+
+        def throttle(company_id, resource, cost=1):
+            if charged:
+                raise TenantRateLimited(company_id, resource, retry_after=30)
+            charged.append(cost)
+
+        def create(**kwargs):
+            time.sleep(0.1)
+            return MagicMock(choices=[MagicMock(message=MagicMock(content="hola"))])
+
+        service.client.chat.completions.create.side_effect = create
+        limiter = MagicMock()
+        limiter.throttle.side_effect = throttle
+        messages = [{"role": "user", "content": "¿precio del botox?"}]
+
+        with patch("app.services.admission_control.get_tenant_limiter", return_value=limiter), \
+                patch("app.services.openai_service._estimate_tokens", return_value=100):
+            results, errors = _run_concurrently(
+                lambda: service.generate_response(messages, agent_key="router_agent", company_id="acme")
+            )
+
+        assert not errors
+        assert results == ["hola"] * 5
+        assert charged == [100]
@@ -0,0 +1,103 @@
+"""
+Unit tests for orchestrator warmup in MultiAgentFactory
+
+Per-company single-flight construction, the cold/warming/ready/failed
+state machine and per-component build timings.
+"""
+
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services.multi_agent_factory import MultiAgentFactory, WarmupState
+
+
+@pytest.fixture
+def builds():
+    return []
+
+
+@pytest.fixture
+def factory(builds):
+    def slow_orchestrator(company_id, openai_service):
+        builds.append(company_id)
+        time.sleep(0.1)
+        return MagicMock(company_id=company_id)
+
+    company_manager = MagicMock()
+    company_manager.validate_company_id.return_value = True
+
+    with patch('app.services.multi_agent_orchestrator.MultiAgentOrchestrator', side_effect=slow_orchestrator), \
+         patch('app.services.multi_agent_factory.get_company_manager', return_value=company_manager):
+        instance = MultiAgentFactory(wait_timeout=5, failed_retry_after=0.2)
+        instance._get_openai_service = MagicMock()
+        instance._get_vectorstore_service = MagicMock()
+        instance._create_tool_executor = MagicMock()
+        yield instance
+
+
+def _concurrently(fn, count=5):
+    barrier = threading.Barrier(count)
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(fn())
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+class TestOrchestratorWarmup:
+    """Test suite for MultiAgentFactory warmup"""
+
+    def test_concurrent_requests_build_once(self, factory, builds):
+        """Test a burst for a cold tenant waits on a single build"""
+        results = _concurrently(lambda: factory.get_orchestrator("acme"))
+
+        assert builds == ["acme"]
+        assert len(results) == 5 and all(result is results[0] for result in results)
+
+        status = factory.get_warmup_status("acme")
+        assert status["state"] == WarmupState.READY.value
+        assert status["attempts"] == 1
+        assert {"openai_service", "orchestrator", "vectorstore", "tool_executor"} <= set(status["components_ms"])
+        assert status["components_ms"]["orchestrator"] >= 100
+
+    def test_warmup_async_triggers_once(self, factory, builds):
+        """Test webhook bursts start one background warmup and requests wait on it"""
+        started = [factory.warmup_async("acme") for _ in range(10)]
+
+        assert started.count(True) == 1
+        assert factory.get_warmup_status("acme")["state"] == WarmupState.WARMING.value
+
+        orchestrator = factory.get_orchestrator("acme")
+
+        assert orchestrator is not None
+        assert builds == ["acme"]
+        assert factory.warmup_async("acme") is False
+
+    def test_failed_warmup_is_not_retried_immediately(self, factory, builds):
+        """Test a failing tenant is rebuilt only after the retry window"""
+        factory._create_tool_executor.side_effect = RuntimeError("redis down")
+
+        assert factory.get_orchestrator("acme") is None
+        assert factory.get_orchestrator("acme") is None
+
+        status = factory.get_warmup_status("acme")
+        assert status["state"] == WarmupState.FAILED.value
+        assert "redis down" in status["error"]
+        assert builds == ["acme"]
+
+        factory._create_tool_executor.side_effect = None
+        time.sleep(0.25)
+
+        assert factory.get_orchestrator("acme") is not None
+        assert factory.get_warmup_status("acme")["state"] == WarmupState.READY.value
+        assert factory.get_warmup_status("acme")["attempts"] == 2
@@ -0,0 +1,97 @@
+"""
+Unit tests for PromptBudgeter
+
+Token-budgeted history, RAG context and question trimming, count caching
+and the per-call input token metric.
+"""
+
+import pytest
+from unittest.mock import patch
+
+from app.services.prompt_budgeter import AgentBudget, PromptBudgeter
+
+
+class TestPromptBudgeter:
+    """Test suite for PromptBudgeter"""
+
+    @pytest.fixture
+    def budgeter(self):
+        return PromptBudgeter(model_name="gpt-4o-mini")
+
+    @pytest.fixture
+    def budget(self):
+        return AgentBudget(max_input_tokens=1000, history_tokens=100, context_tokens=200, question_tokens=50)
+
+    def test_history_keeps_most_recent_turns(self, budgeter, budget):
+        """Test the oldest turns are dropped first"""
+        history = [{"role": "user", "content": f"mensaje {i} " + "x" * 120} for i in range(20)]
+        allocation = budgeter.allocate("sales_agent", budget=budget)
+
+        kept = budgeter.fit_history(history, allocation)
+
+        assert kept and len(kept) < len(history)
+        assert kept[-1] is history[-1]
+        assert kept == history[-len(kept):]
+        assert allocation.history_tokens <= budget.history_tokens
+        assert allocation.dropped_turns == len(history) - len(kept)
+
+    def test_context_drops_lowest_value_chunks(self, budgeter, budget):
+        """Test chunks are kept in relevance order and the tail is trimmed/dropped"""
+        chunks = [f"chunk {i} " + "palabra " * 80 for i in range(6)]
+        allocation = budgeter.allocate("sales_agent", budget=budget)
+
+        context = budgeter.fit_context(chunks, allocation, max_tokens=budget.context_tokens)
+
+        assert context.startswith("chunk 0")
+        assert "chunk 5" not in context
+        assert budgeter.count(context) <= budget.context_tokens
+        assert allocation.dropped_chunks > 0
+
+    def test_unused_history_budget_goes_to_context(self, budgeter, budget):
+        """Test a short conversation leaves more room for RAG context"""
+        allocation = budgeter.allocate("sales_agent", budget=budget)
+        budgeter.fit_history([], allocation)
+
+        assert allocation.context_allowance() == budget.context_tokens + budget.history_tokens
+
+    def test_long_question_is_trimmed(self, budgeter, budget):
+        """Test a question above its share is cut to the question budget"""
+        allocation = budgeter.allocate("sales_agent", budget=budget)
+
+        question = budgeter.fit_question("hola " * 500, allocation)
+
+        assert budgeter.count(question) <= budget.question_tokens
+        assert "question" in allocation.trimmed
+
+    def test_token_counts_are_cached(self, budgeter):
+        """Test repeated messages are counted once"""
+        budgeter.count("mensaje repetido del historial")
+
+        with patch.object(budgeter, "_get_encoding", side_effect=AssertionError("not cached")):
+            assert budgeter.count("mensaje repetido del historial") > 0
+
+    def test_input_tokens_metric(self, budgeter, budget):
+        """Test input tokens per call are exported per company/agent"""
+        for question in ("hola", "precio del botox"):
+            allocation = budgeter.allocate("sales_agent", system_prompt="Eres un asistente", budget=budget)
+            budgeter.fit_question(question, allocation)
+            budgeter.record("acme", allocation)
+
+        metric = budgeter.get_metrics("acme")["agents"]["acme:sales_agent"]
+
+        assert metric["calls"] == 2
+        assert metric["input_tokens_max"] >= metric["input_tokens_last"] > 0
+        assert metric["input_tokens_avg"] == metric["input_tokens_total"] / 2
+        assert budgeter.get_metrics("other")["agents"] == {}
+
+    def test_pinned_leading_message_is_kept(self, budgeter, budget):
+        """Test a leading pinned message survives trimming and counts against the budget"""
+        summary = {"role": "user", "content": "Historial previo: " + "dato " * 20, "pinned": True}
+        history = [summary] + [{"role": "user", "content": f"mensaje {i} " + "x" * 120} for i in range(20)]
+        allocation = budgeter.allocate("sales_agent", budget=budget)
+
+        kept = budgeter.fit_history(history, allocation)
+
+        assert kept[0] is summary
+        assert kept[-1] is history[-1]
+        assert allocation.history_tokens <= budget.history_tokens
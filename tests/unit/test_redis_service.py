@@ -0,0 +1,52 @@
+"""
+Unit tests for the shared Redis helpers
+
+Background services share one client per process and URL, get a fresh
+one after a fork, and keep using an injected client (tests) until then.
+"""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services import redis_service
+from app.services.redis_service import ProcessRedisClient, get_process_redis_client
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients(monkeypatch):
+    monkeypatch.setattr(redis_service, "_process_clients", {})
+    monkeypatch.setattr(redis_service, "_process_clients_pid", None)
+    with patch.object(redis_service.redis, "from_url", side_effect=lambda url, **kwargs: MagicMock(url=url)):
+        yield
+
+
+class TestProcessRedisClient:
+    """Test suite for the process-wide client"""
+
+    def test_one_client_per_url(self):
+        """Test services on the same URL share a client"""
+        first = get_process_redis_client("redis://a")
+
+        assert get_process_redis_client("redis://a") is first
+        assert get_process_redis_client("redis://b") is not first
+
+    def test_new_client_after_fork(self):
+        """Test a forked worker does not reuse the parent's connection pool"""
+        parent = get_process_redis_client("redis://a")
+
+        with patch.object(redis_service.os, "getpid", return_value=-1):
+            child = get_process_redis_client("redis://a")
+
+        assert child is not parent
+
+    def test_injected_client_is_used_until_fork(self):
+        """Test the mixin prefers an injected client in the process that set it"""
+        service = ProcessRedisClient()
+        service._redis_url = "redis://a"
+        injected = MagicMock()
+        service._use_client(injected)
+
+        assert service.redis is injected
+        with patch.object(redis_service.os, "getpid", return_value=-1):
+            assert service.redis is not injected
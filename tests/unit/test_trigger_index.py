@@ -0,0 +1,77 @@
+"""
+Unit tests for the per-company workflow trigger index
+
+Keyword automaton (Aho-Corasick) and webhook map used by
+WorkflowRegistry.find_workflow_by_trigger.
+"""
+
+import pytest
+
+from app.workflows.trigger_index import KeywordAutomaton, TriggerIndex
+from app.workflows.workflow_models import WorkflowGraph
+
+
+def _workflow(workflow_id, triggers):
+    return WorkflowGraph(
+        id=workflow_id,
+        name=workflow_id,
+        description="",
+        company_id="acme",
+        triggers=triggers
+    )
+
+
+class TestKeywordAutomaton:
+    """Test suite for KeywordAutomaton"""
+
+    def test_overlapping_keywords_return_lowest_rank(self):
+        """Test suffix matches reached through fail links are reported"""
+        automaton = KeywordAutomaton()
+        automaton.add("he", 2)
+        automaton.add("she", 1)
+        automaton.add("hers", 0)
+        automaton.build()
+
+        assert automaton.match("ushers") == 0
+        assert automaton.match("ushe") == 1
+        assert automaton.match("ahe") == 2
+        assert automaton.match("xyz") is None
+
+    def test_case_insensitive(self):
+        """Test keywords and text are matched case-insensitively"""
+        automaton = KeywordAutomaton()
+        automaton.add("Botox", 0)
+
+        assert automaton.match("quiero BOTOX ya") == 0
+
+
+class TestTriggerIndex:
+    """Test suite for TriggerIndex"""
+
+    @pytest.fixture
+    def index(self):
+        workflows = [
+            _workflow("wf_botox", [{"type": "keyword", "keywords": ["botox", "relleno"]}]),
+            _workflow("wf_precio", [{"type": "keyword", "keywords": ["precio"]}]),
+            _workflow("wf_hook", [{"type": "webhook", "webhook_id": "hook_1"}]),
+            _workflow("wf_cron", [{"type": "schedule", "cron": "0 9 * * *"}]),
+        ]
+        return TriggerIndex("acme", workflows)
+
+    def test_keyword_match(self, index):
+        """Test substring keyword match"""
+        assert index.match({"type": "keyword", "value": "¿Cuál es el precio?"}).id == "wf_precio"
+
+    def test_first_workflow_wins(self, index):
+        """Test ordering matches the linear scan (first workflow in list)"""
+        assert index.match({"value": "precio del botox"}).id == "wf_botox"
+
+    def test_webhook_match(self, index):
+        """Test webhook_id lookup"""
+        assert index.match({"type": "webhook", "webhook_id": "hook_1"}).id == "wf_hook"
+        assert index.match({"type": "webhook", "webhook_id": "other"}) is None
+
+    def test_no_match(self, index):
+        """Test messages without keywords do not match"""
+        assert index.match({"value": "hola"}) is None
+        assert index.get_stats()["keywords"] == 3
@@ -0,0 +1,296 @@
+"""
+Unit tests for the background vector index health monitor
+
+One worker holds the lease and checks every company off the request path,
+stored documents are counted with maintained counters instead of SCAN,
+and the request path only reads the published status.
+"""
+
+import json
+import os
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services.vector_auto_recovery import RedisVectorAutoRecovery, VectorstoreProtectionMiddleware
+from app.services.vector_health import (
+    VectorHealthMonitor,
+    adjust_document_count,
+    publish_health,
+    read_document_count,
+    reconcile_document_count
+)
+
+
+class _FakeRedis:
+    """Dict-backed Redis with strings, hashes, sets and the lease/counter scripts"""
+
+    def __init__(self, keys=()):
+        self.data = {}
+        self.hashes = {}
+        self.sets = {}
+        self.keys = list(keys)
+        self.scans = 0
+        self.dropped = []
+        self.index_info = {"num_docs": 1}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def hget(self, key, field):
+        value = self.hashes.get(key, {}).get(field)
+        return str(value) if value is not None else None
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = int(value)
+
+    def sadd(self, key, member):
+        self.sets.setdefault(key, set()).add(member)
+
+    def spop(self, key, count):
+        members = self.sets.pop(key, set())
+        return list(members)
+
+    def scard(self, key):
+        return len(self.sets.get(key, ()))
+
+    def scan_iter(self, match=None, count=None):
+        self.scans += 1
+        prefix = match.rstrip("*")
+        return iter([key for key in self.keys if key.startswith(prefix)])
+
+    def ft(self, index_name):
+        redis = self
+
+        class _Index:
+            def info(self):
+                if isinstance(redis.index_info, Exception):
+                    raise redis.index_info
+                return redis.index_info
+
+            def dropindex(self, delete_documents=False):
+                redis.dropped.append(index_name)
+
+        return _Index()
+
+    def register_script(self, source):
+        if "HEXISTS" in source:
+            def adjust(keys, args):
+                counts = self.hashes.get(keys[0], {})
+                if args[0] in counts:
+                    counts[args[0]] += int(args[1])
+                    return counts[args[0]]
+                return None
+            return adjust
+
+        def lease(keys, args):
+            if self.data.get(keys[0]) == args[0]:
+                return 1
+            return 1 if self.set(keys[0], args[0], nx=True) else 0
+        return lease
+
+
+def _monitor(redis_client, token, checked, companies=("benova", "medispa")):
+    monitor_class = type("TokenMonitor", (VectorHealthMonitor,), {"token": token})
+    monitor = monitor_class(
+        interval=30, reconcile_seconds=3600,
+        check=lambda company_id, reconcile: checked.append((token, company_id, reconcile)) or {"healthy": True},
+        companies=lambda: list(companies)
+    )
+    monitor._client = redis_client
+    monitor._client_pid = os.getpid()
+    return monitor
+
+
+class TestVectorHealthMonitor:
+    """Test suite for VectorHealthMonitor"""
+
+    def test_only_the_leader_checks(self):
+        """Test one lease holder checks every company; other workers stay idle"""
+        redis_client, checked = _FakeRedis(), []
+        leader = _monitor(redis_client, "host:1", checked)
+        follower = _monitor(redis_client, "host:2", checked)
+
+        assert leader.run_once(now=1000.0) == 2
+        assert follower.run_once(now=1000.0) == 0
+        assert checked == [("host:1", "benova", True), ("host:1", "medispa", True)]
+        assert leader.get_stats()["leader"] and not follower.get_stats()["leader"]
+
+    def test_requested_checks_run_before_the_next_cycle(self):
+        """Test pending checks are drained early and counters are not re-scanned"""
+        redis_client, checked = _FakeRedis(), []
+        leader = _monitor(redis_client, "host:1", checked)
+        leader.run_once(now=1000.0)
+        checked.clear()
+
+        assert leader.run_once(now=1005.0) == 0
+        redis_client.sadd(VectorHealthMonitor.PENDING_KEY, "medispa")
+
+        assert leader.run_once(now=1006.0) == 1
+        assert checked == [("host:1", "medispa", False)]
+
+
+class TestDocumentCounters:
+    """Test suite for maintained stored-document counters"""
+
+    def test_counter_is_only_adjusted_after_reconcile(self):
+        """Test writes before the first reconcile never create a partial count"""
+        redis_client = _FakeRedis(keys=["benova_documents:1", "benova_documents:2", "medispa_documents:1"])
+
+        adjust_document_count(redis_client, "benova:", "benova_documents", 5)
+        assert read_document_count(redis_client, "benova:", "benova_documents") is None
+
+        assert reconcile_document_count(redis_client, "benova:", "benova_documents") == 2
+        adjust_document_count(redis_client, "benova:", "benova_documents", 3)
+        adjust_document_count(redis_client, "benova:", "benova_documents", -1)
+        assert read_document_count(redis_client, "benova:", "benova_documents") == 4
+
+
+class _FakeAlias:
+    def __init__(self, shared=False):
+        self.shared = shared
+
+    def active_index(self):
+        return "shared_documents" if self.shared else "benova_documents"
+
+    def key_prefix_for(self, index_name):
+        return f"{index_name}:benova" if self.shared else index_name
+
+    def is_shared(self, index_name):
+        return self.shared
+
+    def shared_settings(self):
+        return None
+
+
+def _auto_recovery(redis_client, shared=False):
+    recovery = RedisVectorAutoRecovery.__new__(RedisVectorAutoRecovery)
+    recovery.company_id = "benova"
+    recovery.redis_prefix = "benova:"
+    recovery.base_index_name = "benova_documents"
+    recovery.redis_client = redis_client
+    recovery.index_alias = _FakeAlias(shared)
+    recovery.health_cache = {"last_check": 0, "status": None}
+    recovery.auto_recovery_enabled = True
+    recovery.health_check_interval = 30
+    recovery._recovery_lock = threading.Lock()
+    return recovery
+
+
+class TestRequestPath:
+    """Test suite for the request-path side of auto-recovery"""
+
+    def test_verify_reads_the_published_status(self):
+        """Test the request path neither scans nor reconstructs"""
+        redis_client = _FakeRedis(keys=["benova_documents:1"])
+        publish_health(redis_client, "benova:", {"healthy": False, "needs_recovery": True}, ttl=90)
+        recovery = _auto_recovery(redis_client)
+        recovery.reconstruct_index_from_stored_data = lambda: pytest.fail("recovery on the request path")
+
+        assert not recovery.ensure_index_healthy()
+        assert redis_client.scans == 0
+        assert redis_client.sets[VectorHealthMonitor.PENDING_KEY] == {"benova"}
+
+    def test_failed_search_asks_the_monitor_and_returns_empty(self):
+        """Test a retriever error requests a background check instead of rebuilding inline"""
+        redis_client = _FakeRedis()
+        publish_health(redis_client, "benova:", {"healthy": True, "needs_recovery": False}, ttl=90)
+        recovery = _auto_recovery(redis_client)
+        recovery.reconstruct_index_from_stored_data = lambda: pytest.fail("recovery on the request path")
+
+        class _Retriever:
+            def invoke(self, query, config=None, **kwargs):
+                raise RuntimeError("no such index")
+
+        class _Service:
+            vectorstore = object()
+            retriever = _Retriever()
+
+            def get_retriever(self):
+                return self.retriever
+
+        service = _Service()
+        assert VectorstoreProtectionMiddleware(recovery).apply_protection(service)
+
+        assert service.retriever.invoke("botox") == []
+        assert redis_client.sets[VectorHealthMonitor.PENDING_KEY] == {"benova"}
+        assert json.loads(redis_client.data["benova:vector_health"])["healthy"]
+
+
+class TestSharedIndexRecovery:
+    """Test suite for recovery of tenants in the shared index"""
+
+    def test_recovery_never_drops_the_shared_index(self):
+        """Test one tenant's recovery leaves the index every tenant uses in place"""
+        redis_client = _FakeRedis(keys=["shared_documents:benova:1", "shared_documents:medispa:1"])
+        recovery = _auto_recovery(redis_client, shared=True)
+
+        with patch('app.services.vector_auto_recovery.current_app', MagicMock(config={"REDIS_URL": "redis://"})), \
+             patch('app.services.vector_auto_recovery.ensure_shared_index', return_value=False) as ensure:
+            assert not recovery.reconstruct_index_from_stored_data()
+
+        assert redis_client.dropped == []
+        ensure.assert_called_once()
+
+
+class TestAutomaticRecovery:
+    """Test suite for when the monitor rebuilds an index on its own"""
+
+    def _recovery(self, redis_client, shared=False):
+        recovery = _auto_recovery(redis_client, shared)
+        recovery.rebuilt = 0
+
+        def reconstruct():
+            recovery.rebuilt += 1
+            return True
+
+        recovery.reconstruct_index_from_stored_data = reconstruct
+        return recovery
+
+    def test_probe_errors_are_unknown_not_recovery(self):
+        """Test a transient Redis error never triggers a rebuild"""
+        redis_client = _FakeRedis(keys=["benova_documents:1"])
+        redis_client.index_info = ConnectionError("connection reset by peer")
+        recovery = self._recovery(redis_client)
+
+        for _ in range(5):
+            health = recovery.check_now()
+
+        assert health["status"] == "unknown" and not health["needs_recovery"]
+        assert recovery.rebuilt == 0
+
+    def test_rebuild_needs_repeated_confirmation(self):
+        """Test a missing index is rebuilt only after consecutive confirmed checks"""
+        redis_client = _FakeRedis(keys=["benova_documents:1", "benova_documents:2"])
+        redis_client.index_info = RuntimeError("Unknown index name")
+        recovery = self._recovery(redis_client)
+
+        recovery.check_now()
+        recovery.check_now()
+        assert recovery.rebuilt == 0
+
+        recovery.check_now()
+        assert recovery.rebuilt == 1
+
+    def test_shared_index_is_never_rebuilt_automatically(self):
+        """Test an empty tenant in the shared index only raises an alert"""
+        redis_client = _FakeRedis(keys=["shared_documents:benova:1"])
+        recovery = self._recovery(redis_client, shared=True)
+
+        with patch('app.services.vector_auto_recovery.count_tenant_documents', return_value=0):
+            for _ in range(5):
+                health = recovery.check_now()
+
+        assert health["needs_recovery"] and health["recovery_confirmations"] == 5
+        assert recovery.rebuilt == 0 and redis_client.dropped == []
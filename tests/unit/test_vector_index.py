@@ -0,0 +1,352 @@
+"""
+Unit tests for compact per-tenant vector storage
+
+Per-company VectorSettings, truncate/renormalize/float16 conversion of
+stored vectors, the logical index alias (dedicated and shared indexes)
+and the copy step of the online re-index.
+"""
+
+import math
+import struct
+from unittest.mock import patch
+
+import pytest
+
+from app.services import vector_index
+from app.services.vector_index import (
+    LEGACY_SETTINGS,
+    VectorIndexAlias,
+    VectorSettings,
+    convert_vector,
+    copy_vectors,
+    decode_vector,
+    encode_vector,
+    tenant_filter_query
+)
+
+
+class _FakeIndex:
+    def __init__(self, exists):
+        self.exists = exists
+
+    def info(self):
+        if not self.exists:
+            raise RuntimeError("Unknown index name")
+        return {"num_docs": 1}
+
+
+class _FakeRedis:
+    """Dict-backed Redis with hashes, pipelines and FT.INFO existence"""
+
+    def __init__(self, indexes=()):
+        self.hashes = {}
+        self.indexes = set(indexes)
+
+    def ft(self, name):
+        return _FakeIndex(name in self.indexes)
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        state = self.hashes.setdefault(key, {})
+        if mapping:
+            state.update(mapping)
+        else:
+            state[field] = value
+
+    def hsetnx(self, key, field, value):
+        state = self.hashes.setdefault(key, {})
+        if field in state:
+            return 0
+        state[field] = value
+        return 1
+
+    def hincrby(self, key, field, amount=1):
+        state = self.hashes.setdefault(key, {})
+        state[field] = int(state.get(field, 0)) + amount
+        return state[field]
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    def exists(self, key):
+        return int(key in self.hashes)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.hashes.pop(key, None)
+
+    def pipeline(self, transaction=False):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((getattr(self.redis, name), args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+COMPACT = VectorSettings(dimensions=4, dtype="float16", algorithm="hnsw")
+
+
+def _unit(values):
+    norm = math.sqrt(sum(value * value for value in values))
+    return [value / norm for value in values]
+
+
+class TestVectorSettings:
+    """Test suite for VectorSettings"""
+
+    def test_company_overrides_are_normalized(self):
+        """Test vector_settings from JSON override the app defaults"""
+        settings = VectorSettings.from_dict({"dimensions": "768", "dtype": "FLOAT16", "unknown": 1}, base=LEGACY_SETTINGS)
+
+        assert settings == VectorSettings(dimensions=768, dtype="float16")
+        assert settings.bytes_per_vector == 1536
+        assert LEGACY_SETTINGS.bytes_per_vector == 6144
+        assert LEGACY_SETTINGS.request_dimensions is None
+
+    def test_hnsw_parameters_reach_the_schema(self):
+        """Test M/EF are only sent for HNSW indexes"""
+        attrs = COMPACT.index_schema("benova_documents_v2")["fields"][1]["attrs"]
+
+        assert attrs == {"dims": 4, "distance_metric": "cosine", "algorithm": "hnsw", "datatype": "float16",
+                         "m": 16, "ef_construction": 200, "ef_runtime": 10}
+        assert "m" not in LEGACY_SETTINGS.vector_attrs()
+
+    def test_invalid_settings_are_rejected(self):
+        """Test unknown dtypes and algorithms fail fast"""
+        with pytest.raises(ValueError):
+            VectorSettings.from_dict({"dtype": "int8"})
+        with pytest.raises(ValueError):
+            VectorSettings.from_dict({"algorithm": "ivf"})
+
+
+class TestConvertVector:
+    """Test suite for stored vector conversion"""
+
+    def test_truncates_renormalizes_and_halves(self):
+        """Test a 1536 float32 vector becomes a unit-length reduced float16 vector"""
+        source = _unit([float(i % 7 + 1) for i in range(8)])
+        raw = encode_vector(source, "float32")
+
+        converted = convert_vector(raw, VectorSettings(dimensions=8), COMPACT)
+
+        assert len(converted) == 4 * 2
+        values = decode_vector(converted, "float16")
+        assert values == pytest.approx(_unit(source[:4]), abs=1e-3)
+
+    def test_more_dimensions_need_re_embedding(self):
+        """Test truncation cannot grow a vector"""
+        raw = encode_vector([1.0, 0.0, 0.0, 0.0], "float16")
+
+        assert convert_vector(raw, COMPACT, VectorSettings(dimensions=8)) is None
+
+
+class TestVectorIndexAlias:
+    """Test suite for the logical index alias"""
+
+    def test_existing_index_keeps_its_original_settings(self):
+        """Test a pre-existing index is opened as 1536 float32 until re-indexed"""
+        redis_client = _FakeRedis(indexes={"benova_documents"})
+        alias = VectorIndexAlias(redis_client, "benova", "benova:", "benova_documents", "shared_documents")
+
+        route = alias.resolve(COMPACT)
+
+        assert route.index == "benova_documents"
+        assert route.settings == LEGACY_SETTINGS
+        assert route.target is None
+
+    def test_new_company_uses_configured_settings(self):
+        """Test a company without an index starts with its compact settings"""
+        alias = VectorIndexAlias(_FakeRedis(), "medispa", "medispa:", "medispa_documents", "shared_documents")
+
+        assert alias.resolve(COMPACT).settings == COMPACT
+
+    def test_begin_dual_write_then_swap(self):
+        """Test the target is visible for dual-write and becomes active on swap"""
+        redis_client = _FakeRedis(indexes={"benova_documents"})
+        alias = VectorIndexAlias(redis_client, "benova", "benova:", "benova_documents", "shared_documents")
+        alias.resolve(COMPACT)
+
+        target = alias.begin(COMPACT)
+        route = alias.resolve(COMPACT)
+        # Never prefixed by the old index name: RediSearch PREFIX is a string prefix
+        assert (target, route.target, route.target_settings) == ("v2_benova_documents", target, COMPACT)
+        with pytest.raises(RuntimeError):
+            alias.begin(COMPACT)
+
+        assert alias.swap(target) == "benova_documents"
+        route = alias.resolve(LEGACY_SETTINGS)
+        assert (route.index, route.settings, route.target) == (target, COMPACT, None)
+
+
+class TestSharedIndex:
+    """Test suite for the shared multi-tenant index mode"""
+
+    @pytest.fixture(autouse=True)
+    def app_defaults(self):
+        with patch.object(vector_index, "default_vector_settings", lambda config=None: VectorSettings()):
+            yield
+
+    def test_new_small_tenant_joins_the_shared_index(self):
+        """Test a company in shared mode never creates its own index"""
+        redis_client = _FakeRedis()
+        alias = VectorIndexAlias(redis_client, "spa", "spa:", "spa_documents", "shared_documents")
+
+        route = alias.resolve(COMPACT, shared=True)
+
+        assert (route.index, route.shared, route.key_prefix) == ("shared_documents", True, "shared_documents:spa")
+        assert route.settings == VectorSettings()  # global shape of the shared index, not the company's
+
+    def test_dedicated_tenant_migrates_into_the_shared_index(self):
+        """Test the migration path swaps the alias to the shared index under the tenant prefix"""
+        redis_client = _FakeRedis(indexes={"benova_documents"})
+        alias = VectorIndexAlias(redis_client, "benova", "benova:", "benova_documents", "shared_documents")
+        alias.resolve(LEGACY_SETTINGS)
+
+        target = alias.begin(alias.shared_settings(), shared=True)
+        route = alias.resolve(LEGACY_SETTINGS)
+        assert (route.target, route.target_key_prefix) == ("shared_documents", "shared_documents:benova")
+
+        alias.swap(target)
+        assert alias.get_state()["mode"] == "shared"
+
+    def test_copy_into_shared_index_tags_the_tenant(self):
+        """Test copied documents carry the company_id TAG and the tenant key prefix"""
+        redis_client = _FakeRedis()
+        redis_client.hashes[b"benova_documents:01A"] = {b"embedding": encode_vector(_unit([1.0] * 8), "float32")}
+
+        copy_vectors(redis_client, [b"benova_documents:01A"], "benova_documents", VectorSettings(dimensions=8),
+                     "shared_documents:benova", VectorSettings(dimensions=8),
+                     fields_override={"company_id": "benova"})
+
+        assert redis_client.hashes[b"shared_documents:benova:01A"][b"company_id"] == b"benova"
+
+    def test_schema_and_filter(self):
+        """Test the shared schema has the TAG field and tenant ids are escaped in filters"""
+        schema = LEGACY_SETTINGS.index_schema("shared_documents", prefix="shared_documents:spa", shared=True)
+
+        assert schema["index"]["prefix"] == "shared_documents:spa"
+        assert {"name": "company_id", "type": "tag"} in schema["fields"]
+        assert tenant_filter_query("spa_wellness") == "@company_id:{spa_wellness}"
+        assert tenant_filter_query("dental-clinic") == "@company_id:{dental\\-clinic}"
+
+
+class TestCopyVectors:
+    """Test suite for the re-index copy step"""
+
+    def test_copies_converted_vectors_under_the_same_id(self):
+        """Test documents keep their id and metadata in the target index"""
+        redis_client = _FakeRedis()
+        source = VectorSettings(dimensions=8)
+        redis_client.hashes[b"idx:01A"] = {
+            b"text": b"botox preventivo", b"doc_id": b"doc-1", b"index_name": b"idx",
+            b"embedding": encode_vector(_unit([1.0] * 8), "float32")
+        }
+
+        copied = copy_vectors(redis_client, [b"idx:01A"], "idx", source, "v2_idx", COMPACT,
+                              fields_override={"index_name": "v2_idx"})
+
+        assert copied == 1
+        copy = redis_client.hashes[b"v2_idx:01A"]
+        assert copy[b"doc_id"] == b"doc-1" and copy[b"index_name"] == b"v2_idx"
+        assert decode_vector(copy[b"embedding"], "float16") == pytest.approx([0.5] * 4, abs=1e-3)
+
+    def test_upscaling_re_embeds_the_text(self):
+        """Test the embed callback is used when dimensions grow"""
+        redis_client = _FakeRedis()
+        redis_client.hashes[b"idx:01A"] = {b"text": b"hola", b"embedding": encode_vector([1.0, 0, 0, 0], "float16")}
+        embedded = []
+
+        def embed(texts):
+            embedded.extend(texts)
+            return [[0.125] * 8 for _ in texts]
+
+        copy_vectors(redis_client, [b"idx:01A"], "idx", COMPACT, "v2_idx", VectorSettings(dimensions=8), embed)
+
+        assert embedded == ["hola"]
+        assert struct.unpack("<8f", redis_client.hashes[b"v2_idx:01A"][b"embedding"]) == (0.125,) * 8
+
+    def test_documents_deleted_during_copy_are_not_resurrected(self):
+        """Test a source deleted between read and write leaves no copy behind"""
+        redis_client = _FakeRedis()
+        redis_client.hashes[b"idx:01A"] = {b"embedding": encode_vector([1.0, 0, 0, 0], "float16")}
+        def delete_source_after_write(key, mapping=None, **kwargs):
+            _FakeRedis.hset(redis_client, key, mapping=mapping)
+            redis_client.hashes.pop(b"idx:01A", None)
+
+        redis_client.hset = delete_source_after_write
+
+        assert copy_vectors(redis_client, [b"idx:01A"], "idx", COMPACT, "v2_idx", COMPACT) == 0
+        assert b"v2_idx:01A" not in redis_client.hashes
+
+
+class _Limiter:
+    def __init__(self, burst, throttled=0):
+        from app.services.admission_control import RateLimit
+        self.limit = RateLimit(per_minute=600, burst=burst)
+        self.throttled = throttled
+        self.costs = []
+
+    def get_limit(self, company_id, resource):
+        return self.limit
+
+    def throttle(self, company_id, resource, cost=1.0):
+        from app.services.admission_control import TenantRateLimited
+        if self.throttled:
+            self.throttled -= 1
+            raise TenantRateLimited(company_id, resource, 0.0)
+        self.costs.append(cost)
+
+
+class _Embeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        return [[0.0] * 4 for _ in texts]
+
+
+class TestReindexEmbeddings:
+    """Test suite for throttled re-embedding during a re-index"""
+
+    def test_batches_are_split_to_the_bucket_burst(self):
+        """Test a copy batch larger than the bucket is embedded in chunks that fit"""
+        limiter, embeddings = _Limiter(burst=150), _Embeddings()
+
+        with patch('app.services.admission_control.get_tenant_limiter', return_value=limiter):
+            vectors = vector_index.VectorReindexer("benova", batch_size=200)._embed_throttled(
+                embeddings, [f"doc {i}" for i in range(200)]
+            )
+
+        assert len(vectors) == 200
+        assert limiter.costs == [150, 50] and embeddings.calls == [150, 50]
+
+    def test_persistent_throttling_aborts(self):
+        """Test retries are bounded so the re-index fails instead of spinning forever"""
+        from app.services.admission_control import TenantRateLimited
+        limiter, embeddings = _Limiter(burst=150, throttled=100), _Embeddings()
+        reindexer = vector_index.VectorReindexer("benova", batch_size=200)
+        reindexer.max_throttle_retries = 3
+
+        with patch('app.services.admission_control.get_tenant_limiter', return_value=limiter):
+            with pytest.raises(TenantRateLimited):
+                reindexer._embed_throttled(embeddings, ["hola"])
+
+        assert limiter.throttled == 96 and embeddings.calls == []
@@ -0,0 +1,123 @@
+"""
+Unit tests for the two-level workflow cache in WorkflowRegistry
+
+L1 in-process LRU, L2 Redis keyed by company version, per-tenant stats.
+"""
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+from app.workflows.workflow_models import WorkflowGraph
+from app.workflows.workflow_registry import WorkflowRegistry
+
+
+class _FakeRedis:
+    """Minimal dict-backed Redis for the cache paths"""
+
+    def __init__(self):
+        self.data = {}
+        self.hashes = {}
+        self.published = []
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key) or 0) + 1)
+        return int(self.data[key])
+
+    def hget(self, name, key):
+        return self.hashes.get(name, {}).get(key)
+
+    def hset(self, name, key, value):
+        self.hashes.setdefault(name, {})[key] = value
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    def pipeline(self):
+        pipe = MagicMock()
+        calls = []
+        pipe.setex.side_effect = lambda *a: calls.append((self.setex, a))
+        pipe.hset.side_effect = lambda *a: calls.append((self.hset, a))
+        pipe.execute.side_effect = lambda: [fn(*a) for fn, a in calls]
+        return pipe
+
+
+class TestWorkflowRegistryCache:
+    """Test suite for the two-level workflow cache"""
+
+    @pytest.fixture
+    def redis(self):
+        return _FakeRedis()
+
+    @pytest.fixture
+    def workflow(self):
+        return WorkflowGraph(id="wf_1", name="test", description="", company_id="acme")
+
+    def _registry(self, redis, workflow):
+        with patch('app.workflows.workflow_registry.get_redis_client', return_value=redis), \
+             patch('app.workflows.workflow_registry.resolve_redis_url', return_value="redis://test"):
+            registry = WorkflowRegistry()
+        registry._ensure_invalidation_listener = lambda: None
+        registry._get_from_database = MagicMock(side_effect=lambda wid: WorkflowGraph.from_json(workflow.to_json()))
+        return registry
+
+    def test_l1_returns_same_object(self, redis, workflow):
+        """Test repeated reads are served from L1 without Postgres"""
+        registry = self._registry(redis, workflow)
+
+        first = registry.get_workflow("wf_1")
+        second = registry.get_workflow("wf_1")
+
+        assert first is second
+        assert registry._get_from_database.call_count == 1
+        stats = registry.get_cache_stats("acme")
+        assert stats["misses"] == 1 and stats["l1_hits"] == 1
+
+    def test_l2_shared_between_workers(self, redis, workflow):
+        """Test a second registry (another worker) hits L2"""
+        self._registry(redis, workflow).get_workflow("wf_1")
+        other = self._registry(redis, workflow)
+
+        assert other.get_workflow("wf_1").id == "wf_1"
+        assert other._get_from_database.call_count == 0
+        assert other.get_cache_stats("acme")["l2_hits"] == 1
+
+    def test_company_invalidation_bumps_version(self, redis, workflow):
+        """Test invalidation increments version, evicts L1 and publishes"""
+        registry = self._registry(redis, workflow)
+        cached = registry.get_workflow("wf_1")
+
+        registry._invalidate_company_cache("acme", "wf_1")
+
+        assert redis.get("workflow_cache_version:acme") == "1"
+        assert redis.published
+        reloaded = registry.get_workflow("wf_1")
+        assert reloaded is not cached
+        assert registry._get_from_database.call_count == 2
+
+    def test_stale_version_not_inserted(self, redis, workflow):
+        """Test a load that raced with an invalidation does not repopulate L1"""
+        registry = self._registry(redis, workflow)
+        registry._apply_invalidation("acme", None, version=3)
+
+        registry._l1_put(workflow, version=2)
+
+        assert registry._l1_get("wf_1") is None
+
+    def test_preload_builds_plans_and_trigger_index(self, redis, workflow):
+        """Test the pre-fork preload compiles plans and indexes without the pub/sub listener"""
+        registry = self._registry(redis, workflow)
+        registry._ensure_invalidation_listener = MagicMock()
+        registry.get_workflows_by_company = MagicMock(return_value=[workflow])
+
+        stats = registry.preload(["acme"])
+
+        assert stats == {"companies": 1, "workflows": 1, "plans": 1}
+        assert workflow._plan is not None
+        assert "acme" in registry._trigger_indexes
+        registry._ensure_invalidation_listener.assert_not_called()
@@ -0,0 +1,90 @@
+"""
+Unit tests for WorkflowRuntime
+
+Persistent event loop per worker, blocking offload and per-workflow
+concurrency limits.
+"""
+
+import asyncio
+import time
+
+import pytest
+from unittest.mock import patch
+
+from app.workflows.workflow_runtime import (
+    WorkflowRuntime,
+    WorkflowConcurrencyLimitExceeded
+)
+
+
+class TestWorkflowRuntime:
+    """Test suite for WorkflowRuntime"""
+
+    @pytest.fixture
+    def runtime(self):
+        """Runtime isolated from Flask app context"""
+        with patch.object(WorkflowRuntime, '_current_app', staticmethod(lambda: None)):
+            rt = WorkflowRuntime(max_workers=4, max_concurrent_per_workflow=1, execution_ttl=60)
+            yield rt
+            rt.shutdown()
+
+    def test_loop_is_reused_across_submissions(self, runtime):
+        """Test the same long-lived loop serves every submission"""
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        first = runtime.submit(current_loop()).result(timeout=2)
+        second = runtime.submit(current_loop()).result(timeout=2)
+
+        assert first is second
+        assert first is runtime.loop
+
+    def test_blocking_calls_overlap(self, runtime):
+        """Test run_blocking offloads sync work so gathered calls run concurrently"""
+        async def fan_out():
+            return await asyncio.gather(*[
+                runtime.run_blocking(time.sleep, 0.2) for _ in range(3)
+            ])
+
+        start = time.monotonic()
+        runtime.submit(fan_out()).result(timeout=5)
+
+        assert time.monotonic() - start < 0.5
+
+    def test_concurrency_limit_rejects_when_not_waiting(self, runtime):
+        """Test per-workflow limit rejects extra executions with wait_for_slot=False"""
+        async def slow():
+            await asyncio.sleep(0.2)
+            return "done"
+
+        first = runtime.submit(slow(), workflow_key="acme:wf_1")
+        time.sleep(0.05)
+        second = runtime.submit(slow(), workflow_key="acme:wf_1", wait_for_slot=False)
+
+        with pytest.raises(WorkflowConcurrencyLimitExceeded):
+            second.result(timeout=2)
+        assert first.result(timeout=2) == "done"
+        assert runtime.get_stats()["rejected"] == 1
+
+    def test_background_execution_tracks_status(self, runtime):
+        """Test submit_background returns immediately and records final status"""
+        stored = {}
+        completed = []
+
+        async def workflow():
+            await asyncio.sleep(0.05)
+            return {"status": "success", "completed_at": "2025-01-15T14:00:00"}
+
+        with patch.object(runtime, '_store_execution', side_effect=lambda r: stored.update({r["execution_id"]: r})):
+            execution_id = runtime.submit_background(
+                workflow(), company_id="acme", workflow_id="wf_1",
+                on_complete=completed.append
+            )
+            assert stored[execution_id]["status"] in ("pending", "running")
+
+            deadline = time.monotonic() + 2
+            while stored[execution_id]["status"] != "success" and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        assert stored[execution_id]["status"] == "success"
+        assert completed[0]["execution_id"] == execution_id
@@ -0,0 +1,241 @@
+"""
+Unit tests for durable workflow execution
+
+Cron expressions, the Redis sorted-set timer queue and WAIT nodes that
+suspend an execution and resume it from its checkpoint.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.workflows.workflow_executor import WorkflowExecutor
+from app.workflows.workflow_models import WorkflowGraph, WorkflowNode, WorkflowEdge, NodeType, EdgeType
+from app.workflows.workflow_runtime import WorkflowRuntime
+from app.workflows.workflow_scheduler import CronExpression, WorkflowScheduler
+
+
+class _FakeRedis:
+    """Minimal dict-backed Redis with sorted sets"""
+
+    def __init__(self):
+        self.data = {}
+        self.zsets = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def expire(self, key, ttl):
+        return key in self.data
+
+    def zadd(self, key, mapping, nx=False):
+        zset = self.zsets.setdefault(key, {})
+        added = 0
+        for member, score in mapping.items():
+            if nx and member in zset:
+                continue
+            added += member not in zset
+            zset[member] = score
+        return added
+
+    def zrem(self, key, member):
+        return 1 if self.zsets.get(key, {}).pop(member, None) is not None else 0
+
+    def zrangebyscore(self, key, low, high, start=0, num=None):
+        members = sorted(self.zsets.get(key, {}).items(), key=lambda item: item[1])
+        due = [member for member, score in members if score <= high]
+        return due[start:start + num] if num else due
+
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def register_script(self, source):
+        if "ZRANGEBYSCORE" in source:
+            def move(keys, args):
+                source_key, target_key = keys
+                max_score, new_score, limit = args
+                members = self.zrangebyscore(source_key, "-inf", max_score, start=0, num=int(limit))
+                for member in members:
+                    self.zrem(source_key, member)
+                    self.zadd(target_key, {member: new_score})
+                return members
+            return move
+
+        def save_running(keys, args):
+            checkpoint_key, timers_key, lock_key = keys
+            ttl, payload, recover_member, recover_at, lease = args
+            if lock_key not in self.data:
+                return 0
+            self.setex(checkpoint_key, ttl, payload)
+            self.zadd(timers_key, {recover_member: recover_at})
+            return 1
+        return save_running
+
+    def pipeline(self):
+        redis = self
+
+        class _Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: self.calls.append((getattr(redis, name), args, kwargs))
+
+            def execute(self):
+                return [fn(*args, **kwargs) for fn, args, kwargs in self.calls]
+
+        return _Pipeline()
+
+
+@pytest.fixture
+def scheduler():
+    with patch('app.workflows.workflow_scheduler.resolve_redis_url', return_value="redis://test"), \
+         patch.object(WorkflowScheduler, '_company_key',
+                      staticmethod(lambda pattern, company_id, suffix: f"{company_id}:{pattern}:{suffix}")):
+        instance = WorkflowScheduler(inline_wait_max_ms=100)
+        instance._client = _FakeRedis()
+        instance._client_pid = __import__('os').getpid()
+        yield instance
+
+
+class TestCronExpression:
+    """Test suite for CronExpression"""
+
+    def test_weekdays_only(self):
+        """Test a weekday schedule skips the weekend"""
+        cron = CronExpression("0 9 * * 1-5")
+        friday = datetime(2024, 5, 10, 10, 0)
+
+        assert cron.next_after(friday) == datetime(2024, 5, 13, 9, 0)
+
+    def test_steps_and_lists(self):
+        """Test */15 and comma-separated values"""
+        assert CronExpression("*/15 * * * *").next_after(datetime(2024, 1, 1, 8, 7)) == datetime(2024, 1, 1, 8, 15)
+        assert CronExpression("30 8,20 1 * *").next_after(datetime(2024, 1, 1, 9, 0)) == datetime(2024, 1, 1, 20, 30)
+
+    def test_timezone(self):
+        """Test the expression is evaluated in the trigger timezone"""
+        after = datetime(2024, 3, 1, 0, 0, tzinfo=timezone.utc).timestamp()
+        utc_run = CronExpression("0 9 * * *").next_timestamp(after)
+        bogota_run = CronExpression("0 9 * * *").next_timestamp(after, "America/Bogota")
+
+        assert bogota_run - utc_run == 5 * 3600
+
+    @pytest.mark.parametrize("expression", ["* * *", "61 * * * *", "*/0 * * * *", "a * * * *"])
+    def test_invalid(self, expression):
+        with pytest.raises(ValueError):
+            CronExpression(expression)
+
+
+class TestTimerQueue:
+    """Test suite for the sorted-set timer queue"""
+
+    def test_due_jobs_claimed_once(self, scheduler):
+        """Test only one worker claims a due job and acked jobs disappear"""
+        other = WorkflowScheduler.__new__(WorkflowScheduler)
+        other.__dict__.update(scheduler.__dict__)
+        scheduler.schedule({"kind": "resume", "execution_id": "e1"}, run_at=100)
+        scheduler.schedule({"kind": "resume", "execution_id": "e2"}, run_at=10 ** 12)
+
+        claimed = scheduler.claim_due(now=200)
+
+        assert len(claimed) == 1
+        assert other.claim_due(now=200) == []
+        scheduler.ack(claimed[0])
+        assert scheduler.redis.zcard(WorkflowScheduler.INFLIGHT_KEY) == 0
+
+    def test_expired_claims_requeued(self, scheduler):
+        """Test jobs of a dead worker return to the queue after the lease"""
+        scheduler.schedule({"kind": "cron", "workflow_id": "wf"}, run_at=100)
+        scheduler.claim_due(now=200)
+
+        assert scheduler.requeue_expired(now=200 + scheduler.execution_lease + 1) == 1
+        assert len(scheduler.claim_due(now=10 ** 10)) == 1
+
+    def test_abandoned_execution_is_not_recovered(self, scheduler):
+        """Test a timed out sync execution leaves no recover job, even after a late checkpoint"""
+        token = scheduler.acquire_execution("acme", "exec_1")
+        scheduler.save_checkpoint("acme", "wf", "exec_1", "{}")
+        assert token and scheduler.redis.zcard(WorkflowScheduler.TIMERS_KEY) == 1
+
+        scheduler.abandon_execution("acme", "wf", "exec_1")
+        scheduler.save_checkpoint("acme", "wf", "exec_1", "{}")  # cancelled task still finishing a node
+
+        assert scheduler.redis.zcard(WorkflowScheduler.TIMERS_KEY) == 0
+        assert scheduler.load_checkpoint("acme", "exec_1") is None
+
+
+class TestDurableWait:
+    """Test suite for WAIT nodes with a scheduler"""
+
+    @pytest.fixture
+    def workflow(self):
+        graph = WorkflowGraph(id="wf_reminder", name="reminder", description="", company_id="acme")
+        nodes = [
+            WorkflowNode(id="start", type=NodeType.TRIGGER, name="start", config={}, position={}),
+            WorkflowNode(id="before", type=NodeType.VARIABLE, name="before", position={},
+                         config={"action": "set", "variable_name": "before", "variable_value": 1}),
+            WorkflowNode(id="wait", type=NodeType.WAIT, name="wait", config={"delay_ms": 3600 * 1000}, position={}),
+            WorkflowNode(id="after", type=NodeType.VARIABLE, name="after", position={},
+                         config={"action": "set", "variable_name": "after", "variable_value": 2}),
+            WorkflowNode(id="end", type=NodeType.END, name="end", config={}, position={}),
+        ]
+        for node in nodes:
+            graph.add_node(node)
+        for source, target in [("start", "before"), ("before", "wait"), ("wait", "after"), ("after", "end")]:
+            graph.add_edge(WorkflowEdge(id=f"{source}-{target}", source_node_id=source,
+                                        target_node_id=target, edge_type=EdgeType.DIRECT))
+        graph.start_node_id = "start"
+        return graph
+
+    @pytest.fixture(autouse=True)
+    def runtime(self):
+        """Runtime isolated from Flask app configuration"""
+        runtime = WorkflowRuntime(max_workers=2)
+        with patch('app.workflows.workflow_runtime.get_workflow_runtime', return_value=runtime):
+            yield runtime
+        runtime.shutdown()
+
+    def _execute(self, workflow, scheduler, **kwargs):
+        executor = WorkflowExecutor(workflow, orchestrator=MagicMock(company_id="acme"), scheduler=scheduler)
+        return asyncio.run(executor.execute({"user_id": "u1"}, execution_id="exec_1", **kwargs))
+
+    def test_long_wait_suspends_and_resumes(self, scheduler, workflow):
+        """Test a long WAIT costs no worker time and resumes from the checkpoint"""
+        first = self._execute(workflow, scheduler)
+
+        assert first["status"] == "waiting"
+        assert "after" not in first["final_output"]
+        timers = scheduler.redis.zsets[WorkflowScheduler.TIMERS_KEY]
+        assert [member for member in timers if '"resume"' in member]
+        assert not [member for member in timers if '"recover"' in member]
+
+        checkpoint = scheduler.load_checkpoint("acme", "exec_1")
+        checkpoint["fired_waits"].append("wait:0")
+        second = self._execute(workflow, scheduler, checkpoint=checkpoint)
+
+        assert second["status"] == "success"
+        assert second["final_output"]["after"] == 2
+        executed = [r["node_id"] for r in second["execution_history"] if r["status"] == "success"]
+        assert executed.count("before") == 1
+        assert scheduler.load_checkpoint("acme", "exec_1") is None
+
+    def test_locked_execution_not_run_twice(self, scheduler, workflow):
+        """Test an execution held by another worker is not executed"""
+        scheduler.acquire_execution("acme", "exec_1")
+
+        assert self._execute(workflow, scheduler)["status"] == "running"